@@ -46,7 +46,8 @@ CREATE TABLE dbo.raw_mes (
     
     -- 元数据
     source_file NVARCHAR(512),
-    record_hash NVARCHAR(255) UNIQUE,
+    record_hash BINARY(16) UNIQUE,  -- 记录键的 MD5（UTF-16LE），与 HASHBYTES('MD5', 键) 一致
+    record_key AS CONCAT(CONVERT(NVARCHAR(255), BatchNumber), N'|', CONVERT(NVARCHAR(255), Operation), N'|', CONVERT(NVARCHAR(255), Machine), N'|', CONVERT(NVARCHAR(19), TrackOutTime, 120)),  -- 可读记录键（计算列）
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
 );
@@ -96,7 +97,8 @@ CREATE TABLE dbo.raw_sfc (
     
     -- 元数据
     source_file NVARCHAR(512),
-    record_hash NVARCHAR(255) UNIQUE,
+    record_hash BINARY(16) UNIQUE,  -- 记录键的 MD5（UTF-16LE），与 HASHBYTES('MD5', 键) 一致
+    record_key AS CONCAT(CONVERT(NVARCHAR(255), BatchNumber), N'|', CONVERT(NVARCHAR(255), Operation), N'|', CONVERT(NVARCHAR(19), TrackOutTime, 120)),  -- 可读记录键（计算列）
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
 );
@@ -141,7 +143,8 @@ CREATE TABLE dbo.raw_sap_routing (
     
     -- 元数据
     source_file NVARCHAR(512),
-    record_hash NVARCHAR(255) UNIQUE,
+    record_hash BINARY(16) UNIQUE,  -- 记录键的 MD5（UTF-16LE），与 HASHBYTES('MD5', 键) 一致
+    record_key AS CONCAT(CONVERT(NVARCHAR(255), ProductNumber), N'|', CONVERT(NVARCHAR(255), CFN), N'|', CONVERT(NVARCHAR(255), "Group"), N'|', CONVERT(NVARCHAR(255), Operation), N'|', CONVERT(NVARCHAR(255), factory_code)),  -- 可读记录键（计算列）
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
 );
@@ -179,7 +182,8 @@ CREATE TABLE dbo.raw_sfc_inspection (
     
     -- 元数据
     source_file NVARCHAR(512),
-    record_hash NVARCHAR(255) UNIQUE,
+    record_hash BINARY(16) UNIQUE,  -- 记录键的 MD5（UTF-16LE），与 HASHBYTES('MD5', 键) 一致
+    record_key AS CONCAT(CONVERT(NVARCHAR(255), BatchNumber), N'|', CONVERT(NVARCHAR(255), SerialNumber), N'|', CONVERT(NVARCHAR(255), Operation), N'|', CONVERT(NVARCHAR(19), ReportDate, 120)),  -- 可读记录键（计算列）
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
 );
@@ -267,6 +271,8 @@ CREATE TABLE dbo.etl_file_state (
     file_path NVARCHAR(512) NOT NULL,
     file_mtime REAL,
     file_size INTEGER,
+    file_sample_hash CHAR(32),        -- 内容指纹：抽样哈希（MDDAP_FILE_FINGERPRINT=1 时写入）
+    file_content_hash CHAR(32),       -- 内容指纹：全量哈希
     processed_time DATETIME,
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
@@ -297,6 +303,24 @@ CREATE TABLE dbo.etl_run_log (
 IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'idx_etl_log_name' AND object_id = OBJECT_ID('dbo.etl_run_log'))
 CREATE INDEX idx_etl_log_name ON dbo.etl_run_log(etl_name);
 
+-- ============================================================
+-- bulk_insert 隔离表 (无法写入的行及出错列)
+-- ============================================================
+IF OBJECT_ID('dbo.etl_bulk_insert_quarantine', 'U') IS NULL
+CREATE TABLE dbo.etl_bulk_insert_quarantine (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name NVARCHAR(128) NOT NULL,
+    row_index INTEGER,
+    error_column NVARCHAR(128),
+    error_value NVARCHAR(4000),
+    error_message NVARCHAR(4000),
+    row_data NVARCHAR(MAX),
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'idx_bulk_insert_quarantine_table' AND object_id = OBJECT_ID('dbo.etl_bulk_insert_quarantine'))
+CREATE INDEX idx_bulk_insert_quarantine_table ON dbo.etl_bulk_insert_quarantine(table_name, created_at);
+
 -- ============================================================
 -- 计算层 (DWD): MES 指标计算视图
 -- 沿用 V1 计算逻辑 + V2 改进 (扣除非工作日)
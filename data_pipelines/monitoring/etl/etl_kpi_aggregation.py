@@ -11,8 +11,14 @@ from pathlib import Path
 from datetime import datetime, timedelta
 import logging
 import csv
+import math
+import sys
 
 PROJECT_ROOT = Path(__file__).resolve().parents[3]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from shared_infrastructure.utils.work_calendar import WorkCalendar, get_work_calendar
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -20,12 +26,16 @@ logger = logging.getLogger(__name__)
 CAMPUS_TAG = 'CZ_Campus'
 PLANT_TAGS = ('CKH', 'CZM')
 HISTORY_WEEKS = 8  # 仅处理最近8周的数据
+SQL_SERVER = r'localhost\SQLEXPRESS'
+SQL_DATABASE = 'mddap_v2'
+# dim_calendar 缓存按 server/database 区分，与 get_db_connection 使用同一配置
+DB_SCOPE = f'{SQL_SERVER}/{SQL_DATABASE}'
 
 def get_db_connection():
     conn_str = (
         "DRIVER={ODBC Driver 17 for SQL Server};"
-        r"SERVER=localhost\SQLEXPRESS;"
-        "DATABASE=mddap_v2;"
+        f"SERVER={SQL_SERVER};"
+        f"DATABASE={SQL_DATABASE};"
         "Trusted_Connection=yes;"
         "Encrypt=no;"
     )
@@ -98,41 +108,53 @@ def aggregate_lead_time(conn, run_date=None):
     except Exception as e:
         logger.error(f"  KPI #1 聚合失败: {e}")
 
-def calculate_due_time(start_time, plan_hours, calendar_df):
+def load_kpi_calendar(calendar_df=None):
+    """
+    构造 KPI 使用的工作日历（调用方构造一次，逐条计算时复用）
+
+    参数:
+        calendar_df: 工作日日历DataFrame（date, is_workday）；为空时使用共享的 dim_calendar 日历
+
+    返回:
+        WorkCalendar
+    """
+    if calendar_df is None:
+        return get_work_calendar(conn_factory=get_db_connection, scope=DB_SCOPE)
+    # 日历表中不存在的日期视为非工作日
+    return WorkCalendar.from_frame(
+        calendar_df, flag_col='is_workday', date_col='date', fallback='none', is_work=lambda v: v == 1
+    )
+
+
+def calculate_due_time(start_time, plan_hours, calendar=None):
     """
     按工作日逐天累加工作时间，跳过非工作日
     
     参数:
         start_time: 开始时间（datetime）
         plan_hours: 计划小时数（float）
-        calendar_df: 工作日日历DataFrame
+        calendar: load_kpi_calendar() 构造的 WorkCalendar；为空时使用共享的 dim_calendar 日历
         
     返回:
-        due_time: 应完工时间（datetime）
+        due_time: 应完工时间（datetime）；日历范围内工作日不足时返回 None
     """
-    from datetime import timedelta
-    
-    current_time = start_time
-    remaining_hours = plan_hours
-    
-    while remaining_hours > 0:
-        current_date = current_time.date()
-        
-        # 查询日历表判断是否为工作日
-        is_workday = calendar_df[
-            calendar_df['date'] == current_date.strftime('%Y-%m-%d')
-        ]['is_workday'].values
-        
-        if len(is_workday) > 0 and is_workday[0] == 1:
-            # 工作日：减少剩余工时（每天24小时连续生产）
-            daily_hours = min(remaining_hours, 24)
-            remaining_hours -= daily_hours
-        # 非工作日：不减少工时，但时间推进
-        
-        # 推进到下一天
-        current_time += timedelta(days=1)
-    
-    return current_time
+    if not plan_hours > 0:
+        return start_time
+
+    if calendar is None:
+        calendar = load_kpi_calendar()
+
+    # 每个工作日抵扣 24 小时（连续生产），数满所需工作日后的次日即为应完工时间
+    workdays = max(1, math.ceil(plan_hours / 24))
+    while workdays * 24 < plan_hours:
+        workdays += 1
+    while workdays > 1 and (workdays - 1) * 24 >= plan_hours:
+        workdays -= 1
+
+    days = int(calendar.calendar_days_for_workdays([pd.Timestamp(start_time)], workdays)[0])
+    if days < 0:
+        return None
+    return start_time + timedelta(days=days)
 
 
 def aggregate_schedule_attainment(conn, run_date=None):
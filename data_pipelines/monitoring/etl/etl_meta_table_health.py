@@ -1,7 +1,8 @@
 import argparse
 import os
 import sys
-from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
 from pathlib import Path
 
 import pandas as pd
@@ -13,6 +14,9 @@ if str(PROJECT_ROOT) not in sys.path:
 
 from shared_infrastructure.utils.db_sqlserver_only import SQLServerOnlyManager
 
+# Tables scanned concurrently (each on its own pooled connection); kept low for SQL Server Express
+HEALTH_WORKERS = int(os.getenv("MDDAP_HEALTH_WORKERS", "3") or 1)
+
 
 def _get_db() -> SQLServerOnlyManager:
     return SQLServerOnlyManager(
@@ -123,167 +127,101 @@ def _safe_ident(name: str) -> str:
     return "[" + str(name).replace("]", "]]" ) + "]"
 
 
-def _has_column(conn, table: str, col: str) -> bool:
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT 1 FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_SCHEMA='dbo' AND TABLE_NAME=? AND COLUMN_NAME=?",
-        (table, col),
-    )
-    return cur.fetchone() is not None
-
-
-def _get_columns_for_dq(conn, table: str, max_cols: int):
+def _get_table_metadata(conn, tables, dq_cols_max: int):
+    """Column lists of all candidate tables from one INFORMATION_SCHEMA query."""
+    wanted = {t[1].lower() for t in tables}
     cur = conn.cursor()
     cur.execute(
         """
-        SELECT TOP (?)
-            COLUMN_NAME
+        SELECT TABLE_NAME, COLUMN_NAME
         FROM INFORMATION_SCHEMA.COLUMNS
         WHERE TABLE_SCHEMA='dbo'
-          AND TABLE_NAME=?
-          AND COLUMN_NAME NOT IN ('created_at','updated_at')
-        ORDER BY ORDINAL_POSITION
-        """,
-        (int(max_cols), table),
-    )
-    cols = [str(r[0]) for r in cur.fetchall()]
-
-    cols_filtered = []
-    for c in cols:
-        if c.lower() in {"id"}:
-            continue
-        cols_filtered.append(c)
-    return cols_filtered
-
-
-def _calc_stats_for_table(conn, snapshot: date, schema: str, table: str, lookback_days: int, row_count_map: dict):
-    created_exists = _has_column(conn, table, "created_at")
-    updated_exists = _has_column(conn, table, "updated_at")
-
-    row_count = row_count_map.get(table)
-
-    filter_col = "updated_at" if updated_exists else "created_at"
-
-    today_inserted = None
-    today_updated = None
-    last_updated_at = None
-
-    cur = conn.cursor()
-
-    if created_exists:
-        cur.execute(
-            f"SELECT COUNT_BIG(*) FROM dbo.{_safe_ident(table)} WHERE TRY_CONVERT(date, { _safe_ident('created_at') }) = ?",
-            (snapshot,),
-        )
-        today_inserted = int(cur.fetchone()[0] or 0)
-
-    if updated_exists:
-        cur.execute(
-            f"SELECT COUNT_BIG(*) FROM dbo.{_safe_ident(table)} WHERE TRY_CONVERT(date, { _safe_ident('updated_at') }) = ?",
-            (snapshot,),
-        )
-        today_updated = int(cur.fetchone()[0] or 0)
-
-    cur.execute(
-        f"SELECT MAX(TRY_CONVERT(datetime2, { _safe_ident(filter_col) })) FROM dbo.{_safe_ident(table)}",
+        ORDER BY TABLE_NAME, ORDINAL_POSITION
+        """
     )
-    last_updated_at = cur.fetchone()[0]
-
-    return {
-        "snapshot_date": snapshot,
-        "table_schema": schema,
-        "table_name": table,
-        "row_count": row_count,
-        "today_inserted": today_inserted,
-        "today_updated": today_updated,
-        "last_updated_at": last_updated_at,
-    }
-
-
-def _calc_dq_for_table(conn, snapshot: date, schema: str, table: str, lookback_days: int, dq_cols_max: int):
-    updated_exists = _has_column(conn, table, "updated_at")
-    created_exists = _has_column(conn, table, "created_at")
-
-    date_col = "updated_at" if updated_exists else ("created_at" if created_exists else None)
-
+    columns = {}
+    for table_name, column_name in cur.fetchall():
+        if str(table_name).lower() in wanted:
+            columns.setdefault(str(table_name).lower(), []).append(str(column_name))
+
+    meta = {}
+    for _, table in tables:
+        cols = columns.get(table.lower(), [])
+        lowered = {c.lower() for c in cols}
+        # First dq_cols_max columns besides the audit columns; "id" counts towards the limit but is not checked
+        dq_cols = [c for c in cols if c.lower() not in {"created_at", "updated_at"}][: int(dq_cols_max)]
+        meta[table] = {
+            "column_count": len(cols),
+            "created_exists": "created_at" in lowered,
+            "updated_exists": "updated_at" in lowered,
+            "id_col": next((c for c in cols if c.lower() == "id"), None),
+            "dq_cols": [c for c in dq_cols if c.lower() != "id"],
+        }
+    return meta
+
+
+def _get_prev_column_counts(conn, snapshot: date):
+    """column_count of each table's latest meta_table_dq_daily row before the snapshot."""
     cur = conn.cursor()
-
-    cur.execute(
-        "SELECT COUNT(*) FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_SCHEMA='dbo' AND TABLE_NAME=?",
-        (table,),
-    )
-    column_count = int(cur.fetchone()[0] or 0)
-
-    prev_col_count = None
     cur.execute(
         """
-        SELECT TOP 1 column_count
-        FROM dbo.meta_table_dq_daily
-        WHERE table_schema=? AND table_name=? AND snapshot_date < ?
-        ORDER BY snapshot_date DESC
+        SELECT table_name, column_count
+        FROM (
+            SELECT
+                table_name,
+                column_count,
+                ROW_NUMBER() OVER (PARTITION BY table_schema, table_name ORDER BY snapshot_date DESC) AS rn
+            FROM dbo.meta_table_dq_daily
+            WHERE table_schema='dbo' AND snapshot_date < ?
+        ) x
+        WHERE rn = 1
         """,
-        (schema, table, snapshot),
+        (snapshot,),
     )
-    row = cur.fetchone()
-    if row is not None and row[0] is not None:
-        prev_col_count = int(row[0])
+    return {str(r[0]).lower(): (int(r[1]) if r[1] is not None else None) for r in cur.fetchall()}
 
-    schema_changed = None
-    if prev_col_count is not None:
-        schema_changed = 1 if prev_col_count != column_count else 0
 
-    freshness_hours = None
+def _build_health_query(table: str, meta: dict, snapshot: date, lookback_days: int):
+    """
+    One aggregate query over the table: today's inserts/updates, latest timestamp and freshness,
+    and the per-column null counts / distinct ids within the lookback window.
+    """
+    date_col = "updated_at" if meta["updated_exists"] else ("created_at" if meta["created_exists"] else None)
+
+    select = ["COUNT_BIG(*) AS total_rows"]
+    params = []
+    if meta["created_exists"]:
+        select.append(f"COUNT_BIG(CASE WHEN TRY_CONVERT(date, t.{_safe_ident('created_at')}) = ? THEN 1 END) AS today_inserted")
+        params.append(snapshot)
+    if meta["updated_exists"]:
+        select.append(f"COUNT_BIG(CASE WHEN TRY_CONVERT(date, t.{_safe_ident('updated_at')}) = ? THEN 1 END) AS today_updated")
+        params.append(snapshot)
     if date_col is not None:
-        cur.execute(
-            f"SELECT MAX(TRY_CONVERT(datetime2, { _safe_ident(date_col) })) FROM dbo.{_safe_ident(table)}"
-        )
-        max_dt = cur.fetchone()[0]
-        if max_dt is not None:
-            cur.execute("SELECT DATEDIFF(second, ?, SYSUTCDATETIME()) / 3600.0", (max_dt,))
-            freshness_hours = float(cur.fetchone()[0] or 0)
-
-    cols = _get_columns_for_dq(conn, table, dq_cols_max)
+        max_dt = f"MAX(TRY_CONVERT(datetime2, t.{_safe_ident(date_col)}))"
+        select.append(f"{max_dt} AS last_updated_at")
+        select.append(f"DATEDIFF(second, {max_dt}, SYSUTCDATETIME()) / 3600.0 AS freshness_hours")
 
-    null_rate_max = None
-    null_rate_col = None
+    select.append("COUNT_BIG(CASE WHEN w.in_window = 1 THEN 1 END) AS window_rows")
+    for i, c in enumerate(meta["dq_cols"]):
+        select.append(f"COUNT_BIG(CASE WHEN w.in_window = 1 AND t.{_safe_ident(c)} IS NULL THEN 1 END) AS nulls_{i}")
+    if meta["id_col"] is not None:
+        select.append(f"COUNT_BIG(DISTINCT CASE WHEN w.in_window = 1 THEN t.{_safe_ident(meta['id_col'])} END) AS distinct_ids")
 
-    where_clause = ""
     if date_col is not None and lookback_days is not None and int(lookback_days) > 0:
-        where_clause = f"WHERE TRY_CONVERT(date, { _safe_ident(date_col) }) >= DATEADD(day, -?, ?)"
+        window = f"CASE WHEN TRY_CONVERT(date, t.{_safe_ident(date_col)}) >= ? THEN 1 ELSE 0 END"
+        params.append(snapshot - timedelta(days=int(lookback_days)))
+    else:
+        window = "1"
 
-    for c in cols:
-        sql = (
-            f"SELECT COUNT_BIG(*) AS total, "
-            f"SUM(CASE WHEN { _safe_ident(c) } IS NULL THEN 1 ELSE 0 END) AS nulls "
-            f"FROM dbo.{_safe_ident(table)} {where_clause}"
-        )
-        params = ()
-        if where_clause:
-            params = (int(lookback_days), snapshot)
-        cur.execute(sql, params)
-        total, nulls = cur.fetchone()
-        total = int(total or 0)
-        nulls = int(nulls or 0)
-        if total <= 0:
-            continue
-        rate = float(nulls) / float(total)
-        if null_rate_max is None or rate > null_rate_max:
-            null_rate_max = rate
-            null_rate_col = c
+    sql = (
+        "SELECT " + ", ".join(select) + " "
+        f"FROM dbo.{_safe_ident(table)} t "
+        f"CROSS APPLY (SELECT {window} AS in_window) w"
+    )
+    return sql, tuple(params)
 
-    dup_rate = None
-    if _has_column(conn, table, "id"):
-        sql = f"SELECT COUNT_BIG(*) AS total, COUNT_BIG(DISTINCT { _safe_ident('id') }) AS distinct_cnt FROM dbo.{_safe_ident(table)} {where_clause}"
-        params = ()
-        if where_clause:
-            params = (int(lookback_days), snapshot)
-        cur.execute(sql, params)
-        total, distinct_cnt = cur.fetchone()
-        total = int(total or 0)
-        distinct_cnt = int(distinct_cnt or 0)
-        if total > 0:
-            dup_rate = max(0.0, 1.0 - (float(distinct_cnt) / float(total)))
 
+def _score_dq(null_rate_max, null_rate_col, dup_rate, freshness_hours, schema_changed):
     dq_score = 100.0
     issues = []
 
@@ -310,8 +248,52 @@ def _calc_dq_for_table(conn, snapshot: date, schema: str, table: str, lookback_d
     dq_score = float(max(0.0, min(100.0, dq_score)))
 
     issues_summary = "; ".join(issues) if issues else "OK"
+    return dq_score, issues_summary
+
+
+def _calc_table_health(conn, snapshot: date, schema: str, table: str, lookback_days: int, meta: dict, row_count_map: dict, prev_col_count):
+    """Stats row and DQ row of one table from a single scan."""
+    sql, params = _build_health_query(table, meta, snapshot, lookback_days)
+    cur = conn.cursor()
+    cur.execute(sql, params)
+    row = cur.fetchone()
+    values = dict(zip([d[0] for d in cur.description], row))
 
-    return {
+    null_rate_max = None
+    null_rate_col = None
+    dup_rate = None
+    window_rows = int(values["window_rows"] or 0)
+    if window_rows > 0:
+        for i, c in enumerate(meta["dq_cols"]):
+            rate = float(values[f"nulls_{i}"] or 0) / float(window_rows)
+            if null_rate_max is None or rate > null_rate_max:
+                null_rate_max = rate
+                null_rate_col = c
+        if meta["id_col"] is not None:
+            distinct_cnt = int(values["distinct_ids"] or 0)
+            dup_rate = max(0.0, 1.0 - (float(distinct_cnt) / float(window_rows)))
+
+    freshness_hours = None
+    if values.get("freshness_hours") is not None:
+        freshness_hours = float(values["freshness_hours"])
+
+    column_count = meta["column_count"]
+    schema_changed = None
+    if prev_col_count is not None:
+        schema_changed = 1 if prev_col_count != column_count else 0
+
+    dq_score, issues_summary = _score_dq(null_rate_max, null_rate_col, dup_rate, freshness_hours, schema_changed)
+
+    stats_row = {
+        "snapshot_date": snapshot,
+        "table_schema": schema,
+        "table_name": table,
+        "row_count": row_count_map.get(table),
+        "today_inserted": int(values["today_inserted"] or 0) if meta["created_exists"] else None,
+        "today_updated": int(values["today_updated"] or 0) if meta["updated_exists"] else None,
+        "last_updated_at": values.get("last_updated_at"),
+    }
+    dq_row = {
         "snapshot_date": snapshot,
         "table_schema": schema,
         "table_name": table,
@@ -324,9 +306,36 @@ def _calc_dq_for_table(conn, snapshot: date, schema: str, table: str, lookback_d
         "schema_changed": schema_changed,
         "issues_summary": issues_summary,
     }
+    return stats_row, dq_row
 
 
-def run(snapshot: date, lookback_days: int, dq_cols_max: int) -> None:
+def _error_rows(snapshot: date, schema: str, table: str, row_count_map: dict, error: Exception):
+    stats_row = {
+        "snapshot_date": snapshot,
+        "table_schema": schema,
+        "table_name": table,
+        "row_count": row_count_map.get(table),
+        "today_inserted": None,
+        "today_updated": None,
+        "last_updated_at": None,
+    }
+    dq_row = {
+        "snapshot_date": snapshot,
+        "table_schema": schema,
+        "table_name": table,
+        "dq_score": 0.0,
+        "null_rate_max": None,
+        "null_rate_col": None,
+        "dup_rate": None,
+        "freshness_hours": None,
+        "column_count": None,
+        "schema_changed": None,
+        "issues_summary": f"ERROR:{str(error)[:180]}",
+    }
+    return stats_row, dq_row
+
+
+def run(snapshot: date, lookback_days: int, dq_cols_max: int, workers: int = HEALTH_WORKERS) -> None:
     db = _get_db()
     with db.get_connection() as conn:
         _ensure_meta_tables(conn)
@@ -334,43 +343,38 @@ def run(snapshot: date, lookback_days: int, dq_cols_max: int) -> None:
         tables = _get_candidate_tables(conn)
 
         row_count_map = _get_table_row_counts(conn, tables)
+        table_meta = _get_table_metadata(conn, tables, dq_cols_max)
+        prev_col_counts = _get_prev_column_counts(conn, snapshot)
 
-        stats_rows = []
-        dq_rows = []
-
-        for schema, table in tables:
+        def collect(table_conn, schema, table):
             try:
-                stats_rows.append(
-                    _calc_stats_for_table(conn, snapshot, schema, table, lookback_days, row_count_map)
+                return _calc_table_health(
+                    table_conn, snapshot, schema, table, lookback_days,
+                    table_meta[table], row_count_map, prev_col_counts.get(table.lower()),
                 )
-                dq_rows.append(_calc_dq_for_table(conn, snapshot, schema, table, lookback_days, dq_cols_max))
             except Exception as e:
-                stats_rows.append(
-                    {
-                        "snapshot_date": snapshot,
-                        "table_schema": schema,
-                        "table_name": table,
-                        "row_count": row_count_map.get(table),
-                        "today_inserted": None,
-                        "today_updated": None,
-                        "last_updated_at": None,
-                    }
-                )
-                dq_rows.append(
-                    {
-                        "snapshot_date": snapshot,
-                        "table_schema": schema,
-                        "table_name": table,
-                        "dq_score": 0.0,
-                        "null_rate_max": None,
-                        "null_rate_col": None,
-                        "dup_rate": None,
-                        "freshness_hours": None,
-                        "column_count": None,
-                        "schema_changed": None,
-                        "issues_summary": f"ERROR:{str(e)[:180]}",
-                    }
-                )
+                return _error_rows(snapshot, schema, table, row_count_map, e)
+
+        def collect_pooled(item):
+            schema, table = item
+            try:
+                table_conn = db.get_connection()
+            except Exception as e:
+                return _error_rows(snapshot, schema, table, row_count_map, e)
+            try:
+                return collect(table_conn, schema, table)
+            finally:
+                table_conn.close()
+
+        # Each table is one scan; scans of different tables run on separate pooled connections
+        if int(workers) <= 1:
+            results = [collect(conn, schema, table) for schema, table in tables]
+        else:
+            with ThreadPoolExecutor(max_workers=int(workers), thread_name_prefix="health") as executor:
+                results = list(executor.map(collect_pooled, tables))
+
+        stats_rows = [r[0] for r in results]
+        dq_rows = [r[1] for r in results]
 
         cur = conn.cursor()
         cur.execute(
@@ -402,6 +406,7 @@ def main() -> None:
     parser.add_argument("--snapshot-date", default="", help="YYYY-MM-DD. Defaults to today.")
     parser.add_argument("--lookback-days", type=int, default=7)
     parser.add_argument("--dq-cols-max", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=HEALTH_WORKERS, help="Tables scanned concurrently (1 = sequential).")
     args = parser.parse_args()
 
     if args.snapshot_date:
@@ -409,7 +414,12 @@ def main() -> None:
     else:
         snapshot = date.today()
 
-    run(snapshot=snapshot, lookback_days=int(args.lookback_days), dq_cols_max=int(args.dq_cols_max))
+    run(
+        snapshot=snapshot,
+        lookback_days=int(args.lookback_days),
+        dq_cols_max=int(args.dq_cols_max),
+        workers=max(1, int(args.workers)),
+    )
 
 
 if __name__ == "__main__":
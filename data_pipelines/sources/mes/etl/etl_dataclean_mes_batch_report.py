@@ -13,7 +13,7 @@ import json
 import hashlib
 import threading
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional, Set
+from typing import Dict, Iterable, List, Any, Optional, Set
 import re
 import warnings
 warnings.filterwarnings('ignore')
@@ -47,7 +47,9 @@ from shared_infrastructure.utils.path_resolver import (
     get_state_path,
     get_path_resolver
 )
-from shared_infrastructure.utils.db_utils import get_default_db_manager
+from shared_infrastructure.utils.db_utils import get_default_db_manager, to_sqlite_frame, to_sqlite_params
+from shared_infrastructure.utils.work_calendar import WorkCalendar, get_work_calendar
+from shared_infrastructure.utils.sequence_metrics import calculate_sequence_metrics, to_datetime_column
 
 # 获取路径解析器
 resolver = get_path_resolver()
@@ -370,34 +372,21 @@ def calculate_trackin_time_and_setup(df: pd.DataFrame) -> pd.DataFrame:
         logging.warning("CFN字段不存在，无法进行分组计算，返回原数据")
         return df
     
-    result_list = []
+    # 与按machine分组计算一致：machine为空的记录不参与计算，也不输出
+    result = df[df["machine"].notna()].copy()
     
-    for resource_code, group in df.groupby("machine"):
-        group_sorted = group.sort_values("TrackOutTime", na_position='last').reset_index(drop=True)
-        
-        # 获取上一行的CFN（用于计算Setup）
-        group_sorted['_prev_cfn'] = group_sorted['CFN'].shift(1)
-        
-        # TrackInTime保持源表的原始值，不进行修改
-        # 如果源表中没有TrackInTime字段，尝试使用StartTime
-        if "TrackInTime" not in group_sorted.columns:
-            if "StartTime" in group_sorted.columns:
-                group_sorted['TrackInTime'] = group_sorted['StartTime']
-            else:
-                group_sorted['TrackInTime'] = None
-        
-        # 计算Setup：如果上一行的CFN与当前CFN相同，则为"No"，否则为"Yes"
-        group_sorted['Setup'] = group_sorted.apply(
-            lambda row: "No" if pd.notna(row['_prev_cfn']) and row['_prev_cfn'] == row.get('CFN', None) else "Yes",
-            axis=1
-        )
-        
-        # 删除临时列
-        group_sorted = group_sorted.drop(columns=['_prev_cfn'])
-        
-        result_list.append(group_sorted)
+    # TrackInTime保持源表的原始值，不进行修改
+    # 如果源表中没有TrackInTime字段，尝试使用StartTime
+    if "TrackInTime" not in result.columns:
+        if "StartTime" in result.columns:
+            result["TrackInTime"] = result["StartTime"]
+        else:
+            result["TrackInTime"] = None
+    
+    # 计算Setup：同机台按TrackOutTime排序后，上一行的CFN与当前CFN相同则为"No"，否则为"Yes"
+    result = calculate_sequence_metrics(result, setup=True, previous_end=False)
     
-    return pd.concat(result_list, ignore_index=True)
+    return result.reset_index(drop=True)
 
 
 def merge_sfc_data(mes_df: pd.DataFrame, cfg: Dict[str, Any]) -> pd.DataFrame:
@@ -742,7 +731,7 @@ def merge_standard_time(mes_df: pd.DataFrame, cfg: Dict[str, Any]) -> pd.DataFra
     return result
 
 
-def calculate_previous_batch_end_time(df: pd.DataFrame) -> pd.DataFrame:
+def calculate_previous_batch_end_time(df: pd.DataFrame, changed_machines: Optional[Iterable[Any]] = None) -> pd.DataFrame:
     """
     计算上批结束时间（PreviousBatchEndTime）
     
@@ -752,6 +741,9 @@ def calculate_previous_batch_end_time(df: pd.DataFrame) -> pd.DataFrame:
     - 使用 shift(1) 获取上一批的 TrackOutTime
     - 对于第一批（PreviousBatchEndTime 为空），使用 EnterStepTime 代替
     
+    增量模式：传入 changed_machines（本次有新数据的机台）时只重算这些机台，
+    其余机台沿用已有的 PreviousBatchEndTime
+    
     注意：此函数应在所有数据合并完成后调用，确保排序准确
     """
     if df.empty:
@@ -764,64 +756,31 @@ def calculate_previous_batch_end_time(df: pd.DataFrame) -> pd.DataFrame:
         df["PreviousBatchEndTime"] = None
         return df
     
-    result = df.copy()
-    
     # 确保machine字段存在（如果不存在，创建为None）
-    if "machine" not in result.columns:
+    if "machine" not in df.columns:
         logging.warning("缺少machine字段，无法按machine分组计算 PreviousBatchEndTime")
+        result = df.copy()
         result["PreviousBatchEndTime"] = None
         return result
     
     # 检查machine字段是否有有效值
-    valid_machine_count = result["machine"].notna().sum()
+    valid_machine_count = df["machine"].notna().sum()
     if valid_machine_count == 0:
         logging.warning("machine字段全部为空，无法计算 PreviousBatchEndTime")
+        result = df.copy()
         result["PreviousBatchEndTime"] = None
         return result
     
-    logging.info(f"开始计算 PreviousBatchEndTime：有效machine记录 {valid_machine_count} 条，总计 {len(result)} 条")
+    logging.info(f"开始计算 PreviousBatchEndTime：有效machine记录 {valid_machine_count} 条，总计 {len(df)} 条")
     
-    # 按 machine 分组，按 TrackOutTime 升序排序（最早的在前）
-    # 对于 machine 为空或 TrackOutTime 为空的记录，先处理
-    result = result.sort_values(
-        ["machine", "TrackOutTime"],
-        na_position='last',  # 空值排在最后
-        ascending=[True, True]  # machine 和 TrackOutTime 都升序
-    )
-    
-    # 使用 shift(1) 获取上一批的 TrackOutTime
-    # 只对machine不为空的记录进行分组计算
-    result["PreviousBatchEndTime"] = None
-    
-    # 只对machine不为空的记录进行分组计算
-    mask_valid = result["machine"].notna() & result["TrackOutTime"].notna()
-    if mask_valid.any():
-        # 对有效记录进行分组计算
-        # 确保TrackOutTime是datetime类型
-        if result["TrackOutTime"].dtype not in ['datetime64[ns]', 'datetime64[us]', 'datetime64[ms]']:
-            result["TrackOutTime"] = pd.to_datetime(result["TrackOutTime"], unit='ms', errors='coerce')
-        
-        # 使用shift(1)获取上一批的TrackOutTime，保持datetime类型
-        result.loc[mask_valid, "PreviousBatchEndTime"] = (
-            result[mask_valid].groupby("machine")["TrackOutTime"].shift(1)
-        )
-        
-        # 确保PreviousBatchEndTime是datetime类型
-        if "PreviousBatchEndTime" in result.columns:
-            result["PreviousBatchEndTime"] = pd.to_datetime(result["PreviousBatchEndTime"], errors='coerce')
-        
-        # 对于第一批（PreviousBatchEndTime 为空），使用 EnterStepTime 代替
-        mask_first_batch = mask_valid & result["PreviousBatchEndTime"].isna()
-        if "EnterStepTime" in result.columns and mask_first_batch.any():
-            # 确保EnterStepTime是datetime类型
-            if result["EnterStepTime"].dtype not in ['datetime64[ns]', 'datetime64[us]', 'datetime64[ms]']:
-                result["EnterStepTime"] = pd.to_datetime(result["EnterStepTime"], errors='coerce')
-            result.loc[mask_first_batch, "PreviousBatchEndTime"] = result.loc[mask_first_batch, "EnterStepTime"]
+    # 按 machine + TrackOutTime 升序一次排序，组内上一批的 TrackOutTime 即为上批结束时间
+    result = calculate_sequence_metrics(df, setup=False, previous_end=True, changed_machines=changed_machines)
     
     # 统计计算结果
+    mask_valid = result["machine"].notna() & result["TrackOutTime"].notna()
     total_count = len(result)
     calculated_count = result["PreviousBatchEndTime"].notna().sum()
-    valid_calculated = (mask_valid & result["PreviousBatchEndTime"].notna()).sum() if mask_valid.any() else 0
+    valid_calculated = (mask_valid & result["PreviousBatchEndTime"].notna()).sum()
     logging.info(f"计算 PreviousBatchEndTime 完成：总计 {total_count} 条，成功计算 {calculated_count} 条（其中有效machine记录 {valid_calculated} 条）")
     
     return result
@@ -840,9 +799,9 @@ def calculate_metrics(df: pd.DataFrame, cfg: Dict[str, Any]) -> pd.DataFrame:
     # 记录实际存在的列名（用于调试）
     logging.debug(f"数据列名: {list(result.columns)}")
     
-    # 加载日历表
+    # 加载工作日历（共享日历服务，进程内/磁盘缓存）
     calendar_file = cfg.get("source", {}).get("calendar_file", "")
-    calendar_df = load_calendar_table(calendar_file) if calendar_file else pd.DataFrame()
+    work_calendar = get_work_calendar(calendar_file=calendar_file or None)
     
     # 获取每日工作时间配置
     daily_working_hours = cfg.get("source", {}).get("daily_working_hours", 8.0)
@@ -871,12 +830,12 @@ def calculate_metrics(df: pd.DataFrame, cfg: Dict[str, Any]) -> pd.DataFrame:
     # 5. 计算ST(d)
     result["ST(d)"] = result.apply(calculate_st, axis=1)
     
-    # 6. 计算DueTime和NonWorkday(d)（基于日历表）
-    result["DueTime"] = result.apply(lambda row: calculate_due_time(row, calendar_df, daily_working_hours), axis=1)
-    result["NonWorkday(d)"] = result.apply(lambda row: calculate_nonworkday_days(row, calendar_df), axis=1)
+    # 6. 计算DueTime和NonWorkday(d)（基于日历表，整列向量化计算）
+    result["DueTime"] = calculate_due_time_column(result, work_calendar, daily_working_hours)
+    result["NonWorkday(d)"] = calculate_nonworkday_days_column(result, work_calendar)
     
     # 7. 计算CompletionStatus（基于PT和ST比较，考虑容差和换批时间）
-    result["CompletionStatus"] = result.apply(lambda row: calculate_completion_status(row, calendar_df), axis=1)
+    result["CompletionStatus"] = calculate_completion_status_column(result)
     
     # 8. 计算容差小时数（单独字段，与SFC逻辑一致）
     result["Tolerance(h)"] = result.apply(calculate_tolerance_hours, axis=1)
@@ -1487,6 +1446,112 @@ def calculate_completion_status(row: pd.Series, calendar_df: pd.DataFrame) -> Op
         return "OnTime"
 
 
+# ==================== 向量化日历计算 ====================
+# 与上面逐行函数（calculate_due_time / calculate_nonworkday_days / calculate_completion_status）
+# 结果逐位一致，日历计算使用 shared_infrastructure.utils.work_calendar 的批量接口
+
+
+def _column(df: pd.DataFrame, name: str, default: Any = None) -> pd.Series:
+    """取列，缺失时返回默认值列（对应 row.get(name, default)）"""
+    if name in df.columns:
+        return df[name]
+    return pd.Series([default] * len(df), index=df.index, dtype=object)
+
+
+def _or_default(values: pd.Series, default: Any) -> pd.Series:
+    """向量化的 `value or default`：None/0/False/'' 取默认值，NaN 保留"""
+    if values.dtype.kind in "biuf":
+        return values.where(values != 0, default)
+    return values.map(lambda v: v or default)
+
+
+def _setup_hours(df: pd.DataFrame, default: float) -> pd.Series:
+    """Setup="Yes" 且有标准换型时间时取 `Setup Time (h) or default`，否则为 default"""
+    setup_time = _column(df, "Setup Time (h)")
+    use_setup = (_column(df, "Setup") == "Yes") & setup_time.notna()
+    value = _or_default(setup_time, default)
+    return pd.to_numeric(value.where(use_setup, default), errors='coerce')
+
+
+def _lt_start_time(df: pd.DataFrame) -> pd.Series:
+    """LT 周期开始时间（与 calculate_lt / calculate_nonworkday_days 一致）"""
+    checkin_sfc = _column(df, "Checkin_SFC")
+    enter_step = _column(df, "EnterStepTime")
+    trackin = _column(df, "TrackInTime")
+    first_op = _column(df, "Operation", "") == "0010"
+    start_first_op = checkin_sfc.where(checkin_sfc.notna(), enter_step)
+    start_first_op = start_first_op.where(start_first_op.notna(), trackin)
+    return start_first_op.where(first_op, enter_step)
+
+
+def calculate_due_time_column(df: pd.DataFrame, calendar: WorkCalendar, daily_working_hours: float = 8.0) -> pd.Series:
+    """整列计算DueTime（与 calculate_due_time 逐行结果一致）"""
+    start_time = _column(df, "PreviousBatchEndTime")
+    start_time = start_time.where(start_time.notna(), _column(df, "EnterStepTime"))
+    start_dt = pd.to_datetime(start_time)
+    
+    setup_time = _setup_hours(df, 0)
+    
+    # 优先使用Machine，如果Machine为0或空，则使用Labor
+    machine_time_s = pd.to_numeric(_column(df, "EH_machine(s)"), errors='coerce')
+    labor_time_s = pd.to_numeric(_column(df, "EH_labor(s)"), errors='coerce')
+    use_machine = machine_time_s.notna() & (machine_time_s > 0)
+    use_labor = ~use_machine & labor_time_s.notna() & (labor_time_s > 0)
+    unit_time_s = machine_time_s.where(use_machine, labor_time_s)
+    
+    qty = pd.to_numeric(_or_default(_column(df, "StepInQuantity", 0), 0), errors='coerce')
+    oee = pd.to_numeric(_or_default(_column(df, "OEE", 0.77), 0.77), errors='coerce')
+    
+    # 总工时 = 调试时间 + 数量 × 单件时间（秒）/ OEE / 3600 + 0.5小时换批时间
+    total_hours = setup_time + (qty * unit_time_s / oee) / 3600 + 0.5
+    
+    valid = (start_dt.notna() & (use_machine | use_labor)).to_numpy()
+    if not valid.any():
+        return pd.Series([None] * len(df), index=df.index, dtype=object)
+    due = np.full(len(df), np.datetime64('NaT'), dtype='datetime64[ns]')
+    due[valid] = calendar.add_working_hours(
+        start_dt.to_numpy(dtype='datetime64[ns]')[valid],
+        total_hours.to_numpy(dtype=np.float64)[valid],
+        daily_working_hours,
+    )
+    return pd.Series(due, index=df.index)
+
+
+def calculate_nonworkday_days_column(df: pd.DataFrame, calendar: WorkCalendar) -> pd.Series:
+    """整列计算NonWorkday(d)（与 calculate_nonworkday_days 逐行结果一致）"""
+    trackout = _column(df, "TrackOutTime")
+    start_dt = pd.to_datetime(_lt_start_time(df))
+    end_dt = pd.to_datetime(trackout)
+    
+    valid = (trackout.notna() & start_dt.notna() & (end_dt > start_dt)).to_numpy()
+    days = np.full(len(df), np.nan)
+    if valid.any():
+        # 与 calculate_nonworkday_hours 一致：开始日期 8:00 之前的部分不计入
+        hours = calendar.nonworking_hours_between(
+            start_dt.to_numpy(dtype='datetime64[ns]')[valid],
+            end_dt.to_numpy(dtype='datetime64[ns]')[valid],
+            count_before_8am=False,
+        )
+        # Python round 与 np.round 的舍入方式不同，逐个调用保持一致
+        days[valid] = [round(round(h, 2) / 24, 2) for h in hours.tolist()]
+    return pd.Series(days, index=df.index)
+
+
+def calculate_completion_status_column(df: pd.DataFrame) -> pd.Series:
+    """整列计算CompletionStatus（与 calculate_completion_status 逐行结果一致）"""
+    pt = pd.to_numeric(_column(df, "PT(d)"), errors='coerce')
+    st = pd.to_numeric(_column(df, "ST(d)"), errors='coerce')
+    tolerance_h = pd.to_numeric(_column(df, "Tolerance(h)", 8.0), errors='coerce')
+    nonworkday_d = pd.to_numeric(_column(df, "NonWorkday(d)", 0.0), errors='coerce')
+    changeover_time = _setup_hours(df, 0.5)
+    
+    # 阈值 = ST + 容差 + 换批/换型时间 + 非工作日时间
+    threshold = st * 24 + tolerance_h + changeover_time + nonworkday_d * 24
+    status = np.where(pt * 24 > threshold, "Overdue", "OnTime").astype(object)
+    status[(pt.isna() | st.isna()).to_numpy()] = None
+    return pd.Series(status, index=df.index, dtype=object)
+
+
 def calculate_tolerance_hours(row: pd.Series) -> Optional[float]:
     """计算容差小时数（固定8小时，与SFC逻辑一致）"""
     due = row.get("DueTime", None)
@@ -1571,7 +1636,8 @@ def process_all_data(cfg: Dict[str, Any], force_full_refresh: bool = False) -> t
     处理所有数据的主函数
     
     Returns:
-        tuple: (DataFrame, IncrementalProcessor) - 处理后的数据和文件级增量处理器
+        tuple: (DataFrame, IncrementalProcessor, bool) - 处理后的数据、文件级增量处理器、
+        是否已按唯一键增量写入SQLite历史表（为 True 时 DataFrame 只包含本次写入的数据）
     """
     # 检查测试模式配置
     test_cfg = cfg.get("test", {})
@@ -1618,7 +1684,7 @@ def process_all_data(cfg: Dict[str, Any], force_full_refresh: bool = False) -> t
         
         if not changed_files and not force_full_refresh:
             logging.info("所有MES数据文件未变化，跳过处理")
-            return pd.DataFrame(), file_incr_processor
+            return pd.DataFrame(), file_incr_processor, False
         
         # 多工厂模式
         logging.info("开始读取多工厂数据...")
@@ -1626,12 +1692,12 @@ def process_all_data(cfg: Dict[str, Any], force_full_refresh: bool = False) -> t
         
         if mes_df.empty:
             logging.error("未读取到任何MES数据，ETL终止")
-            return pd.DataFrame(), file_incr_processor
+            return pd.DataFrame(), file_incr_processor, False
         
         # 验证多工厂数据完整性
         if not validate_multi_factory_data(mes_df):
             logging.error("多工厂数据验证失败，ETL终止")
-            return pd.DataFrame(), file_incr_processor
+            return pd.DataFrame(), file_incr_processor, False
         
         # 输出多工厂数据摘要
         factory_summary = get_factory_summary(mes_df)
@@ -1648,7 +1714,7 @@ def process_all_data(cfg: Dict[str, Any], force_full_refresh: bool = False) -> t
             mes_files = glob.glob(mes_path)
             if not mes_files:
                 logging.error(f"未找到匹配的MES文件: {mes_path}")
-                return pd.DataFrame(), file_incr_processor
+                return pd.DataFrame(), file_incr_processor, False
             logging.info(f"找到 {len(mes_files)} 个MES文件")
             # 读取所有文件并合并
             mes_dfs = []
@@ -1661,7 +1727,7 @@ def process_all_data(cfg: Dict[str, Any], force_full_refresh: bool = False) -> t
                     logging.warning(f"读取文件失败 {file_path}: {e}")
             if not mes_dfs:
                 logging.error("所有MES文件读取失败")
-                return pd.DataFrame(), file_incr_processor
+                return pd.DataFrame(), file_incr_processor, False
             mes_df = pd.concat(mes_dfs, ignore_index=True)
             logging.info(f"合并后MES数据行数: {len(mes_df)}")
             
@@ -1670,12 +1736,12 @@ def process_all_data(cfg: Dict[str, Any], force_full_refresh: bool = False) -> t
         else:
             if not os.path.exists(mes_path):
                 logging.error(f"MES数据路径不存在: {mes_path}")
-                return pd.DataFrame(), file_incr_processor
+                return pd.DataFrame(), file_incr_processor, False
             logging.info(f"读取MES数据: {mes_path}")
             mes_df = read_sharepoint_excel(mes_path, max_rows=max_rows)
     else:
         logging.error("未配置MES数据源（需要 mes_sources 或 mes_path）")
-        return pd.DataFrame(), file_incr_processor
+        return pd.DataFrame(), file_incr_processor, False
     
     # 先做基础处理（字段映射和类型转换），以便增量过滤能识别标准字段名
     mes_df = process_mes_data(mes_df, cfg)
@@ -1712,7 +1778,7 @@ def process_all_data(cfg: Dict[str, Any], force_full_refresh: bool = False) -> t
             mes_df = filter_incremental_data(mes_df, cfg, state_file)
             if mes_df.empty:
                 logging.info("MES数据没有新数据，跳过后续处理")
-                return pd.DataFrame(), file_incr_processor
+                return pd.DataFrame(), file_incr_processor, False
     
     # 3. 处理MES数据
     result = mes_df.copy()
@@ -1727,16 +1793,34 @@ def process_all_data(cfg: Dict[str, Any], force_full_refresh: bool = False) -> t
     result = calculate_metrics(result, cfg)
     
     # 4. 增量处理：合并历史数据（如果启用）
+    # upsert：按唯一键只写入新数据并更新受影响的机台序列；replace：读取全表合并后整表重写
+    changed_machines = None
+    history_written = False
     if incr_cfg.get("enabled", False):
-        history_file = incr_cfg.get("history_file", "publish/MES_batch_report_latest.parquet")
-        history_file = os.path.join(BASE_DIR, history_file) if not os.path.isabs(history_file) else history_file
-        result = merge_with_history(result, history_file, cfg)
-    
-    # 5. 在最终保存前，对所有合并后的数据统一重新计算 PreviousBatchEndTime
-    # 确保基于完整、排序后的数据集进行准确计算
-    if not result.empty:
+        upserted = None
+        # Parquet输出需要完整数据，只能走全量合并
+        if incr_cfg.get("history_merge", "upsert") == "upsert" and not WRITE_PARQUET_OUTPUT:
+            try:
+                upserted = upsert_history(result, cfg)
+            except Exception as e:
+                logging.warning(f"增量合并历史数据失败，改用全量合并: {e}")
+        
+        if upserted is not None:
+            result = upserted
+            history_written = True
+        else:
+            history_file = incr_cfg.get("history_file", "publish/MES_batch_report_latest.parquet")
+            history_file = os.path.join(BASE_DIR, history_file) if not os.path.isabs(history_file) else history_file
+            # 只有本次有新数据的机台的批次序列会变化
+            if "machine" in result.columns:
+                changed_machines = result["machine"].dropna().unique()
+            result = merge_with_history(result, history_file, cfg)
+    
+    # 5. 在最终保存前，对合并后的数据重新计算 PreviousBatchEndTime
+    # 确保基于完整、排序后的数据集进行准确计算（增量模式只重算有新数据的机台）
+    if not result.empty and not history_written:
         logging.info("对所有合并后的数据统一计算 PreviousBatchEndTime")
-        result = calculate_previous_batch_end_time(result)
+        result = calculate_previous_batch_end_time(result, changed_machines=changed_machines)
     
     # 标记所有文件已处理
     # 支持 pattern（通配符）和 path（单文件）两种配置方式
@@ -1753,8 +1837,8 @@ def process_all_data(cfg: Dict[str, Any], force_full_refresh: bool = False) -> t
                 # 单文件模式
                 file_incr_processor.mark_file_processed(source["path"])
     
-    # 返回MES结果和文件级增量处理器
-    return result, file_incr_processor
+    # 返回MES结果、文件级增量处理器，以及是否已增量写入历史表
+    return result, file_incr_processor, history_written
 
 
 def generate_record_hash(row: pd.Series, key_fields: List[str]) -> str:
@@ -1902,7 +1986,12 @@ def merge_with_history(new_df: pd.DataFrame, history_file: str, cfg: Dict[str, A
             
             # 去重：基于唯一键，保留最新的（如果有TrackOutTime）
             if "TrackOutTime" in combined_df.columns:
-                combined_df = combined_df.sort_values("TrackOutTime", na_position='last')
+                # 历史表回读的是ISO字符串，统一为datetime后才能排序和按键去重（与 upsert_history 一致）
+                combined_df["TrackOutTime"] = to_datetime_column(combined_df["TrackOutTime"])
+                if "EnterStepTime" in combined_df.columns:
+                    combined_df["EnterStepTime"] = to_datetime_column(combined_df["EnterStepTime"], numeric_unit=None)
+                # 稳定排序：TrackOutTime 相同时保持历史在前、新数据在后，keep='last' 保证新数据覆盖历史
+                combined_df = combined_df.sort_values("TrackOutTime", na_position='last', kind="stable")
             
             combined_df = combined_df.drop_duplicates(subset=available_key_fields, keep='last').reset_index(drop=True)
             
@@ -1925,6 +2014,164 @@ def merge_with_history(new_df: pd.DataFrame, history_file: str, cfg: Dict[str, A
         logging.error(f"合并历史数据失败: {e}，返回新数据")
         return new_df
 
+HISTORY_TABLE = "mes_batch_report_latest"
+# 增量合并依赖的索引（唯一键查找、按机台顺序定位上下批）
+HISTORY_KEY_INDEX = "ix_mes_batch_report_latest_key"
+HISTORY_SEQUENCE_INDEX = "ix_mes_batch_report_latest_machine_time"
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _ensure_history_indexes(conn, key_fields: List[str]) -> bool:
+    """
+    创建增量合并所需的索引（表被全量替换后索引随之删除，下次增量合并时重建）
+
+    首次建索引前检查 TrackOutTime 是否统一为 ISO 格式（按文本比较时间范围的前提），
+    不统一时返回 False，由调用方走一次全量合并重写历史表。
+    """
+    existing = {
+        row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ?", (HISTORY_TABLE,)
+        )
+    }
+    if HISTORY_KEY_INDEX in existing and HISTORY_SEQUENCE_INDEX in existing:
+        return True
+
+    non_iso = conn.execute(
+        f"SELECT COUNT(*) FROM {HISTORY_TABLE} "
+        "WHERE TrackOutTime IS NOT NULL AND TrackOutTime NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]T*'"
+    ).fetchone()[0]
+    if non_iso:
+        logging.warning(f"历史表有 {non_iso} 条 TrackOutTime 不是 ISO 格式，本次使用全量合并")
+        return False
+
+    key_columns = ", ".join(_quote(f) for f in key_fields)
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {HISTORY_KEY_INDEX} ON {HISTORY_TABLE} ({key_columns})")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {HISTORY_SEQUENCE_INDEX} ON {HISTORY_TABLE} (machine, TrackOutTime)")
+    logging.info(f"已创建历史表增量合并索引: {HISTORY_KEY_INDEX}, {HISTORY_SEQUENCE_INDEX}")
+    return True
+
+
+def upsert_history(new_df: pd.DataFrame, cfg: Dict[str, Any]) -> Optional[pd.DataFrame]:
+    """
+    按唯一键把新数据增量合并到SQLite历史表（只读写受影响的行）
+    
+    - 与新数据唯一键相同的历史记录被替换
+    - 只读取有新数据的机台在新数据时间范围内的记录及其前后各一批，
+      重算这些记录的 PreviousBatchEndTime，值有变化的历史记录原地更新
+    
+    Returns:
+        写入的新数据（含重算后的 PreviousBatchEndTime）；
+        历史表不存在或结构不支持增量合并时返回 None，由调用方走全量合并
+    """
+    incr_cfg = cfg.get("incremental", {})
+    key_fields = incr_cfg.get("unique_key_fields", ["BatchNumber", "Operation", "machine", "TrackOutTime"])
+    
+    db = get_default_db_manager()
+    with db.get_connection() as conn:
+        table_columns = [row[1] for row in conn.execute(f"PRAGMA table_info({HISTORY_TABLE})")]
+        if not table_columns:
+            logging.info("SQLite历史表不存在，使用全量合并")
+            return None
+        
+        missing_columns = [c for c in new_df.columns if c not in table_columns]
+        if missing_columns:
+            logging.info(f"新数据包含历史表没有的字段 {missing_columns}，使用全量合并")
+            return None
+        
+        key_fields = [f for f in key_fields if f in new_df.columns and f in table_columns]
+        if not key_fields or "machine" not in table_columns or "TrackOutTime" not in table_columns:
+            logging.info("缺少唯一键或 machine/TrackOutTime 字段，使用全量合并")
+            return None
+        
+        if not _ensure_history_indexes(conn, key_fields):
+            return None
+        
+        # 新数据：TrackOutTime/EnterStepTime 统一为 datetime，同一唯一键保留最后一条
+        new_rows = new_df.copy()
+        new_rows["TrackOutTime"] = to_datetime_column(new_rows["TrackOutTime"])
+        if "EnterStepTime" in new_rows.columns:
+            new_rows["EnterStepTime"] = to_datetime_column(new_rows["EnterStepTime"], numeric_unit=None)
+        new_rows = new_rows.drop_duplicates(subset=key_fields, keep="last")
+        
+        # 1. 删除与新数据唯一键相同的历史记录，并记下它们原来在机台序列中的位置
+        conn.execute("DROP TABLE IF EXISTS temp._mes_upsert_keys")
+        key_names = [f"k{i}" for i in range(len(key_fields))]
+        conn.execute(f"CREATE TEMP TABLE _mes_upsert_keys ({', '.join(key_names)})")
+        conn.executemany(
+            f"INSERT INTO temp._mes_upsert_keys VALUES ({', '.join('?' for _ in key_names)})",
+            to_sqlite_params(new_rows[key_fields]),
+        )
+        key_match = " AND ".join(f"h.{_quote(f)} IS k.{k}" for f, k in zip(key_fields, key_names))
+        replaced = conn.execute(
+            f"SELECT h.rowid, h.machine, h.TrackOutTime FROM temp._mes_upsert_keys k "
+            f"CROSS JOIN {HISTORY_TABLE} h ON {key_match}"
+        ).fetchall()
+        conn.executemany(f"DELETE FROM {HISTORY_TABLE} WHERE rowid = ?", [(r[0],) for r in replaced])
+        
+        # 2. 受影响的序列位置（新记录 + 被替换记录的原位置）
+        positions = pd.concat([
+            new_rows[["machine"]].assign(TrackOutTime=to_sqlite_frame(new_rows[["TrackOutTime"]])["TrackOutTime"]),
+            pd.DataFrame([r[1:] for r in replaced], columns=["machine", "TrackOutTime"]),
+        ], ignore_index=True).dropna().drop_duplicates()
+        
+        conn.execute("DROP TABLE IF EXISTS temp._mes_upsert_positions")
+        conn.execute("CREATE TEMP TABLE _mes_upsert_positions (machine, t)")
+        conn.executemany("INSERT INTO temp._mes_upsert_positions VALUES (?, ?)", to_sqlite_params(positions))
+        
+        # 3. 读取每个位置上的历史记录及其前后各一批（前一批只作为上下文，不更新）
+        # CROSS JOIN 固定以临时表为外层，逐个位置走 (machine, TrackOutTime) 索引
+        enter_col = "h.EnterStepTime" if "EnterStepTime" in table_columns else "NULL"
+        previous_col = "h.PreviousBatchEndTime" if "PreviousBatchEndTime" in table_columns else "NULL"
+        context = pd.read_sql_query(
+            f"""
+            SELECT h.rowid AS _rowid, h.machine, h.TrackOutTime, {enter_col} AS EnterStepTime,
+                   {previous_col} AS PreviousBatchEndTime, MAX(h.TrackOutTime >= w.t) AS _updatable
+            FROM temp._mes_upsert_positions w
+            CROSS JOIN {HISTORY_TABLE} h ON h.machine = w.machine
+             AND h.TrackOutTime >= COALESCE(
+                    (SELECT MAX(p.TrackOutTime) FROM {HISTORY_TABLE} p
+                     WHERE p.machine = w.machine AND p.TrackOutTime < w.t), w.t)
+             AND h.TrackOutTime <= COALESCE(
+                    (SELECT MIN(n.TrackOutTime) FROM {HISTORY_TABLE} n
+                     WHERE n.machine = w.machine AND n.TrackOutTime > w.t), w.t)
+            GROUP BY h.rowid
+            ORDER BY h.rowid
+            """,
+            conn,
+        )
+        conn.execute("DROP TABLE temp._mes_upsert_keys")
+        conn.execute("DROP TABLE temp._mes_upsert_positions")
+        
+        # 4. 在上下文中重算 PreviousBatchEndTime（历史记录在前，与全量合并的拼接顺序一致）
+        # 可更新的记录的上一批一定在上下文或新数据中，前一批本身的值不受影响
+        sequence = pd.concat([
+            context[["machine", "TrackOutTime", "EnterStepTime", "_rowid"]],
+            new_rows[["machine", "TrackOutTime", "EnterStepTime"]].assign(_rowid=-1),
+        ], ignore_index=True)
+        sequence = calculate_sequence_metrics(sequence, setup=False, previous_end=True).sort_index()
+        recomputed = to_sqlite_frame(sequence[["PreviousBatchEndTime"]])["PreviousBatchEndTime"]
+        
+        history_part = recomputed.iloc[:len(context)]
+        updatable = context["_updatable"].astype(bool).to_numpy()
+        changed = updatable & (history_part.to_numpy() != context["PreviousBatchEndTime"].to_numpy())
+        updates = list(zip(history_part[changed].tolist(), context["_rowid"][changed].tolist()))
+        if updates and "PreviousBatchEndTime" in table_columns:
+            conn.executemany(f"UPDATE {HISTORY_TABLE} SET PreviousBatchEndTime = ? WHERE rowid = ?", updates)
+        
+        # 5. 写入新数据
+        new_rows["PreviousBatchEndTime"] = sequence["PreviousBatchEndTime"].iloc[len(context):].to_numpy()
+        to_sqlite_frame(new_rows).to_sql(HISTORY_TABLE, conn, if_exists="append", index=False)
+    
+    logging.info(
+        f"增量合并历史数据完成：写入 {len(new_rows)} 行（替换历史记录 {len(replaced)} 行），"
+        f"读取上下文 {len(context)} 行（{len(positions)} 个序列位置），更新 PreviousBatchEndTime {len(updates)} 行"
+    )
+    return new_rows
+
+
 def should_do_full_refresh(cfg: Dict[str, Any], state_file: str) -> bool:
     """判断是否应该执行全量刷新"""
     incr_cfg = cfg.get("incremental", {})
@@ -1976,7 +2223,7 @@ if __name__ == "__main__":
     t0 = time.time()
     try:
         # 处理MES数据
-        mes_result_df, file_incr_processor = process_all_data(cfg, force_full_refresh=force_full_refresh)
+        mes_result_df, file_incr_processor, history_written = process_all_data(cfg, force_full_refresh=force_full_refresh)
         
         if mes_result_df.empty:
             logging.info("没有新数据需要处理，保持现有数据不变")
@@ -2020,10 +2267,15 @@ if __name__ == "__main__":
             # 写入SQLite数据库（供后续统一导出Parquet使用）
             # ============================================================
             try:
-                logging.info("开始写入数据库...")
                 db = get_default_db_manager()
-                inserted_count = db.bulk_insert(mes_result_df, 'mes_batch_report_latest', if_exists='replace')
-                logging.info(f"数据库写入完成: 共 {inserted_count} 条记录")
+                if history_written:
+                    # 已在增量合并时按唯一键写入
+                    inserted_count = len(mes_result_df)
+                    logging.info(f"数据库已增量写入: 共 {inserted_count} 条记录")
+                else:
+                    logging.info("开始写入数据库...")
+                    inserted_count = db.bulk_insert(mes_result_df, 'mes_batch_report_latest', if_exists='replace')
+                    logging.info(f"数据库写入完成: 共 {inserted_count} 条记录")
 
                 db.log_etl_run(
                     etl_name='mes_batch_report',
@@ -25,8 +25,10 @@ from shared_infrastructure.utils.etl_utils import (
     setup_logging,
     load_config,
     read_sharepoint_excel,
+    iter_sharepoint_excel_chunks,
 )
 from shared_infrastructure.utils.db_sqlserver_only import SQLServerOnlyManager
+from shared_infrastructure.utils.record_dedup import RecordKeyFilter, make_record_filter
 
 # 配置
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -545,6 +547,54 @@ def save_to_database(df: pd.DataFrame, table_name: str = "raw_mes") -> Dict[str,
     return {"inserted": inserted, "updated": 0, "skipped": skipped}
 
 
+def load_mes_frame(
+    df: pd.DataFrame,
+    factory_id: str,
+    factory_name: str,
+    file_path: str,
+    factory_name_from_plant: bool,
+    seen: RecordKeyFilter,
+) -> Optional[Dict[str, int]]:
+    """
+    清洗一个 DataFrame（整个文件或流式读取的一块）并写入 raw_mes
+
+    Returns:
+        写入统计；清洗后无有效数据时返回 None
+    """
+    df["factory_source"] = factory_id
+    df["factory_name"] = factory_name
+    df["source_file"] = file_path
+
+    df_clean = clean_mes_data(df)
+    if df_clean.empty:
+        return None
+
+    # factory_name: replace the prefix (e.g. 工厂1) with per-row Plant value
+    if factory_name_from_plant and "Plant" in df_clean.columns:
+        plant_s = df_clean["Plant"].where(df_clean["Plant"].notna(), None)
+        plant_s = plant_s.apply(lambda x: None if x is None else str(x).strip())
+        plant_s = plant_s.apply(lambda x: None if (x is None or x == '' or x.lower() == 'nan') else x)
+        if "factory_name" in df_clean.columns:
+            df_clean.loc[plant_s.notna(), "factory_name"] = plant_s[plant_s.notna()] + f"-{factory_id}"
+        else:
+            df_clean["factory_name"] = plant_s.where(plant_s.notna(), None)
+            df_clean.loc[plant_s.notna(), "factory_name"] = df_clean.loc[plant_s.notna(), "factory_name"] + f"-{factory_id}"
+
+    has_key = "record_hash" in df_clean.columns
+    if has_key:
+        keep = seen.new_mask(df_clean["record_hash"])
+        removed = int(len(keep) - keep.sum())
+        df_clean = df_clean[keep]
+        if removed > 0:
+            logging.info(f"  本次运行跨文件去重: 移除 {removed} 条")
+
+    stats = save_to_database(df_clean, "raw_mes")
+    # 写库成功后才记录键：失败的块不会让后续文件中的同一批记录被丢弃
+    if has_key:
+        seen.add(df_clean["record_hash"])
+    return stats
+
+
 def main(
     test_mode: bool = False,
     max_files: int = 3,
@@ -555,6 +605,7 @@ def main(
     only_factory: Optional[str] = None,
     only_file: Optional[str] = None,
     refresh: bool = False,
+    chunk_rows: Optional[int] = None,
 ):
     """主函数"""
     logging.info("=" * 60)
@@ -576,6 +627,9 @@ def main(
             return
 
         factory_name_from_plant = bool(cfg.get("runtime", {}).get("factory_name_from_plant", True))
+        # 流式分块读取的行数（0 = 整个文件一次读入）
+        if chunk_rows is None:
+            chunk_rows = int(cfg.get("runtime", {}).get("stream_chunk_rows", 0) or 0)
         
         # 3. 获取待处理文件清单（逐文件处理）
         tasks = get_mes_file_tasks(
@@ -592,69 +646,68 @@ def main(
             logging.info("没有新数据需要处理")
             return
 
-        # 用于跨文件去重（仅本次运行内）
-        seen_hashes = set()
+        # 用于跨文件去重（仅本次运行内）；bloom 命中的键查询 raw_mes 确认
+        seen = make_record_filter(
+            exact_check=lambda keys: get_db_manager().get_existing_hashes("raw_mes", "record_hash", hashes=keys)
+        )
 
         total_read = 0
         total_inserted = 0
         total_skipped = 0
 
-        for t in tasks:
-            factory_id = t["factory_id"]
-            factory_name = t["factory_name"]
-            file_path = t["file_path"]
-
-            if refresh:
-                deleted = delete_existing_for_source_file(file_path, "raw_mes")
-                logging.info(f"刷新模式：已删除 raw_mes 中 source_file={os.path.basename(file_path)} 的 {deleted} 行")
-
-            logging.info(f"读取: {os.path.basename(file_path)}")
-            rows_limit = max_rows if test_mode else (max_rows_per_file if max_rows_per_file and max_rows_per_file > 0 else None)
-            df = read_sharepoint_excel(file_path, max_rows=rows_limit)
-
-            if df.empty:
-                logging.warning(f"文件无数据，跳过: {file_path}")
-                continue
-
-            df["factory_source"] = factory_id
-            df["factory_name"] = factory_name
-            df["source_file"] = file_path
-
-            total_read += len(df)
-            logging.info(f"  成功读取 {len(df)} 行")
-
-            df_clean = clean_mes_data(df)
-            if df_clean.empty:
-                logging.warning(f"清洗后无有效数据，跳过: {file_path}")
-                continue
-
-            # factory_name: replace the prefix (e.g. 工厂1) with per-row Plant value
-            if factory_name_from_plant and "Plant" in df_clean.columns:
-                plant_s = df_clean["Plant"].where(df_clean["Plant"].notna(), None)
-                plant_s = plant_s.apply(lambda x: None if x is None else str(x).strip())
-                plant_s = plant_s.apply(lambda x: None if (x is None or x == '' or x.lower() == 'nan') else x)
-                if "factory_name" in df_clean.columns:
-                    df_clean.loc[plant_s.notna(), "factory_name"] = plant_s[plant_s.notna()] + f"-{factory_id}"
+        # 已成功处理的文件 {etl_name: [file_path]}
+        processed_files: Dict[str, List[str]] = {}
+
+        try:
+            for t in tasks:
+                factory_id = t["factory_id"]
+                factory_name = t["factory_name"]
+                file_path = t["file_path"]
+
+                if refresh:
+                    deleted = delete_existing_for_source_file(file_path, "raw_mes")
+                    logging.info(f"刷新模式：已删除 raw_mes 中 source_file={os.path.basename(file_path)} 的 {deleted} 行")
+
+                logging.info(f"读取: {os.path.basename(file_path)}")
+                rows_limit = max_rows if test_mode else (max_rows_per_file if max_rows_per_file and max_rows_per_file > 0 else None)
+                if chunk_rows:
+                    # 流式分块读取：每块独立清洗、去重、入库，内存与文件大小无关
+                    frames = iter_sharepoint_excel_chunks(file_path, chunk_rows=chunk_rows, max_rows=rows_limit)
                 else:
-                    df_clean["factory_name"] = plant_s.where(plant_s.notna(), None)
-                    df_clean.loc[plant_s.notna(), "factory_name"] = df_clean.loc[plant_s.notna(), "factory_name"] + f"-{factory_id}"
-
-            if "record_hash" in df_clean.columns:
-                before = len(df_clean)
-                df_clean = df_clean[~df_clean["record_hash"].isin(seen_hashes)]
-                for h in df_clean["record_hash"].dropna().astype(str).tolist():
-                    seen_hashes.add(h)
-                removed = before - len(df_clean)
-                if removed > 0:
-                    logging.info(f"  本次运行跨文件去重: 移除 {removed} 条")
-
-            stats = save_to_database(df_clean, "raw_mes")
-            total_inserted += stats["inserted"]
-            total_skipped += stats["skipped"]
-
-            # 处理成功后标记文件已处理（用于增量）
+                    frames = [read_sharepoint_excel(file_path, max_rows=rows_limit)]
+
+                file_rows = 0
+                saved = False
+                for df in frames:
+                    if df.empty:
+                        continue
+                    file_rows += len(df)
+                    total_read += len(df)
+                    logging.info(f"  成功读取 {len(df)} 行")
+
+                    stats = load_mes_frame(
+                        df, factory_id, factory_name, file_path, factory_name_from_plant, seen
+                    )
+                    if stats is None:
+                        continue
+                    saved = True
+                    total_inserted += stats["inserted"]
+                    total_skipped += stats["skipped"]
+
+                if file_rows == 0:
+                    logging.warning(f"文件无数据，跳过: {file_path}")
+                    continue
+                if not saved:
+                    logging.warning(f"清洗后无有效数据，跳过: {file_path}")
+                    continue
+
+                # 处理成功后记录，循环结束后按工厂批量标记（用于增量）
+                processed_files.setdefault(f"mes_raw_{factory_id}", []).append(file_path)
+        finally:
+            # 中途失败时也保留已成功文件的状态，一次 MERGE 写入
             db = get_db_manager()
-            db.mark_file_processed(f"mes_raw_{factory_id}", file_path)
+            for etl_name, paths in processed_files.items():
+                db.mark_files_processed(etl_name, paths)
 
         logging.info(f"写入完成: 读取 {total_read} 行, 插入 {total_inserted} 条, 跳过 {total_skipped} 条")
         
@@ -684,6 +737,7 @@ if __name__ == "__main__":
     parser.add_argument('--only-factory', type=str, default=None, help='仅处理指定工厂（CZM/CKH）')
     parser.add_argument('--only-file', type=str, default=None, help='仅处理文件名包含该字符串的文件（例如 CMES_Product_Output_CZM_202601）')
     parser.add_argument('--refresh', action='store_true', help='刷新模式：导入前先删除该文件对应的历史数据（按 source_file 精确匹配）')
+    parser.add_argument('--chunk-rows', type=int, default=None, help='流式分块读取每块行数（0=整个文件一次读入，默认取配置 runtime.stream_chunk_rows）')
     args = parser.parse_args()
     
     main(
@@ -696,4 +750,5 @@ if __name__ == "__main__":
         only_factory=args.only_factory,
         only_file=args.only_file,
         refresh=args.refresh,
+        chunk_rows=args.chunk_rows,
     )
@@ -36,6 +36,7 @@ from shared_infrastructure.utils.etl_utils import (
     update_etl_state,
 )
 from shared_infrastructure.utils.db_sqlserver_only import SQLServerOnlyManager
+from shared_infrastructure.utils.schema_catalog import get_table_schema, invalidate_table_schema
 
 # 配置路径
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -86,30 +87,13 @@ def init_database():
 
 
 def _sqlserver_table_has_column(conn, table_name: str, column_name: str, schema: str = "dbo") -> bool:
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT 1
-        FROM INFORMATION_SCHEMA.COLUMNS
-        WHERE TABLE_SCHEMA = ? AND TABLE_NAME = ? AND COLUMN_NAME = ?
-        """,
-        (schema, table_name, column_name),
-    )
-    return cur.fetchone() is not None
+    table_schema = get_table_schema(conn, table_name, schema=schema)
+    return table_schema is not None and table_schema.has_column(column_name)
 
 
 def _get_sqlserver_columns(conn, table_name: str, schema: str = "dbo") -> List[str]:
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT COLUMN_NAME
-        FROM INFORMATION_SCHEMA.COLUMNS
-        WHERE TABLE_SCHEMA = ? AND TABLE_NAME = ?
-        ORDER BY ORDINAL_POSITION
-        """,
-        (schema, table_name),
-    )
-    return [str(r[0]) for r in cur.fetchall() if r and r[0]]
+    table_schema = get_table_schema(conn, table_name, schema=schema)
+    return table_schema.column_names() if table_schema else []
 
 
 def _ensure_planner_sqlserver_columns(conn) -> None:
@@ -134,6 +118,7 @@ def _ensure_planner_sqlserver_columns(conn) -> None:
 
     if ddl:
         conn.commit()
+        invalidate_table_schema("planner_tasks", schema="dbo")
 
 
 def _create_temp_table_for_planner_tasks(cur, temp_name: str = "#PlannerTasks") -> None:
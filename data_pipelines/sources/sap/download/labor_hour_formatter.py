@@ -43,6 +43,7 @@ def get_etl_config_path() -> Path:
     return PROJECT_ROOT / "data_pipelines" / "sources" / "sap" / "config" / "config_sap_labor.yaml"
 
 from shared_infrastructure.env_utils import load_yaml_with_env
+from shared_infrastructure.export_utils import month_where_clause
 
 # Output Directory for Parquet
 A1_OUTPUT_DIR = Path(
@@ -393,14 +394,16 @@ def export_parquet_by_months(db, df: pd.DataFrame):
                 target_file = target_dir / f"sap_labor_hours_{file_ym_suffix}.parquet"
                 
                 # Query full data for this month from SQL (Partition Reconciliation)
-                sql = """
+                # 日期类型的 PostingDate 用半开区间过滤，可走索引
+                month_where, month_params = month_where_clause(conn, "raw_sap_labor_hours", "PostingDate", ym)
+                sql = f"""
                 SELECT * 
                 FROM dbo.raw_sap_labor_hours 
-                WHERE CONVERT(char(7), TRY_CONVERT(date, [PostingDate]), 120) = ?
+                WHERE {month_where}
                 """
                 
                 # Use pandas read_sql
-                month_df = pd.read_sql_query(sql, conn, params=(ym,))
+                month_df = pd.read_sql_query(sql, conn, params=month_params)
                 
                 if month_df.empty:
                     logger.warning(f"  [Skip] No data found in DB for {ym}")
@@ -11,7 +11,7 @@ import glob
 import hashlib
 import threading
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional, List, Set
+from typing import Dict, Any, Iterable, Optional, List, Set
 import re
 import warnings
 warnings.filterwarnings('ignore')
@@ -25,6 +25,7 @@ except ImportError:
     HAS_MSVCRT = False
 
 import pandas as pd
+import numpy as np
 import yaml
 
 try:
@@ -57,6 +58,8 @@ from shared_infrastructure.utils.path_resolver import (
     get_path_resolver
 )
 from shared_infrastructure.utils.db_utils import get_default_db_manager
+from shared_infrastructure.utils.work_calendar import WorkCalendar, get_work_calendar
+from shared_infrastructure.utils.sequence_metrics import calculate_sequence_metrics
 
 # 获取路径解析器
 resolver = get_path_resolver()
@@ -666,87 +669,19 @@ def calculate_sfc_pt(row: pd.Series) -> Optional[float]:
     return round(total_hours / 24, 2)
 
 
-def get_weekend_period(date: datetime) -> tuple:
-    """
-    获取指定日期所在周的周末区间（周六8:00到周一8:00）
-    返回: (saturday_8am, monday_8am)
-    """
-    weekday = date.weekday()  # Monday=0, Sunday=6
-    
-    # 找到本周六8点
-    if weekday == 5:  # Saturday
-        if date.hour >= 8:
-            # 如果已经是周六8点之后，使用本周六8点
-            saturday_8am = date.replace(hour=8, minute=0, second=0, microsecond=0)
-        else:
-            # 周六8点之前，使用上周六8点
-            saturday_8am = date.replace(hour=8, minute=0, second=0, microsecond=0) - timedelta(days=7)
-    elif weekday == 6:  # Sunday
-        saturday_8am = date.replace(hour=8, minute=0, second=0, microsecond=0) - timedelta(days=1)
-    elif weekday == 0:  # Monday
-        if date.hour < 8:
-            saturday_8am = date.replace(hour=8, minute=0, second=0, microsecond=0) - timedelta(days=2)
-        else:
-            saturday_8am = date.replace(hour=8, minute=0, second=0, microsecond=0) + timedelta(days=5)
-    else:  # Tuesday to Friday
-        days_to_saturday = 5 - weekday
-        saturday_8am = date.replace(hour=8, minute=0, second=0, microsecond=0) + timedelta(days=days_to_saturday)
-        # 如果还没到本周六，使用上周六
-        if saturday_8am > date:
-            saturday_8am = saturday_8am - timedelta(days=7)
-    
-    monday_8am = saturday_8am + timedelta(days=2)
-    return saturday_8am, monday_8am
+# 周末定义：周六8:00到周一8:00（即周六、周日两个工作时段）；配置 source.calendar_file 时按日历表判断
+_WEEKEND_CALENDAR = WorkCalendar.weekdays_only()
 
 
-def calculate_weekend_hours(start: datetime, end: datetime) -> float:
+def calculate_weekend_hours(start: datetime, end: datetime, calendar: Optional[WorkCalendar] = None) -> float:
     """
-    计算从start到end之间的周末小时数
+    计算从start到end之间的周末（非工作时段）小时数
     周末定义：周六8:00到周一8:00之间的所有时间（48小时）
     """
     if end <= start:
         return 0.0
-    
-    total_hours = 0.0
-    
-    # 找到start和end之间的所有周末区间
-    current_start = start
-    processed_weekends = set()  # 记录已处理的周末区间（用周六8点作为key）
-    
-    while current_start < end:
-        # 获取当前时间所在周的周末区间
-        saturday_8am, monday_8am = get_weekend_period(current_start)
-        
-        # 避免重复处理同一个周末区间
-        weekend_key = saturday_8am
-        if weekend_key in processed_weekends:
-            # 已经处理过这个周末，跳到下个周一8点
-            current_start = monday_8am
-            continue
-        
-        processed_weekends.add(weekend_key)
-        
-        # 计算周末区间与[start, end]的重叠部分
-        overlap_start = max(current_start, saturday_8am)
-        overlap_end = min(end, monday_8am)
-        
-        if overlap_start < overlap_end:
-            # 有重叠，计算重叠小时数
-            hours = (overlap_end - overlap_start).total_seconds() / 3600
-            total_hours += hours
-        
-        # 移动到下一个可能的周末区间
-        if current_start < monday_8am:
-            current_start = monday_8am
-        else:
-            # 找到下一个周末区间
-            next_saturday = saturday_8am + timedelta(days=7)
-            if next_saturday < end:
-                current_start = next_saturday
-            else:
-                break
-    
-    return round(total_hours, 2)
+    calendar = calendar or _WEEKEND_CALENDAR
+    return round(float(calendar.nonworking_hours_between(start, end)[0]), 2)
 
 
 def calculate_sfc_st(row: pd.Series) -> Optional[float]:
@@ -837,44 +772,22 @@ def calculate_sfc_due_time(row: pd.Series) -> Optional[datetime]:
     return due_final
 
 
-def adjust_weekend_sfc(start: datetime, due: datetime) -> datetime:
+def adjust_weekend_sfc(start: datetime, due: datetime, calendar: Optional[WorkCalendar] = None) -> datetime:
     """
     调整周末，顺延到工作日（SFC版本）
     周末定义：周六8:00到周一8:00之间的所有时间
-    如果截止时间落在周末，顺延到周一8:00
+    如果截止时间落在周末，顺延到周一8:00（下一个工作时段的开始）
     """
     if due <= start:
         return due
+    calendar = calendar or _WEEKEND_CALENDAR
     
     # 计算从start到due之间的周末小时数
-    weekend_hours = calculate_weekend_hours(start, due)
-    
-    # 检查due是否落在周末区间内
-    weekday = due.weekday()  # Monday=0, Sunday=6
-    due_hour = due.hour
-    
-    # 判断是否在周末区间：周六8点之后，或周日，或周一8点之前
-    is_in_weekend = False
-    if weekday == 5 and due_hour >= 8:  # 周六8点及以后
-        is_in_weekend = True
-    elif weekday == 6:  # 周日全天
-        is_in_weekend = True
-    elif weekday == 0 and due_hour < 8:  # 周一8点之前
-        is_in_weekend = True
-    
-    # 如果落在周末区间，顺延到周一8点
-    if is_in_weekend:
-        # 找到下一个周一8点
-        if weekday == 5:  # 周六
-            days_to_monday = 2
-        elif weekday == 6:  # 周日
-            days_to_monday = 1
-        else:  # 周一（但还没到8点）
-            days_to_monday = 7  # 下周一
-        
-        next_monday = (due.replace(hour=8, minute=0, second=0, microsecond=0) + 
-                      timedelta(days=days_to_monday))
-        return next_monday
+    weekend_hours = calculate_weekend_hours(start, due, calendar)
+    
+    # 落在周末区间（所属工作时段为非工作日），顺延到下一个工作时段的8点
+    if not calendar.is_workday(due - timedelta(hours=8))[0]:
+        return pd.Timestamp(calendar.next_workday_start(due)[0])
     
     # 如果不在周末区间，直接加上周末小时数
     return due + timedelta(hours=weekend_hours)
@@ -927,6 +840,96 @@ def calculate_sfc_weekend_days(row: pd.Series) -> Optional[float]:
     return round(weekend_hours / 24, 2)
 
 
+def _column(df: pd.DataFrame, name: str, default: Any = None) -> pd.Series:
+    """取列，缺失时返回默认值列（对应 row.get(name, default)）"""
+    if name in df.columns:
+        return df[name]
+    return pd.Series([default] * len(df), index=df.index, dtype=object)
+
+
+def _or_default(values: pd.Series, default: Any) -> pd.Series:
+    """向量化的 `value or default`：None/0/False/'' 取默认值，NaN/NaT 保留"""
+    if values.dtype.kind in "biuf":
+        return values.where(values != 0, default)
+    if values.dtype.kind == "M":
+        return values
+    return values.map(lambda v: v or default)
+
+
+def _sfc_due_base(df: pd.DataFrame) -> tuple:
+    """
+    整列计算 DueTime/Weekend(d) 的公共部分
+    返回 (开始时间, 未调整周末的截止时间 due0, 可计算的行掩码)
+    """
+    # SFC数据可能没有TrackInTime，使用Checkin_SFC作为开始时间
+    # 对应 `TrackInTime or Checkin_SFC`：只有 None/空字符串等假值才回退，NaN/NaT 不回退
+    trackin = _column(df, "TrackInTime")
+    start_time = trackin.where(trackin.map(bool).astype(bool), _column(df, "Checkin_SFC"))
+    start_dt = pd.to_datetime(start_time)
+    
+    setup_value = _column(df, "Setup Time (h)")
+    use_setup = (_column(df, "Setup") == "Yes") & setup_value.notna()
+    setup_time = pd.to_numeric(_or_default(setup_value, 0).where(use_setup, 0), errors='coerce')
+    
+    # 获取单件时间（秒），优先使用EH_machine(s)，否则使用EH_labor(s)
+    machine_time_s = pd.to_numeric(_column(df, "EH_machine(s)"), errors='coerce')
+    labor_time_s = pd.to_numeric(_column(df, "EH_labor(s)"), errors='coerce')
+    use_machine = machine_time_s.notna() & (machine_time_s > 0)
+    use_labor = ~use_machine & labor_time_s.notna() & (labor_time_s > 0)
+    unit_time_h = machine_time_s.where(use_machine, labor_time_s) / 3600
+    
+    # 使用TrackOutQuantity + ScrapQuantity
+    trackout_qty = pd.to_numeric(_or_default(_column(df, "TrackOutQuantity", 0), 0), errors='coerce')
+    scrap_qty = pd.to_numeric(_or_default(_column(df, "ScrapQuantity", 0), 0), errors='coerce')
+    qty = trackout_qty + scrap_qty
+    oee = pd.to_numeric(_or_default(_column(df, "OEE", 0.77), 0.77), errors='coerce')
+    
+    total_hours = (setup_time + unit_time_h * qty / oee + 0.5).to_numpy(dtype=np.float64)
+    valid = (start_dt.notna() & (use_machine | use_labor)).to_numpy() & np.isfinite(total_hours)
+    
+    start_values = start_dt.to_numpy(dtype='datetime64[ns]')
+    due0 = np.full(len(df), np.datetime64('NaT'), dtype='datetime64[ns]')
+    if valid.any():
+        # timedelta(hours=x) 逐个构造，保持与逐行计算相同的微秒舍入
+        offsets = [timedelta(hours=h) for h in total_hours[valid].tolist()]
+        due0[valid] = start_values[valid] + np.array(offsets, dtype='timedelta64[us]').astype('timedelta64[ns]')
+    return start_values, due0, valid
+
+
+def calculate_sfc_due_time_column(df: pd.DataFrame, calendar: WorkCalendar) -> pd.Series:
+    """整列计算SFC的DueTime（与 calculate_sfc_due_time 逐行结果一致）"""
+    start, due0, valid = _sfc_due_base(df)
+    due = np.full(len(df), np.datetime64('NaT'), dtype='datetime64[ns]')
+    if not valid.any():
+        return pd.Series([None] * len(df), index=df.index, dtype=object)
+    
+    start, due0 = start[valid], due0[valid]
+    weekend_hours = np.array(
+        [round(h, 2) for h in calendar.nonworking_hours_between(start, due0).tolist()], dtype=np.float64
+    )
+    adjusted = due0 + np.array([timedelta(hours=h) for h in weekend_hours.tolist()], dtype='timedelta64[us]').astype('timedelta64[ns]')
+    # 截止时间落在周末（非工作时段）：顺延到下一个工作时段的8点
+    in_weekend = ~calendar.is_workday(due0 - np.timedelta64(8, 'h'))
+    if in_weekend.any():
+        adjusted[in_weekend] = calendar.next_workday_start(due0[in_weekend])
+    # 截止时间不晚于开始时间时不调整
+    not_after = due0 <= start
+    adjusted[not_after] = due0[not_after]
+    due[valid] = adjusted
+    return pd.Series(due, index=df.index)
+
+
+def calculate_sfc_weekend_days_column(df: pd.DataFrame, calendar: WorkCalendar) -> pd.Series:
+    """整列计算SFC的Weekend(d)（与 calculate_sfc_weekend_days 逐行结果一致）"""
+    start, due0, valid = _sfc_due_base(df)
+    days = np.full(len(df), np.nan)
+    if valid.any():
+        hours = calendar.nonworking_hours_between(start[valid], due0[valid])
+        # Python round 与 np.round 的舍入方式不同，逐个调用保持一致
+        days[valid] = [round(round(h, 2) / 24, 2) for h in hours.tolist()]
+    return pd.Series(days, index=df.index)
+
+
 def calculate_sfc_completion_status(row: pd.Series) -> Optional[str]:
     """
     计算SFC的CompletionStatus（基于PT和ST比较，与MES保持一致）
@@ -1007,7 +1010,7 @@ def extract_machine_number_sfc(machine: Any) -> Optional[int]:
     return None
 
 
-def calculate_previous_batch_end_time(df: pd.DataFrame) -> pd.DataFrame:
+def calculate_previous_batch_end_time(df: pd.DataFrame, changed_machines: Optional[Iterable[Any]] = None) -> pd.DataFrame:
     """
     计算上批结束时间（PreviousBatchEndTime）
     
@@ -1017,6 +1020,9 @@ def calculate_previous_batch_end_time(df: pd.DataFrame) -> pd.DataFrame:
     - 使用 shift(1) 获取上一批的 TrackOutTime
     - 对于第一批（PreviousBatchEndTime 为空），使用 EnterStepTime 代替
     
+    增量模式：传入 changed_machines（本次有新数据的机台）时只重算这些机台，
+    其余机台沿用已有的 PreviousBatchEndTime
+    
     注意：此函数应在所有数据合并完成后调用，确保排序准确
     """
     if df.empty:
@@ -1029,68 +1035,43 @@ def calculate_previous_batch_end_time(df: pd.DataFrame) -> pd.DataFrame:
         df["PreviousBatchEndTime"] = None
         return df
     
-    result = df.copy()
-    
     # 确保machine字段存在（如果不存在，创建为None）
-    if "machine" not in result.columns:
+    if "machine" not in df.columns:
         logging.warning("缺少machine字段，无法按machine分组计算 PreviousBatchEndTime")
+        result = df.copy()
         result["PreviousBatchEndTime"] = None
         return result
     
     # 检查machine字段是否有有效值
-    valid_machine_count = result["machine"].notna().sum()
+    valid_machine_count = df["machine"].notna().sum()
     if valid_machine_count == 0:
         logging.warning("machine字段全部为空，无法计算 PreviousBatchEndTime")
+        result = df.copy()
         result["PreviousBatchEndTime"] = None
         return result
     
-    logging.info(f"开始计算 PreviousBatchEndTime：有效machine记录 {valid_machine_count} 条，总计 {len(result)} 条")
+    logging.info(f"开始计算 PreviousBatchEndTime：有效machine记录 {valid_machine_count} 条，总计 {len(df)} 条")
     
-    # 按 machine 分组，按 TrackOutTime 升序排序（最早的在前）
-    # 对于 machine 为空或 TrackOutTime 为空的记录，先处理
-    result = result.sort_values(
-        ["machine", "TrackOutTime"],
-        na_position='last',  # 空值排在最后
-        ascending=[True, True]  # machine 和 TrackOutTime 都升序
-    )
-    
-    # 使用 shift(1) 获取上一批的 TrackOutTime
-    # 只对machine不为空的记录进行分组计算
-    result["PreviousBatchEndTime"] = None
-    
-    # 只对machine不为空的记录进行分组计算
-    mask_valid = result["machine"].notna() & result["TrackOutTime"].notna()
-    if mask_valid.any():
-        # 对有效记录进行分组计算
-        result.loc[mask_valid, "PreviousBatchEndTime"] = (
-            result[mask_valid].groupby("machine")["TrackOutTime"].shift(1)
-        )
-        
-        # 对于第一批（PreviousBatchEndTime 为空），使用 EnterStepTime 代替
-        mask_first_batch = mask_valid & result["PreviousBatchEndTime"].isna()
-        if "EnterStepTime" in result.columns and mask_first_batch.any():
-            result.loc[mask_first_batch, "PreviousBatchEndTime"] = result.loc[mask_first_batch, "EnterStepTime"]
-    
-    # 将NaT转换为None（确保datetime类型的空值正确处理）
-    # 对于datetime类型的列，NaT（Not a Time）需要转换为None才能正确保存为null
-    if "PreviousBatchEndTime" in result.columns:
-        # 先转换为object类型，然后替换NaT为None
-        if pd.api.types.is_datetime64_any_dtype(result["PreviousBatchEndTime"]):
-            result["PreviousBatchEndTime"] = result["PreviousBatchEndTime"].astype(object)
-            result["PreviousBatchEndTime"] = result["PreviousBatchEndTime"].apply(lambda x: None if pd.isna(x) else x)
-        elif result["PreviousBatchEndTime"].dtype == 'object':
-            # 如果已经是object类型，直接替换NaT为None
-            result["PreviousBatchEndTime"] = result["PreviousBatchEndTime"].apply(lambda x: None if pd.isna(x) else x)
+    # 按 machine + TrackOutTime 升序一次排序，组内上一批的 TrackOutTime 即为上批结束时间
+    result = calculate_sequence_metrics(df, setup=False, previous_end=True, changed_machines=changed_machines)
     
     # 统计计算结果
+    mask_valid = result["machine"].notna() & result["TrackOutTime"].notna()
     total_count = len(result)
-    calculated_count = result["PreviousBatchEndTime"].notna().sum() if "PreviousBatchEndTime" in result.columns else 0
-    valid_calculated = (mask_valid & result["PreviousBatchEndTime"].notna()).sum() if mask_valid.any() and "PreviousBatchEndTime" in result.columns else 0
+    calculated_count = result["PreviousBatchEndTime"].notna().sum()
+    valid_calculated = (mask_valid & result["PreviousBatchEndTime"].notna()).sum()
     logging.info(f"计算 PreviousBatchEndTime 完成：总计 {total_count} 条，成功计算 {calculated_count} 条（其中有效machine记录 {valid_calculated} 条）")
     
+    # 保持 datetime64 类型：NaT 在写入 SQLite / Parquet 时保存为 null
     return result
 
 
+def _collect_machines(df: pd.DataFrame, changed_machines: Optional[Set[Any]]) -> None:
+    """记录本次有新数据的机台（用于增量重算 PreviousBatchEndTime）"""
+    if changed_machines is not None and "machine" in df.columns:
+        changed_machines.update(df["machine"].dropna().unique().tolist())
+
+
 def calculate_sfc_metrics(df: pd.DataFrame, cfg: Dict[str, Any]) -> pd.DataFrame:
     """
     计算SFC数据的所有指标字段
@@ -1127,9 +1108,11 @@ def calculate_sfc_metrics(df: pd.DataFrame, cfg: Dict[str, Any]) -> pd.DataFrame
     # 5. 计算ST(d)
     result["ST(d)"] = result.apply(calculate_sfc_st, axis=1)
     
-    # 6. 计算DueTime和Weekend(d)
-    result["DueTime"] = result.apply(calculate_sfc_due_time, axis=1)
-    result["Weekend(d)"] = result.apply(calculate_sfc_weekend_days, axis=1)
+    # 6. 计算DueTime和Weekend(d)（共享工作日历，整列计算；未配置日历表时按周六8:00到周一8:00为周末）
+    calendar_file = cfg.get("source", {}).get("calendar_file", "")
+    work_calendar = get_work_calendar(calendar_file=calendar_file) if calendar_file else _WEEKEND_CALENDAR
+    result["DueTime"] = calculate_sfc_due_time_column(result, work_calendar)
+    result["Weekend(d)"] = calculate_sfc_weekend_days_column(result, work_calendar)
     
     # 7. 计算CompletionStatus（基于PT和ST比较，不使用DueTime）
     result["CompletionStatus"] = result.apply(calculate_sfc_completion_status, axis=1)
@@ -1711,8 +1694,17 @@ def should_do_full_refresh(cfg: Dict[str, Any], conn) -> bool:
     return False
 
 
-def process_all_sfc_data(cfg: Dict[str, Any], force_full_refresh: bool = False) -> pd.DataFrame:
-    """处理所有SFC数据的主函数（增量处理）"""
+def process_all_sfc_data(
+    cfg: Dict[str, Any],
+    force_full_refresh: bool = False,
+    changed_machines: Optional[Set[Any]] = None,
+) -> pd.DataFrame:
+    """
+    处理所有SFC数据的主函数（增量处理）
+    
+    Args:
+        changed_machines: 传入集合时，收集本次计算了新数据的机台
+    """
     # 读取SFC数据（支持通配符）
     sfc_path = cfg.get("source", {}).get("sfc_path", "")
     if not sfc_path:
@@ -1827,6 +1819,7 @@ def process_all_sfc_data(cfg: Dict[str, Any], force_full_refresh: bool = False)
                         
                         # 计算指标（LT, PT, ST, DueTime等）
                         df = calculate_sfc_metrics(df, cfg)
+                        _collect_machines(df, changed_machines)
                         
                         # 立即与历史数据合并
                         sfc_df = merge_with_history(df, "", cfg)
@@ -1841,6 +1834,7 @@ def process_all_sfc_data(cfg: Dict[str, Any], force_full_refresh: bool = False)
                         
                         # 计算指标（LT, PT, ST, DueTime等）
                         df = calculate_sfc_metrics(df, cfg)
+                        _collect_machines(df, changed_machines)
                         
                         # 合并历史数据
                         sfc_df = merge_with_history(df, "", cfg)
@@ -1902,6 +1896,7 @@ def process_all_sfc_data(cfg: Dict[str, Any], force_full_refresh: bool = False)
                 
                 # 计算指标（LT, PT, ST, DueTime等）
                 sfc_df = calculate_sfc_metrics(sfc_df, cfg)
+                _collect_machines(sfc_df, changed_machines)
             
             # 合并历史数据
             sfc_df = merge_with_history(sfc_df, "", cfg)
@@ -1912,6 +1907,7 @@ def process_all_sfc_data(cfg: Dict[str, Any], force_full_refresh: bool = False)
             
             # 计算指标（LT, PT, ST, DueTime等）
             sfc_df = calculate_sfc_metrics(sfc_df, cfg)
+            _collect_machines(sfc_df, changed_machines)
             
             # 合并历史数据
             sfc_df = merge_with_history(sfc_df, "", cfg)
@@ -1938,15 +1934,19 @@ if __name__ == "__main__":
     t0 = time.time()
     try:
         # 处理SFC数据
-        sfc_result_df = process_all_sfc_data(cfg, force_full_refresh=force_full_refresh)
+        changed_machines: Set[Any] = set()
+        sfc_result_df = process_all_sfc_data(cfg, force_full_refresh=force_full_refresh, changed_machines=changed_machines)
         
         if sfc_result_df.empty:
             logging.info("没有新数据需要处理，保持现有数据不变")
         else:
             # 在最终保存前，对所有合并后的数据统一重新计算 PreviousBatchEndTime
-            # 确保排序准确（方案A：最终统一计算）
+            # 确保排序准确（方案A：最终统一计算；增量模式只重算有新数据的机台）
             logging.info("对所有合并后的数据统一计算 PreviousBatchEndTime")
-            sfc_result_df = calculate_previous_batch_end_time(sfc_result_df)
+            incremental_sequence = cfg.get("incremental", {}).get("enabled", False) and not force_full_refresh
+            sfc_result_df = calculate_previous_batch_end_time(
+                sfc_result_df, changed_machines=changed_machines if incremental_sequence else None
+            )
             
             # 增量处理：状态已写入SQLite
             incr_cfg = cfg.get("incremental", {})
@@ -9,7 +9,7 @@ import time
 import logging
 import glob
 from datetime import datetime
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from pathlib import Path
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -23,8 +23,10 @@ import pandas as pd
 from shared_infrastructure.utils.etl_utils import (
     load_config,
     read_sharepoint_excel,
+    iter_sharepoint_excel_chunks,
 )
 from shared_infrastructure.utils.db_sqlserver_only import SQLServerOnlyManager
+from shared_infrastructure.utils.record_dedup import make_record_filter
 
 # 配置
 CONFIG_PATH = os.path.join(current_dir, "..", "config", "config_sfc_batch_report.yaml")
@@ -221,6 +223,7 @@ def main(
     max_rows: int = 1000,
     max_new_files: int = 20,
     max_rows_per_file: int = 0,
+    chunk_rows: Optional[int] = None,
 ):
     logging.info("=" * 60)
     logging.info("SFC 批次报工原始数据 ETL (V2) 启动")
@@ -235,6 +238,10 @@ def main(
         if not cfg:
             logging.error("配置加载失败")
             return
+
+        # 流式分块读取的行数（0 = 整个文件一次读入）
+        if chunk_rows is None:
+            chunk_rows = int(cfg.get("runtime", {}).get("stream_chunk_rows", 0) or 0)
         
         files_to_process = read_sfc_files(
             cfg,
@@ -255,23 +262,47 @@ def main(
         db = get_db_manager()
 
         failed_files: List[str] = []
+        processed_files: List[str] = []
+
+        # 用于跨文件去重（仅本次运行内）；bloom 命中的键查询 raw_sfc 确认
+        seen = make_record_filter(
+            exact_check=lambda keys: db.get_existing_hashes("raw_sfc", "record_hash", hashes=keys)
+        )
 
         for file_path in files_to_process:
             try:
                 logging.info(f"读取: {os.path.basename(file_path)}")
                 rows_limit = max_rows if test_mode else (max_rows_per_file if max_rows_per_file and max_rows_per_file > 0 else None)
-                df_file = read_sharepoint_excel(file_path, max_rows=rows_limit)
-
-                df_file["source_file"] = file_path
-                total_read += len(df_file)
-
-                df_clean = clean_sfc_data(df_file, cfg)
-                stats = save_to_database(df_clean, "raw_sfc")
+                if chunk_rows:
+                    # 流式分块读取：每块独立清洗、入库，内存与文件大小无关
+                    frames = iter_sharepoint_excel_chunks(file_path, chunk_rows=chunk_rows, max_rows=rows_limit)
+                else:
+                    frames = [read_sharepoint_excel(file_path, max_rows=rows_limit)]
+
+                stats = {"inserted": 0, "skipped": 0}
+                for df_file in frames:
+                    df_file["source_file"] = file_path
+                    total_read += len(df_file)
+
+                    df_clean = clean_sfc_data(df_file, cfg)
+                    has_key = "record_hash" in df_clean.columns and not df_clean.empty
+                    if has_key:
+                        keep = seen.new_mask(df_clean["record_hash"])
+                        removed = int(len(keep) - keep.sum())
+                        df_clean = df_clean[keep]
+                        if removed > 0:
+                            logging.info(f"  本次运行跨文件去重: 移除 {removed} 条")
+                    chunk_stats = save_to_database(df_clean, "raw_sfc")
+                    # 写库成功后才记录键：失败的块不会让后续文件中的同一批记录被丢弃
+                    if has_key:
+                        seen.add(df_clean["record_hash"])
+                    stats["inserted"] += chunk_stats["inserted"]
+                    stats["skipped"] += chunk_stats["skipped"]
 
                 total_inserted += stats["inserted"]
                 total_skipped += stats["skipped"]
 
-                db.mark_file_processed("sfc_batch_output_raw", file_path)
+                processed_files.append(file_path)
                 logging.info(
                     f"文件写入完成: {os.path.basename(file_path)} 插入 {stats['inserted']} 条, 跳过 {stats['skipped']} 条"
                 )
@@ -279,6 +310,9 @@ def main(
                 logging.error(f"文件处理失败 {os.path.basename(file_path)}: {e}")
                 failed_files.append(file_path)
 
+        # 成功文件一次 MERGE 标记已处理（用于增量）
+        db.mark_files_processed("sfc_batch_output_raw", processed_files)
+
         logging.info(f"写入完成: 插入 {total_inserted} 条, 跳过 {total_skipped} 条")
 
         if failed_files:
@@ -311,6 +345,7 @@ if __name__ == "__main__":
     parser.add_argument('--max-rows', type=int, default=1000, help='测试模式下每文件最大行数')
     parser.add_argument('--max-new-files', type=int, default=20, help='非测试模式：每次最多处理的未导入/变化文件数（按最新优先）')
     parser.add_argument('--max-rows-per-file', type=int, default=0, help='非测试模式：每个文件最多读取行数（0=不限制，用于快速验证）')
+    parser.add_argument('--chunk-rows', type=int, default=None, help='流式分块读取每块行数（0=整个文件一次读入，默认取配置 runtime.stream_chunk_rows）')
     args = parser.parse_args()
     main(
         test_mode=args.test,
@@ -318,4 +353,5 @@ if __name__ == "__main__":
         max_rows=args.max_rows,
         max_new_files=args.max_new_files,
         max_rows_per_file=args.max_rows_per_file,
+        chunk_rows=args.chunk_rows,
     )
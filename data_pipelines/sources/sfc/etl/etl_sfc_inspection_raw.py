@@ -265,6 +265,7 @@ def main(
         db = get_db_manager()
 
         failed_files: List[str] = []
+        processed_files: List[str] = []
 
         for file_path in files_to_process:
             try:
@@ -283,7 +284,7 @@ def main(
                 total_inserted += stats["inserted"]
                 total_skipped += stats["skipped"]
 
-                db.mark_file_processed("sfc_inspection_raw", file_path)
+                processed_files.append(file_path)
                 logging.info(
                     f"文件写入完成: {os.path.basename(file_path)} 插入 {stats['inserted']} 条, 跳过 {stats['skipped']} 条"
                 )
@@ -291,6 +292,9 @@ def main(
                 logging.error(f"文件处理失败 {os.path.basename(file_path)}: {e}")
                 failed_files.append(file_path)
         
+        # 成功文件一次 MERGE 标记已处理（用于增量）
+        db.mark_files_processed("sfc_inspection_raw", processed_files)
+
         logging.info(f"写入完成: 插入 {total_inserted} 条, 跳过 {total_skipped} 条")
 
         if failed_files:
@@ -286,6 +286,7 @@ def main():
     total_inserted = 0
     total_skipped = 0
     failed_files: List[str] = []
+    processed_files: List[str] = []
 
     for file_path in files_to_process:
         try:
@@ -299,7 +300,7 @@ def main():
             total_inserted += stats['inserted']
             total_skipped += stats['skipped']
 
-            db.mark_file_processed('sfc_nc', file_path)
+            processed_files.append(file_path)
             logger.info(
                 f"文件写入完成: {os.path.basename(file_path)} 插入 {stats['inserted']} 条, 跳过 {stats['skipped']} 条"
             )
@@ -307,6 +308,9 @@ def main():
             logger.error(f"文件处理失败 {os.path.basename(file_path)}: {e}")
             failed_files.append(file_path)
 
+    # 成功文件一次 MERGE 标记已处理（用于增量）
+    db.mark_files_processed('sfc_nc', processed_files)
+
     logger.info(f"写入完成: 插入 {total_inserted} 条, 跳过 {total_skipped} 条")
     if failed_files:
         raise RuntimeError(f"{len(failed_files)} files failed: {[os.path.basename(p) for p in failed_files[:5]]}")
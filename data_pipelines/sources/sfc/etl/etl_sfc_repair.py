@@ -255,16 +255,19 @@ def import_all_files(db, limit=None):
     logger.info(f'待处理文件: {len(files_to_process)} / {len(files)}')
     
     total_new = 0
-    for i, filepath in enumerate(files_to_process):
-        logger.info(f'[{i+1}/{len(files_to_process)}] 处理: {os.path.basename(filepath)}')
-        written = import_file(db, filepath)
-        total_new += written
-        
-        # Mark as processed
-        db.mark_file_processed("sfc_repair", filepath)
-        
-        if (i + 1) % 50 == 0:
-            logger.info(f'已处理 {i+1} 个文件，累计新增 {total_new} 条')
+    processed = []
+    try:
+        for i, filepath in enumerate(files_to_process):
+            logger.info(f'[{i+1}/{len(files_to_process)}] 处理: {os.path.basename(filepath)}')
+            written = import_file(db, filepath)
+            total_new += written
+            processed.append(filepath)
+            
+            if (i + 1) % 50 == 0:
+                logger.info(f'已处理 {i+1} 个文件，累计新增 {total_new} 条')
+    finally:
+        # Mark as processed (one MERGE, also keeps progress when a later file fails)
+        db.mark_files_processed("sfc_repair", processed)
     
     return total_new
 
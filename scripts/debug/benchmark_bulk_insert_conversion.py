@@ -0,0 +1,121 @@
+"""
+Benchmark SQLServerOnlyManager.bulk_insert parameter conversion (no database needed).
+
+Compares the per-cell reference converter with the vectorized converter on a
+synthetic MES-like frame, checks that both produce the same parameter values,
+and prints rows/sec for each.
+
+Usage:
+    python scripts/debug/benchmark_bulk_insert_conversion.py --rows 200000
+"""
+
+import argparse
+import math
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from shared_infrastructure.utils.db_sqlserver_only import SQLServerOnlyManager
+
+# (column, SQL Server DATA_TYPE) as returned by INFORMATION_SCHEMA.COLUMNS
+TABLE_COLS = [
+    ("BatchNumber", "nvarchar"),
+    ("Operation", "nvarchar"),
+    ("Plant", "nvarchar"),
+    ("Group", "nvarchar"),
+    ("machine", "nvarchar"),
+    ("TrackOutQuantity", "float"),
+    ("ScrapQty", "decimal"),
+    ("StepCount", "int"),
+    ("IsRework", "bit"),
+    ("TrackOutDate", "datetime2"),
+    ("TrackInText", "datetime"),
+    ("record_hash", "nvarchar"),
+]
+
+
+def build_frame(rows: int, seed: int = 42) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+
+    def pick(values):
+        return np.array(values, dtype=object)[rng.integers(0, len(values), rows)]
+
+    qty = rng.normal(100, 30, rows).round(2)
+    qty[rng.random(rows) < 0.05] = np.nan
+    track_out = pd.Timestamp("2025-01-01") + pd.to_timedelta(rng.integers(0, 365 * 24 * 3600, rows), unit="s")
+    track_out = pd.Series(track_out)
+    track_out[rng.random(rows) < 0.02] = pd.NaT
+
+    return pd.DataFrame({
+        "BatchNumber": pick(["K24A001", " K24A002 ", "K24B010", "", None, "nan", "K24C\x07777"]),
+        "Operation": pick([10.0, 20.0, 80.0, np.nan, 35.5]),
+        "Plant": pick(["1303", "9997", "1303\\x0", "NULL", None]),
+        "Group": pick(["G1", "G2 ", "", "none"]),
+        "machine": pick(["M-01", "M-02", "M-03", None]),
+        "TrackOutQuantity": qty,
+        "ScrapQty": pick(["0", "1.5", " 2 ", "", "N/A", None, "1e3", "-0.25", "inf"]),
+        "StepCount": pick([1, 2.0, "3", "3.7", "", None, "x", -4.9]),
+        "IsRework": pick(["true", "False", "0", "1", 1, 0, None, "", "yes"]),
+        "TrackOutDate": track_out,
+        "TrackInText": pick(["2025-01-01 08:00:00", " 2025-02-01 ", "", None]),
+        "record_hash": pd.Series(rng.integers(0, 2**62, rows)).map("{:016x}".format),
+    })
+
+
+def same_value(a, b) -> bool:
+    if a is None or b is None:
+        return a is None and b is None
+    if isinstance(a, float) and isinstance(b, float) and math.isnan(a) and math.isnan(b):
+        return True
+    # int columns holding NULLs come back as floats from the reference path (pandas upcasts)
+    return a == b and (type(a) is type(b) or {type(a), type(b)} <= {int, float})
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark bulk_insert parameter conversion")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    db = SQLServerOnlyManager()
+    df = build_frame(args.rows)
+    sql_types = dict(TABLE_COLS)
+
+    def run(convert):
+        best = float("inf")
+        result = None
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            result = [convert(df[c], c, sql_types[c]).tolist() for c in df.columns]
+            rows = list(zip(*result))
+            best = min(best, time.perf_counter() - t0)
+        return rows, best
+
+    print(f"Rows: {len(df)}  Columns: {len(df.columns)}  Repeat: {args.repeat}")
+    ref_rows, ref_sec = run(db._convert_column_rowwise)
+    fast_rows, fast_sec = run(db._convert_column)
+
+    mismatches = 0
+    for r, (ref_row, fast_row) in enumerate(zip(ref_rows, fast_rows)):
+        for c, (a, b) in enumerate(zip(ref_row, fast_row)):
+            if not same_value(a, b):
+                mismatches += 1
+                if mismatches <= 10:
+                    print(f"  MISMATCH row {r} column {df.columns[c]}: {a!r} != {b!r}")
+
+    print(f"rowwise    : {ref_sec:8.3f}s  {len(df) / ref_sec:12,.0f} rows/sec")
+    print(f"vectorized : {fast_sec:8.3f}s  {len(df) / fast_sec:12,.0f} rows/sec")
+    print(f"speedup    : {ref_sec / fast_sec:8.1f}x")
+    print(f"mismatches : {mismatches}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""
+Benchmark the MES DueTime / NonWorkday(d) / CompletionStatus calculations (no database needed).
+
+Runs the row-wise reference functions of etl_dataclean_mes_batch_report and the
+vectorized column functions (backed by the shared WorkCalendar) on a synthetic
+frame, checks that the results are identical, and prints the timing of each.
+
+Usage:
+    python scripts/debug/benchmark_mes_calendar_metrics.py --rows 20000
+    python scripts/debug/benchmark_mes_calendar_metrics.py --calendar-file 日历工作日表.csv
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+for path in (PROJECT_ROOT, PROJECT_ROOT / "data_pipelines" / "sources" / "mes" / "etl"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+import etl_dataclean_mes_batch_report as mes
+from shared_infrastructure.utils.work_calendar import WorkCalendar
+
+
+def build_calendar(rng: np.random.Generator) -> pd.DataFrame:
+    days = pd.date_range("2024-01-01", "2025-06-30")
+    workday = days.weekday < 5
+    # Holidays and make-up workdays
+    flip = rng.random(len(days)) < 0.05
+    return pd.DataFrame({"日期": days, "是否工作日": np.where(flip, ~workday, workday)}).set_index("日期")
+
+
+def build_frame(rows: int, rng: np.random.Generator) -> pd.DataFrame:
+    base = pd.Timestamp("2024-03-01").value
+
+    def timestamps(spread_days: int, null_ratio: float) -> pd.Series:
+        values = pd.Series(pd.to_datetime(base + rng.integers(0, spread_days * 86400, rows) * 10**9))
+        values[rng.random(rows) < null_ratio] = pd.NaT
+        return values
+
+    enter = timestamps(450, 0.05)
+    previous = enter - pd.to_timedelta(rng.integers(-3 * 86400, 10 * 86400, rows), unit="s")
+    previous[rng.random(rows) < 0.3] = pd.NaT
+    trackout = enter + pd.to_timedelta(rng.exponential(3 * 86400, rows).astype(int), unit="s")
+    trackout[rng.random(rows) < 0.03] = pd.NaT
+
+    return pd.DataFrame({
+        "Operation": rng.choice(["0010", "0020", "0030"], rows),
+        "Checkin_SFC": timestamps(450, 0.5),
+        "EnterStepTime": enter,
+        "TrackInTime": timestamps(450, 0.3),
+        "TrackOutTime": trackout,
+        "PreviousBatchEndTime": previous,
+        "Setup": rng.choice(["Yes", "No", None], rows),
+        "Setup Time (h)": rng.choice([0.0, 1.5, np.nan, 3.0], rows),
+        "EH_machine(s)": rng.choice([0, np.nan, 30.0, 120.5, 7.3], rows),
+        "EH_labor(s)": rng.choice([0, np.nan, 45.0, 9.9], rows),
+        "StepInQuantity": rng.choice([0, np.nan, 1, 50, 333, 10000], rows).astype(float),
+        "OEE": rng.choice([0.77, 0.5, 0.9], rows),
+        "PT(d)": rng.choice([np.nan, 0.5, 1.2, 3.0, 10.0], rows),
+        "ST(d)": rng.choice([np.nan, 0.3, 1.0, 2.5], rows),
+    })
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark MES calendar metrics")
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--daily-working-hours", type=float, default=24.0)
+    parser.add_argument("--calendar-file", help="日历工作日表.csv (default: synthetic calendar)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    calendar_df = mes.load_calendar_table(args.calendar_file) if args.calendar_file else build_calendar(rng)
+    df = build_frame(args.rows, rng)
+    hours = args.daily_working_hours
+
+    t0 = time.perf_counter()
+    ref = pd.DataFrame(index=df.index)
+    ref["DueTime"] = df.apply(lambda row: mes.calculate_due_time(row, calendar_df, hours), axis=1)
+    ref["NonWorkday(d)"] = df.apply(lambda row: mes.calculate_nonworkday_days(row, calendar_df), axis=1)
+    ref["CompletionStatus"] = df.assign(**{"NonWorkday(d)": ref["NonWorkday(d)"]}).apply(
+        lambda row: mes.calculate_completion_status(row, calendar_df), axis=1
+    )
+    ref_sec = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    calendar = WorkCalendar.from_frame(calendar_df, flag_col="是否工作日")
+    fast = pd.DataFrame(index=df.index)
+    fast["DueTime"] = mes.calculate_due_time_column(df, calendar, hours)
+    fast["NonWorkday(d)"] = mes.calculate_nonworkday_days_column(df, calendar)
+    fast["CompletionStatus"] = mes.calculate_completion_status_column(df.assign(**{"NonWorkday(d)": fast["NonWorkday(d)"]}))
+    fast_sec = time.perf_counter() - t0
+
+    mismatches = 0
+    for col in ref.columns:
+        a, b = ref[col], fast[col]
+        diff = ~((a == b) | (a.isna() & b.isna()))
+        mismatches += int(diff.sum())
+        for i in np.flatnonzero(diff.to_numpy())[:5]:
+            print(f"  MISMATCH row {i} column {col}: {a.iloc[i]!r} != {b.iloc[i]!r}")
+
+    print(f"Rows: {len(df)}  Calendar days: {len(calendar_df)}  Daily working hours: {hours}")
+    print(f"rowwise    : {ref_sec:8.3f}s")
+    print(f"vectorized : {fast_sec:8.3f}s")
+    print(f"speedup    : {ref_sec / fast_sec:8.1f}x")
+    print(f"mismatches : {mismatches}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
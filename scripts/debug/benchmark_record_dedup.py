@@ -0,0 +1,84 @@
+"""
+Benchmark the cross-file record dedup filters (no database needed).
+
+Feeds synthetic MES-style record_hash columns, with overlap between files, through
+each filter kind of shared_infrastructure.utils.record_dedup and compares the kept
+rows with the Python set reference. A filter may keep extra duplicates (the database
+still removes them) but must never drop a row the reference keeps. The bloom filter
+runs with an exact check backed by the reference set, standing in for the database.
+
+Usage:
+    python scripts/debug/benchmark_record_dedup.py --files 40 --rows 50000
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from shared_infrastructure.utils.record_dedup import make_record_filter
+
+
+def build_files(files: int, rows: int, overlap: float, rng: np.random.Generator):
+    start = 0
+    for _ in range(files):
+        # Consecutive exports overlap by `overlap` of their rows
+        ids = np.arange(start, start + rows)
+        start += int(rows * (1 - overlap))
+        keys = pd.Series([f"B{i:08d}|{i % 90:04d}|M{i % 57:03d}|2024-01-01 08:00:{i % 60:02d}" for i in ids], dtype="string")
+        keys[rng.random(rows) < 0.001] = pd.NA
+        yield keys
+
+
+def run(kind: str, frames, max_keys: int, reference_keys: set):
+    exact_check = (lambda keys: {k for k in keys if k in reference_keys}) if kind == "bloom" else None
+    seen = make_record_filter(kind, max_keys=max_keys, exact_check=exact_check)
+    masks = []
+    t0 = time.perf_counter()
+    for keys in frames:
+        masks.append(seen.filter_new(keys))
+        if kind == "bloom":
+            reference_keys.update(keys[masks[-1]].dropna().tolist())
+    elapsed = time.perf_counter() - t0
+    return masks, elapsed, seen.nbytes
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark record dedup filters")
+    parser.add_argument("--files", type=int, default=40)
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--overlap", type=float, default=0.3)
+    parser.add_argument("--max-keys", type=int, default=10_000_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    frames = list(build_files(args.files, args.rows, args.overlap, np.random.default_rng(args.seed)))
+    total = sum(len(f) for f in frames)
+
+    results = {kind: run(kind, frames, args.max_keys, set()) for kind in ("set", "hashset", "bloom")}
+    reference = results["set"][0]
+
+    mismatches = 0
+    print(f"Files: {args.files}  Rows: {total}  Overlap: {args.overlap}")
+    for kind, (masks, elapsed, nbytes) in results.items():
+        # Dropping a row the reference keeps loses data; keeping extra rows only leaves them to the database
+        dropped = sum(int((~m & r).sum()) for m, r in zip(masks, reference))
+        extra = sum(int((m & ~r).sum()) for m, r in zip(masks, reference))
+        mismatches += dropped
+        kept = sum(int(m.sum()) for m in masks)
+        print(
+            f"{kind:8s}: {elapsed:7.3f}s  filter {nbytes / 1024 / 1024:8.1f} MB  kept {kept}  "
+            f"wrongly dropped {dropped}  left to database {extra}"
+        )
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+"""
+Migrate record_hash of the raw tables from NVARCHAR(255) keys to BINARY(16) digests.
+
+For each table:
+  1. add record_hash_bin BINARY(16) and backfill it server-side in id ranges with
+     HASHBYTES('MD5', record_hash) (identical to record_key_hash.record_key_digest)
+  2. drop the constraints/indexes on the old column, drop it and rename record_hash_bin
+  3. recreate the unique index on the 16-byte record_hash
+  4. add record_key, a non-persisted computed column with the readable key
+
+The ETLs keep building readable keys; SQLServerOnlyManager hashes them on the way in
+once the column is binary. Tables that are already binary only get the missing pieces.
+
+Usage:
+    python scripts/maintenance/migrate_record_hash_binary.py --dry-run
+    python scripts/maintenance/migrate_record_hash_binary.py --tables raw_mes raw_sfc
+"""
+
+import argparse
+import logging
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from shared_infrastructure.utils.db_sqlserver_only import SQLServerOnlyManager
+from shared_infrastructure.utils.record_key_hash import BINARY_HASH_SQL_TYPES, RECORD_HASH_SQL_EXPR
+from shared_infrastructure.utils.schema_catalog import get_table_schema, invalidate_table_schema
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Key fields in the order the ETLs join them with '|'
+RECORD_KEY_FIELDS: Dict[str, List[str]] = {
+    "raw_mes": ["BatchNumber", "Operation", "Machine", "TrackOutTime"],
+    "raw_sfc": ["BatchNumber", "Operation", "TrackOutTime"],
+    "raw_sfc_inspection": ["BatchNumber", "SerialNumber", "Operation", "ReportDate"],
+    "raw_sap_routing": ["ProductNumber", "CFN", "Group", "Operation", "factory_code"],
+}
+
+DATETIME_TYPES = {"datetime", "datetime2", "smalldatetime"}
+
+
+def record_key_expression(table_schema, fields: List[str]) -> str:
+    """Readable key as a computed column expression (datetimes as 'yyyy-mm-dd hh:mi:ss')."""
+    parts = []
+    for field in fields:
+        col = table_schema.column(field)
+        if col is None:
+            continue
+        if col.data_type in DATETIME_TYPES:
+            parts.append(f"CONVERT(NVARCHAR(19), [{col.name}], 120)")
+        else:
+            parts.append(f"CONVERT(NVARCHAR(255), [{col.name}])")
+    if len(parts) == 1:
+        return f"ISNULL({parts[0]}, N'')"
+    return "CONCAT(" + ", N'|', ".join(parts) + ")"
+
+
+def hash_column_indexes(cursor, table: str) -> List[tuple]:
+    """(name, is_constraint) for every index or key constraint that includes record_hash."""
+    cursor.execute(
+        """
+        SELECT DISTINCT i.name, CAST(i.is_primary_key | i.is_unique_constraint AS INT)
+        FROM sys.indexes i
+        JOIN sys.index_columns ic ON ic.object_id = i.object_id AND ic.index_id = i.index_id
+        JOIN sys.columns c ON c.object_id = ic.object_id AND c.column_id = ic.column_id
+        WHERE i.object_id = OBJECT_ID(?) AND c.name = 'record_hash'
+        """,
+        (f"dbo.{table}",),
+    )
+    return [(r[0], bool(r[1])) for r in cursor.fetchall()]
+
+
+def backfill_digests(conn, table: str, batch_size: int) -> int:
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT MIN(id), MAX(id) FROM dbo.[{table}]")
+    lo, hi = cursor.fetchone()
+    if lo is None:
+        return 0
+    updated = 0
+    digest = RECORD_HASH_SQL_EXPR.format(key="[record_hash]")
+    for start in range(int(lo), int(hi) + 1, batch_size):
+        cursor.execute(
+            f"UPDATE dbo.[{table}] SET record_hash_bin = {digest} "
+            f"WHERE id >= ? AND id < ? AND record_hash_bin IS NULL "
+            f"AND record_hash IS NOT NULL AND record_hash <> N''",
+            (start, start + batch_size),
+        )
+        updated += max(int(cursor.rowcount or 0), 0)
+        conn.commit()
+        logging.info(f"  {table}: backfilled ids < {start + batch_size} ({updated} rows)")
+    return updated
+
+
+def migrate_table(db: SQLServerOnlyManager, table: str, batch_size: int, dry_run: bool) -> None:
+    fields = RECORD_KEY_FIELDS[table]
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        table_schema = get_table_schema(conn, table)
+        if table_schema is None or not table_schema.has_column("record_hash"):
+            logging.warning(f"[SKIP] dbo.{table} has no record_hash column")
+            return
+
+        hash_col = table_schema.column("record_hash")
+        if hash_col.data_type not in BINARY_HASH_SQL_TYPES:
+            indexes = hash_column_indexes(cursor, table)
+            logging.info(
+                f"dbo.{table}: record_hash {hash_col.data_type}({hash_col.max_length}) -> BINARY(16); "
+                f"dropping {[name for name, _ in indexes]}"
+            )
+            if dry_run:
+                return
+
+            if not table_schema.has_column("record_hash_bin"):
+                cursor.execute(f"ALTER TABLE dbo.[{table}] ADD record_hash_bin BINARY(16) NULL")
+                conn.commit()
+            backfill_digests(conn, table, batch_size)
+
+            for name, is_constraint in indexes:
+                if is_constraint:
+                    cursor.execute(f"ALTER TABLE dbo.[{table}] DROP CONSTRAINT [{name}]")
+                else:
+                    cursor.execute(f"DROP INDEX [{name}] ON dbo.[{table}]")
+            cursor.execute(f"ALTER TABLE dbo.[{table}] DROP COLUMN record_hash")
+            cursor.execute("EXEC sp_rename ?, 'record_hash', 'COLUMN'", (f"dbo.{table}.record_hash_bin",))
+            conn.commit()
+            invalidate_table_schema(table)
+            table_schema = get_table_schema(conn, table)
+        elif dry_run:
+            logging.info(f"dbo.{table}: record_hash is already {hash_col.data_type}")
+            return
+
+        if not hash_column_indexes(cursor, table):
+            cursor.execute(
+                f"SELECT TOP 1 1 FROM dbo.[{table}] WHERE record_hash IS NOT NULL "
+                f"GROUP BY record_hash HAVING COUNT(*) > 1"
+            )
+            if cursor.fetchone() is None:
+                cursor.execute(f"CREATE UNIQUE INDEX [ux_{table}_record_hash] ON dbo.[{table}] (record_hash)")
+            else:
+                logging.warning(f"dbo.{table}: duplicate record_hash values, creating a non-unique index")
+                cursor.execute(f"CREATE INDEX [idx_{table}_record_hash] ON dbo.[{table}] (record_hash)")
+            conn.commit()
+
+        if not table_schema.has_column("record_key"):
+            expr = record_key_expression(table_schema, fields)
+            cursor.execute(f"ALTER TABLE dbo.[{table}] ADD record_key AS {expr}")
+            conn.commit()
+
+        invalidate_table_schema(table)
+        logging.info(f"[OK] dbo.{table} uses BINARY(16) record_hash with computed record_key")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Migrate record_hash columns to BINARY(16)")
+    parser.add_argument("--tables", nargs="+", choices=sorted(RECORD_KEY_FIELDS), default=list(RECORD_KEY_FIELDS))
+    parser.add_argument("--batch-size", type=int, default=200_000, help="ids per backfill UPDATE")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would change")
+    args = parser.parse_args()
+
+    db = SQLServerOnlyManager()
+    failed = 0
+    for table in args.tables:
+        try:
+            migrate_table(db, table, args.batch_size, args.dry_run)
+        except Exception as e:
+            failed += 1
+            logging.error(f"[FAILED] dbo.{table}: {e}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
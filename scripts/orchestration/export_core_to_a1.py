@@ -3,13 +3,16 @@ import json
 import logging
 import shutil
 import sys
+import time
 import warnings
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
 from datetime import date
 
 # Suppress pandas UserWarning: pandas only supports SQLAlchemy connectable...
 warnings.filterwarnings("ignore", category=UserWarning, message=r".*pandas only supports SQLAlchemy connectable.*")
 from pathlib import Path
-from typing import Optional, List, Tuple
+from typing import Any, Callable, Optional, List, Tuple
 
 import pandas as pd
 import pyodbc
@@ -77,6 +80,13 @@ PARTITIONED_EXPORTS = {
 }
 
 
+# Parallel export: number of SQL connections exporting (dataset, month) partitions at once.
+# 1 exports sequentially over the main connection. Capped at EXPORT_MAX_WORKERS because
+# SQL Server Express uses at most 4 cores; more workers would only queue on the server.
+EXPORT_WORKERS = int(os.getenv("MDDAP_EXPORT_WORKERS", "3") or 1)
+EXPORT_MAX_WORKERS = 4
+
+
 PARTITIONED_EXPORT_PREFIX = {
     'mes_batch_report': 'mes_metrics',
 }
@@ -135,6 +145,9 @@ SCHEMA_FALLBACK_PARQUETS = {
 try:
     from shared_infrastructure.export_utils import (
         export_partitioned_table, 
+        export_partition_month,
+        plan_partitioned_export,
+        ensure_export_partition_meta_table,
         get_default_output_dir, 
         _read_existing_schema, 
         _sqlserver_table_to_arrow_schema,
@@ -144,8 +157,12 @@ try:
         _month_ym,
         _add_months,
         _month_list_last_n,
-        _max_month_in_table
+        _max_month_in_table,
+        _discover_months_in_table,
+        ensure_partition_ym_column,
+        partition_ym_column,
     )
+    from shared_infrastructure.utils.sqlserver_pool import close_all_pools, get_pool
 except ImportError as e:
     logger.error(f"Failed to import shared_infrastructure: {e}")
     sys.exit(1)
@@ -162,27 +179,9 @@ PARTITIONED_OUTPUT_DIR = A1_OUTPUT_DIR / '02_CURATED_PARTITIONED'
 # ==============================================================================
 
 def _discover_months(conn, table_name: str, date_col: str) -> List[str]:
-    # Kept locally or moved really? 
-    # Let's use simple logic here or import from utils if available (it wasn't in public API I exported)
-    # Re-implement simple discovery or move to utils?
-    # I realized I didn't export `_discover_months` in `__all__` style but it is def-ed in export_utils
-    # But since it's a helper, I can just query here or add to utils.
-    # Actually, export_partitioned_table takes `months` list. Or does it discover?
-    # My export_utils.export_partitioned_table takes `months`.
-    # So discovery is still needed here.
-    
+    # Index seeks / ym column when the table allows it (see export_utils._discover_months_in_table)
     try:
-        _, _, qualified = _qualify_table_name(table_name)
-        sql = (
-            f"SELECT DISTINCT CONVERT(char(7), TRY_CONVERT(date, [{date_col}]), 120) AS ym "
-            f"FROM {qualified} "
-            f"WHERE TRY_CONVERT(date, [{date_col}]) IS NOT NULL "
-            f"ORDER BY ym"
-        )
-        cur = conn.cursor()
-        cur.execute(sql)
-        rows = cur.fetchall()
-        return [r[0] for r in rows if isinstance(r[0], str) and len(r[0]) == 7]
+        return _discover_months_in_table(conn, table_name, date_col)
     except Exception:
         return []
 
@@ -225,33 +224,38 @@ def _export_partitioned_exports(
         force=force
     )
 
+def _export_static_table(conn, filename: str, table_name: str) -> Optional[int]:
+    """Export one static table; returns the row count, or None when it is skipped."""
+    dst_path = STATIC_OUTPUT_DIR / filename
+    if not _sqlserver_table_exists(conn, table_name):
+        logger.warning(f"Static table missing, skip: {table_name}")
+        return None
+
+    schema = _read_existing_schema(dst_path)
+    if schema is None:
+        # Use shared util
+        schema = _sqlserver_table_to_arrow_schema(conn, table_name)
+
+    if schema is None:
+        logger.warning(f"Failed to infer schema (skip static export): {table_name}")
+        return None
+
+    try:
+        _, _, qualified = _qualify_table_name(table_name)
+        df = pd.read_sql_query(f"SELECT * FROM {qualified}", conn)
+    except Exception as e:
+         logger.warning(f"Read failed: {e}")
+         return None
+    
+    _df_to_parquet_with_schema(df, dst_path, schema)
+    logger.info(f"Exported {table_name} -> {dst_path} ({len(df)} rows)")
+    return len(df)
+
 def _export_static_exports(conn) -> bool:
     failed = False
     for filename, table_name in STATIC_EXPORTS.items():
-        dst_path = STATIC_OUTPUT_DIR / filename
         try:
-            if not _sqlserver_table_exists(conn, table_name):
-                logger.warning(f"Static table missing, skip: {table_name}")
-                continue
-
-            schema = _read_existing_schema(dst_path)
-            if schema is None:
-                # Use shared util
-                schema = _sqlserver_table_to_arrow_schema(conn, table_name)
-
-            if schema is None:
-                logger.warning(f"Failed to infer schema (skip static export): {table_name}")
-                continue
-
-            try:
-                _, _, qualified = _qualify_table_name(table_name)
-                df = pd.read_sql_query(f"SELECT * FROM {qualified}", conn)
-            except Exception as e:
-                 logger.warning(f"Read failed: {e}")
-                 continue
-            
-            _df_to_parquet_with_schema(df, dst_path, schema)
-            logger.info(f"Exported {table_name} -> {dst_path} ({len(df)} rows)")
+            _export_static_table(conn, filename, table_name)
         except Exception as e:
             logger.error(f"Failed to export static {table_name}: {e}")
             failed = True
@@ -356,42 +360,249 @@ def _export_legacy_exports(conn) -> bool:
     return failed
 
 
+def _export_metadata_table(conn, filename: str, table_name: str) -> Optional[int]:
+    """Export one 03_METADATA table; returns the row count, or None when it is skipped."""
+    dst_path = A1_OUTPUT_DIR / filename
+    if not _sqlserver_table_exists(conn, table_name):
+        logger.warning(f"Metadata table missing, skip: {table_name}")
+        return None
+
+    schema = _read_existing_schema(dst_path)
+    if schema is None:
+        schema = _sqlserver_table_to_arrow_schema(conn, table_name)
+
+    if schema is None:
+        logger.warning(f"Failed to infer schema (skip metadata export): {table_name}")
+        return None
+
+    try:
+        _, _, qualified = _qualify_table_name(table_name)
+        df = pd.read_sql_query(f"SELECT * FROM {qualified}", conn)
+    except Exception as e:
+        msg = str(e)
+        if 'invalid object name' in msg.lower() and dst_path.exists():
+            logger.warning(f"Table missing, keep existing parquet: {table_name} -> {dst_path}")
+            return None
+        raise RuntimeError(f"read_sql failed for table {table_name}: {e}")
+    _df_to_parquet_with_schema(df, dst_path, schema)
+    logger.info(f"Exported {table_name} -> {dst_path} ({len(df)} rows)")
+    return len(df)
+
+
 def _export_metadata_exports(conn) -> bool:
     failed = False
     for filename, table_name in EXPORTS.items():
         if not filename.startswith('03_METADATA/'):
             continue
-
-        dst_path = A1_OUTPUT_DIR / filename
         try:
-            if not _sqlserver_table_exists(conn, table_name):
-                logger.warning(f"Metadata table missing, skip: {table_name}")
-                continue
+            _export_metadata_table(conn, filename, table_name)
+        except Exception as e:
+            logger.error(f"Failed to export {table_name} to {filename}: {e}")
+            failed = True
 
-            schema = _read_existing_schema(dst_path)
-            if schema is None:
-                schema = _sqlserver_table_to_arrow_schema(conn, table_name)
+    return failed
 
-            if schema is None:
-                logger.warning(f"Failed to infer schema (skip metadata export): {table_name}")
-                continue
 
+# ==============================================================================
+# Export Jobs (sequential or on a bounded pool of connections)
+# ==============================================================================
+
+@dataclass
+class ExportJob:
+    """A unit of export work. run(conn) returns the row count, None (skipped) or follow-up jobs."""
+    label: str
+    run: Callable[[Any], Any]
+    path: Optional[Path] = None
+
+
+@dataclass
+class ExportJobResult:
+    label: str
+    seconds: float
+    rows: Optional[int] = None
+    bytes_written: Optional[int] = None
+    error: Optional[str] = None
+
+
+def _resolve_dataset_months(conn, args, table_name: str, date_col: str, today: date) -> List[str]:
+    curr_month = _month_ym(today)
+    if args.months_list:
+        months = list(args.months_list)
+    elif args.months == 'all':
+        # Export all months (organized by year folders)
+        months = _discover_months(conn, table_name, date_col)
+        if not months:
+            logger.warning(f"No months discovered for {table_name}; skip partitioned export")
+            return []
+    else:
+        # Export latest available month for each dataset (handles data latency, e.g. SAP labor hours)
+        base_month = _max_month_in_table(conn, table_name, date_col) or curr_month
+        months = [base_month]
+        if args.backwrite_days is not None and today.day <= int(args.backwrite_days):
             try:
-                _, _, qualified = _qualify_table_name(table_name)
-                df = pd.read_sql_query(f"SELECT * FROM {qualified}", conn)
-            except Exception as e:
-                msg = str(e)
-                if 'invalid object name' in msg.lower() and dst_path.exists():
-                    logger.warning(f"Table missing, keep existing parquet: {table_name} -> {dst_path}")
-                    continue
-                raise RuntimeError(f"read_sql failed for table {table_name}: {e}")
-            _df_to_parquet_with_schema(df, dst_path, schema)
-            logger.info(f"Exported {table_name} -> {dst_path} ({len(df)} rows)")
+                y, m = base_month.split('-')
+                prev = _month_ym(_add_months(date(int(y), int(m), 1), -1))
+                if prev not in months:
+                    months.append(prev)
+            except Exception:
+                pass
+
+    if args.reconcile and (not args.months_list) and (not args.reconcile_all) and (args.months != 'all'):
+        months = _month_list_last_n(
+            _max_month_in_table(conn, table_name, date_col) or curr_month,
+            int(args.reconcile_last_n),
+        )
+    return months
+
+
+def _check_partition_ym_columns(conn, datasets: List[str], create: bool) -> None:
+    """Report partitioned tables without an indexed <date_col>_ym column (and add it with create)."""
+    missing = []
+    for dataset in datasets:
+        table_name, date_col = PARTITIONED_EXPORTS[dataset]
+        try:
+            status = ensure_partition_ym_column(conn, table_name, date_col, create=create)
         except Exception as e:
-            logger.error(f"Failed to export {table_name} to {filename}: {e}")
-            failed = True
+            status = f"failed ({e})"
+        if status in {'missing column', 'missing index'} or status.startswith('failed'):
+            missing.append(f"{dataset} ({table_name}.{partition_ym_column(date_col)}: {status})")
+        elif status not in {'ok', 'created'}:
+            logger.info(f"Partition ym column not applicable for {dataset} ({table_name}): {status}")
+    if missing:
+        hint = "" if create else "; run with --ensure-ym-columns to add them"
+        logger.warning(f"Datasets without an indexed month column: {', '.join(missing)}{hint}")
+
+
+def _partitioned_export_jobs(args, datasets: List[str], today: date) -> List[ExportJob]:
+    """One planning job per dataset; each plans its months and returns one job per (dataset, month)."""
+    def plan(dataset: str) -> ExportJob:
+        table_name, date_col = PARTITIONED_EXPORTS[dataset]
+
+        def run(conn) -> List[ExportJob]:
+            months = _resolve_dataset_months(conn, args, table_name, date_col, today)
+            if not months:
+                return []
+            parts = plan_partitioned_export(
+                conn,
+                dataset,
+                table_name,
+                date_col,
+                months,
+                output_dir=A1_OUTPUT_DIR,
+                reconcile=bool(args.reconcile),
+                force=bool(args.force),
+            )
+            return [
+                ExportJob(f"{dataset} {part.ym}", lambda c, part=part: export_partition_month(c, part), part.dst_path)
+                for part in parts
+            ]
+
+        return ExportJob(f"plan {dataset}", run)
+
+    return [plan(dataset) for dataset in datasets]
+
+
+def _table_export_jobs(args) -> List[ExportJob]:
+    jobs = []
+    if not args.skip_static:
+        for filename, table_name in STATIC_EXPORTS.items():
+            jobs.append(ExportJob(
+                f"static {table_name}",
+                lambda c, f=filename, t=table_name: _export_static_table(c, f, t),
+                STATIC_OUTPUT_DIR / filename,
+            ))
+    if not args.skip_metadata:
+        for filename, table_name in EXPORTS.items():
+            if not filename.startswith('03_METADATA/'):
+                continue
+            jobs.append(ExportJob(
+                f"metadata {table_name}",
+                lambda c, f=filename, t=table_name: _export_metadata_table(c, f, t),
+                A1_OUTPUT_DIR / filename,
+            ))
+    return jobs
+
+
+def _run_export_job(job: ExportJob, conn) -> Tuple[ExportJobResult, List[ExportJob]]:
+    t0 = time.perf_counter()
+    result = ExportJobResult(job.label, 0.0)
+    follow_up: List[ExportJob] = []
+    try:
+        out = job.run(conn)
+        if isinstance(out, list):
+            follow_up = out
+        else:
+            result.rows = out
+    except Exception as e:
+        logger.error(f"Failed to export {job.label}: {e}")
+        result.error = str(e)
+    result.seconds = time.perf_counter() - t0
+    if result.rows and job.path is not None and job.path.exists():
+        result.bytes_written = job.path.stat().st_size
+    return result, follow_up
+
+
+def _run_export_jobs(jobs: List[ExportJob], conn, workers: int) -> List[ExportJobResult]:
+    """
+    Run the jobs and their follow-ups.
+
+    workers <= 1 runs everything in order on `conn` (each dataset's months right after
+    its planning job, as before). Otherwise up to `workers` jobs run at once, each on its
+    own pooled connection; follow-up jobs are queued as soon as their planning job ends.
+    """
+    results: List[ExportJobResult] = []
+    if workers <= 1:
+        queue = list(jobs)
+        while queue:
+            result, follow_up = _run_export_job(queue.pop(0), conn)
+            results.append(result)
+            queue[0:0] = follow_up
+        return results
+
+    pool = get_pool(SQLSERVER_CONN_STR, lambda: pyodbc.connect(SQLSERVER_CONN_STR))
+
+    def run_pooled(job: ExportJob):
+        job_conn = pool.acquire()
+        try:
+            return _run_export_job(job, job_conn)
+        finally:
+            job_conn.close()
 
-    return failed
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="export") as executor:
+            running = {executor.submit(run_pooled, job) for job in jobs}
+            while running:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result, follow_up = future.result()
+                    results.append(result)
+                    running |= {executor.submit(run_pooled, job) for job in follow_up}
+    finally:
+        close_all_pools()
+    return results
+
+
+def _log_export_report(results: List[ExportJobResult], wall_seconds: float, workers: int) -> None:
+    logger.info("Export report (slowest first):")
+    for r in sorted(results, key=lambda r: r.seconds, reverse=True):
+        if r.error is not None:
+            status = "FAILED"
+        elif r.rows is None:
+            status = "-"
+        else:
+            status = f"{r.rows} rows"
+        size = f"{r.bytes_written / 1024 / 1024:.2f} MB" if r.bytes_written is not None else "-"
+        logger.info(f"  {r.label:<40} {r.seconds:8.1f}s  {status:>14}  {size:>10}")
+
+    rows = sum(r.rows or 0 for r in results)
+    written = sum(r.bytes_written or 0 for r in results)
+    job_seconds = sum(r.seconds for r in results)
+    failed = sum(1 for r in results if r.error is not None)
+    logger.info(
+        f"Export total: {len(results)} jobs ({failed} failed), {rows} rows, "
+        f"{written / 1024 / 1024:.1f} MB in {wall_seconds:.1f}s "
+        f"(job time {job_seconds:.1f}s, {workers} workers)"
+    )
 
 
 def main(argv: Optional[list] = None) -> int:
@@ -409,8 +620,25 @@ def main(argv: Optional[list] = None) -> int:
     parser.add_argument('--skip-static', action='store_true')
     parser.add_argument('--skip-metadata', action='store_true')
     parser.add_argument('--skip-monitoring', action='store_true')
+    parser.add_argument('--ensure-ym-columns', action='store_true',
+                        help="add persisted <date_col>_ym columns and indexes to the partitioned tables (rewrites each table once)")
+    parser.add_argument('--workers', type=int, default=EXPORT_WORKERS,
+                        help=f"concurrent export connections (1 = sequential, max {EXPORT_MAX_WORKERS})")
     args = parser.parse_args(argv)
 
+    workers = max(1, int(args.workers))
+    if workers > EXPORT_MAX_WORKERS:
+        logger.warning(f"--workers {workers} capped at {EXPORT_MAX_WORKERS}")
+        workers = EXPORT_MAX_WORKERS
+
+    selected_datasets = args.datasets if args.datasets else list(PARTITIONED_EXPORTS.keys())
+    unknown = [d for d in selected_datasets if d not in PARTITIONED_EXPORTS]
+    if unknown:
+        raise ValueError(f"Unknown datasets: {unknown}. Valid: {list(PARTITIONED_EXPORTS.keys())}")
+    for m in args.months_list or []:
+        if not isinstance(m, str) or len(m) != 7 or m[4] != '-' or not m[:4].isdigit() or not m[5:].isdigit():
+            raise ValueError(f"Invalid --months-list value: {m}. Expect YYYY-MM")
+
     A1_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
     STATIC_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
     PARTITIONED_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
@@ -421,60 +649,18 @@ def main(argv: Optional[list] = None) -> int:
             failed = _export_legacy_exports(conn) or failed
 
         if args.mode in {'partitioned', 'all'}:
-            today = date.today()
-            curr_month = _month_ym(today)
-            selected_datasets = args.datasets if args.datasets else list(PARTITIONED_EXPORTS.keys())
-            unknown = [d for d in selected_datasets if d not in PARTITIONED_EXPORTS]
-            if unknown:
-                raise ValueError(f"Unknown datasets: {unknown}. Valid: {list(PARTITIONED_EXPORTS.keys())}")
-
-            for dataset in selected_datasets:
-                table_name, date_col = PARTITIONED_EXPORTS[dataset]
-                if args.months_list:
-                    months = args.months_list
-                    for m in months:
-                        if not isinstance(m, str) or len(m) != 7 or m[4] != '-' or not m[:4].isdigit() or not m[5:].isdigit():
-                            raise ValueError(f"Invalid --months-list value: {m}. Expect YYYY-MM")
-                elif args.months == 'all':
-                    # Export all months (organized by year folders)
-                    months = _discover_months(conn, table_name, date_col)
-                    if not months:
-                        logger.warning(f"No months discovered for {table_name}; skip partitioned export")
-                        continue
-                else:
-                    # Export latest available month for each dataset (handles data latency, e.g. SAP labor hours)
-                    base_month = _max_month_in_table(conn, table_name, date_col) or curr_month
-                    months = [base_month]
-                    if args.backwrite_days is not None and today.day <= int(args.backwrite_days):
-                        try:
-                            y, m = base_month.split('-')
-                            prev = _month_ym(_add_months(date(int(y), int(m), 1), -1))
-                            if prev not in months:
-                                months.append(prev)
-                        except Exception:
-                            pass
-
-                if args.reconcile and (not args.months_list) and (not args.reconcile_all) and (args.months != 'all'):
-                    months = _month_list_last_n(
-                        _max_month_in_table(conn, table_name, date_col) or curr_month,
-                        int(args.reconcile_last_n),
-                    )
-
-                failed = export_partitioned_table(
-                    conn,
-                    dataset,
-                    table_name,
-                    date_col,
-                    months,
-                    output_dir=A1_OUTPUT_DIR,
-                    reconcile=bool(args.reconcile),
-                    force=bool(args.force)
-                ) or failed
-
-            if not args.skip_static:
-                failed = _export_static_exports(conn) or failed
-            if not args.skip_metadata:
-                failed = _export_metadata_exports(conn) or failed
+            _check_partition_ym_columns(conn, selected_datasets, create=bool(args.ensure_ym_columns))
+            if args.reconcile:
+                # Once, before the concurrent plan/month jobs read and write meta rows
+                try:
+                    ensure_export_partition_meta_table(conn)
+                except Exception as e:
+                    logger.warning(f"Could not create export_partition_meta, months will not be reconciled: {e}")
+            jobs = _partitioned_export_jobs(args, selected_datasets, date.today()) + _table_export_jobs(args)
+            t0 = time.perf_counter()
+            results = _run_export_jobs(jobs, conn, workers)
+            _log_export_report(results, time.perf_counter() - t0, workers)
+            failed = any(r.error is not None for r in results) or failed
 
     # Copy monitoring trigger result outputs (CSV/TSV) into A1 metadata folder
     try:
@@ -1,12 +1,19 @@
+import gc
+import io
 import os
 import sys
+import math
+import runpy
+import contextlib
+import traceback
 import time
 import logging
 import subprocess
 import concurrent.futures
+import concurrent.futures.process
 import multiprocessing
 import pyodbc 
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Callable
 from datetime import datetime
 
 # ============================================================
@@ -49,57 +56,90 @@ cleanup_logs(keep_days=5)
 TIMESTAMP = datetime.now().strftime("%Y%m%d_%H%M%S")
 LOG_FILE = os.path.join(LOG_DIR, f"orchestrator_{TIMESTAMP}.log")
 
+# Named resource pools: a task is only admitted when every slot it is tagged
+# with is free. Browsers are RAM hungry, SQL Server Express chokes on too many
+# concurrent loads, CPU slots default to the core count.
+RESOURCE_POOLS = {
+    "browser": int(os.getenv("MDDAP_BROWSER_SLOTS", "2")),
+    "sql": int(os.getenv("MDDAP_SQL_SLOTS", "3")),
+    "cpu": int(os.getenv("MDDAP_CPU_SLOTS", str(os.cpu_count() or 4))),
+}
+DEFAULT_RESOURCES = {"cpu": 1}
+
 # ============================================================
 # Task Definitions (Stages)
 # ============================================================
+# Every task declares the tasks it needs via "depends_on" (task names). The
+# scheduler starts a task as soon as all of its dependencies have succeeded,
+# regardless of stage; stages only group tasks for --stage selection and
+# reporting. A task WITHOUT "depends_on" waits for the whole previous stage
+# (legacy barrier behaviour), "depends_on": [] means it can start immediately.
+# "resources" tags each task with the slots it holds while running (see
+# RESOURCE_POOLS). Untagged tasks take one CPU slot. "etl_name" links a task
+# to its dbo.etl_run_log entries so task history can record rows touched.
+# "isolated" keeps a task in its own interpreter even with --warm-workers.
+BROWSER = {"browser": 1}
+SQL = {"sql": 1}
+CPU = {"cpu": 1}
+CPU_SQL = {"cpu": 1, "sql": 1}
+
+RAW_LOAD_TASKS = [
+    "SAP Routing Raw", "SFC Batch Raw", "SFC Inspection Raw", "MES Batch Raw",
+    "Planner Tasks", "Calendar Dim", "Operation Mapping", "SAP 9997 GI",
+]
+WIP_TASKS = ["SFC WIP CZM", "CMES WIP", "SFC Repair"]
+
 STAGES = [
     {
         "name": "0. Data Collection",
         "tasks": [
             # Group A: Production Scheduling & Labor
-            {"name": "Collection: Planner",   "script": "scripts/orchestration/run_data_collection.py", "args": ["planner", "--no-headless"], "max_retries": 2},
-            {"name": "Collection: SAP Labor", "script": "scripts/orchestration/run_data_collection.py", "args": ["labor"],   "max_retries": 2},
+            {"name": "Collection: Planner",   "script": "scripts/orchestration/run_data_collection.py", "args": ["planner", "--no-headless"], "max_retries": 2, "resources": BROWSER, "depends_on": []},
+            {"name": "Collection: SAP Labor", "script": "scripts/orchestration/run_data_collection.py", "args": ["labor"],   "max_retries": 2, "resources": CPU, "depends_on": []},
 
             # Group B: Manufacturing Execution & Logistics
-            {"name": "Collection: CMES",      "script": "scripts/orchestration/run_data_collection.py", "args": ["cmes", "--no-headless"],    "max_retries": 2},
-            {"name": "Collection: Indirect",  "script": "scripts/orchestration/run_data_collection.py", "args": ["indirect_material", "--no-headless"], "max_retries": 2},
-            {"name": "Collection: SAP 9997",  "script": "scripts/orchestration/run_data_collection.py", "args": ["sap9997"], "max_retries": 2},
+            {"name": "Collection: CMES",      "script": "scripts/orchestration/run_data_collection.py", "args": ["cmes", "--no-headless"],    "max_retries": 2, "resources": BROWSER, "depends_on": []},
+            {"name": "Collection: Indirect",  "script": "scripts/orchestration/run_data_collection.py", "args": ["indirect_material", "--no-headless"], "max_retries": 2, "resources": BROWSER, "depends_on": []},
+            {"name": "Collection: SAP 9997",  "script": "scripts/orchestration/run_data_collection.py", "args": ["sap9997"], "max_retries": 2, "resources": CPU_SQL, "depends_on": []},
         ]
     },
     {
         "name": "1. Raw Data & Dimensions",
         "tasks": [
-            {"name": "SAP Routing Raw",       "script": "data_pipelines/sources/sap/etl/etl_sap_routing_raw.py"},
-            {"name": "SFC Batch Raw",         "script": "data_pipelines/sources/sfc/etl/etl_sfc_batch_output_raw.py", "args": ["--max-new-files", "22"]},
-            {"name": "SFC Inspection Raw",    "script": "data_pipelines/sources/sfc/etl/etl_sfc_inspection_raw.py", "args": ["--max-new-files", "22"]},
-            {"name": "MES Batch Raw",         "script": "data_pipelines/sources/mes/etl/etl_mes_batch_output_raw.py"},
-            {"name": "Planner Tasks",         "script": "data_pipelines/sources/planner/etl/etl_planner_tasks_raw.py"},
-            {"name": "Calendar Dim",          "script": "data_pipelines/sources/dimension/etl/etl_calendar.py"},
-            {"name": "Operation Mapping",     "script": "data_pipelines/sources/dimension/etl/etl_operation_mapping.py"},
-            # {"name": "SAP Labor Hours",       "script": "data_pipelines/sources/sap/etl/etl_sap_labor_hours.py", "args": ["--ypp"]},
-            {"name": "SAP 9997 GI",           "script": "data_pipelines/sources/sap/etl/etl_sap_gi_9997.py"},
+            {"name": "SAP Routing Raw",       "script": "data_pipelines/sources/sap/etl/etl_sap_routing_raw.py", "etl_name": "sap_routing_raw", "resources": CPU_SQL, "depends_on": []},
+            {"name": "SFC Batch Raw",         "script": "data_pipelines/sources/sfc/etl/etl_sfc_batch_output_raw.py", "etl_name": "sfc_batch_output_raw", "args": ["--max-new-files", "22"], "resources": CPU_SQL, "depends_on": []},
+            {"name": "SFC Inspection Raw",    "script": "data_pipelines/sources/sfc/etl/etl_sfc_inspection_raw.py", "etl_name": "sfc_inspection_raw", "args": ["--max-new-files", "22"], "resources": CPU_SQL, "depends_on": []},
+            {"name": "MES Batch Raw",         "script": "data_pipelines/sources/mes/etl/etl_mes_batch_output_raw.py", "resources": CPU_SQL, "depends_on": ["Collection: CMES"]},
+            {"name": "Planner Tasks",         "script": "data_pipelines/sources/planner/etl/etl_planner_tasks_raw.py", "resources": CPU_SQL, "depends_on": ["Collection: Planner"]},
+            {"name": "Calendar Dim",          "script": "data_pipelines/sources/dimension/etl/etl_calendar.py", "resources": CPU_SQL, "depends_on": []},
+            {"name": "Operation Mapping",     "script": "data_pipelines/sources/dimension/etl/etl_operation_mapping.py", "resources": CPU_SQL, "depends_on": []},
+            # {"name": "SAP Labor Hours",       "script": "data_pipelines/sources/sap/etl/etl_sap_labor_hours.py", "args": ["--ypp"], "resources": CPU_SQL, "depends_on": ["Collection: SAP Labor"]},
+            {"name": "SAP 9997 GI",           "script": "data_pipelines/sources/sap/etl/etl_sap_gi_9997.py", "resources": CPU_SQL, "depends_on": ["Collection: SAP 9997"]},
         ]
     },
     {
         "name": "2. WIP & Calculations",
         "tasks": [
-            {"name": "SFC WIP CZM",           "script": "data_pipelines/sources/sfc/etl/etl_sfc_wip_czm.py", "args": ["--mode", "latest"]},
-            {"name": "CMES WIP",              "script": "data_pipelines/sources/mes/etl/etl_mes_wip_cmes.py", "args": ["--days", "7"]},
-            {"name": "SFC Repair",            "script": "data_pipelines/sources/sfc/etl/etl_sfc_repair.py", "args": ["--mode", "latest"]},
+            {"name": "SFC WIP CZM",           "script": "data_pipelines/sources/sfc/etl/etl_sfc_wip_czm.py", "args": ["--mode", "latest"], "resources": CPU_SQL, "depends_on": []},
+            {"name": "CMES WIP",              "script": "data_pipelines/sources/mes/etl/etl_mes_wip_cmes.py", "args": ["--days", "7"], "resources": CPU_SQL, "depends_on": ["Collection: CMES"]},
+            {"name": "SFC Repair",            "script": "data_pipelines/sources/sfc/etl/etl_sfc_repair.py", "args": ["--mode", "latest"], "resources": CPU_SQL, "depends_on": []},
         ]
     },
     {
         "name": "3. Materialized Views",
         "tasks": [
-            {"name": "MES Metrics Materialized", "script": "scripts/maintenance/_refresh_mes_metrics_materialized.py"},
+            {"name": "MES Metrics Materialized", "script": "scripts/maintenance/_refresh_mes_metrics_materialized.py",
+             "resources": SQL, "depends_on": ["MES Batch Raw", "SFC Batch Raw", "SAP Routing Raw", "Calendar Dim"]},
         ]
     },
     {
         "name": "4. Export & Validation",
         "tasks": [
-            {"name": "Export to A1",          "script": "scripts/orchestration/export_core_to_a1.py", "args": ["--mode", "partitioned", "--reconcile", "--reconcile-last-n", "2", "--meta-store", "sql"]},
-            {"name": "Validation Postcheck",  "script": "scripts/orchestration/sqlserver_postcheck.py"},
-            {"name": "Meta Summary",          "script": "data_pipelines/monitoring/etl/etl_meta_table_health.py"},
+            {"name": "Export to A1",          "script": "scripts/orchestration/export_core_to_a1.py", "args": ["--mode", "partitioned", "--reconcile", "--reconcile-last-n", "2", "--meta-store", "sql"],
+             "resources": CPU_SQL, "depends_on": RAW_LOAD_TASKS + WIP_TASKS + ["MES Metrics Materialized"]},
+            {"name": "Validation Postcheck",  "script": "scripts/orchestration/sqlserver_postcheck.py", "resources": SQL, "depends_on": RAW_LOAD_TASKS},
+            {"name": "Meta Summary",          "script": "data_pipelines/monitoring/etl/etl_meta_table_health.py",
+             "resources": SQL, "depends_on": RAW_LOAD_TASKS + WIP_TASKS + ["MES Metrics Materialized"]},
         ]
     },
     {
@@ -107,14 +147,133 @@ STAGES = [
         "tasks": [
             # 1. PowerBI Refresh (New migration)
             # Use 'run_data_collection.py refresh'
-            {"name": "PowerBI Refresh",            "script": "scripts/orchestration/run_data_collection.py", "args": ["refresh"]},
+            {"name": "PowerBI Refresh",            "script": "scripts/orchestration/run_data_collection.py", "args": ["refresh"], "resources": BROWSER, "isolated": True, "depends_on": ["Export to A1"]},
             
             # 2. Start Dashboard Service (Non-blocking launch)
-            {"name": "Start Dashboard Service",    "script": "scripts/orchestration/launch_services.py"},
+            {"name": "Start Dashboard Service",    "script": "scripts/orchestration/launch_services.py", "resources": CPU, "isolated": True, "depends_on": ["Meta Summary", "Validation Postcheck"]},
         ]
     }
 ]
 
+# ============================================================
+# Task Graph
+# ============================================================
+def build_task_graph(stages: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Flattens STAGES into {task_name: task}, resolving "depends_on".
+
+    Raises ValueError on duplicate names, unknown dependencies or cycles.
+    """
+    graph: Dict[str, Dict[str, Any]] = {}
+    prev_stage_names: List[str] = []
+
+    for stage_index, stage in enumerate(stages):
+        stage_names = []
+        for t in stage["tasks"]:
+            task = dict(t)
+            name = task["name"]
+            if name in graph:
+                raise ValueError(f"Duplicate task name: {name}")
+            task["stage"] = stage["name"]
+            task["stage_index"] = stage_index
+            task["depends_on"] = list(t["depends_on"]) if "depends_on" in t else list(prev_stage_names)
+            task["resources"] = dict(t.get("resources") or DEFAULT_RESOURCES)
+            for res_name, amount in task["resources"].items():
+                if res_name not in RESOURCE_POOLS:
+                    raise ValueError(f"Task '{name}' uses unknown resource '{res_name}'")
+                if amount > RESOURCE_POOLS[res_name]:
+                    raise ValueError(
+                        f"Task '{name}' needs {amount} '{res_name}' slot(s), pool only has {RESOURCE_POOLS[res_name]}"
+                    )
+            # Stage 0 (Data Collection) streams its output live
+            if stage["name"].startswith("0."):
+                task["stream_output"] = True
+            graph[name] = task
+            stage_names.append(name)
+        prev_stage_names = stage_names
+
+    for name, task in graph.items():
+        unknown = [d for d in task["depends_on"] if d not in graph]
+        if unknown:
+            raise ValueError(f"Task '{name}' depends on unknown task(s): {unknown}")
+
+    topological_order(graph)
+    return graph
+
+class ResourceSlots:
+    """Admission control over the named resource pools (orchestrator side only)."""
+
+    def __init__(self, capacity: Dict[str, int]):
+        self.capacity = dict(capacity)
+        self.in_use = {name: 0 for name in capacity}
+
+    def try_acquire(self, request: Dict[str, int]) -> bool:
+        """Takes all requested slots atomically, or none of them."""
+        if any(self.in_use[r] + n > self.capacity[r] for r, n in request.items()):
+            return False
+        for r, n in request.items():
+            self.in_use[r] += n
+        return True
+
+    def release(self, request: Dict[str, int]) -> None:
+        for r, n in request.items():
+            self.in_use[r] -= n
+
+    def describe(self) -> str:
+        return ", ".join(f"{r}={self.in_use[r]}/{self.capacity[r]}" for r in self.capacity)
+
+def topological_order(graph: Dict[str, Dict[str, Any]]) -> List[str]:
+    """Returns task names in dependency order (declaration order among peers)."""
+    order: List[str] = []
+    state: Dict[str, int] = {}  # 1 = visiting, 2 = done
+
+    def visit(name: str, path: List[str]):
+        if state.get(name) == 2:
+            return
+        if state.get(name) == 1:
+            raise ValueError(f"Dependency cycle detected: {' -> '.join(path + [name])}")
+        state[name] = 1
+        for dep in graph[name]["depends_on"]:
+            visit(dep, path + [name])
+        state[name] = 2
+        order.append(name)
+
+    for name in graph:
+        visit(name, [])
+    return order
+
+def select_tasks(graph: Dict[str, Dict[str, Any]], stage_filter: str = None,
+                 task_filter: str = None, only_collection: bool = False, with_upstream: bool = False) -> List[str]:
+    """
+    Selects the sub-graph to run. Dependencies outside the selection are treated
+    as satisfied unless with_upstream pulls them in.
+    """
+    requested_stages = [s.strip().lower() for s in stage_filter.split(",")] if stage_filter else []
+    filters = [f.strip().lower() for f in task_filter.split(",")] if task_filter else []
+
+    selected = set()
+    for name, task in graph.items():
+        if only_collection and not task["stage"].startswith("0."):
+            continue
+        if requested_stages:
+            stage_index = str(task["stage_index"])
+            stage_name_lower = task["stage"].lower()
+            if not any(rs == stage_index or rs in stage_name_lower for rs in requested_stages):
+                continue
+        if filters and not any(f in name.lower() for f in filters):
+            continue
+        selected.add(name)
+
+    if with_upstream:
+        stack = list(selected)
+        while stack:
+            for dep in graph[stack.pop()]["depends_on"]:
+                if dep not in selected:
+                    selected.add(dep)
+                    stack.append(dep)
+
+    return [n for n in topological_order(graph) if n in selected]
+
 # ============================================================
 # Pre-flight Checks
 # ============================================================
@@ -181,16 +340,131 @@ def setup_logging():
 # ============================================================
 # Execution Logic
 # ============================================================
+# ============================================================
+# Warm Workers (in-process execution)
+# ============================================================
+# Libraries every ETL pays for at startup; warm workers import them once.
+WARM_IMPORTS = ["pandas", "numpy", "pyarrow", "pyarrow.parquet", "pyodbc", "openpyxl", "yaml"]
+
+def warm_worker_init() -> None:
+    """ProcessPoolExecutor initializer: mirror the subprocess environment and pre-import heavy libraries."""
+    os.environ["PYTHONUTF8"] = "1"
+    os.environ["PYTHONIOENCODING"] = "utf-8"
+    os.environ["MDDAP_ORCHESTRATOR_RUN"] = "true"
+    os.chdir(PROJECT_ROOT)
+    if PROJECT_ROOT not in sys.path:
+        sys.path.insert(0, PROJECT_ROOT)
+    for module_name in WARM_IMPORTS:
+        try:
+            __import__(module_name)
+        except Exception:
+            pass
+
+def _named_logger_handlers() -> Dict[str, List[logging.Handler]]:
+    """Snapshot the handlers of every named logger (the root logger is handled separately)."""
+    return {
+        name: logger.handlers[:]
+        for name, logger in logging.Logger.manager.loggerDict.items()
+        if isinstance(logger, logging.Logger)
+    }
+
+def _restore_named_logger_handlers(saved: Dict[str, List[logging.Handler]]) -> None:
+    """Close handlers added to named loggers since the snapshot and put the previous ones back."""
+    for name, logger in list(logging.Logger.manager.loggerDict.items()):
+        if not isinstance(logger, logging.Logger):
+            continue
+        previous = saved.get(name, [])
+        for handler in logger.handlers:
+            if handler not in previous:
+                try:
+                    handler.close()
+                except Exception:
+                    pass
+        logger.handlers = previous[:]
+
+def _evict_script_modules(script_dir: str, saved_modules: set) -> None:
+    """Drop modules first imported during the run from the script's directory."""
+    prefix = os.path.join(script_dir, "")
+    for module_name in set(sys.modules) - saved_modules:
+        module_file = getattr(sys.modules.get(module_name), "__file__", None)
+        if module_file and os.path.abspath(module_file).startswith(prefix):
+            del sys.modules[module_name]
+
+def run_script_in_process(script_path: str, args: List[str]) -> Tuple[int, str]:
+    """
+    Executes a script's __main__ block inside the current (warm) worker, the way
+    `python script.py args` would, and returns (returncode, captured output).
+
+    stdout/stderr are redirected into a buffer and the root logger handlers are
+    swapped out for the duration, so the module-level logging.basicConfig() of
+    the script attaches to the buffer instead of leaking into the next task.
+    Afterwards, handlers the script added to named loggers are closed and
+    removed, and modules first imported from the script's directory are evicted
+    so the next task imports its own siblings (e.g. a different config.py).
+    """
+    buffer = io.StringIO()
+    root = logging.getLogger()
+    saved_handlers, saved_level = root.handlers[:], root.level
+    saved_argv, saved_path = sys.argv[:], sys.path[:]
+    saved_modules = set(sys.modules)
+    saved_logger_handlers = _named_logger_handlers()
+    script_dir = os.path.dirname(os.path.abspath(script_path))
+
+    # Tables may have been altered by other tasks since this worker last ran one
+    catalog = sys.modules.get("shared_infrastructure.utils.schema_catalog")
+    if catalog is not None:
+        catalog.invalidate_table_schema()
+
+    root.handlers = []
+    sys.argv = [script_path] + list(args)
+    sys.path.insert(0, script_dir)
+    returncode = 0
+    try:
+        with contextlib.redirect_stdout(buffer), contextlib.redirect_stderr(buffer):
+            try:
+                runpy.run_path(script_path, run_name="__main__")
+            except SystemExit as e:
+                if e.code is None:
+                    returncode = 0
+                elif isinstance(e.code, int):
+                    returncode = e.code
+                else:
+                    print(e.code, file=sys.stderr)
+                    returncode = 1
+            except Exception:
+                traceback.print_exc()
+                returncode = 1
+    finally:
+        for handler in root.handlers:
+            try:
+                handler.close()
+            except Exception:
+                pass
+        root.handlers = saved_handlers
+        root.setLevel(saved_level)
+        _restore_named_logger_handlers(saved_logger_handlers)
+        _evict_script_modules(script_dir, saved_modules)
+        sys.argv = saved_argv
+        sys.path[:] = saved_path
+        gc.collect()
+
+    return returncode, buffer.getvalue()
+
 def run_task(task: Dict[str, Any]) -> Dict[str, Any]:
-    """Runs a single task in a subprocess, capturing output, with optional retries."""
+    """
+    Runs a single task in a subprocess (or in the warm worker itself when
+    task['in_process'] is set), capturing output, with optional retries.
+    """
     name = task["name"]
     script_rel_path = task["script"]
     args = task.get("args", [])
     stream_output = task.get("stream_output", False)
     max_retries = task.get("max_retries", 0)
+    in_process = task.get("in_process", False) and not stream_output
     
     attempt = 0
     final_result = None
+    started_at = time.time()
 
     while attempt <= max_retries:
         if attempt > 0:
@@ -207,7 +481,7 @@ def run_task(task: Dict[str, Any]) -> Dict[str, Any]:
             if stream_output:
                 print(full_msg)
 
-        log(f"STARTING (Attempt {attempt+1}/{max_retries+1})...")
+        log(f"STARTING (Attempt {attempt+1}/{max_retries+1}){' [in-process]' if in_process else ''}...")
         start_time = time.time()
         
         script_path = os.path.join(PROJECT_ROOT, script_rel_path)
@@ -219,7 +493,8 @@ def run_task(task: Dict[str, Any]) -> Dict[str, Any]:
                 'duration': 0, 
                 'error': 'Script not found',
                 'output': "\n".join(log_buffer),
-                'streamed': stream_output
+                'streamed': stream_output,
+                'started_at': started_at
             }
 
         # Use the same python interpreter as the orchestrator
@@ -235,7 +510,13 @@ def run_task(task: Dict[str, Any]) -> Dict[str, Any]:
 
         try:
             # Run and capture output
-            if stream_output:
+            if in_process:
+                process_returncode, output = run_script_in_process(script_path, args)
+                if output.strip():
+                    log_buffer.append(output.strip())
+                success = process_returncode == 0
+
+            elif stream_output:
                 process = subprocess.Popen(
                     cmd,
                     stdout=subprocess.PIPE,
@@ -294,7 +575,8 @@ def run_task(task: Dict[str, Any]) -> Dict[str, Any]:
                 'duration': duration,
                 'output': "\n".join(log_buffer),
                 'streamed': stream_output,
-                'attempts': attempt + 1
+                'attempts': attempt + 1,
+                'started_at': started_at
             }
 
             if success:
@@ -311,59 +593,165 @@ def run_task(task: Dict[str, Any]) -> Dict[str, Any]:
                 'error': str(e),
                 'output': "\n".join(log_buffer),
                 'streamed': stream_output,
-                'attempts': attempt + 1
+                'attempts': attempt + 1,
+                'started_at': started_at
             }
             attempt += 1
 
     return final_result
 
-def run_stage(stage: Dict[str, Any], pool: concurrent.futures.ProcessPoolExecutor) -> Tuple[bool, List[Dict]]:
-    stage_name = stage["name"]
-    tasks = stage["tasks"]
-    logging.info(f"=== STAGE: {stage_name} ===")
+def log_task_output(result: Dict[str, Any]) -> None:
+    """Writes the buffered output of a finished task as one contiguous log block."""
+    # Determine if we should print the log block
+    was_streamed = result.get('streamed', False)
     
-    stage_results = []
-    failed = False
-    
-    # Inject streaming flag for Stage 0 (Data Collection)
-    is_streaming_stage = stage_name.startswith("0.")
-    if is_streaming_stage:
-        for t in tasks:
-            t["stream_output"] = True
-    
-    # Submit all tasks in this stage
-    futures = {pool.submit(run_task, task): task for task in tasks}
-    
-    for future in concurrent.futures.as_completed(futures):
-        result = future.result()
-        stage_results.append(result)
-        
-        # Determine if we should print the log block
-        was_streamed = result.get('streamed', False)
-        
-        # Always print buffered logs to file/console for record keeping
-        # (Even if streamed, we want them in the log file)
-        logging.info("")
-        logging.info(f"==================================================================")
-        logging.info(f"LOGS for TASK: {result['name']}")
-        logging.info(f"==================================================================")
-        if result.get('output'):
-            for line in result['output'].splitlines():
-                if was_streamed:
-                     # Add a subtle prefix so we know it was visually streamed
-                     logging.info(f"  [STREAMED] {line}")
+    # Always print buffered logs to file/console for record keeping
+    # (Even if streamed, we want them in the log file)
+    logging.info("")
+    logging.info(f"==================================================================")
+    logging.info(f"LOGS for TASK: {result['name']}")
+    logging.info(f"==================================================================")
+    if result.get('output'):
+        for line in result['output'].splitlines():
+            if was_streamed:
+                 # Add a subtle prefix so we know it was visually streamed
+                 logging.info(f"  [STREAMED] {line}")
+            else:
+                 logging.info(f"  {line}")
+    else:
+        logging.info("  (No output captured)")
+    logging.info(f"==================================================================")
+    logging.info("")
+
+def run_graph(graph: Dict[str, Dict[str, Any]], selected: List[str],
+              pool_factory: Callable[[], concurrent.futures.Executor],
+              slots: ResourceSlots = None,
+              priorities: Dict[str, float] = None) -> Tuple[bool, List[Dict]]:
+    """
+    Runs the selected tasks as a DAG: a task is submitted as soon as all of its
+    selected dependencies succeeded and its resource slots are free. Within the
+    ready set, tasks with the highest priority (expected remaining work) go
+    first. When a task fails, everything downstream of it is skipped while
+    independent branches keep running.
+
+    If a worker process dies (e.g. a native crash in an in-process task), the
+    pool is rebuilt and the tasks that were running on it are resubmitted as
+    isolated subprocesses.
+    """
+    if slots is None:
+        slots = ResourceSlots(RESOURCE_POOLS)
+    selected_set = set(selected)
+    pending = {name: {d for d in graph[name]["depends_on"] if d in selected_set} for name in selected}
+    running: Dict[concurrent.futures.Future, Tuple[str, int]] = {}
+    succeeded = set()
+    blocked = set()  # failed or skipped
+    results: List[Dict] = []
+
+    pool = pool_factory()
+    pool_generation = 0
+
+    logging.info(f"=== DAG: {len(selected)} tasks selected ===")
+
+    try:
+        while pending or running:
+            # Skip tasks whose upstream failed (pending is in topological order,
+            # so a single pass propagates transitively)
+            for name in list(pending):
+                bad_deps = sorted(pending[name] & blocked)
+                if bad_deps:
+                    del pending[name]
+                    blocked.add(name)
+                    logging.warning(f"[{name}] SKIPPED - upstream failed: {', '.join(bad_deps)}")
+                    results.append({
+                        'name': name,
+                        'success': False,
+                        'skipped': True,
+                        'duration': 0,
+                        'error': f"Upstream failed: {', '.join(bad_deps)}",
+                        'output': "",
+                    })
+
+            ready = [name for name, deps in pending.items() if deps <= succeeded]
+            if priorities:
+                ready.sort(key=lambda n: -priorities.get(n, 0.0))  # stable: ties keep declaration order
+            for name in ready:
+                task = graph[name]
+                # Ready tasks that do not fit stay pending; smaller ones may backfill
+                if not slots.try_acquire(task["resources"]):
+                    continue
+                del pending[name]
+                logging.info(f"--- Submitting: {name} ({task['stage']}) [{slots.describe()}] ---")
+                running[pool.submit(run_task, task)] = (name, pool_generation)
+
+            if not running:
+                break
+
+            finished, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                name, generation = running.pop(future)
+                try:
+                    result = future.result()
+                except concurrent.futures.process.BrokenProcessPool:
+                    if generation == pool_generation:
+                        logging.error("A worker process died; rebuilding the worker pool.")
+                        pool.shutdown(wait=False)
+                        pool = pool_factory()
+                        pool_generation += 1
+                    logging.warning(f"[{name}] Worker crashed, resubmitting as isolated subprocess.")
+                    isolated_task = dict(graph[name], in_process=False)
+                    running[pool.submit(run_task, isolated_task)] = (name, pool_generation)
+                    continue
+                except Exception as e:
+                    result = {'name': name, 'success': False, 'duration': 0, 'error': str(e), 'output': ""}
+
+                slots.release(graph[name]["resources"])
+                result['finished_at'] = time.time()
+                results.append(result)
+                log_task_output(result)
+
+                if result['success']:
+                    succeeded.add(name)
                 else:
-                     logging.info(f"  {line}")
-        else:
-            logging.info("  (No output captured)")
-        logging.info(f"==================================================================")
-        logging.info("")
+                    blocked.add(name)
+                    logging.error(f"Task {name} failed. Downstream tasks will be skipped.")
+    finally:
+        pool.shutdown(wait=True)
 
-        if not result['success']:
-            failed = True
-            
-    logging.info(f"=== STAGE {stage_name} COMPLETED. Success: {not failed} ===")
-    return not failed, stage_results
+    success = not blocked
+    logging.info(f"=== DAG COMPLETED. Success: {success} ===")
+    return success, results
+
+def print_critical_path(graph: Dict[str, Dict[str, Any]], all_results: List[Dict], run_started_at: float) -> None:
+    """
+    Logs the critical path: starting from the task that finished last, walk back
+    through the dependency that finished last. 'Wait' is the time a task spent
+    ready but waiting for a free worker.
+    """
+    timed = {r['name']: r for r in all_results if r.get('finished_at') and r.get('started_at')}
+    if not timed:
+        return
+
+    path = []
+    current = max(timed.values(), key=lambda r: r['finished_at'])
+    while current is not None:
+        path.append(current)
+        deps = [timed[d] for d in graph[current['name']]["depends_on"] if d in timed]
+        current = max(deps, key=lambda r: r['finished_at']) if deps else None
+    path.reverse()
+
+    logging.info("")
+    logging.info("CRITICAL PATH")
+    logging.info(f"{'Task Name':<35} | {'Start(s)':>9} | {'Wait(s)':>8} | {'Time(s)':>9}")
+    logging.info("-" * 71)
+    prev_finished = run_started_at
+    for r in path:
+        start = r['started_at'] - run_started_at
+        wait = max(0.0, r['started_at'] - prev_finished)
+        elapsed = r['finished_at'] - r['started_at']
+        logging.info(f"{r['name']:<35} | {start:>9.2f} | {wait:>8.2f} | {elapsed:>9.2f}")
+        prev_finished = r['finished_at']
+    logging.info("-" * 71)
+    logging.info(f"CRITICAL PATH LENGTH: {path[-1]['finished_at'] - run_started_at:.2f}s ({len(path)} tasks)")
 
 def get_db_stats() -> List[Dict]:
     """Fetches the latest table statistics from the database."""
@@ -400,6 +788,175 @@ def get_db_stats() -> List[Dict]:
         # Don't fail the orchestrator just because stats collection failed
         return []
 
+# ============================================================
+# Task History (duration-aware scheduling)
+# ============================================================
+HISTORY_TABLE = "dbo.etl_task_history"
+HISTORY_WINDOW = 30      # recent successful runs per task used for estimates
+REGRESSION_MIN_SAMPLES = 5
+
+def get_conn_str() -> str:
+    server = os.getenv("MDDAP_SQL_SERVER", r"localhost\SQLEXPRESS")
+    database = os.getenv("MDDAP_SQL_DATABASE", "mddap_v2")
+    driver = os.getenv("MDDAP_SQL_DRIVER", "ODBC Driver 17 for SQL Server")
+    return (
+        f"DRIVER={{{driver}}};"
+        f"SERVER={server};"
+        f"DATABASE={database};"
+        "Trusted_Connection=yes;"
+        "Encrypt=no;"
+        "TrustServerCertificate=yes;"
+    )
+
+def ensure_task_history_table(cursor) -> None:
+    cursor.execute(f"""
+        IF OBJECT_ID('{HISTORY_TABLE}', 'U') IS NULL
+        BEGIN
+            CREATE TABLE {HISTORY_TABLE} (
+                id BIGINT IDENTITY(1,1) PRIMARY KEY,
+                run_id NVARCHAR(32) NOT NULL,
+                task_name NVARCHAR(255) NOT NULL,
+                stage NVARCHAR(128) NULL,
+                started_at DATETIME2 NULL,
+                finished_at DATETIME2 NULL,
+                duration_s FLOAT NULL,
+                attempts INT NULL,
+                status NVARCHAR(16) NOT NULL,
+                rows_touched BIGINT NULL,
+                created_at DATETIME2 NOT NULL DEFAULT GETDATE()
+            );
+            CREATE INDEX idx_etl_task_history_task ON {HISTORY_TABLE}(task_name, finished_at);
+        END
+    """)
+
+def _percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile (values need not be sorted)."""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+def load_task_history(task_names: List[str]) -> Dict[str, Dict[str, float]]:
+    """
+    Returns {task_name: {'expected': median, 'p95': p95, 'samples': n}} over the
+    last HISTORY_WINDOW successful runs. Empty dict if history is unavailable.
+    """
+    if not task_names:
+        return {}
+    try:
+        with pyodbc.connect(get_conn_str(), timeout=5) as conn:
+            cursor = conn.cursor()
+            ensure_task_history_table(cursor)
+            conn.commit()
+            placeholders = ",".join("?" for _ in task_names)
+            cursor.execute(f"""
+                SELECT task_name, duration_s
+                FROM (
+                    SELECT task_name, duration_s,
+                           ROW_NUMBER() OVER (PARTITION BY task_name ORDER BY finished_at DESC) AS rn
+                    FROM {HISTORY_TABLE}
+                    WHERE status = 'SUCCESS' AND duration_s IS NOT NULL AND task_name IN ({placeholders})
+                ) h
+                WHERE rn <= ?
+            """, (*task_names, HISTORY_WINDOW))
+            durations: Dict[str, List[float]] = {}
+            for name, duration in cursor.fetchall():
+                durations.setdefault(name, []).append(float(duration))
+    except Exception as e:
+        logging.warning(f"Task history unavailable, falling back to declaration order: {e}")
+        return {}
+
+    return {
+        name: {'expected': _percentile(vals, 50), 'p95': _percentile(vals, 95), 'samples': len(vals)}
+        for name, vals in durations.items()
+    }
+
+def compute_priorities(graph: Dict[str, Dict[str, Any]], selected: List[str],
+                       history: Dict[str, Dict[str, float]]) -> Dict[str, float]:
+    """
+    Priority of a task = its expected duration plus the longest expected chain
+    of selected tasks that depend on it, so that within a ready set the task
+    with the most remaining work behind it is started first. Tasks without
+    history count as 0s.
+    """
+    selected_set = set(selected)
+    dependents: Dict[str, List[str]] = {name: [] for name in selected}
+    for name in selected:
+        for dep in graph[name]["depends_on"]:
+            if dep in selected_set:
+                dependents[dep].append(name)
+
+    priorities: Dict[str, float] = {}
+    for name in reversed(selected):  # selected is topologically ordered
+        own = history.get(name, {}).get('expected', 0.0)
+        downstream = max((priorities[d] for d in dependents[name]), default=0.0)
+        priorities[name] = own + downstream
+    return priorities
+
+def _rows_touched(cursor, etl_name: str, started_at: float) -> Any:
+    """Inserted + updated rows the task reported to etl_run_log during this run."""
+    cursor.execute("""
+        SELECT TOP 1 ISNULL(records_inserted, 0) + ISNULL(records_updated, 0)
+        FROM dbo.etl_run_log
+        WHERE etl_name = ? AND created_at >= ?
+        ORDER BY created_at DESC
+    """, (etl_name, datetime.fromtimestamp(started_at)))
+    row = cursor.fetchone()
+    return int(row[0]) if row and row[0] is not None else None
+
+def save_task_history(graph: Dict[str, Dict[str, Any]], all_results: List[Dict]) -> None:
+    """Persists duration/attempts/rows of every executed task of this run."""
+    executed = [r for r in all_results if not r.get('skipped') and r.get('started_at')]
+    if not executed:
+        return
+    try:
+        with pyodbc.connect(get_conn_str(), timeout=5) as conn:
+            cursor = conn.cursor()
+            ensure_task_history_table(cursor)
+            rows = []
+            for r in executed:
+                task = graph.get(r['name'], {})
+                rows_touched = None
+                if task.get("etl_name"):
+                    try:
+                        rows_touched = _rows_touched(cursor, task["etl_name"], r['started_at'])
+                    except Exception:
+                        pass
+                finished_at = r.get('finished_at') or (r['started_at'] + r.get('duration', 0))
+                rows.append((
+                    TIMESTAMP,
+                    r['name'],
+                    task.get("stage"),
+                    datetime.fromtimestamp(r['started_at']),
+                    datetime.fromtimestamp(finished_at),
+                    float(r.get('duration', 0) or 0),
+                    int(r.get('attempts', 1) or 1),
+                    "SUCCESS" if r['success'] else "FAILED",
+                    rows_touched,
+                ))
+            cursor.executemany(f"""
+                INSERT INTO {HISTORY_TABLE}
+                    (run_id, task_name, stage, started_at, finished_at, duration_s, attempts, status, rows_touched)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+            conn.commit()
+            logging.info(f"Saved task history for {len(rows)} tasks to {HISTORY_TABLE}")
+    except Exception as e:
+        # Don't fail the orchestrator just because history could not be written
+        logging.warning(f"Failed to save task history: {e}")
+
+def report_regressions(all_results: List[Dict], history: Dict[str, Dict[str, float]]) -> None:
+    """Warns about successful tasks that ran longer than their historical p95."""
+    for r in all_results:
+        h = history.get(r['name'])
+        if not r['success'] or not h or h['samples'] < REGRESSION_MIN_SAMPLES:
+            continue
+        duration = r.get('duration', 0) or 0
+        if duration > h['p95']:
+            logging.warning(
+                f"REGRESSION: {r['name']} took {duration:.2f}s, above p95 {h['p95']:.2f}s "
+                f"(median {h['expected']:.2f}s over last {h['samples']} runs, {duration / max(h['expected'], 0.01):.1f}x)"
+            )
+
 def print_execution_summary(all_results: List[Dict], total_duration: float):
     """
     Prints a beautiful summary table of the execution and data stats.
@@ -420,7 +977,7 @@ def print_execution_summary(all_results: List[Dict], total_duration: float):
     all_results.sort(key=lambda x: x['name'])
 
     for res in all_results:
-        status = "SUCCESS" if res['success'] else "FAILED"
+        status = "SUCCESS" if res['success'] else ("SKIPPED" if res.get('skipped') else "FAILED")
         duration = res.get('duration', 0)
         if res['success']: 
             success_count += 1
@@ -469,6 +1026,9 @@ def main():
     parser.add_argument("--only-collection", action="store_true", help="Only run Stage 0 (Data Collection), skip SQL/DB stages.")
     parser.add_argument("--stage", type=str, help="Run only specific stages by index or name (e.g., '0' or '1,2').")
     parser.add_argument("--task-filter", type=str, help="Filter tasks by name keyword (comma separated).")
+    parser.add_argument("--with-upstream", action="store_true", help="Also run the upstream dependencies of the selected tasks.")
+    parser.add_argument("--warm-workers", action="store_true", help="Run ETL scripts inside long-lived worker processes that import pandas/pyarrow/pyodbc once.")
+    parser.add_argument("--no-history", action="store_true", help="Do not read/write task duration history (dbo.etl_task_history).")
     args = parser.parse_args()
 
     setup_logging()
@@ -477,6 +1037,26 @@ def main():
     if args.only_collection:
         logging.info(">>> MODE: ONLY COLLECTION (System logic will skip SQL/DB stages)")
     
+    try:
+        graph = build_task_graph(STAGES)
+    except ValueError as e:
+        logging.error(f"Invalid task graph: {e}")
+        sys.exit(1)
+
+    selected = select_tasks(
+        graph,
+        stage_filter=args.stage,
+        task_filter=args.task_filter,
+        only_collection=args.only_collection,
+        with_upstream=args.with_upstream,
+    )
+    for name in graph:
+        if name not in selected:
+            logging.info(f"--- Skipping Task: {name} (Not selected) ---")
+    if not selected:
+        logging.info("No tasks selected. Nothing to do.")
+        sys.exit(0)
+
     # Run pre-flight checks
     if not preflight_check():
         logging.error("Pre-flight checks failed. Aborting.")
@@ -485,60 +1065,38 @@ def main():
     logging.info(f"Project Root: {PROJECT_ROOT}")
     logging.info(f"Log File: {LOG_FILE}")
     
+    history = {} if args.no_history else load_task_history(selected)
+    priorities = compute_priorities(graph, selected, history)
+    if history:
+        logging.info(f"Loaded duration history for {len(history)} tasks; scheduling longest-expected-first.")
+
     start_total = time.time()
-    all_results = []
-    workflow_success = True
-
-    # Use ProcessPoolExecutor
-    with concurrent.futures.ProcessPoolExecutor(max_workers=5) as pool:
-        for stage in STAGES:
-            # Skip stages if requested via --only-collection or --stage
-            if args.only_collection and not stage["name"].startswith("0."):
-                logging.info(f"--- Skipping Stage: {stage['name']} (Collection-only mode) ---")
-                continue
-            
-            if args.stage:
-                requested_stages = [s.strip().lower() for s in args.stage.split(",")]
-                stage_index = str(STAGES.index(stage))
-                stage_name_lower = stage["name"].lower()
-                
-                # Check if current stage is in the requested list (by index or partial name)
-                is_requested = False
-                for rs in requested_stages:
-                    if rs == stage_index or rs in stage_name_lower:
-                        is_requested = True
-                        break
-                
-                if not is_requested:
-                    logging.info(f"--- Skipping Stage: {stage['name']} (Not in requested list) ---")
-                    continue
 
-            # Task filtering
-            current_tasks = stage["tasks"]
-            if args.task_filter:
-                filters = [f.strip().lower() for f in args.task_filter.split(",")]
-                filtered_tasks = []
-                for t in current_tasks:
-                    task_name_lower = t["name"].lower()
-                    if any(f in task_name_lower for f in filters):
-                        filtered_tasks.append(t)
-                
-                if not filtered_tasks:
-                    logging.info(f"--- Skipping Stage: {stage['name']} (No tasks match filter '{args.task_filter}') ---")
-                    continue
-                
-                # Create a copy of the stage with only filtered tasks
-                stage = stage.copy()
-                stage["tasks"] = filtered_tasks
+    # Actual concurrency is bounded by the resource slots; the process pool just
+    # needs enough workers to never be the bottleneck (Windows caps it at 61).
+    logging.info("Resource pools: " + ", ".join(f"{k}={v}" for k, v in RESOURCE_POOLS.items()))
+    max_workers = max(1, min(len(selected), sum(RESOURCE_POOLS.values()), 61))
 
-            success, stage_res = run_stage(stage, pool)
-            all_results.extend(stage_res)
-            if not success:
-                logging.error(f"Stage {stage['name']} failed. Stopping workflow.")
-                workflow_success = False
-                break
+    if args.warm_workers:
+        # Streaming (collection) and explicitly isolated tasks keep their own interpreter
+        for name in selected:
+            task = graph[name]
+            task["in_process"] = not task.get("stream_output") and not task.get("isolated")
+        in_process_count = sum(1 for name in selected if graph[name]["in_process"])
+        logging.info(f">>> MODE: WARM WORKERS ({in_process_count}/{len(selected)} tasks in-process)")
+
+    def pool_factory() -> concurrent.futures.ProcessPoolExecutor:
+        if args.warm_workers:
+            return concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, initializer=warm_worker_init)
+        return concurrent.futures.ProcessPoolExecutor(max_workers=max_workers)
+
+    workflow_success, all_results = run_graph(graph, selected, pool_factory, priorities=priorities)
     
     total_duration = time.time() - start_total
+    if not args.no_history:
+        save_task_history(graph, all_results)
+    report_regressions(all_results, history)
+    print_critical_path(graph, all_results, start_total)
     print_execution_summary(all_results, total_duration)
     
     logging.info("Orchestration workflow completed.")
@@ -4,10 +4,12 @@ import sys
 import json
 import logging
 import warnings
-from datetime import date
+from dataclasses import dataclass
+from datetime import date, datetime
 from pathlib import Path
-from typing import Optional, List, Tuple
+from typing import Dict, Optional, List, Tuple
 
+import numpy as np
 import pandas as pd
 import pyodbc
 
@@ -19,6 +21,8 @@ except ImportError:
     pa = None
     pq = None
 
+from shared_infrastructure.utils.schema_catalog import get_table_schema, invalidate_table_schema
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
@@ -60,9 +64,15 @@ def _max_month_in_table(conn, table_name: str, date_col: str) -> Optional[str]:
     """Get the latest month present in the table"""
     try:
         _, _, qualified = _qualify_table_name(table_name)
+        is_date, _ = _partition_date_info(conn, table_name, date_col)
         cur = conn.cursor()
+        if is_date:
+            # MAX of the bare column: one seek at the end of an index on date_col
+            cur.execute(f"SELECT MAX([{date_col}]) FROM {qualified}")
+            row = cur.fetchone()
+            return _value_ym(row[0]) if row and row[0] is not None else None
         sql = (
-            f"SELECT MAX(CONVERT(char(7), TRY_CONVERT(date, [{date_col}]), 120)) "
+            f"SELECT MAX({_ym_sql_expr(conn, table_name, date_col)}) "
             f"FROM {qualified}"
         )
         cur.execute(sql)
@@ -97,6 +107,11 @@ def get_default_output_dir() -> Path:
     # Default to local if all else fails (safety)
     return Path("data/output")
 
+# Stream partition exports through Arrow record batches instead of loading a whole month into pandas
+EXPORT_STREAMING = os.getenv("MDDAP_EXPORT_STREAMING", "1").strip().lower() in ("1", "true", "yes", "on")
+# Rows per fetchmany / Parquet row group of the streaming exporter
+EXPORT_BATCH_ROWS = int(os.getenv("MDDAP_EXPORT_BATCH_ROWS", "50000") or 50000)
+
 # Prefixes for specific datasets
 PARTITIONED_EXPORT_PREFIX = {
     'mes_batch_report': 'mes_metrics',
@@ -142,23 +157,14 @@ def _qualify_table_name(table_name: str, default_schema: str = 'dbo'):
     qualified = f"[{schema}].[{name}]"
     return schema, name, qualified
 
-def _sqlserver_table_to_arrow_schema(conn, table_name: str):
+def _sqlserver_table_to_arrow_schema(conn, table_name: str, exclude: Tuple[str, ...] = ()):
     if not pa: raise RuntimeError("pyarrow required")
     
     schema, name, _ = _qualify_table_name(table_name)
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT COLUMN_NAME, DATA_TYPE
-        FROM INFORMATION_SCHEMA.COLUMNS
-        WHERE TABLE_SCHEMA = ? AND TABLE_NAME = ?
-        ORDER BY ORDINAL_POSITION
-        """,
-        (schema, name),
-    )
-    rows = cur.fetchall()
-    if not rows:
+    table_schema = get_table_schema(conn, name, schema=schema)
+    if table_schema is None:
         return None
+    rows = table_schema.column_types(exclude)
 
     def _map_sqlserver_type_to_arrow(sql_type: str):
         t = (sql_type or "").lower()
@@ -171,15 +177,8 @@ def _sqlserver_table_to_arrow_schema(conn, table_name: str):
     fields = [pa.field(r[0], _map_sqlserver_type_to_arrow(r[1])) for r in rows]
     return pa.schema(fields)
 
-def _df_to_parquet_with_schema(df: pd.DataFrame, out_path: Path, schema) -> None:
-    if not pa or not pq: raise RuntimeError("pyarrow required")
-
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-
-    if schema is None:
-        df.to_parquet(out_path, index=False)
-        return
-
+def _coerce_df_to_schema(df: pd.DataFrame, schema):
+    """Align columns to the schema, coerce dtypes and return the Arrow table."""
     # Align columns
     expected_cols = [f.name for f in schema]
     df_out = df.copy()
@@ -202,14 +201,147 @@ def _df_to_parquet_with_schema(df: pd.DataFrame, out_path: Path, schema) -> None
             pass
 
     table = pa.Table.from_pandas(df_out, preserve_index=False)
-    table = table.cast(schema, safe=False)
-    pq.write_table(table, out_path)
+    return table.cast(schema, safe=False)
+
+def _df_to_parquet_with_schema(df: pd.DataFrame, out_path: Path, schema) -> None:
+    if not pa or not pq: raise RuntimeError("pyarrow required")
+
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+
+    if schema is None:
+        df.to_parquet(out_path, index=False)
+        return
+
+    pq.write_table(_coerce_df_to_schema(df, schema), out_path)
+
+# pandas formats a datetime64 column as text with one precision for the whole column
+# (dates only / seconds / ms / us / ns). The streaming exporter formats batch by batch, so it
+# records the column-wide precision first and appends a sentinel with that precision to each batch.
+_NS_PER_DAY = 86_400 * 10**9
+_DATETIME_SENTINEL_NS = {0: 10**9, 1: 10**6, 2: 10**3, 3: 1}
+
+def _datetime_resolution(values_ns: np.ndarray) -> int:
+    """0 = seconds, 1 = ms, 2 = us, 3 = ns (NaT already removed)."""
+    if (values_ns % 1000).any():
+        return 3
+    if (values_ns % 10**6).any():
+        return 2
+    if (values_ns % 10**9).any():
+        return 1
+    return 0
+
+def _format_datetime_batch(values: pd.Series, dates_only: bool, resolution: int) -> pd.Series:
+    """values.astype('string') as if the batch were formatted together with the whole column."""
+    if dates_only:
+        return values.astype('string')
+    sentinel = pd.Series([pd.Timestamp(_DATETIME_SENTINEL_NS[resolution])], dtype='datetime64[ns]')
+    formatted = pd.concat([values, sentinel], ignore_index=True).astype('string')
+    return formatted.iloc[:-1]
+
+def _remove_quietly(path: Path) -> None:
+    try:
+        path.unlink()
+    except OSError:
+        pass
+
+def _stream_query_to_parquet(conn, sql: str, params: tuple, out_path: Path, schema, batch_rows: int = EXPORT_BATCH_ROWS) -> int:
+    """
+    Write a query result to Parquet batch by batch and atomically move it into place.
+
+    Rows are fetched with cursor.fetchmany and converted like _df_to_parquet_with_schema, one
+    row group per batch, so memory does not grow with the month. DATETIME columns that the
+    schema stores as text are first staged as timestamps; once their column-wide precision is
+    known they are formatted in a second pass over the local staging file, giving exactly
+    the text the in-memory export produces. Returns the row count (0 writes nothing).
+
+    The cursor is always cancelled and closed: without MARS, unread rows left by a failed
+    batch would keep the connection busy for the in-memory fallback.
+    """
+    if not pa or not pq: raise RuntimeError("pyarrow required")
+
+    cur = conn.cursor()
+    try:
+        cur.execute(sql, params)
+        return _cursor_to_parquet(cur, out_path, schema, batch_rows)
+    finally:
+        for release in (cur.cancel, cur.close):
+            try:
+                release()
+            except Exception:
+                pass
+
+def _cursor_to_parquet(cur, out_path: Path, schema, batch_rows: int) -> int:
+    """Body of _stream_query_to_parquet for an executed cursor."""
+    columns = [d[0] for d in cur.description]
+    string_fields = {f.name for f in schema if pa.types.is_string(f.type)}
+    datetime_cols = [d[0] for d in cur.description if d[1] is datetime and d[0] in string_fields]
+    stage_schema = pa.schema([
+        pa.field(f.name, pa.timestamp('ns')) if f.name in datetime_cols else f for f in schema
+    ])
+    # column -> [dates only, resolution]
+    datetime_flags = {c: [True, 0] for c in datetime_cols}
+
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = out_path.with_name(f"{out_path.name}.{os.getpid()}.tmp")
+    stage_path = out_path.with_name(f"{out_path.name}.{os.getpid()}.stage") if datetime_cols else tmp_path
+
+    rows_written = 0
+    writer = None
+    try:
+        while True:
+            rows = cur.fetchmany(batch_rows)
+            if not rows:
+                break
+            df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+            for col in datetime_cols:
+                df[col] = pd.to_datetime(df[col]).astype('datetime64[ns]')
+                ns = df[col].to_numpy().view(np.int64)
+                ns = ns[~np.isnat(df[col].to_numpy())]
+                if len(ns):
+                    flags = datetime_flags[col]
+                    flags[0] = flags[0] and not (ns % _NS_PER_DAY).any()
+                    flags[1] = max(flags[1], _datetime_resolution(ns))
+            if writer is None:
+                writer = pq.ParquetWriter(stage_path, stage_schema)
+            writer.write_table(_coerce_df_to_schema(df, stage_schema))
+            rows_written += len(df)
+        if writer is None:
+            return 0
+        writer.close()
+        writer = None
+
+        if datetime_cols:
+            # Second pass over the local staging file: timestamps -> text with the column-wide format
+            with pq.ParquetWriter(tmp_path, schema) as final_writer:
+                for batch in pq.ParquetFile(stage_path).iter_batches(batch_size=batch_rows):
+                    table = pa.Table.from_batches([batch])
+                    for col in datetime_cols:
+                        idx = table.schema.get_field_index(col)
+                        text = _format_datetime_batch(table.column(col).to_pandas(), *datetime_flags[col])
+                        table = table.set_column(idx, pa.field(col, pa.string()), pa.array(text, type=pa.string()))
+                    final_writer.write_table(table.cast(schema, safe=False))
+            _remove_quietly(stage_path)
+
+        os.replace(tmp_path, out_path)
+        return rows_written
+    finally:
+        if writer is not None:
+            writer.close()
+        _remove_quietly(tmp_path)
+        if stage_path != tmp_path:
+            _remove_quietly(stage_path)
 
 # ==============================================================================
 # Metadata & DB Helpers
 # ==============================================================================
 
-def _ensure_export_partition_meta_table(conn) -> None:
+def ensure_export_partition_meta_table(conn) -> None:
+    """
+    Create dbo.export_partition_meta if missing. Raises on failure.
+
+    Call once before exporting partitions (concurrent month jobs only read/write rows),
+    so concurrent IF-NOT-EXISTS CREATEs cannot race on a fresh database.
+    """
     sql = (
         "IF OBJECT_ID('dbo.export_partition_meta', 'U') IS NULL "
         "BEGIN "
@@ -244,14 +376,15 @@ def _sql_partition_stats(conn, table_name: str, date_col: str, ym: str) -> Tuple
     except:
         pass
 
+    month_where, month_params = month_where_clause(conn, table_name, date_col, ym)
     if has_hash:
         sql = (
             f"SELECT COUNT(1) AS cnt, "
             f"CHECKSUM_AGG(BINARY_CHECKSUM(CAST([record_hash] AS NVARCHAR(512)))) AS h "
             f"FROM {qualified} "
-            f"WHERE CONVERT(char(7), TRY_CONVERT(date, [{date_col}]), 120) = ?"
+            f"WHERE {month_where}"
         )
-        cur.execute(sql, (ym,))
+        cur.execute(sql, month_params)
         row = cur.fetchone()
         cnt = int(row[0]) if row and row[0] is not None else 0
         h = int(row[1]) if row and row[1] is not None else None
@@ -260,16 +393,36 @@ def _sql_partition_stats(conn, table_name: str, date_col: str, ym: str) -> Tuple
     sql = (
         f"SELECT COUNT(1) AS cnt "
         f"FROM {qualified} "
-        f"WHERE CONVERT(char(7), TRY_CONVERT(date, [{date_col}]), 120) = ?"
+        f"WHERE {month_where}"
     )
-    cur.execute(sql, (ym,))
+    cur.execute(sql, month_params)
     row = cur.fetchone()
     cnt = int(row[0]) if row and row[0] is not None else 0
     return cnt, None
 
+def _sql_partition_stats_by_month(conn, table_name: str, date_col: str) -> Dict[str, Tuple[int, Optional[int]]]:
+    """Row count and record_hash checksum of every month in one grouped scan (same values as _sql_partition_stats)."""
+    schema, name, qualified = _qualify_table_name(table_name)
+    table_schema = get_table_schema(conn, name, schema=schema)
+    has_hash = table_schema is not None and table_schema.has_column('record_hash')
+    ym_expr = _ym_sql_expr(conn, table_name, date_col)
+    hash_expr = "CHECKSUM_AGG(BINARY_CHECKSUM(CAST([record_hash] AS NVARCHAR(512))))" if has_hash else "NULL"
+
+    cur = conn.cursor()
+    cur.execute(
+        f"SELECT {ym_expr} AS ym, COUNT(1) AS cnt, {hash_expr} AS h "
+        f"FROM {qualified} "
+        f"WHERE {ym_expr} IS NOT NULL "
+        f"GROUP BY {ym_expr}"
+    )
+    return {
+        row[0]: (int(row[1]), int(row[2]) if row[2] is not None else None)
+        for row in cur.fetchall()
+        if row and row[0]
+    }
+
 def _write_partition_meta_to_sql(conn, meta: dict) -> None:
     try:
-        _ensure_export_partition_meta_table(conn)
         cur = conn.cursor()
         cur.execute(
             "MERGE dbo.export_partition_meta AS t "
@@ -286,12 +439,16 @@ def _write_partition_meta_to_sql(conn, meta: dict) -> None:
             ),
         )
         conn.commit()
-    except Exception:
-        pass
+    except Exception as e:
+        # Without its meta row the month is re-exported on the next run
+        logger.warning(f"Failed to record export meta for {meta.get('dataset')} ({meta.get('ym')}): {e}")
+        try:
+            conn.rollback()
+        except Exception:
+            pass
 
 def _read_partition_meta_from_sql(conn, dataset: str, ym: str) -> Optional[dict]:
     try:
-        _ensure_export_partition_meta_table(conn)
         cur = conn.cursor()
         cur.execute(
             "SELECT row_count, record_hash_checksum FROM dbo.export_partition_meta WHERE dataset = ? AND ym = ?",
@@ -303,6 +460,18 @@ def _read_partition_meta_from_sql(conn, dataset: str, ym: str) -> Optional[dict]
     except:
         return None
 
+def _read_all_partition_meta_from_sql(conn, dataset: str) -> Dict[str, dict]:
+    """All export_partition_meta rows of a dataset keyed by ym."""
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT ym, row_count, record_hash_checksum FROM dbo.export_partition_meta WHERE dataset = ?",
+            (dataset,),
+        )
+        return {row[0]: {'row_count': row[1], 'record_hash_checksum': row[2]} for row in cur.fetchall()}
+    except Exception:
+        return {}
+
 def _sqlserver_table_exists(conn, table_name: str, schema: str = 'dbo') -> bool:
     """Check if table exists in SQL Server"""
     try:
@@ -325,11 +494,148 @@ def _sqlserver_table_exists(conn, table_name: str, schema: str = 'dbo') -> bool:
     except Exception:
         return False
 
+# ==============================================================================
+# Month Partition Predicates
+# ==============================================================================
+# CONVERT(char(7), TRY_CONVERT(date, col), 120) = 'YYYY-MM' hides the column from the optimizer,
+# so every month read, discovery and MAX scanned the whole table. For date/time columns the month
+# is selected with a half-open range instead (index seek on the date column); tables can also carry
+# a persisted computed <date_col>_ym column with an index for grouping and discovery.
+
+# Types whose month can be selected with a range on the bare column
+DATE_SQL_TYPES = {"date", "datetime", "datetime2", "smalldatetime"}
+PARTITION_YM_SUFFIX = "_ym"
+
+def partition_ym_column(date_col: str) -> str:
+    """Name of the persisted 'YYYY-MM' computed column for a partition date column."""
+    return f"{date_col}{PARTITION_YM_SUFFIX}"
+
+def _month_bounds(ym: str) -> Tuple[date, date]:
+    """First day of the month and of the next month (half-open range)."""
+    first = date(int(ym[:4]), int(ym[5:7]), 1)
+    return first, _add_months(first, 1)
+
+def _value_ym(value) -> str:
+    if hasattr(value, 'year'):
+        return f"{value.year:04d}-{value.month:02d}"
+    return str(value)[:7]
+
+def _partition_date_info(conn, table_name: str, date_col: str) -> Tuple[bool, Optional[str]]:
+    """(date_col has a date/time type, name of its persisted ym column or None)"""
+    schema, name, _ = _qualify_table_name(table_name)
+    table_schema = get_table_schema(conn, name, schema=schema)
+    if table_schema is None:
+        return False, None
+    col = table_schema.column(date_col)
+    ym_col = table_schema.column(partition_ym_column(date_col))
+    return (col is not None and col.data_type in DATE_SQL_TYPES), (ym_col.name if ym_col is not None else None)
+
+def _ym_sql_expr(conn, table_name: str, date_col: str) -> str:
+    """'YYYY-MM' of date_col in SQL (same values as CONVERT(char(7), TRY_CONVERT(date, col), 120))."""
+    is_date, ym_col = _partition_date_info(conn, table_name, date_col)
+    if ym_col:
+        return f"[{ym_col}]"
+    if is_date:
+        return f"CONVERT(char(7), [{date_col}], 120)"
+    return f"CONVERT(char(7), TRY_CONVERT(date, [{date_col}]), 120)"
+
+def month_where_clause(conn, table_name: str, date_col: str, ym: str) -> Tuple[str, tuple]:
+    """WHERE condition and params selecting one month of date_col, sargable when the column allows it."""
+    is_date, ym_col = _partition_date_info(conn, table_name, date_col)
+    if is_date:
+        first, next_first = _month_bounds(ym)
+        return f"[{date_col}] >= ? AND [{date_col}] < ?", (first, next_first)
+    if ym_col:
+        return f"[{ym_col}] = ?", (ym,)
+    return f"CONVERT(char(7), TRY_CONVERT(date, [{date_col}]), 120) = ?", (ym,)
+
+def _discover_months_in_table(conn, table_name: str, date_col: str) -> List[str]:
+    """
+    Distinct months of date_col, ascending.
+
+    Reads the ym column's index when present; with an index led by a date/time column it
+    seeks month by month (MIN(col) WHERE col >= next month); otherwise groups the whole table.
+    """
+    schema, name, qualified = _qualify_table_name(table_name)
+    is_date, ym_col = _partition_date_info(conn, table_name, date_col)
+    table_schema = get_table_schema(conn, name, schema=schema)
+    cur = conn.cursor()
+
+    if not ym_col and is_date and table_schema is not None and table_schema.leads_index(date_col):
+        months: List[str] = []
+        cur.execute(f"SELECT MIN([{date_col}]) FROM {qualified}")
+        row = cur.fetchone()
+        while row and row[0] is not None:
+            ym = _value_ym(row[0])
+            months.append(ym)
+            cur.execute(f"SELECT MIN([{date_col}]) FROM {qualified} WHERE [{date_col}] >= ?", (_month_bounds(ym)[1],))
+            row = cur.fetchone()
+        return months
+
+    ym_expr = _ym_sql_expr(conn, table_name, date_col)
+    cur.execute(
+        f"SELECT DISTINCT {ym_expr} AS ym "
+        f"FROM {qualified} "
+        f"WHERE {ym_expr} IS NOT NULL "
+        f"ORDER BY ym"
+    )
+    return [r[0] for r in cur.fetchall() if isinstance(r[0], str) and len(r[0]) == 7]
+
+def ensure_partition_ym_column(conn, table_name: str, date_col: str, create: bool = False) -> str:
+    """
+    Check the persisted <date_col>_ym column and its index; with create, add what is missing.
+
+    The index includes record_hash when the table has one, so the reconcile stats scan reads
+    only the index. Adding a persisted column rewrites the table once. Returns a short status:
+    'ok', 'created', 'missing column', 'missing index', 'view', 'not a date column' or 'missing table'.
+    """
+    schema, name, qualified = _qualify_table_name(table_name)
+    table_schema = get_table_schema(conn, name, schema=schema)
+    if table_schema is None:
+        return 'missing table'
+    col = table_schema.column(date_col)
+    if col is None or col.data_type not in DATE_SQL_TYPES:
+        return 'not a date column'
+
+    cur = conn.cursor()
+    cur.execute("SELECT OBJECTPROPERTY(OBJECT_ID(?), 'IsView')", (f"{schema}.{name}",))
+    row = cur.fetchone()
+    if row and row[0] == 1:
+        return 'view'
+
+    ym_col = partition_ym_column(date_col)
+    has_col = table_schema.has_column(ym_col)
+    has_index = has_col and table_schema.leads_index(ym_col)
+    if has_index:
+        return 'ok'
+    if not create:
+        return 'missing index' if has_col else 'missing column'
+
+    if not has_col:
+        cur.execute(f"ALTER TABLE {qualified} ADD [{ym_col}] AS CONVERT(char(7), [{col.name}], 120) PERSISTED")
+    include = " INCLUDE ([record_hash])" if table_schema.has_column('record_hash') else ""
+    cur.execute(f"CREATE INDEX [ix_{name}_{ym_col}] ON {qualified} ([{ym_col}]){include}")
+    conn.commit()
+    invalidate_table_schema(name, schema=schema)
+    logger.info(f"Added persisted {ym_col} column and index to {qualified}")
+    return 'created'
+
 # ==============================================================================
 # Main Export Function
 # ==============================================================================
 
-def export_partitioned_table(
+@dataclass
+class PartitionExport:
+    """One (dataset, month) partition to write; stats are the reconcile values taken while planning."""
+    dataset: str
+    table_name: str
+    date_col: str
+    ym: str
+    dst_path: Path
+    reconcile: bool = True
+    stats: Optional[Tuple[int, Optional[int]]] = None
+
+def plan_partitioned_export(
     conn,
     dataset: str,
     table_name: str,
@@ -339,87 +645,156 @@ def export_partitioned_table(
     output_dir: Path,
     reconcile: bool = True,
     force: bool = False
-) -> bool:
+) -> List[PartitionExport]:
     """
-    Exports specified months of a table to Parquet with incremental checks.
+    Months of a table that need to be (re)written.
+
+    With reconcile, the row count / record_hash checksum of all months come from one
+    grouped scan and are compared with export_partition_meta in memory; only months
+    whose stats changed (or whose Parquet is missing) are planned.
     """
-    failed = False
-    
     # Resolve base path
     partitioned_base = output_dir / '02_CURATED_PARTITIONED'
-    
+    prefix = PARTITIONED_EXPORT_PREFIX.get(dataset, dataset)
+
+    # Reconcile plan: one grouped scan for the stats of all months, compared with the meta in memory
+    stats: Optional[Dict[str, Tuple[int, Optional[int]]]] = None
+    meta_by_ym: Dict[str, dict] = {}
+    if reconcile:
+        try:
+            stats = _sql_partition_stats_by_month(conn, table_name, date_col)
+            if not force:
+                meta_by_ym = _read_all_partition_meta_from_sql(conn, dataset)
+        except Exception as e:
+            logger.warning(f"Partition stats failed for {table_name}, exporting without reconcile: {e}")
+            stats = None
+
+    to_export: List[PartitionExport] = []
     for ym in months:
         if len(ym) != 7: continue 
         
         year = ym[:4]
         yyyymm = ym.replace('-', '')
-        prefix = PARTITIONED_EXPORT_PREFIX.get(dataset, dataset)
         dst_path = partitioned_base / dataset / year / f"{prefix}_{yyyymm}.parquet"
         
         # Incremental Check
-        if reconcile and not force:
-            try:
-                if dst_path.exists():
-                    # Check DB state
-                    sql_cnt, sql_h = _sql_partition_stats(conn, table_name, date_col, ym)
-                    if sql_cnt == 0:
-                        logger.info(f"Skip empty partition: {table_name} ({ym})")
-                        continue
-                        
-                    # Check Metadata (Fastest)
-                    meta = _read_partition_meta_from_sql(conn, dataset, ym)
-                    if meta:
-                        if meta['row_count'] == sql_cnt and (sql_h is None or meta['record_hash_checksum'] == sql_h):
-                             logger.info(f"Skip up-to-date: {table_name} ({ym})")
-                             continue
-                    
-                    # Fallback: Check Parquet File (Slower but reliable if meta missing)
-                    pq_cnt = _parquet_row_count(dst_path)
-                    if pq_cnt == sql_cnt:
-                        # Assuming count match is enough if hash missing
-                        logger.info(f"Skip up-to-date (count match): {table_name} ({ym})")
-                        continue
-            except Exception as e:
-                logger.warning(f"Reconcile check failed for {ym}, forcing export: {e}")
-
-        # Perform Export
-        try:
-            _, _, qualified = _qualify_table_name(table_name)
-            df = pd.read_sql_query(
-                f"SELECT * FROM {qualified} WHERE CONVERT(char(7), TRY_CONVERT(date, [{date_col}]), 120) = ?",
-                conn,
-                params=(ym,),
-            )
-            
-            if df.empty:
-                logger.info(f"No data found for {ym}, skipping.")
+        if stats is not None and not force and dst_path.exists():
+            sql_cnt, sql_h = stats.get(ym, (0, None))
+            if sql_cnt == 0:
+                logger.info(f"Skip empty partition: {table_name} ({ym})")
+                continue
+
+            # Check Metadata (Fastest)
+            meta = meta_by_ym.get(ym)
+            if meta:
+                if meta['row_count'] == sql_cnt and (sql_h is None or meta['record_hash_checksum'] == sql_h):
+                     logger.info(f"Skip up-to-date: {table_name} ({ym})")
+                     continue
+
+            # Fallback: Check Parquet File (Slower but reliable if meta missing)
+            pq_cnt = _parquet_row_count(dst_path)
+            if pq_cnt == sql_cnt:
+                # Assuming count match is enough if hash missing
+                logger.info(f"Skip up-to-date (count match): {table_name} ({ym})")
                 continue
 
-            # Schema Handling
-            schema = _read_existing_schema(dst_path)
-            if not schema:
-                schema = _sqlserver_table_to_arrow_schema(conn, table_name)
-                
+        to_export.append(PartitionExport(
+            dataset, table_name, date_col, ym, dst_path,
+            reconcile=reconcile,
+            stats=stats.get(ym, (0, None)) if stats is not None else None,
+        ))
+
+    if stats is not None:
+        logger.info(f"Reconcile {dataset}: {len(to_export)}/{len(months)} months to export")
+    return to_export
+
+def export_partition_month(conn, part: PartitionExport) -> int:
+    """
+    Write one planned partition and record its meta; returns the row count (0 = no data, nothing written).
+
+    Only uses its own connection and destination file, so different partitions can be
+    exported concurrently on separate connections (create the meta table first with
+    ensure_export_partition_meta_table). Raises on failure.
+    """
+    dataset, table_name, date_col, ym, dst_path = part.dataset, part.table_name, part.date_col, part.ym, part.dst_path
+    _, _, qualified = _qualify_table_name(table_name)
+    month_where, month_params = month_where_clause(conn, table_name, date_col, ym)
+    month_sql = f"SELECT * FROM {qualified} WHERE {month_where}"
+
+    # Schema Handling (the computed month column is a query aid, not part of the export)
+    schema = _read_existing_schema(dst_path)
+    if not schema:
+        schema = _sqlserver_table_to_arrow_schema(conn, table_name, exclude=(partition_ym_column(date_col),))
+
+    row_count = None
+    if EXPORT_STREAMING and schema is not None:
+        try:
+            row_count = _stream_query_to_parquet(conn, month_sql, month_params, dst_path, schema)
+        except Exception as e:
+            logger.warning(f"Streaming export failed for {dataset} ({ym}), retrying in memory: {e}")
+
+    if row_count is None:
+        df = pd.read_sql_query(month_sql, conn, params=month_params)
+        row_count = len(df)
+        if row_count:
             _df_to_parquet_with_schema(df, dst_path, schema)
-            
-            # Update Meta
-            if reconcile:
-                sql_cnt, sql_h = _sql_partition_stats(conn, table_name, date_col, ym)
-                _write_partition_meta_to_sql(conn, {
-                    'dataset': dataset,
-                    'table': table_name,
-                    'date_col': date_col,
-                    'ym': ym,
-                    'row_count': sql_cnt,
-                    'record_hash_checksum': sql_h,
-                    'parquet_path': str(dst_path),
-                    'exported_at': date.today().isoformat()
-                })
-            
-            logger.info(f"Exported {dataset} ({ym}) -> {dst_path.name} ({len(df)} rows)")
-            
+
+    if row_count == 0:
+        logger.info(f"No data found for {ym}, skipping.")
+        return 0
+
+    # Update Meta (stats taken before the export: a concurrent change only causes a re-export next run)
+    if part.reconcile:
+        if part.stats is not None:
+            sql_cnt, sql_h = part.stats
+        else:
+            sql_cnt, sql_h = _sql_partition_stats(conn, table_name, date_col, ym)
+        _write_partition_meta_to_sql(conn, {
+            'dataset': dataset,
+            'table': table_name,
+            'date_col': date_col,
+            'ym': ym,
+            'row_count': sql_cnt,
+            'record_hash_checksum': sql_h,
+            'parquet_path': str(dst_path),
+            'exported_at': date.today().isoformat()
+        })
+
+    logger.info(f"Exported {dataset} ({ym}) -> {dst_path.name} ({row_count} rows)")
+    return row_count
+
+def export_partitioned_table(
+    conn,
+    dataset: str,
+    table_name: str,
+    date_col: str,
+    months: List[str],
+    *,
+    output_dir: Path,
+    reconcile: bool = True,
+    force: bool = False
+) -> bool:
+    """
+    Exports specified months of a table to Parquet with incremental checks.
+
+    Plans the months with plan_partitioned_export and writes them one by one with
+    export_partition_month on the given connection. Returns True if any month failed.
+    """
+    failed = False
+    if reconcile:
+        try:
+            ensure_export_partition_meta_table(conn)
+        except Exception as e:
+            logger.warning(f"Could not create export_partition_meta, months will not be reconciled: {e}")
+    parts = plan_partitioned_export(
+        conn, dataset, table_name, date_col, months,
+        output_dir=output_dir, reconcile=reconcile, force=force,
+    )
+    for part in parts:
+        try:
+            export_partition_month(conn, part)
         except Exception as e:
-            logger.error(f"Failed to export {dataset} ({ym}): {e}")
+            logger.error(f"Failed to export {dataset} ({part.ym}): {e}")
             failed = True
 
     return failed
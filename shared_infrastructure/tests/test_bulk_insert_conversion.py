@@ -0,0 +1,87 @@
+"""
+测试 SQLServerOnlyManager.bulk_insert 参数转换
+向量化转换（_convert_column）与逐单元格参照实现（_convert_column_rowwise）结果逐值一致
+"""
+
+import math
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+# 未安装 ODBC 驱动的环境无法导入 db_sqlserver_only
+pytest.importorskip("pyodbc", exc_type=ImportError)
+
+from shared_infrastructure.utils.db_sqlserver_only import SQLServerOnlyManager
+
+# (列名, INFORMATION_SCHEMA.COLUMNS 中的 DATA_TYPE)
+TABLE_COLS = [
+    ("BatchNumber", "nvarchar"),
+    ("Operation", "nvarchar"),
+    ("Plant", "nvarchar"),
+    ("Group", "nvarchar"),
+    ("machine", "nvarchar"),
+    ("TrackOutQuantity", "float"),
+    ("ScrapQty", "decimal"),
+    ("StepCount", "int"),
+    ("IsRework", "bit"),
+    ("TrackOutDate", "datetime2"),
+    ("TrackInText", "datetime"),
+    ("record_hash", "nvarchar"),
+]
+
+
+def _frame(rows=5000, seed=42):
+    """MES 风格的合成数据：含空值、空白、'nan'/'NULL' 文本、控制字符和无法解析的数字"""
+    rng = np.random.default_rng(seed)
+
+    def pick(values):
+        return np.array(values, dtype=object)[rng.integers(0, len(values), rows)]
+
+    qty = rng.normal(100, 30, rows).round(2)
+    qty[rng.random(rows) < 0.05] = np.nan
+    track_out = pd.Series(pd.Timestamp("2025-01-01") + pd.to_timedelta(rng.integers(0, 365 * 24 * 3600, rows), unit="s"))
+    track_out[rng.random(rows) < 0.02] = pd.NaT
+
+    return pd.DataFrame({
+        "BatchNumber": pick(["K24A001", " K24A002 ", "K24B010", "", None, "nan", "K24C\x07777"]),
+        "Operation": pick([10.0, 20.0, 80.0, np.nan, 35.5]),
+        "Plant": pick(["1303", "9997", "1303\\x0", "NULL", None]),
+        "Group": pick(["G1", "G2 ", "", "none"]),
+        "machine": pick(["M-01", "M-02", "M-03", None]),
+        "TrackOutQuantity": qty,
+        "ScrapQty": pick(["0", "1.5", " 2 ", "", "N/A", None, "1e3", "-0.25", "inf"]),
+        "StepCount": pick([1, 2.0, "3", "3.7", "", None, "x", -4.9]),
+        "IsRework": pick(["true", "False", "0", "1", 1, 0, None, "", "yes"]),
+        "TrackOutDate": track_out,
+        "TrackInText": pick(["2025-01-01 08:00:00", " 2025-02-01 ", "", None]),
+        "record_hash": pd.Series(rng.integers(0, 2**62, rows)).map("{:016x}".format),
+    })
+
+
+def _same_value(a, b):
+    if a is None or b is None:
+        return a is None and b is None
+    if isinstance(a, float) and isinstance(b, float) and math.isnan(a) and math.isnan(b):
+        return True
+    # 含 NULL 的整数列在参照实现中会被 pandas 升为 float
+    return a == b and (type(a) is type(b) or {type(a), type(b)} <= {int, float})
+
+
+@pytest.mark.parametrize("col_name,sql_type", TABLE_COLS)
+def test_vectorized_conversion_matches_rowwise(col_name, sql_type):
+    db = SQLServerOnlyManager()
+    series = _frame()[col_name]
+
+    expected = db._convert_column_rowwise(series, col_name, sql_type).tolist()
+    actual = db._convert_column(series, col_name, sql_type).tolist()
+
+    assert len(actual) == len(expected)
+    mismatches = [(i, a, b) for i, (a, b) in enumerate(zip(expected, actual)) if not _same_value(a, b)]
+    assert not mismatches, f"{col_name}: {mismatches[:5]}"
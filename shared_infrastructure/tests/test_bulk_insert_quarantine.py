@@ -0,0 +1,72 @@
+"""
+测试 bulk_insert 隔离表（bulk_insert_quarantine）
+建表 DDL 单独提交后才记入进程内 DDL 备忘：隔离写入失败回滚时不会撤销建表
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+# 未安装 ODBC 驱动的环境无法导入 db_sqlserver_only
+pytest.importorskip("pyodbc", exc_type=ImportError)
+
+from shared_infrastructure.utils import db_sqlserver_only as sqlserver
+from shared_infrastructure.utils.sqlserver_pool import ddl_ensured, reset_ddl_memo
+
+
+class _FakeConnection:
+    """模拟事务：未提交的建表在 rollback 时被撤销"""
+
+    def __init__(self, fail_inserts):
+        self.fail_inserts = fail_inserts
+        self.table_exists = False
+        self.pending_create = False
+        self.quarantined = 0
+
+    def cursor(self):
+        return _FakeCursor(self)
+
+    def commit(self):
+        self.table_exists = self.table_exists or self.pending_create
+        self.pending_create = False
+
+    def rollback(self):
+        self.pending_create = False
+
+
+class _FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, *params):
+        if "CREATE TABLE" in sql and not self.conn.table_exists:
+            self.conn.pending_create = True
+
+    def executemany(self, sql, rows):
+        if not (self.conn.table_exists or self.conn.pending_create):
+            raise RuntimeError(f"Invalid object name '{sqlserver.QUARANTINE_TABLE}'")
+        if self.conn.fail_inserts:
+            self.conn.fail_inserts -= 1
+            raise RuntimeError("String or binary data would be truncated")
+        self.conn.quarantined += len(rows)
+
+
+def test_failed_quarantine_write_does_not_undo_create():
+    reset_ddl_memo()
+    db = sqlserver.SQLServerOnlyManager()
+    conn = _FakeConnection(fail_inserts=1)
+    rejected = [(3, ("K1", "x"), RuntimeError("Parameter 2: invalid value"))]
+
+    assert db._quarantine_rows(conn, "raw_mes", ["BatchNumber", "Qty"], rejected) == 0
+    assert ddl_ensured(db.connection_string, sqlserver.QUARANTINE_TABLE)
+    assert conn.table_exists
+
+    # 备忘已记录建表：后续写入跳过 DDL，表仍然存在
+    assert db._quarantine_rows(conn, "raw_mes", ["BatchNumber", "Qty"], rejected) == 1
+    assert conn.quarantined == 1
+    reset_ddl_memo()
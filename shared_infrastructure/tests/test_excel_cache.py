@@ -0,0 +1,116 @@
+"""
+测试Excel落地缓存（excel_cache）
+- 来源文件 (路径, 大小, mtime) 不变时不读取全量哈希；变化时用全量哈希确认，内容不同则不命中
+- 解析期间文件被改写时不写缓存
+- 超过上限时按最近使用时间淘汰
+"""
+
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from shared_infrastructure.utils import excel_cache
+from shared_infrastructure.utils.excel_cache import ExcelLandingCache
+
+BLOCK = 64 * 1024
+
+
+def _workbook(path, filler=b"x"):
+    """五个块的文件：抽样只读第 1/3/5 块，filler 所在的块变化不会改变抽样哈希"""
+    path.write_bytes(b"h" * BLOCK + filler * BLOCK + b"m" * BLOCK + filler * BLOCK + b"t" * BLOCK)
+    return str(path)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ExcelLandingCache(str(tmp_path / "cache"), max_bytes=100 * 1024 * 1024)
+
+
+@pytest.fixture
+def full_hash_calls(monkeypatch):
+    calls = []
+    real = excel_cache.full_hash
+
+    def counting(file_path, *args, **kwargs):
+        calls.append(file_path)
+        return real(file_path, *args, **kwargs)
+
+    monkeypatch.setattr(excel_cache, "full_hash", counting)
+    return calls
+
+
+def test_unchanged_source_hits_without_full_hash(tmp_path, cache, full_hash_calls):
+    src = _workbook(tmp_path / "a.xlsx")
+    # 字符串列的空值与 read_excel 一样读回为 NaN
+    df = pd.DataFrame({"BatchNumber": ["K1", np.nan], "Qty": [1.0, 2.5]})
+    assert cache.put(cache.key(src), cache.source(src), df)
+    full_hash_calls.clear()
+
+    pd.testing.assert_frame_equal(cache.get(cache.key(src), src), df)
+    chunks = list(cache.iter_chunks(cache.key(src), src, chunk_rows=1))
+    pd.testing.assert_frame_equal(pd.concat(chunks), df)
+    assert full_hash_calls == []
+
+
+def test_touched_or_copied_source_confirmed_by_full_hash(tmp_path, cache, full_hash_calls):
+    src = _workbook(tmp_path / "a.xlsx")
+    df = pd.DataFrame({"BatchNumber": ["K1"]})
+    cache.put(cache.key(src), cache.source(src), df)
+    full_hash_calls.clear()
+
+    # 同步工具只改 mtime
+    os.utime(src, ns=(0, 10**18))
+    pd.testing.assert_frame_equal(cache.get(cache.key(src), src), df)
+    # 另一路径的同一内容
+    copy = _workbook(tmp_path / "b.xlsx")
+    pd.testing.assert_frame_equal(cache.get(cache.key(copy), copy), df)
+    assert full_hash_calls == [src, copy]
+
+
+def test_same_sample_different_content_misses(tmp_path, cache):
+    src = _workbook(tmp_path / "a.xlsx")
+    cache.put(cache.key(src), cache.source(src), pd.DataFrame({"BatchNumber": ["K1"]}))
+
+    other = _workbook(tmp_path / "b.xlsx", filler=b"z")
+    assert cache.key(other) == cache.key(src)
+    assert cache.get(cache.key(other), other) is None
+    assert cache.iter_chunks(cache.key(other), other, chunk_rows=10) is None
+
+
+def test_rewrite_during_parse_is_not_cached(tmp_path, cache):
+    src = _workbook(tmp_path / "a.xlsx")
+    key, source = cache.key(src), cache.source(src)
+    # 解析期间同步工具改写了文件
+    _workbook(tmp_path / "a.xlsx", filler=b"z")
+    os.utime(src, ns=(0, 10**18))
+
+    assert not cache.put(key, source, pd.DataFrame({"BatchNumber": ["old"]}))
+    assert cache.get(cache.key(src), src) is None
+
+
+def test_evict_removes_least_recently_used(tmp_path, cache):
+    sources = []
+    for name in "abc":
+        (tmp_path / f"{name}.xlsx").write_bytes(name.encode() * 4096)
+        sources.append(str(tmp_path / f"{name}.xlsx"))
+    keys = [cache.key(src) for src in sources]
+    for key, src in zip(keys, sources):
+        assert cache.put(key, cache.source(src), pd.DataFrame({"BatchNumber": [src] * 100}))
+    paths = [cache._path(key) for key in keys]
+    for age, path in zip((300, 200, 100), paths):
+        os.utime(path, (1_000_000 - age, 1_000_000 - age))
+
+    # 命中刷新最近使用时间：a 虽然最早写入，但比 b 更新
+    assert cache.get(keys[0], sources[0]) is not None
+    cache.max_bytes = os.path.getsize(paths[0]) + os.path.getsize(paths[2])
+    cache.evict()
+
+    assert [os.path.exists(path) for path in paths] == [True, False, True]
@@ -0,0 +1,62 @@
+"""
+测试分区导出元数据（dbo.export_partition_meta）的写入
+并发的月份任务只写元数据行，不再各自执行建表；写入失败记录日志而不是静默丢弃
+"""
+
+import logging
+import sys
+from pathlib import Path
+
+import pytest
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+# 未安装 ODBC 驱动的环境无法导入 export_utils
+pytest.importorskip("pyodbc", exc_type=ImportError)
+
+from shared_infrastructure import export_utils
+
+META = {"dataset": "mes_batch_report", "table": "raw_mes", "date_col": "TrackOutDate", "ym": "2025-01", "row_count": 3}
+
+
+class _FakeConnection:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.statements = []
+        self.rolled_back = False
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, *params):
+        self.statements.append(sql)
+        if self.fail:
+            raise RuntimeError("Invalid object name 'dbo.export_partition_meta'")
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        self.rolled_back = True
+
+
+def test_month_meta_write_runs_no_ddl():
+    conn = _FakeConnection()
+    export_utils._write_partition_meta_to_sql(conn, META)
+    assert len(conn.statements) == 1
+    assert conn.statements[0].startswith("MERGE")
+
+
+def test_failed_meta_write_is_logged(caplog):
+    conn = _FakeConnection(fail=True)
+    with caplog.at_level(logging.WARNING, logger=export_utils.logger.name):
+        export_utils._write_partition_meta_to_sql(conn, META)
+    assert conn.rolled_back
+    assert "mes_batch_report (2025-01)" in caplog.text
+
+
+def test_ensure_meta_table_raises():
+    with pytest.raises(RuntimeError):
+        export_utils.ensure_export_partition_meta_table(_FakeConnection(fail=True))
@@ -0,0 +1,113 @@
+"""
+测试分区导出的流式写入（export_utils._stream_query_to_parquet）
+- 逐批写入的 Parquet 与整月读入内存后写入（_df_to_parquet_with_schema）的结果完全一致，
+  包括 DATETIME 列按整列精度格式化为文本（两遍写入）
+- 中途失败时游标被取消并关闭，连接可以继续用于内存回退
+"""
+
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+# 未安装 ODBC 驱动的环境无法导入 export_utils
+pytest.importorskip("pyodbc", exc_type=ImportError)
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from shared_infrastructure import export_utils
+
+COLUMNS = [("BatchNumber", str), ("Qty", float), ("StepCount", int), ("TrackOutTime", datetime)]
+SCHEMA = pa.schema([
+    pa.field("BatchNumber", pa.string()),
+    pa.field("Qty", pa.float64()),
+    pa.field("StepCount", pa.int64()),
+    # DATETIME 列在导出 schema 中是文本
+    pa.field("TrackOutTime", pa.string()),
+])
+
+
+class _FakeCursor:
+    def __init__(self, rows, fail_after=None):
+        self.rows = list(rows)
+        self.fail_after = fail_after
+        self.fetches = 0
+        self.description = None
+        self.calls = []
+
+    def execute(self, sql, params):
+        self.description = [(name, type_code, None, None, None, None, True) for name, type_code in COLUMNS]
+        return self
+
+    def fetchmany(self, size):
+        if self.fail_after is not None and self.fetches >= self.fail_after:
+            raise ValueError("cast failed")
+        self.fetches += 1
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        return batch
+
+    def cancel(self):
+        self.calls.append("cancel")
+
+    def close(self):
+        self.calls.append("close")
+
+
+class _FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def cursor(self):
+        return self._cursor
+
+
+def _rows(track_out_times):
+    return [
+        (f"K{i:04d}" if i % 7 else None, i * 1.5 if i % 5 else None, i if i % 3 else None, ts)
+        for i, ts in enumerate(track_out_times)
+    ]
+
+
+DAY = [datetime(2025, 1, d) for d in range(1, 11)]
+CASES = {
+    "dates_only": DAY,
+    "seconds_in_last_batch": DAY[:8] + [datetime(2025, 1, 9, 8, 30, 5), datetime(2025, 1, 10)],
+    "ms_in_one_batch": DAY[:3] + [datetime(2025, 1, 4, 1, 2, 3, 456000)] + DAY[4:],
+    "us_and_nulls": [None, None, None] + DAY[3:6] + [datetime(2025, 1, 7, 0, 0, 0, 1)] + DAY[7:],
+    "all_null": [None] * 10,
+}
+
+
+@pytest.mark.parametrize("case", sorted(CASES))
+def test_streaming_matches_in_memory_export(tmp_path, case):
+    rows = _rows(CASES[case])
+    streamed = tmp_path / "streamed.parquet"
+    in_memory = tmp_path / "in_memory.parquet"
+
+    cursor = _FakeCursor(rows)
+    count = export_utils._stream_query_to_parquet(_FakeConnection(cursor), "SELECT", (), streamed, SCHEMA, batch_rows=3)
+    # 与 pd.read_sql_query 相同的 DataFrame 构造方式
+    df = pd.DataFrame.from_records(rows, columns=[c for c, _ in COLUMNS], coerce_float=True)
+    export_utils._df_to_parquet_with_schema(df, in_memory, SCHEMA)
+
+    assert count == len(rows)
+    assert pq.read_table(streamed).equals(pq.read_table(in_memory))
+    assert cursor.calls == ["cancel", "close"]
+
+
+def test_failed_stream_releases_cursor_and_leaves_no_file(tmp_path):
+    cursor = _FakeCursor(_rows(DAY), fail_after=1)
+    out_path = tmp_path / "month.parquet"
+
+    with pytest.raises(ValueError):
+        export_utils._stream_query_to_parquet(_FakeConnection(cursor), "SELECT", (), out_path, SCHEMA, batch_rows=3)
+
+    assert cursor.calls == ["cancel", "close"]
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,62 @@
+"""
+测试KPI应完工时间（etl_kpi_aggregation.calculate_due_time）
+共享 WorkCalendar 的结果与按天扫描日历表的参照实现一致，日历只构造一次
+"""
+
+import sys
+from datetime import timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / "data_pipelines" / "monitoring" / "etl"))
+
+# 未安装 ODBC 驱动的环境无法导入 etl_kpi_aggregation
+pytest.importorskip("pyodbc", exc_type=ImportError)
+
+import etl_kpi_aggregation as kpi
+
+
+def _calendar_df(rng):
+    """dim_calendar 格式（date 为 yyyy-mm-dd 文本，is_workday 为 0/1），含节假日 / 调休"""
+    days = pd.date_range("2024-01-01", "2025-12-31")
+    workday = days.weekday < 5
+    flip = rng.random(len(days)) < 0.05
+    return pd.DataFrame({
+        "date": days.strftime("%Y-%m-%d"),
+        "is_workday": np.where(flip, ~workday, workday).astype(int),
+    })
+
+
+def _reference_due_time(start_time, plan_hours, calendar_df):
+    """按天扫描日历表的原实现"""
+    current_time = start_time
+    remaining_hours = plan_hours
+    while remaining_hours > 0:
+        is_workday = calendar_df[
+            calendar_df['date'] == current_time.date().strftime('%Y-%m-%d')
+        ]['is_workday'].values
+        if len(is_workday) > 0 and is_workday[0] == 1:
+            remaining_hours -= min(remaining_hours, 24)
+        current_time += timedelta(days=1)
+    return current_time
+
+
+def test_due_time_matches_reference_with_reused_calendar(monkeypatch):
+    rng = np.random.default_rng(5)
+    calendar_df = _calendar_df(rng)
+    calendar = kpi.load_kpi_calendar(calendar_df)
+    # 传入日历时不应再构造或加载日历
+    monkeypatch.setattr(kpi, "load_kpi_calendar", lambda *a, **k: pytest.fail("日历被重复构造"))
+
+    starts = pd.Timestamp("2024-02-01") + pd.to_timedelta(rng.integers(0, 500 * 86400, 300), unit="s")
+    hours = rng.choice([0.0, 0.5, 8.0, 24.0, 24.5, 47.9, 48.0, 100.0, 300.0], 300)
+    for start, plan_hours in zip(starts, hours):
+        start = start.to_pydatetime()
+        expected = _reference_due_time(start, plan_hours, calendar_df)
+        assert kpi.calculate_due_time(start, plan_hours, calendar) == expected, (start, plan_hours)
@@ -0,0 +1,87 @@
+"""
+测试MES DueTime / NonWorkday(d) / CompletionStatus 的整列计算
+向量化函数（共享 WorkCalendar）与逐行参照函数结果完全一致
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / "data_pipelines" / "sources" / "mes" / "etl"))
+
+import etl_dataclean_mes_batch_report as mes
+from shared_infrastructure.utils.work_calendar import WorkCalendar
+
+
+def _calendar(rng):
+    """周一到周五为工作日，随机 5% 的日期翻转（节假日 / 调休）"""
+    days = pd.date_range("2024-01-01", "2025-06-30")
+    workday = days.weekday < 5
+    flip = rng.random(len(days)) < 0.05
+    return pd.DataFrame({"日期": days, "是否工作日": np.where(flip, ~workday, workday)}).set_index("日期")
+
+
+def _frame(rows, rng):
+    base = pd.Timestamp("2024-03-01").value
+
+    def timestamps(spread_days, null_ratio):
+        values = pd.Series(pd.to_datetime(base + rng.integers(0, spread_days * 86400, rows) * 10**9))
+        values[rng.random(rows) < null_ratio] = pd.NaT
+        return values
+
+    enter = timestamps(450, 0.05)
+    previous = enter - pd.to_timedelta(rng.integers(-3 * 86400, 10 * 86400, rows), unit="s")
+    previous[rng.random(rows) < 0.3] = pd.NaT
+    trackout = enter + pd.to_timedelta(rng.exponential(3 * 86400, rows).astype(int), unit="s")
+    trackout[rng.random(rows) < 0.03] = pd.NaT
+
+    return pd.DataFrame({
+        "Operation": rng.choice(["0010", "0020", "0030"], rows),
+        "Checkin_SFC": timestamps(450, 0.5),
+        "EnterStepTime": enter,
+        "TrackInTime": timestamps(450, 0.3),
+        "TrackOutTime": trackout,
+        "PreviousBatchEndTime": previous,
+        "Setup": rng.choice(["Yes", "No", None], rows),
+        "Setup Time (h)": rng.choice([0.0, 1.5, np.nan, 3.0], rows),
+        "EH_machine(s)": rng.choice([0, np.nan, 30.0, 120.5, 7.3], rows),
+        "EH_labor(s)": rng.choice([0, np.nan, 45.0, 9.9], rows),
+        "StepInQuantity": rng.choice([0, np.nan, 1, 50, 333, 10000], rows).astype(float),
+        "OEE": rng.choice([0.77, 0.5, 0.9], rows),
+        "PT(d)": rng.choice([np.nan, 0.5, 1.2, 3.0, 10.0], rows),
+        "ST(d)": rng.choice([np.nan, 0.3, 1.0, 2.5], rows),
+    })
+
+
+def _assert_same(expected, actual):
+    diff = ~((expected == actual) | (expected.isna() & actual.isna()))
+    rows = np.flatnonzero(diff.to_numpy())[:5]
+    assert not diff.any(), [(i, expected.iloc[i], actual.iloc[i]) for i in rows]
+
+
+@pytest.mark.parametrize("daily_working_hours", [24.0, 8.0])
+def test_vectorized_calendar_metrics_match_rowwise(daily_working_hours):
+    rng = np.random.default_rng(42)
+    calendar_df = _calendar(rng)
+    df = _frame(2000, rng)
+    calendar = WorkCalendar.from_frame(calendar_df, flag_col="是否工作日")
+
+    ref_due = df.apply(lambda row: mes.calculate_due_time(row, calendar_df, daily_working_hours), axis=1)
+    ref_nonworkday = df.apply(lambda row: mes.calculate_nonworkday_days(row, calendar_df), axis=1)
+    ref_status = df.assign(**{"NonWorkday(d)": ref_nonworkday}).apply(
+        lambda row: mes.calculate_completion_status(row, calendar_df), axis=1
+    )
+
+    due = mes.calculate_due_time_column(df, calendar, daily_working_hours)
+    nonworkday = mes.calculate_nonworkday_days_column(df, calendar)
+    status = mes.calculate_completion_status_column(df.assign(**{"NonWorkday(d)": nonworkday}))
+
+    _assert_same(pd.to_datetime(ref_due), pd.to_datetime(due))
+    _assert_same(ref_nonworkday.astype(float), nonworkday.astype(float))
+    _assert_same(ref_status, status)
@@ -0,0 +1,83 @@
+"""
+测试MES历史表的两种合并方式结果一致
+upsert_history（增量）与 merge_with_history + calculate_previous_batch_end_time（全量）
+在唯一键重复、TrackOutTime 相同（小时粒度）时都应以新数据为准
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / "data_pipelines" / "sources" / "mes" / "etl"))
+
+import etl_dataclean_mes_batch_report as mes
+from shared_infrastructure.utils.db_utils import DatabaseManager
+
+KEY_FIELDS = ["BatchNumber", "Operation", "machine", "TrackOutTime"]
+CFG = {"incremental": {"unique_key_fields": KEY_FIELDS}}
+
+
+def _batches(rng, count, start, qty_offset):
+    """小时粒度的批次：同一机台内大量 TrackOutTime 相同"""
+    track_out = pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, 48, count), unit="h")
+    return pd.DataFrame({
+        "BatchNumber": [f"B{i:04d}" for i in rng.integers(0, 60, count)],
+        "Operation": rng.choice(["0010", "0020"], count),
+        "machine": rng.choice(["M1", "M2", "M3"], count),
+        "TrackOutTime": track_out,
+        "EnterStepTime": track_out - pd.Timedelta(hours=2),
+        "Qty": rng.integers(0, 1000, count) + qty_offset,
+    })
+
+
+def _history_snapshot(db_path):
+    with sqlite3.connect(db_path) as conn:
+        df = pd.read_sql_query(f"SELECT * FROM {mes.HISTORY_TABLE}", conn)
+    return df
+
+
+def _normalize(df):
+    out = df[KEY_FIELDS + ["Qty", "PreviousBatchEndTime"]].copy()
+    out["TrackOutTime"] = mes.to_datetime_column(out["TrackOutTime"])
+    out["PreviousBatchEndTime"] = pd.to_datetime(out["PreviousBatchEndTime"], format="ISO8601")
+    out["Qty"] = out["Qty"].astype("int64")
+    return out.sort_values(KEY_FIELDS, kind="stable").reset_index(drop=True)
+
+
+def _run(tmp_path, monkeypatch, mode, history, new_rows):
+    db_path = tmp_path / f"{mode}.db"
+    db = DatabaseManager(str(db_path))
+    monkeypatch.setattr(mes, "get_default_db_manager", lambda: db)
+    db.bulk_insert(mes.calculate_previous_batch_end_time(history.copy()), mes.HISTORY_TABLE, if_exists="replace")
+
+    if mode == "upsert":
+        assert mes.upsert_history(new_rows.copy(), CFG) is not None
+        return _history_snapshot(db_path)
+
+    changed = new_rows["machine"].dropna().unique()
+    merged = mes.merge_with_history(new_rows.copy(), str(tmp_path / "unused.parquet"), CFG)
+    return mes.calculate_previous_batch_end_time(merged, changed_machines=changed)
+
+
+def test_upsert_matches_full_merge_with_tied_track_out_times(tmp_path, monkeypatch):
+    rng = np.random.default_rng(11)
+    history = _batches(rng, 400, "2024-03-01", qty_offset=0)
+    history = history.drop_duplicates(subset=KEY_FIELDS).reset_index(drop=True)
+    # 新数据一半重复历史唯一键（Qty 不同，应覆盖历史），一半为新批次
+    replaced = history.sample(100, random_state=3).assign(Qty=lambda d: d["Qty"] + 10_000)
+    fresh = _batches(rng, 100, "2024-03-02", qty_offset=20_000)
+    new_rows = pd.concat([replaced, fresh], ignore_index=True).drop_duplicates(subset=KEY_FIELDS)
+
+    upserted = _normalize(_run(tmp_path, monkeypatch, "upsert", history, new_rows))
+    merged = _normalize(_run(tmp_path, monkeypatch, "merge", history, new_rows))
+
+    pd.testing.assert_frame_equal(upserted, merged)
+    # 重复唯一键全部以新数据为准
+    replaced_keys = replaced.merge(merged, on=KEY_FIELDS, suffixes=("_new", ""))
+    assert (replaced_keys["Qty"] == replaced_keys["Qty_new"]).all()
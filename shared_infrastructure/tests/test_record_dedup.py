@@ -0,0 +1,91 @@
+"""
+测试跨文件记录去重过滤器（record_dedup）
+与 Python 集合参照实现逐行对比：任何过滤器都不能丢弃参照实现保留的行
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from shared_infrastructure.utils.record_dedup import RecordKeyFilter, make_record_filter
+
+
+def _files(count=6, rows=3000, overlap=0.4, seed=7):
+    """相邻文件按 overlap 比例重叠的记录键，含少量空键"""
+    rng = np.random.default_rng(seed)
+    start = 0
+    frames = []
+    for _ in range(count):
+        ids = np.arange(start, start + rows)
+        start += int(rows * (1 - overlap))
+        keys = pd.Series([f"B{i:08d}|{i % 90:04d}|M{i % 57:03d}" for i in ids], dtype="string")
+        keys[rng.random(rows) < 0.01] = pd.NA
+        frames.append(keys)
+    return frames
+
+
+def _reference_masks(frames):
+    seen = set()
+    masks = []
+    for keys in frames:
+        mask = np.array([pd.isna(k) or k not in seen for k in keys], dtype=bool)
+        seen.update(k for k in keys[mask] if not pd.isna(k))
+        masks.append(mask)
+    return masks
+
+
+@pytest.mark.parametrize("kind", ["set", "hashset", "bloom"])
+def test_filter_matches_reference_set(kind):
+    """set / hashset（未达上限）/ 带 exact_check 的 bloom 与参照集合结果完全一致"""
+    frames = _files()
+    reference = _reference_masks(frames)
+    written = set()
+    seen = make_record_filter(
+        kind,
+        max_keys=1_000_000,
+        exact_check=lambda keys: {k for k in keys if k in written},
+    )
+    for keys, expected in zip(frames, reference):
+        keep = seen.new_mask(keys)
+        written.update(k for k in keys[keep] if not pd.isna(k))
+        seen.add(keys[keep])
+        assert np.array_equal(keep, expected)
+
+
+def test_hashset_over_capacity_never_drops_new_rows():
+    """超过上限后只会漏判（多保留的重复交给数据库），不会丢弃新记录"""
+    frames = _files()
+    reference = _reference_masks(frames)
+    seen = make_record_filter("hashset", max_keys=2000)
+    for keys, expected in zip(frames, reference):
+        keep = seen.filter_new(keys)
+        assert not (expected & ~keep).any()
+    assert len(seen) <= 2000
+
+
+def test_keys_not_added_after_failed_write_stay_new():
+    """写库失败的块不调用 add：后续文件中的同一批记录仍视为新记录"""
+    seen = make_record_filter("hashset", max_keys=1000)
+    failed_chunk = pd.Series(["a", "b"], dtype="string")
+    assert seen.new_mask(failed_chunk).all()
+    # 写库失败，不记录
+    later_file = pd.Series(["a", "b", "c"], dtype="string")
+    assert seen.new_mask(later_file).all()
+    seen.add(later_file)
+    assert not seen.new_mask(later_file).any()
+
+
+def test_incomplete_filter_subclass_cannot_be_instantiated():
+    class Incomplete(RecordKeyFilter):
+        def _contains(self, text):
+            return np.zeros(len(text), dtype=bool)
+
+    with pytest.raises(TypeError):
+        Incomplete()
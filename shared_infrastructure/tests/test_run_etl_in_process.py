@@ -0,0 +1,68 @@
+"""
+测试常驻工作进程中的脚本执行（run_etl_parallel.run_script_in_process）
+连续两次运行不同目录下的脚本：同名的同级模块各自重新导入，
+具名 logger 的输出进入本次任务的缓冲区，而不是上一个任务已关闭的缓冲区
+"""
+
+import logging
+import sys
+import textwrap
+from pathlib import Path
+
+import pytest
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / "scripts" / "orchestration"))
+
+# 未安装 ODBC 驱动的环境无法导入 run_etl_parallel
+pytest.importorskip("pyodbc", exc_type=ImportError)
+
+import run_etl_parallel
+
+SIBLING = '''
+import logging
+import sys
+
+SOURCE = "{source}"
+logger = logging.getLogger("etl_sibling")
+if not logger.handlers:
+    logger.addHandler(logging.StreamHandler(sys.stdout))
+logger.propagate = False
+'''
+
+SCRIPT = '''
+import logging
+import etl_sibling_config
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+etl_sibling_config.logger.warning("sibling from %s", etl_sibling_config.SOURCE)
+logging.getLogger("etl_task").info("task done")
+'''
+
+
+def _write_task(directory, source):
+    directory.mkdir()
+    (directory / "etl_sibling_config.py").write_text(textwrap.dedent(SIBLING.format(source=source)), encoding="utf-8")
+    script = directory / "etl_task.py"
+    script.write_text(textwrap.dedent(SCRIPT), encoding="utf-8")
+    return str(script)
+
+
+def test_consecutive_runs_are_isolated(tmp_path):
+    first = _write_task(tmp_path / "first", "first")
+    second = _write_task(tmp_path / "second", "second")
+    handlers_before = logging.getLogger().handlers[:]
+
+    code1, out1 = run_etl_parallel.run_script_in_process(first, [])
+    code2, out2 = run_etl_parallel.run_script_in_process(second, [])
+
+    assert (code1, code2) == (0, 0)
+    assert "sibling from first" in out1 and "task done" in out1
+    assert "sibling from second" in out2 and "task done" in out2
+    assert "first" not in out2
+
+    assert "etl_sibling_config" not in sys.modules
+    assert logging.getLogger("etl_sibling").handlers == []
+    assert logging.getLogger().handlers == handlers_before
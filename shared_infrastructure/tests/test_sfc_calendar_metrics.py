@@ -0,0 +1,155 @@
+"""
+测试SFC DueTime / Weekend(d) 的整列计算（共享 WorkCalendar，周一到周五为工作日）
+与改用共享日历之前的逐行实现（按 48 小时周末区间循环）对比，已知的两处差异单独断言：
+1. 截止时间落在周一 8:00 之前：现在顺延到当天 8:00，原实现顺延到下周一 8:00
+2. 周末小时数按天累加后再舍入：恰好在 x.xx5h 的值可能相差 0.01h
+"""
+
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / "data_pipelines" / "sources" / "sfc" / "etl"))
+
+import etl_dataclean_sfc_batch_report as sfc
+
+
+# ---------------- 原逐行实现（参照） ----------------
+
+def _reference_weekend_period(date):
+    weekday = date.weekday()
+    eight = date.replace(hour=8, minute=0, second=0, microsecond=0)
+    if weekday == 5:
+        saturday_8am = eight if date.hour >= 8 else eight - timedelta(days=7)
+    elif weekday == 6:
+        saturday_8am = eight - timedelta(days=1)
+    elif weekday == 0:
+        saturday_8am = eight - timedelta(days=2) if date.hour < 8 else eight + timedelta(days=5)
+    else:
+        saturday_8am = eight + timedelta(days=5 - weekday)
+        if saturday_8am > date:
+            saturday_8am -= timedelta(days=7)
+    return saturday_8am, saturday_8am + timedelta(days=2)
+
+
+def _reference_weekend_hours(start, end):
+    if end <= start:
+        return 0.0
+    total_hours = 0.0
+    current_start = start
+    processed = set()
+    while current_start < end:
+        saturday_8am, monday_8am = _reference_weekend_period(current_start)
+        if saturday_8am in processed:
+            current_start = monday_8am
+            continue
+        processed.add(saturday_8am)
+        overlap_start = max(current_start, saturday_8am)
+        overlap_end = min(end, monday_8am)
+        if overlap_start < overlap_end:
+            total_hours += (overlap_end - overlap_start).total_seconds() / 3600
+        if current_start < monday_8am:
+            current_start = monday_8am
+        else:
+            next_saturday = saturday_8am + timedelta(days=7)
+            if next_saturday < end:
+                current_start = next_saturday
+            else:
+                break
+    return round(total_hours, 2)
+
+
+def _reference_adjust(start, due):
+    if due <= start:
+        return due
+    weekend_hours = _reference_weekend_hours(start, due)
+    weekday, hour = due.weekday(), due.hour
+    if (weekday == 5 and hour >= 8) or weekday == 6 or (weekday == 0 and hour < 8):
+        days_to_monday = {5: 2, 6: 1, 0: 7}[weekday]
+        return due.replace(hour=8, minute=0, second=0, microsecond=0) + timedelta(days=days_to_monday)
+    return due + timedelta(hours=weekend_hours)
+
+
+# ---------------- 测试数据 ----------------
+
+def _frame(rows, seed=3):
+    rng = np.random.default_rng(seed)
+    start = pd.Series(pd.Timestamp("2024-03-01") + pd.to_timedelta(rng.integers(0, 120 * 86400, rows), unit="s"))
+    start[rng.random(rows) < 0.05] = pd.NaT
+    return pd.DataFrame({
+        "TrackInTime": start,
+        "Checkin_SFC": start,
+        "Setup": rng.choice(["Yes", "No"], rows),
+        "Setup Time (h)": rng.choice([0.0, 1.5, np.nan, 3.0], rows),
+        "EH_machine(s)": rng.choice([0, np.nan, 30.0, 120.5, 7.3], rows),
+        "EH_labor(s)": rng.choice([0, np.nan, 45.0, 9.9], rows),
+        "TrackOutQuantity": rng.choice([0, 1, 50, 333, 2000], rows).astype(float),
+        "ScrapQuantity": rng.choice([0, 1, 5], rows).astype(float),
+        "OEE": rng.choice([0.77, 0.5, 0.9], rows),
+    })
+
+
+def _due0(df):
+    start, due0, valid = sfc._sfc_due_base(df)
+    return pd.Series(start), pd.Series(due0), valid
+
+
+def test_weekend_days_match_reference_within_rounding():
+    df = _frame(3000)
+    start, due0, valid = _due0(df)
+    weekend_d = sfc.calculate_sfc_weekend_days_column(df, sfc._WEEKEND_CALENDAR)
+
+    expected = [
+        round(_reference_weekend_hours(s.to_pydatetime(), d.to_pydatetime()) / 24, 2) if ok else np.nan
+        for s, d, ok in zip(start, due0, valid)
+    ]
+    diff = np.abs(weekend_d.to_numpy() - np.array(expected))
+    assert np.array_equal(np.isnan(weekend_d.to_numpy()), np.isnan(expected))
+    # 只允许 x.xx5h 舍入差异
+    assert np.nanmax(diff) <= 0.01 + 1e-9
+    assert (diff[valid] == 0).mean() > 0.99
+
+
+def test_due_time_matches_reference_except_documented_changes():
+    df = _frame(3000)
+    start, due0, valid = _due0(df)
+    due = sfc.calculate_sfc_due_time_column(df, sfc._WEEKEND_CALENDAR)
+
+    monday_before_8 = 0
+    for i in np.flatnonzero(valid):
+        s, d = start[i].to_pydatetime(), due0[i].to_pydatetime()
+        expected, actual = pd.Timestamp(_reference_adjust(s, d)), pd.Timestamp(due.iloc[i])
+        if d > s and d.weekday() == 0 and d.hour < 8:
+            # 差异 1：顺延到当天 8:00，原实现多推了一周
+            monday_before_8 += 1
+            assert actual == pd.Timestamp(d.replace(hour=8, minute=0, second=0, microsecond=0))
+            assert expected == actual + pd.Timedelta(days=7)
+        else:
+            # 差异 2：周末小时数的 0.01h 舍入差异
+            assert abs(actual - expected) <= pd.Timedelta(hours=0.01)
+    assert monday_before_8 > 0
+    assert due[~valid].isna().all()
+
+
+def test_due_time_on_monday_before_8am_moves_to_same_monday():
+    # 周五 10:00 开始，未调整的截止时间为周一 07:00
+    df = pd.DataFrame({
+        "TrackInTime": [pd.Timestamp("2025-01-03 10:00")],
+        "EH_machine(s)": [3600.0],
+        "TrackOutQuantity": [68.5],
+        "ScrapQuantity": [0.0],
+        "OEE": [1.0],
+    })
+    assert pd.Timestamp(sfc._sfc_due_base(df)[1][0]) == pd.Timestamp("2025-01-06 07:00")
+
+    due = sfc.calculate_sfc_due_time_column(df, sfc._WEEKEND_CALENDAR).iloc[0]
+    assert pd.Timestamp(due) == pd.Timestamp("2025-01-06 08:00")
+    assert sfc.adjust_weekend_sfc(datetime(2025, 1, 3, 10), datetime(2025, 1, 6, 7)) == pd.Timestamp("2025-01-06 08:00")
+    # 原实现推到下周一
+    assert _reference_adjust(datetime(2025, 1, 3, 10), datetime(2025, 1, 6, 7)) == datetime(2025, 1, 13, 8)
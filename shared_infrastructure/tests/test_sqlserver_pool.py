@@ -0,0 +1,93 @@
+"""
+测试SQL Server连接池（sqlserver_pool）的游标跟踪
+不再引用的游标立即释放；连接归还时只关闭仍存活的游标
+"""
+
+import gc
+import sys
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from shared_infrastructure.utils.sqlserver_pool import ConnectionPool, PooledCursor
+
+
+class _RawCursor:
+    """与 pyodbc.Cursor 一样不支持弱引用"""
+
+    __slots__ = ("log", "rows", "closed", "fast_executemany")
+
+    def __init__(self, log):
+        self.log = log
+        self.rows = [(1,), (2,)]
+        self.closed = False
+
+    def execute(self, sql, *params):
+        return self
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def __next__(self):
+        if not self.rows:
+            raise StopIteration
+        return self.rows.pop(0)
+
+    def close(self):
+        self.closed = True
+        self.log.append("closed")
+
+    def __del__(self):
+        self.log.append("freed")
+
+
+class _RawConnection:
+    __slots__ = ("log", "autocommit", "timeout")
+
+    def __init__(self):
+        self.log = []
+        self.autocommit = False
+        self.timeout = 0
+
+    def cursor(self):
+        return _RawCursor(self.log)
+
+    def execute(self, sql, *params):
+        return self.cursor().execute(sql, *params)
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_dropped_cursor_is_freed_before_release():
+    raw = _RawConnection()
+    conn = ConnectionPool(lambda: raw, max_size=1).acquire()
+    for _ in range(3):
+        assert conn.cursor().execute("SELECT 1").fetchall() == [(1,), (2,)]
+    gc.collect()
+    assert raw.log == ["freed"] * 3
+    assert len(conn._cursors) == 0
+    conn.close()
+
+
+def test_live_cursors_closed_on_release():
+    raw = _RawConnection()
+    conn = ConnectionPool(lambda: raw, max_size=1).acquire()
+    kept = conn.cursor()
+    kept.fast_executemany = True
+    chained = conn.execute("SELECT 1")
+    conn.cursor()
+    gc.collect()
+
+    assert isinstance(chained, PooledCursor)
+    assert kept._raw.fast_executemany is True
+    assert list(chained) == [(1,), (2,)]
+    conn.close()
+    assert kept.closed and chained.closed
+    assert raw.log.count("closed") == 2
@@ -10,6 +10,7 @@ import pyodbc
 import pandas as pd
 from typing import Dict, List, Any, Optional, Tuple
 from .db_utils import DatabaseManager
+from .schema_catalog import get_table_schema, invalidate_table_schema
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -40,7 +41,6 @@ class DualDatabaseManager:
         self.sql_server = sql_server
         self.sql_db = sql_db
         self.driver = driver
-        self._sqlserver_columns_cache: Dict[Tuple[str, str], set] = {}
         self.sql_connection_string = (
             f"DRIVER={{{driver}}};"
             f"SERVER={sql_server};"
@@ -165,6 +165,7 @@ class DualDatabaseManager:
                 ddl = f"CREATE TABLE [{schema}].[{table_name}] (" + ", ".join(col_defs) + ")"
                 cur.execute(ddl)
                 conn.commit()
+                invalidate_table_schema(table_name, schema=schema)
 
             # Add missing columns if needed
             sql_cols = self._get_sqlserver_columns(table_name, schema=schema)
@@ -180,9 +181,8 @@ class DualDatabaseManager:
                     logging.warning(f"SQL Server add column failed for {schema}.{table_name}.{c}: {e}")
             if missing:
                 conn.commit()
-
-        # Refresh cache
-        self._sqlserver_columns_cache.pop((schema, table_name), None)
+                # Refresh cached schema after DDL
+                invalidate_table_schema(table_name, schema=schema)
 
     def sync_dataframe_to_sqlserver(
         self,
@@ -246,27 +246,13 @@ class DualDatabaseManager:
         return total
 
     def _get_sqlserver_columns(self, table_name: str, schema: str = "dbo") -> set:
-        cache_key = (schema, table_name)
-        if cache_key in self._sqlserver_columns_cache:
-            return self._sqlserver_columns_cache[cache_key]
-
-        cols: set = set()
-        with self._get_sql_server_connection() as conn:
-            cur = conn.cursor()
-            cur.execute(
-                """
-                SELECT COLUMN_NAME
-                FROM INFORMATION_SCHEMA.COLUMNS
-                WHERE TABLE_SCHEMA = ? AND TABLE_NAME = ?
-                """,
-                (schema, table_name),
-            )
-            for row in cur.fetchall():
-                if row and row[0]:
-                    cols.add(str(row[0]))
-
-        self._sqlserver_columns_cache[cache_key] = cols
-        return cols
+        table_schema = get_table_schema(
+            self._get_sql_server_connection,
+            table_name,
+            schema=schema,
+            scope=f"{self.sql_server}/{self.sql_db}",
+        )
+        return set(table_schema.column_names()) if table_schema else set()
 
     def execute_query(self, sql: str, params: tuple = ()) -> List[Dict]:
         """
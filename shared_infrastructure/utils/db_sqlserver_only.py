@@ -3,18 +3,279 @@ SQL Server Only Database Manager
 Writes only to SQL Server, no SQLite dependency.
 """
 
+import json
 import logging
 import math
 import numbers
 import os
 import pyodbc
+import numpy as np
 import pandas as pd
 import re
-from typing import Dict, List, Any, Optional, Tuple, Iterable, Set
+from typing import Callable, Dict, List, Any, Optional, Tuple, Iterable, Set
 from datetime import datetime
 
+from .schema_catalog import connection_scope, get_schema_catalog, get_table_schema, invalidate_table_schema
+from .sqlserver_pool import SQL_POOL_SIZE, ddl_ensured, get_pool, mark_ddl_ensured
+from .file_fingerprint import FILE_FINGERPRINT_ENABLED, compute_fingerprint, content_unchanged
+from .record_key_hash import BINARY_HASH_SQL_TYPES, record_key_digest, record_key_digests
+
 # logging.basicConfig removed to allow consumer scripts to configure logging
 
+# SQL type families used by bulk_insert to pick a parameter conversion
+FLOAT_SQL_TYPES = {'float', 'real', 'decimal', 'numeric', 'money', 'smallmoney'}
+INT_SQL_TYPES = {'int', 'bigint', 'smallint'}
+BIT_SQL_TYPES = {'bit'}
+DATETIME_SQL_TYPES = {'datetime', 'datetime2'}
+
+# Join keys that must never be written as '80.0' into NVARCHAR columns
+KEY_COLUMNS = {"Operation", "Plant", "Group"}
+
+# Hash columns that take readable record keys; stored as a 16-byte digest once migrated to BINARY(16)
+HASH_KEY_COLUMNS = {"record_hash"}
+
+# "vectorized" (default) or "rowwise" (per-cell reference implementation)
+BULK_INSERT_CONVERTER = os.getenv("MDDAP_BULK_INSERT_CONVERTER", "vectorized").strip().lower()
+
+# Content fingerprint columns of dbo.etl_file_state (added on first use, see file_fingerprint)
+FILE_FINGERPRINT_COLUMNS = ("file_sample_hash", "file_content_hash")
+
+# Rows rejected by bulk_insert are kept here with the column the ODBC error pointed at
+QUARANTINE_TABLE = "dbo.etl_bulk_insert_quarantine"
+# Failing chunks at or below this size are retried one row at a time instead of split further
+BISECT_ROW_THRESHOLD = 8
+
+_NULL_LIKE_STRINGS = ["null", "none", "nan"]
+# Plain decimal literals that float() is guaranteed to accept; anything else is
+# handed to the per-cell converter so odd inputs keep their historical result.
+_DECIMAL_TEXT_RE = r"\s*[+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?\s*"
+# Same characters _clean_string drops: ord < 32 except \t \n \r
+_CONTROL_CHARS_RE = r"[\x00-\x08\x0b\x0c\x0e-\x1f]"
+_INT64_LIMIT = 2.0 ** 63
+_EXACT_FLOAT_INT_LIMIT = 2 ** 53
+
+
+def _to_float(v: Any) -> Optional[float]:
+    if v is None:
+        return None
+    if isinstance(v, str) and v.strip() == "":
+        return None
+    try:
+        if pd.isna(v):
+            return None
+    except Exception:
+        pass
+    try:
+        fv = float(v)
+    except Exception:
+        return None
+    if not math.isfinite(fv):
+        return None
+    return fv
+
+
+def _to_int(v: Any) -> Optional[int]:
+    if v is None:
+        return None
+    if isinstance(v, str) and v.strip() == "":
+        return None
+    try:
+        if pd.isna(v):
+            return None
+    except Exception:
+        pass
+    try:
+        # allow values like 12345.0 / '12345.0'
+        return int(float(v))
+    except Exception:
+        return None
+
+
+def _to_bit(v: Any) -> Optional[int]:
+    if v is None:
+        return None
+    if isinstance(v, str) and v.strip() == "":
+        return None
+    try:
+        if pd.isna(v):
+            return None
+    except Exception:
+        pass
+    try:
+        fv = float(v)
+        return 1 if fv != 0 else 0
+    except Exception:
+        pass
+    if isinstance(v, str):
+        if v.lower() == 'true': return 1
+        if v.lower() == 'false': return 0
+    return None
+
+
+def _to_str(v: Any, is_key: bool) -> Optional[str]:
+    try:
+        if pd.isna(v):
+            return None
+    except Exception:
+        pass
+
+    if v is None:
+        return None
+
+    # Special-case numeric join keys so they never become '80.0' in NVARCHAR columns.
+    if is_key and isinstance(v, numbers.Number) and not isinstance(v, bool):
+        try:
+            fv = float(v)
+            if math.isfinite(fv) and fv == round(fv):
+                return str(int(round(fv)))
+        except Exception:
+            pass
+
+    if isinstance(v, str):
+        s = v.strip()
+        if s == "" or s.lower() in {"null", "none", "nan"}:
+            return None
+        if is_key:
+            s = re.sub(r"\\.0$", "", s)
+        return s
+
+    return str(v)
+
+
+def _to_record_hash(v: Any) -> Optional[bytes]:
+    """Readable record key -> digest, cleaned exactly like an NVARCHAR value; bytes pass through."""
+    if isinstance(v, (bytes, bytearray)):
+        return bytes(v)
+    s = _to_str(v, False)
+    if s is None:
+        return None
+    s = s.strip()
+    if s == "" or s.lower() in {"null", "none", "nan"}:
+        return None
+    return record_key_digest(re.sub(_CONTROL_CHARS_RE, "", s))
+
+
+def _is_binary_hash_column(col_name: str, sql_type: str) -> bool:
+    return col_name in HASH_KEY_COLUMNS and (sql_type or '').lower() in BINARY_HASH_SQL_TYPES
+
+
+def _cell_converter(col_name: str, sql_type: str) -> Optional[Callable[[Any], Any]]:
+    """Per-cell converter for a column, or None when values are passed through as-is."""
+    sql_type_norm = (sql_type or '').lower()
+    if _is_binary_hash_column(col_name, sql_type):
+        return _to_record_hash
+    if sql_type_norm in BINARY_HASH_SQL_TYPES:
+        return None
+    if sql_type_norm in FLOAT_SQL_TYPES:
+        return _to_float
+    if sql_type_norm in INT_SQL_TYPES:
+        return _to_int
+    if sql_type_norm in BIT_SQL_TYPES:
+        return _to_bit
+    if sql_type_norm in DATETIME_SQL_TYPES:
+        return None
+    is_key = col_name in KEY_COLUMNS
+    return lambda v: _to_str(v, is_key)
+
+
+def _is_plain_numeric_dtype(dtype: Any) -> bool:
+    """bool/int/float dtypes (numpy or nullable) that convert to float64 losslessly like float(v)."""
+    return getattr(dtype, "kind", "O") in "biuf"
+
+
+def _parse_float64(series: pd.Series) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Vectorized float(v) over a column.
+
+    Returns (values, parsed, unresolved):
+      - values: float64 array, meaningful where parsed is True
+      - parsed: cells where float(v) succeeds and equals values
+      - unresolved: non-null cells that must go through the per-cell converter
+    Cells in neither mask are null/blank and convert to None.
+    Returns None when the column cannot be vectorized at all.
+    """
+    n = len(series)
+    if _is_plain_numeric_dtype(series.dtype):
+        values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+        parsed = ~np.asarray(series.isna(), dtype=bool)
+        return values, parsed, np.zeros(n, dtype=bool)
+
+    if series.dtype != object:
+        return None
+
+    values = np.full(n, np.nan, dtype=np.float64)
+    parsed = np.zeros(n, dtype=bool)
+    unresolved = np.zeros(n, dtype=bool)
+
+    notna = ~np.asarray(series.isna(), dtype=bool)
+    present = series[notna]
+    if present.empty:
+        return values, parsed, unresolved
+
+    positions = np.flatnonzero(notna)
+    is_str = (present.map(type) == str).to_numpy(dtype=bool)
+
+    numbers_part = present[~is_str]
+    if not numbers_part.empty:
+        kind = pd.api.types.infer_dtype(numbers_part, skipna=False)
+        if kind not in ("floating", "integer", "mixed-integer-float", "boolean"):
+            return None
+        try:
+            # object -> float64 calls float() on every element
+            values[positions[~is_str]] = numbers_part.to_numpy(dtype=object).astype(np.float64)
+        except (ValueError, TypeError, OverflowError):
+            return None
+        parsed[positions[~is_str]] = True
+
+    text_part = present[is_str]
+    if text_part.empty:
+        return values, parsed, unresolved
+
+    # Parse each distinct string once, then broadcast back through the codes
+    codes, uniques = pd.factorize(text_part)
+    uniques = pd.Series(uniques, dtype=object)
+    blank = (uniques.str.strip() == "").to_numpy(dtype=bool)
+    decimal = uniques.str.fullmatch(_DECIMAL_TEXT_RE).to_numpy(dtype=bool) & ~blank
+    unique_values = np.full(len(uniques), np.nan, dtype=np.float64)
+    if decimal.any():
+        try:
+            unique_values[decimal] = uniques[decimal].to_numpy(dtype=object).astype(np.float64)
+        except (ValueError, OverflowError):
+            return None
+    text_positions = positions[is_str]
+    values[text_positions] = unique_values[codes]
+    parsed[text_positions] = decimal[codes]
+    unresolved[text_positions] = (~decimal & ~blank)[codes]
+    return values, parsed, unresolved
+
+
+def _is_text_column(present: pd.Series) -> bool:
+    """True when every non-null value is a str (object or pandas string dtype)."""
+    if present.dtype != object and not isinstance(present.dtype, pd.StringDtype):
+        return False
+    return present.empty or pd.api.types.infer_dtype(present, skipna=False) == "string"
+
+
+def _clean_text_values(present: pd.Series, is_key: bool) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Vectorized _to_str + _clean_param_value for an all-str Series.
+
+    Returns (text, is_none) as numpy arrays aligned with present.
+    """
+    # Clean each distinct string once, then broadcast back through the codes
+    codes, uniques = pd.factorize(present)
+    text = pd.Series(uniques, dtype=object).str.strip()
+    is_none = (text == "") | text.str.lower().isin(_NULL_LIKE_STRINGS)
+    if is_key:
+        text = text.str.replace(r"\\.0$", "", regex=True)
+        # _clean_param_value strips and re-checks the already converted string
+        text = text.str.strip()
+        is_none |= (text == "") | text.str.lower().isin(_NULL_LIKE_STRINGS)
+    has_ctrl = text.str.contains(_CONTROL_CHARS_RE, regex=True)
+    if has_ctrl.any():
+        text = text.where(~has_ctrl, text.str.replace(_CONTROL_CHARS_RE, "", regex=True))
+    return text.to_numpy(dtype=object)[codes], is_none.to_numpy(dtype=bool)[codes]
+
 class SQLServerOnlyManager:
     """Database Manager that writes only to SQL Server"""
     
@@ -56,10 +317,18 @@ class SQLServerOnlyManager:
             "TrustServerCertificate=no;"
         )
 
+    def _connect(self):
+        """Check out a pooled connection (or open a fresh one when pooling is disabled)."""
+        connection_string = self.connection_string
+        connect = lambda: pyodbc.connect(connection_string, autocommit=False, timeout=30)
+        if SQL_POOL_SIZE <= 0:
+            return connect()
+        return get_pool(connection_string, connect).acquire()
+
     def get_connection(self):
         """Get SQL Server connection"""
         try:
-            return pyodbc.connect(self.connection_string, autocommit=False, timeout=30)
+            return self._connect()
         except pyodbc.Error as e:
             msg = str(e)
             # Only try fallback for localhost strings
@@ -75,7 +344,7 @@ class SQLServerOnlyManager:
                 alt_server = "(local)"
                 self.sql_server = alt_server
                 self._build_connection_string() # Rebuild with new server
-                return pyodbc.connect(self.connection_string, autocommit=False, timeout=30)
+                return self._connect()
             raise
 
     def _clean_string(self, value: Any) -> Any:
@@ -111,6 +380,115 @@ class SQLServerOnlyManager:
             pass
         return self._clean_string(value)
 
+    def _convert_column_rowwise(self, series: pd.Series, col_name: str, sql_type: str) -> np.ndarray:
+        """Reference per-cell conversion (converter + _clean_param_value on every value)."""
+        converter = _cell_converter(col_name, sql_type)
+        if converter is not None:
+            series = series.apply(converter)
+        return np.array([self._clean_param_value(v) for v in series], dtype=object)
+
+    def _convert_column(self, series: pd.Series, col_name: str, sql_type: str) -> np.ndarray:
+        """
+        Convert a column to pyodbc parameter values with column-wide numpy/pandas operations.
+
+        Produces the same values as _convert_column_rowwise. Cells the fast path cannot
+        prove equivalent (e.g. 'N/A', 'true', Decimal) fall back to the per-cell converter.
+        """
+        sql_type_norm = (sql_type or '').lower()
+        converter = _cell_converter(col_name, sql_type)
+        n = len(series)
+        out = np.full(n, None, dtype=object)
+        unresolved: Optional[np.ndarray] = None
+
+        if sql_type_norm in FLOAT_SQL_TYPES or sql_type_norm in INT_SQL_TYPES or sql_type_norm in BIT_SQL_TYPES:
+            parsed = _parse_float64(series)
+            if parsed is None:
+                return self._convert_column_rowwise(series, col_name, sql_type)
+            values, ok, unresolved = parsed
+            if sql_type_norm in FLOAT_SQL_TYPES:
+                keep = ok & np.isfinite(values)
+                out[keep] = values[keep].astype(object)
+            elif sql_type_norm in INT_SQL_TYPES:
+                finite = ok & np.isfinite(values)
+                in_range = finite & (np.abs(values) < _INT64_LIMIT)
+                out[in_range] = np.trunc(values[in_range]).astype(np.int64).astype(object)
+                unresolved = unresolved | (finite & ~in_range)
+            else:
+                out[ok] = (values[ok] != 0).astype(np.int64).astype(object)
+
+        elif _is_binary_hash_column(col_name, sql_type):
+            nulls = np.asarray(series.isna(), dtype=bool)
+            present = series[~nulls]
+            if not _is_text_column(present):
+                return self._convert_column_rowwise(series, col_name, sql_type)
+            # Clean like an NVARCHAR key, then hash each distinct key once
+            text, is_none = _clean_text_values(present, is_key=False)
+            codes, uniques = pd.factorize(np.where(is_none, None, text))
+            digests = record_key_digests(uniques.tolist())
+            values = np.full(len(present), None, dtype=object)
+            values[codes >= 0] = digests[codes[codes >= 0]]
+            out[~nulls] = values
+
+        elif sql_type_norm in BINARY_HASH_SQL_TYPES:
+            return self._convert_column_rowwise(series, col_name, sql_type)
+
+        elif sql_type_norm in DATETIME_SQL_TYPES:
+            nulls = np.asarray(series.isna(), dtype=bool)
+            if series.dtype.kind == "M":
+                out[~nulls] = series[~nulls].astype(object).to_numpy()
+            elif _is_text_column(series[~nulls]):
+                text, is_none = _clean_text_values(series[~nulls], is_key=False)
+                out[~nulls] = np.where(is_none, None, text)
+            else:
+                return self._convert_column_rowwise(series, col_name, sql_type)
+
+        else:
+            is_key = col_name in KEY_COLUMNS
+            nulls = np.asarray(series.isna(), dtype=bool)
+            present = series[~nulls]
+            kind = series.dtype.kind
+            if _is_text_column(present):
+                text, is_none = _clean_text_values(present, is_key)
+                out[~nulls] = np.where(is_none, None, text)
+            elif kind in "iu" and isinstance(series.dtype, np.dtype) and (
+                not is_key
+                or present.empty
+                or bool((np.abs(present.to_numpy(dtype=np.float64)) <= _EXACT_FLOAT_INT_LIMIT).all())
+            ):
+                out[~nulls] = present.astype(str).to_numpy(dtype=object)
+            elif is_key and (kind == "f" or (
+                series.dtype == object
+                and pd.api.types.infer_dtype(present, skipna=False) in ("floating", "mixed-integer-float")
+            )):
+                values = np.full(n, np.nan, dtype=np.float64)
+                try:
+                    values[~nulls] = present.to_numpy(dtype=object).astype(np.float64)
+                except (ValueError, TypeError, OverflowError):
+                    return self._convert_column_rowwise(series, col_name, sql_type)
+                integral = ~nulls & np.isfinite(values) & (values == np.round(values)) & (np.abs(values) < _INT64_LIMIT)
+                codes, uniques = pd.factorize(values[integral].astype(np.int64))
+                out[integral] = np.array([str(u) for u in uniques.tolist()], dtype=object)[codes]
+                unresolved = ~nulls & ~integral
+            else:
+                return self._convert_column_rowwise(series, col_name, sql_type)
+
+        if unresolved is not None and unresolved.any():
+            originals = series.to_numpy(dtype=object)[unresolved]
+            if pd.api.types.infer_dtype(originals, skipna=False) == "string":
+                # Strings compare exactly, so converting each distinct value once is safe
+                codes, uniques = pd.factorize(originals)
+                converted = [self._clean_param_value(converter(v)) for v in uniques.tolist()]
+                out[unresolved] = np.array(converted, dtype=object)[codes]
+            else:
+                out[unresolved] = [self._clean_param_value(converter(v)) for v in originals]
+        return out
+
+    def _prepare_insert_columns(self, df_insert: pd.DataFrame, table_cols: List[Tuple[str, str]]) -> List[list]:
+        """Convert every insert column to a list of pyodbc parameter values."""
+        sql_types = dict(table_cols)
+        convert = self._convert_column_rowwise if BULK_INSERT_CONVERTER == "rowwise" else self._convert_column
+        return [convert(df_insert[col], col, sql_types[col]).tolist() for col in df_insert.columns]
+
     def init_database(self, schema_path: str) -> bool:
         """Initialize SQL Server database schema"""
         if not os.path.exists(schema_path):
@@ -239,6 +617,7 @@ class SQLServerOnlyManager:
                             if 'already exists' not in str(e).lower():
                                 logging.warning(f"Schema statement warning: {e}")
                 conn.commit()
+                invalidate_table_schema()
                 logging.info(f"SQL Server database initialized: {self.sql_db}")
                 return True
         except Exception as e:
@@ -295,127 +674,16 @@ class SQLServerOnlyManager:
                 except Exception:
                     pass
                 
-                # Get table columns in order
-                cursor.execute(f"""
-                    SELECT COLUMN_NAME, DATA_TYPE
-                    FROM INFORMATION_SCHEMA.COLUMNS
-                    WHERE TABLE_NAME = '{table_name}' AND TABLE_SCHEMA = 'dbo'
-                    AND COLUMN_NAME != 'id'
-                    ORDER BY ORDINAL_POSITION
-                """)
-                table_cols = [(row[0], row[1]) for row in cursor.fetchall()]
+                # Get table columns in order (cached by the schema catalog)
+                table_schema = get_table_schema(conn, table_name)
+                table_cols = table_schema.column_types(exclude=("id",)) if table_schema else []
                 
                 # Filter DataFrame to only include columns that exist in table
                 valid_cols = [col_name for col_name, _ in table_cols if col_name in df.columns]
                 df_insert = df[valid_cols].copy()
                 
-                # Clean data and convert numpy types to Python native types
-                for col_name, sql_type in table_cols:
-                    if col_name not in df_insert.columns:
-                        continue
-
-                    sql_type_norm = (sql_type or '').lower()
-                    
-                    if sql_type_norm in ['float', 'real', 'decimal', 'numeric', 'money', 'smallmoney']:
-                        # Convert to Python float, replace NaN/Inf/invalid strings with None
-                        def _to_float(v: Any) -> Optional[float]:
-                            if v is None:
-                                return None
-                            if isinstance(v, str) and v.strip() == "":
-                                return None
-                            try:
-                                if pd.isna(v):
-                                    return None
-                            except Exception:
-                                pass
-                            try:
-                                fv = float(v)
-                            except Exception:
-                                return None
-                            if not math.isfinite(fv):
-                                return None
-                            return fv
-
-                        df_insert[col_name] = df_insert[col_name].apply(_to_float)
-                    elif sql_type_norm in ['int', 'bigint', 'smallint']:
-                        # Convert to Python int, replace NaN/blank with None
-                        def _to_int(v: Any) -> Optional[int]:
-                            if v is None:
-                                return None
-                            if isinstance(v, str) and v.strip() == "":
-                                return None
-                            try:
-                                if pd.isna(v):
-                                    return None
-                            except Exception:
-                                pass
-                            try:
-                                # allow values like 12345.0 / '12345.0'
-                                return int(float(v))
-                            except Exception:
-                                return None
-
-                        df_insert[col_name] = df_insert[col_name].apply(_to_int)
-                    elif sql_type_norm in ['bit']:
-                         # Convert to 0 or 1
-                        def _to_bit(v: Any) -> Optional[int]:
-                            if v is None:
-                                return None
-                            if isinstance(v, str) and v.strip() == "":
-                                return None
-                            try:
-                                if pd.isna(v):
-                                    return None
-                            except Exception:
-                                pass
-                            try:
-                                fv = float(v)
-                                return 1 if fv != 0 else 0
-                            except Exception:
-                                pass
-                            if isinstance(v, str):
-                                if v.lower() == 'true': return 1
-                                if v.lower() == 'false': return 0
-                            return None
-                            
-                        df_insert[col_name] = df_insert[col_name].apply(_to_bit)
-                    elif sql_type_norm in ['datetime', 'datetime2']:
-                        # Keep datetime as is
-                        pass
-                    else:
-                        # For string types, convert to Python str, replace NaN with None
-                        key_cols = {"Operation", "Plant", "Group"}
-
-                        def _to_str(v: Any) -> Optional[str]:
-                            try:
-                                if pd.isna(v):
-                                    return None
-                            except Exception:
-                                pass
-
-                            if v is None:
-                                return None
-
-                            # Special-case numeric join keys so they never become '80.0' in NVARCHAR columns.
-                            if col_name in key_cols and isinstance(v, numbers.Number) and not isinstance(v, bool):
-                                try:
-                                    fv = float(v)
-                                    if math.isfinite(fv) and fv == round(fv):
-                                        return str(int(round(fv)))
-                                except Exception:
-                                    pass
-
-                            if isinstance(v, str):
-                                s = v.strip()
-                                if s == "" or s.lower() in {"null", "none", "nan"}:
-                                    return None
-                                if col_name in key_cols:
-                                    s = re.sub(r"\\.0$", "", s)
-                                return s
-
-                            return str(v)
-
-                        df_insert[col_name] = df_insert[col_name].apply(_to_str)
+                # Convert each column to Python native parameter values in one pass
+                param_columns = self._prepare_insert_columns(df_insert, table_cols)
                 
                 # Build INSERT statement
                 placeholders = ','.join(['?' for _ in valid_cols])
@@ -428,18 +696,15 @@ class SQLServerOnlyManager:
                 rows_inserted = 0
                 rows_since_commit = 0
                 failed_batches = 0
+                rows_quarantined = 0
                 
                 for i in range(0, len(df_insert), batch_size):
-                    batch = df_insert.iloc[i:i+batch_size]
+                    batch_rows = list(zip(*(col[i:i+batch_size] for col in param_columns)))
                     
                     try:
-                        batch_rows = [
-                            [self._clean_param_value(v) for v in row]
-                            for row in batch.itertuples(index=False, name=None)
-                        ]
                         cursor.executemany(insert_sql, batch_rows)
-                        rows_inserted += len(batch)
-                        rows_since_commit += len(batch)
+                        rows_inserted += len(batch_rows)
+                        rows_since_commit += len(batch_rows)
 
                         if rows_since_commit >= commit_every_rows:
                             conn.commit()
@@ -449,178 +714,407 @@ class SQLServerOnlyManager:
                             logging.debug(f"Inserted {rows_inserted}/{len(df_insert)} rows...")
                     
                     except Exception as batch_error:
-                        # Log error and try inserting rows one by one
-                        logging.warning(f"Batch insert failed at row {i}, trying row-by-row: {batch_error}")
-                        try:
-                            err_s = str(batch_error)
-                            m = re.search(r"(?:参数|Parameter)\s+(\d+)", err_s, flags=re.IGNORECASE)
-                            if m:
-                                param_idx = int(m.group(1)) - 1
-                                if 0 <= param_idx < len(valid_cols):
-                                    bad_col = valid_cols[param_idx]
-                                    logging.warning(
-                                        f"Batch insert error references param {param_idx+1}; mapped column: {bad_col}"
-                                    )
-                                    try:
-                                        sample_vals = (
-                                            batch[bad_col]
-                                            .dropna()
-                                            .astype(str)
-                                            .unique()
-                                            .tolist()[:10]
-                                        )
-                                        logging.warning(f"Sample values for {bad_col}: {sample_vals}")
-                                    except Exception:
-                                        pass
-                                else:
-                                    logging.warning(
-                                        f"Batch insert error references param {param_idx+1}, but only {len(valid_cols)} columns are being inserted."
-                                    )
-                                    logging.warning(f"Insert columns (order): {valid_cols[:40]}")
-                        except Exception:
-                            pass
+                        # Isolate the offending rows by bisection instead of replaying row by row
+                        logging.warning(f"Batch insert failed at row {i}, isolating bad rows: {batch_error}")
                         failed_batches += 1
+                        bad_col = self._error_column(batch_error, valid_cols)
+                        if bad_col:
+                            logging.warning(f"Batch insert error mapped to column: {bad_col}")
+                            try:
+                                sample_vals = (
+                                    pd.Series(param_columns[valid_cols.index(bad_col)][i:i+batch_size])
+                                    .dropna()
+                                    .astype(str)
+                                    .unique()
+                                    .tolist()[:10]
+                                )
+                                logging.warning(f"Sample values for {bad_col}: {sample_vals}")
+                            except Exception:
+                                pass
                         # Reset transaction state to avoid later commit being rolled back
                         try:
                             conn.rollback()
                         except Exception:
                             pass
-                        
-                        for j, row in batch.iterrows():
-                            try:
-                                row_params = [self._clean_param_value(v) for v in row.tolist()]
-                                cursor.execute(insert_sql, row_params)
-                                rows_inserted += 1
-                                rows_since_commit += 1
-                            except Exception as row_error:
-                                logging.error(f"Failed to insert row {j}: {row_error}")
-                                try:
-                                    err_s2 = str(row_error)
-                                    m2 = re.search(r"(?:参数|Parameter)\s+(\d+)", err_s2, flags=re.IGNORECASE)
-                                    if m2:
-                                        param_idx2 = int(m2.group(1)) - 1
-                                        if 0 <= param_idx2 < len(valid_cols):
-                                            bad_col2 = valid_cols[param_idx2]
-                                            bad_val2 = row.get(bad_col2, None)
-                                            logging.error(f"Row error references param {param_idx2+1}; column: {bad_col2}; value: {bad_val2}")
-                                        else:
-                                            logging.error(
-                                                f"Row error references param {param_idx2+1}, but only {len(valid_cols)} columns are being inserted."
-                                            )
-                                            logging.error(f"Insert columns (order): {valid_cols[:40]}")
-                                except Exception:
-                                    pass
-                                logging.debug(f"Problematic row data: {row.to_dict()}")
-
-                        # Commit what we managed to insert in this fallback batch
-                        try:
-                            conn.commit()
-                            rows_since_commit = 0
-                        except Exception as commit_error:
-                            logging.error(f"Commit failed after row-by-row fallback: {commit_error}")
-                            raise
-                
+
+                        # The rollback also discarded earlier batches since the last commit: replay them too
+                        replay_start = i - rows_since_commit
+                        rows_inserted -= rows_since_commit
+                        rows_since_commit = 0
+                        replay_rows = list(zip(*(col[replay_start:i+batch_size] for col in param_columns)))
+                        inserted, rejected = self._bisect_insert(conn, cursor, insert_sql, replay_rows, replay_start)
+                        rows_inserted += inserted
+
+                        for row_idx, row_params, row_error in rejected:
+                            logging.error(f"Failed to insert row {row_idx}: {row_error}")
+                            logging.debug(f"Problematic row data: {dict(zip(valid_cols, row_params))}")
+                        rows_quarantined += self._quarantine_rows(conn, table_name, valid_cols, rejected)
+
                 # Final commit
                 if rows_since_commit > 0:
                     conn.commit()
                     rows_since_commit = 0
-                logging.info(f"Inserted {rows_inserted} rows into {table_name} (failed batches: {failed_batches})")
+                logging.info(
+                    f"Inserted {rows_inserted} rows into {table_name} "
+                    f"(failed batches: {failed_batches}, quarantined rows: {rows_quarantined})"
+                )
                 return rows_inserted
                 
         except Exception as e:
             logging.error(f"Bulk insert failed for {table_name}: {e}")
             raise
 
+    @staticmethod
+    def _error_column(error: Exception, columns: List[str]) -> Optional[str]:
+        """Map the ODBC parameter index in an error message (e.g. 'Parameter 7') to a column name."""
+        m = re.search(r"(?:参数|Parameter)\s+(\d+)", str(error), flags=re.IGNORECASE)
+        if not m:
+            return None
+        param_idx = int(m.group(1)) - 1
+        if 0 <= param_idx < len(columns):
+            return columns[param_idx]
+        logging.warning(
+            f"Insert error references param {param_idx+1}, but only {len(columns)} columns are being inserted."
+        )
+        return None
+
+    def _bisect_insert(
+        self, conn, cursor, insert_sql: str, rows: List[tuple], offset: int
+    ) -> Tuple[int, List[Tuple[int, tuple, Exception]]]:
+        """
+        Insert rows, splitting failing chunks in half until the bad rows are isolated.
+
+        Every chunk that succeeds is committed immediately so a later rollback cannot undo it.
+        Returns (rows_inserted, [(row_index, row_params, error), ...]).
+        """
+        inserted = 0
+        rejected: List[Tuple[int, tuple, Exception]] = []
+        stack = [(offset, rows)]
+        while stack:
+            start, chunk = stack.pop()
+            try:
+                cursor.executemany(insert_sql, chunk)
+                conn.commit()
+                inserted += len(chunk)
+                continue
+            except Exception as chunk_error:
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+                if len(chunk) == 1:
+                    rejected.append((start, chunk[0], chunk_error))
+                    continue
+            if len(chunk) <= BISECT_ROW_THRESHOLD:
+                stack.extend(reversed([(start + k, [row]) for k, row in enumerate(chunk)]))
+            else:
+                mid = len(chunk) // 2
+                # Push the right half first so rows are retried in their original order
+                stack.append((start + mid, chunk[mid:]))
+                stack.append((start, chunk[:mid]))
+        return inserted, rejected
+
+    def ensure_quarantine_table(self, conn) -> None:
+        """Ensure the bulk_insert quarantine table exists.
+
+        The DDL is committed on its own, so a failed quarantine insert rolling back
+        afterwards cannot undo the CREATE behind the per-process memo.
+        """
+        if ddl_ensured(self.connection_string, QUARANTINE_TABLE):
+            return
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            IF OBJECT_ID('{QUARANTINE_TABLE}', 'U') IS NULL
+            BEGIN
+                CREATE TABLE {QUARANTINE_TABLE} (
+                    id BIGINT IDENTITY(1,1) PRIMARY KEY,
+                    table_name NVARCHAR(128) NOT NULL,
+                    row_index INT NULL,
+                    error_column NVARCHAR(128) NULL,
+                    error_value NVARCHAR(4000) NULL,
+                    error_message NVARCHAR(4000) NULL,
+                    row_data NVARCHAR(MAX) NULL,
+                    created_at DATETIME2 NOT NULL DEFAULT GETDATE()
+                );
+                CREATE INDEX idx_bulk_insert_quarantine_table ON {QUARANTINE_TABLE}(table_name, created_at);
+            END
+        """)
+        conn.commit()
+        mark_ddl_ensured(self.connection_string, QUARANTINE_TABLE)
+
+    def _quarantine_rows(
+        self, conn, table_name: str, columns: List[str], rejected: List[Tuple[int, tuple, Exception]]
+    ) -> int:
+        """Write rejected rows to the quarantine table. Returns the number of rows written."""
+        if not rejected:
+            return 0
+        records = []
+        for row_idx, row_params, row_error in rejected:
+            bad_col = self._error_column(row_error, columns)
+            bad_val = row_params[columns.index(bad_col)] if bad_col else None
+            if bad_col:
+                logging.error(f"Row {row_idx} rejected; column: {bad_col}; value: {bad_val}")
+            records.append((
+                table_name,
+                int(row_idx),
+                bad_col,
+                None if bad_val is None else str(bad_val)[:4000],
+                str(row_error)[:4000],
+                json.dumps(dict(zip(columns, row_params)), ensure_ascii=False, default=str),
+            ))
+        try:
+            self.ensure_quarantine_table(conn)
+            cursor = conn.cursor()
+            cursor.executemany(
+                f"""
+                INSERT INTO {QUARANTINE_TABLE}
+                    (table_name, row_index, error_column, error_value, error_message, row_data)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                records,
+            )
+            conn.commit()
+            logging.warning(f"Quarantined {len(records)} rows from {table_name} into {QUARANTINE_TABLE}")
+            return len(records)
+        except Exception as e:
+            logging.error(f"Failed to quarantine {len(records)} rows from {table_name}: {e}")
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            return 0
+
+    @staticmethod
+    def _file_state_key(file_path: str) -> str:
+        # etl_file_state.file_path compares case-insensitively (default collation)
+        return os.path.normpath(os.path.abspath(file_path)).lower()
+
+    def ensure_file_fingerprint_columns(self) -> bool:
+        """Add the content fingerprint columns to etl_file_state (once per process).
+
+        Returns False when the columns could not be added (fingerprinting is then skipped).
+        """
+        if ddl_ensured(self.connection_string, "etl_file_state_fingerprint"):
+            return True
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                for col in FILE_FINGERPRINT_COLUMNS:
+                    cursor.execute(
+                        f"IF COL_LENGTH('dbo.etl_file_state', '{col}') IS NULL "
+                        f"ALTER TABLE dbo.etl_file_state ADD [{col}] CHAR(32) NULL"
+                    )
+                conn.commit()
+            invalidate_table_schema("etl_file_state")
+        except Exception as e:
+            logging.warning(f"Cannot add fingerprint columns to dbo.etl_file_state, using mtime/size only: {e}")
+            return False
+        mark_ddl_ensured(self.connection_string, "etl_file_state_fingerprint")
+        return True
+
+    def _has_file_fingerprint_columns(self) -> bool:
+        if ddl_ensured(self.connection_string, "etl_file_state_fingerprint"):
+            return True
+        with self.get_connection() as conn:
+            table_schema = get_table_schema(conn, "etl_file_state")
+            return bool(table_schema) and all(table_schema.has_column(c) for c in FILE_FINGERPRINT_COLUMNS)
+
+    def get_file_states(
+        self, etl_name: str, with_fingerprint: bool = False
+    ) -> Dict[str, Tuple[Optional[float], Optional[int], Optional[str], Optional[str]]]:
+        """Load every etl_file_state row of an ETL in one query.
+
+        Returns {normalized lower-cased path: (file_mtime, file_size, sample_hash, content_hash)};
+        look paths up with _file_state_key(). The hashes are None unless with_fingerprint
+        is set (requires ensure_file_fingerprint_columns()).
+        """
+        hash_cols = ", " + ", ".join(FILE_FINGERPRINT_COLUMNS) if with_fingerprint else ""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"SELECT file_path, file_mtime, file_size{hash_cols} FROM dbo.etl_file_state WHERE etl_name = ?",
+                (etl_name,),
+            )
+            return {
+                self._file_state_key(r[0]): (
+                    r[1], r[2], r[3] if with_fingerprint else None, r[4] if with_fingerprint else None
+                )
+                for r in cursor.fetchall()
+                if r and r[0]
+            }
+
     def mark_file_processed(self, etl_name: str, file_path: str) -> None:
         """Mark file as processed in etl_file_state table"""
-        # Normalize path
-        file_path = os.path.normpath(os.path.abspath(file_path))
-        
-        file_mtime = os.path.getmtime(file_path)
-        file_size = os.path.getsize(file_path)
-        
+        self.mark_files_processed(etl_name, [file_path])
+
+    def mark_files_processed(
+        self,
+        etl_name: str,
+        file_paths: Iterable[str],
+        batch_size: int = 400,
+        fingerprint: Optional[bool] = None,
+    ) -> int:
+        """Mark many files as processed with one MERGE per batch of rows.
+
+        With fingerprinting (default MDDAP_FILE_FINGERPRINT) the sampled and full content
+        hashes are stored too. Missing files are skipped with a warning. Returns the
+        number of files marked.
+        """
+        fingerprint = FILE_FINGERPRINT_ENABLED if fingerprint is None else fingerprint
+        if fingerprint:
+            fingerprint = self.ensure_file_fingerprint_columns()
+
+        rows: Dict[str, Tuple[Any, ...]] = {}
+        for raw_path in file_paths:
+            # Normalize path
+            file_path = os.path.normpath(os.path.abspath(raw_path))
+            try:
+                st = os.stat(file_path)
+                hashes = compute_fingerprint(file_path) if fingerprint else (None, None)
+            except OSError:
+                logging.warning(f"File not found, not marked processed: {raw_path}")
+                continue
+            # Later duplicates win; MERGE must not match a target row twice
+            rows[self._file_state_key(file_path)] = (file_path, st.st_mtime, st.st_size) + hashes
+        if not rows:
+            return 0
+
+        values = list(rows.values())
         try:
+            # Stale hashes must not survive a mark without fingerprinting: write NULLs
+            with_hashes = fingerprint or self._has_file_fingerprint_columns()
+            if with_hashes:
+                src_cols = ("file_path", "file_mtime", "file_size") + FILE_FINGERPRINT_COLUMNS
+            else:
+                src_cols = ("file_path", "file_mtime", "file_size")
+                values = [v[:3] for v in values]
+            row_placeholder = "(" + ", ".join(["?"] * len(src_cols)) + ")"
+            # All-NULL hash parameters must still be typed as CHAR(32)
+            src_select = ", ".join(
+                f"CAST(v.{c} AS CHAR(32)) AS {c}" if c in FILE_FINGERPRINT_COLUMNS else f"v.{c}" for c in src_cols
+            )
+            update_set = ", ".join(f"{c} = source.{c}" for c in src_cols[1:])
+            insert_cols = ", ".join(src_cols)
+            insert_vals = ", ".join(f"source.{c}" for c in src_cols)
+
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                
-                # Check if record exists
-                cursor.execute("""
-                    SELECT COUNT(*) FROM dbo.etl_file_state 
-                    WHERE etl_name = ? AND file_path = ?
-                """, (etl_name, file_path))
-                
-                exists = cursor.fetchone()[0] > 0
-                
-                if exists:
-                    cursor.execute("""
-                        UPDATE dbo.etl_file_state 
-                        SET file_mtime = ?, file_size = ?, processed_time = GETDATE(), updated_at = GETDATE()
-                        WHERE etl_name = ? AND file_path = ?
-                    """, (file_mtime, file_size, etl_name, file_path))
-                else:
-                    cursor.execute("""
-                        INSERT INTO dbo.etl_file_state 
-                        (etl_name, file_path, file_mtime, file_size, processed_time, created_at, updated_at)
-                        VALUES (?, ?, ?, ?, GETDATE(), GETDATE(), GETDATE())
-                    """, (etl_name, file_path, file_mtime, file_size))
-                
+                # At most 5 parameters per row keeps each batch under the 2100 parameter limit
+                for i in range(0, len(values), batch_size):
+                    batch = values[i : i + batch_size]
+                    placeholders = ",".join([row_placeholder] * len(batch))
+                    params: List[Any] = [etl_name]
+                    for row in batch:
+                        params.extend(row)
+                    cursor.execute(f"""
+                        MERGE dbo.etl_file_state AS target
+                        USING (
+                            SELECT CAST(? AS NVARCHAR(128)) AS etl_name, {src_select}
+                            FROM (VALUES {placeholders}) AS v ({insert_cols})
+                        ) AS source
+                        ON (target.etl_name = source.etl_name AND target.file_path = source.file_path)
+                        WHEN MATCHED THEN
+                            UPDATE SET {update_set},
+                                       processed_time = GETDATE(), updated_at = GETDATE()
+                        WHEN NOT MATCHED THEN
+                            INSERT (etl_name, {insert_cols}, processed_time, created_at, updated_at)
+                            VALUES (source.etl_name, {insert_vals}, GETDATE(), GETDATE(), GETDATE());
+                    """, params)
                 conn.commit()
-                logging.info(f"Marked processed: {os.path.basename(file_path)} (mtime={file_mtime}, size={file_size})")
         except Exception as e:
-            logging.error(f"Failed to mark file processed: {e}")
+            logging.error(f"Failed to mark files processed: {e}")
             raise
 
-    def filter_changed_files(self, etl_name: str, file_paths: List[str]) -> List[str]:
-        """Filter to only files that have changed since last processing"""
-        changed_files = []
-        
+        if len(values) == 1:
+            file_path, file_mtime, file_size = values[0][:3]
+            logging.info(f"Marked processed: {os.path.basename(file_path)} (mtime={file_mtime}, size={file_size})")
+        else:
+            logging.info(f"Marked processed: {len(values)} files for {etl_name}")
+        return len(values)
+
+    def _refresh_file_mtimes(self, etl_name: str, rows: List[Tuple[str, float]], batch_size: int = 1000) -> None:
+        """Store the new mtime of files whose content did not change (best effort)."""
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                
-                for raw_path in file_paths:
-                    if not os.path.exists(raw_path):
-                        logging.warning(f"File not found: {raw_path}")
-                        continue
-                    
-                    # Normalize path
-                    file_path = os.path.normpath(os.path.abspath(raw_path))
-                    
-                    current_mtime = os.path.getmtime(file_path)
-                    current_size = os.path.getsize(file_path)
-                    
-                    cursor.execute("""
-                        SELECT file_mtime, file_size 
-                        FROM dbo.etl_file_state 
-                        WHERE etl_name = ? AND file_path = ?
-                    """, (etl_name, file_path))
-                    
-                    row = cursor.fetchone()
-                    
-                    if row:
-                        db_mtime, db_size = row[0], row[1]
-                        # Check if file has changed (different mtime or size)
-                        # Note: db_mtime is float (was real), check tolerance
-                        mtime_diff = abs(current_mtime - (db_mtime or 0))
-                        size_match = (current_size == db_size)
-                        
-                        if db_mtime is not None and db_size is not None:
-                            if mtime_diff < 1.0 and size_match:
-                                # logging.debug(f"Skipping unchanged file: {os.path.basename(file_path)}")
-                                continue
-                            else:
-                                logging.info(f"File changed: {os.path.basename(file_path)} | DB: mtime={db_mtime}, size={db_size} | FS: mtime={current_mtime}, size={current_size} | Diff: {mtime_diff}")
-                        else:
-                             logging.info(f"File state incomplete in DB: {os.path.basename(file_path)}")
-                    else:
-                        logging.info(f"New file found: {os.path.basename(file_path)}")
-                    
-                    changed_files.append(raw_path) # Return original path to avoid confusion in caller
-                    
+                for i in range(0, len(rows), batch_size):
+                    batch = rows[i : i + batch_size]
+                    params: List[Any] = []
+                    for file_path, file_mtime in batch:
+                        params.extend((file_path, file_mtime))
+                    params.append(etl_name)
+                    placeholders = ",".join(["(?, ?)"] * len(batch))
+                    cursor.execute(f"""
+                        UPDATE target SET file_mtime = v.file_mtime, updated_at = GETDATE()
+                        FROM dbo.etl_file_state AS target
+                        JOIN (VALUES {placeholders}) AS v (file_path, file_mtime)
+                          ON target.file_path = v.file_path
+                        WHERE target.etl_name = ?
+                    """, params)
+                conn.commit()
+        except Exception as e:
+            logging.warning(f"Failed to refresh file mtimes for {etl_name}: {e}")
+
+    def filter_changed_files(
+        self, etl_name: str, file_paths: List[str], fingerprint: Optional[bool] = None
+    ) -> List[str]:
+        """Filter to only files that have changed since last processing.
+
+        With fingerprinting (default MDDAP_FILE_FINGERPRINT), a file whose mtime moved
+        but whose size and content hashes match the stored ones is skipped, and its new
+        mtime is stored so the next run skips it on mtime alone.
+        """
+        changed_files = []
+        touched: List[Tuple[str, float]] = []
+        
+        try:
+            fingerprint = FILE_FINGERPRINT_ENABLED if fingerprint is None else fingerprint
+            if fingerprint:
+                fingerprint = self.ensure_file_fingerprint_columns()
+            # One query for the whole ETL, then compare stat() results in memory
+            states = self.get_file_states(etl_name, with_fingerprint=fingerprint)
         except Exception as e:
             logging.error(f"Failed to filter changed files: {e}")
             return file_paths  # Return all files on error
-        
+
+        for raw_path in file_paths:
+            # Normalize path
+            file_path = os.path.normpath(os.path.abspath(raw_path))
+            try:
+                st = os.stat(file_path)
+            except OSError:
+                logging.warning(f"File not found: {raw_path}")
+                continue
+            current_mtime = st.st_mtime
+            current_size = st.st_size
+
+            row = states.get(self._file_state_key(file_path))
+            if row:
+                db_mtime, db_size, db_sample, db_content = row
+                # Check if file has changed (different mtime or size)
+                # Note: db_mtime is float (was real), check tolerance
+                mtime_diff = abs(current_mtime - (db_mtime or 0))
+                size_match = (current_size == db_size)
+
+                if db_mtime is not None and db_size is not None:
+                    if mtime_diff < 1.0 and size_match:
+                        continue
+                    elif size_match and fingerprint and content_unchanged(file_path, db_sample, db_content):
+                        logging.info(f"File content unchanged (mtime only): {os.path.basename(file_path)}")
+                        touched.append((file_path, current_mtime))
+                        continue
+                    else:
+                        logging.info(f"File changed: {os.path.basename(file_path)} | DB: mtime={db_mtime}, size={db_size} | FS: mtime={current_mtime}, size={current_size} | Diff: {mtime_diff}")
+                else:
+                    logging.info(f"File state incomplete in DB: {os.path.basename(file_path)}")
+            else:
+                logging.info(f"New file found: {os.path.basename(file_path)}")
+
+            changed_files.append(raw_path) # Return original path to avoid confusion in caller
+
+        if touched:
+            self._refresh_file_mtimes(etl_name, touched)
+
         return changed_files
 
     def get_table_count(self, table_name: str, schema: str = "dbo") -> int:
@@ -639,15 +1133,27 @@ class SQLServerOnlyManager:
         schema: str = "dbo",
         batch_size: int = 800,
     ) -> Set[str]:
-        """Get existing hashes from a table.
+        """Get the readable record keys that already exist in a table.
 
         If `hashes` is provided, performs batched `IN (...)` queries to avoid scanning
-        the whole table.
+        the whole table and returns the subset of `hashes` found. When the hash column has
+        been migrated to BINARY(16), the readable keys are hashed for the lookup and the
+        matching readable keys are returned.
+
+        Without `hashes` the whole column is read, which only yields readable keys for an
+        NVARCHAR column; a full scan of a binary column raises ValueError (use
+        get_existing_hash_digests instead).
         """
         with self.get_connection() as conn:
             cursor = conn.cursor()
+            binary = self._is_binary_hash(conn, table_name, hash_column, schema)
 
             if hashes is None:
+                if binary:
+                    raise ValueError(
+                        f"{schema}.{table_name}.{hash_column} stores digests; pass hashes= "
+                        f"or use get_existing_hash_digests for a full scan"
+                    )
                 cursor.execute(f"SELECT [{hash_column}] FROM {schema}.[{table_name}] WHERE [{hash_column}] IS NOT NULL")
                 return {str(r[0]) for r in cursor.fetchall() if r and r[0] is not None}
 
@@ -655,18 +1161,60 @@ class SQLServerOnlyManager:
             if not uniq:
                 return set()
 
+            keys_by_digest: Dict[bytes, List[str]] = {}
+            if binary:
+                for key in uniq:
+                    digest = _to_record_hash(key)
+                    if digest is not None:
+                        keys_by_digest.setdefault(digest, []).append(key)
+                lookup: List[Any] = list(keys_by_digest)
+            else:
+                lookup = uniq
+
             existing: Set[str] = set()
-            for i in range(0, len(uniq), batch_size):
-                batch = uniq[i : i + batch_size]
+            for i in range(0, len(lookup), batch_size):
+                batch = lookup[i : i + batch_size]
                 placeholders = ",".join(["?"] * len(batch))
                 sql = (
                     f"SELECT [{hash_column}] FROM {schema}.[{table_name}] "
                     f"WHERE [{hash_column}] IN ({placeholders})"
                 )
                 cursor.execute(sql, batch)
-                existing.update({str(r[0]) for r in cursor.fetchall() if r and r[0] is not None})
+                rows = [r[0] for r in cursor.fetchall() if r and r[0] is not None]
+                if binary:
+                    for digest in rows:
+                        existing.update(keys_by_digest.get(bytes(digest), ()))
+                else:
+                    existing.update(str(v) for v in rows)
             return existing
 
+    def get_existing_hash_digests(
+        self,
+        table_name: str,
+        hash_column: str = "record_hash",
+        schema: str = "dbo",
+    ) -> Set[bytes]:
+        """Get every record key in a table as its 16-byte digest (see record_key_hash).
+
+        Works for both column shapes: a BINARY(16) column is returned as stored, readable
+        NVARCHAR keys are hashed the same way bulk_insert would hash them. Compare against
+        record_key_digests() of the (cleaned) readable keys.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            binary = self._is_binary_hash(conn, table_name, hash_column, schema)
+            cursor.execute(f"SELECT [{hash_column}] FROM {schema}.[{table_name}] WHERE [{hash_column}] IS NOT NULL")
+            rows = [r[0] for r in cursor.fetchall() if r and r[0] is not None]
+            if binary:
+                return {bytes(v) for v in rows}
+            return {d for d in (_to_record_hash(str(v)) for v in rows) if d is not None}
+
+    @staticmethod
+    def _is_binary_hash(conn, table_name: str, hash_column: str, schema: str) -> bool:
+        table_schema = get_table_schema(conn, table_name, schema=schema)
+        col_info = table_schema.column(hash_column) if table_schema else None
+        return col_info is not None and _is_binary_hash_column(hash_column, col_info.data_type)
+
     def merge_insert_by_hash(
         self,
         df: pd.DataFrame,
@@ -689,17 +1237,10 @@ class SQLServerOnlyManager:
             # Optional optimization: create an index on the hash column when possible.
             # In SQL Server, types like NVARCHAR(MAX)/TEXT cannot be indexed as key columns.
             try:
-                cursor.execute(
-                    """
-                    SELECT DATA_TYPE, CHARACTER_MAXIMUM_LENGTH
-                    FROM INFORMATION_SCHEMA.COLUMNS
-                    WHERE TABLE_SCHEMA = ? AND TABLE_NAME = ? AND COLUMN_NAME = ?
-                    """,
-                    (schema, table_name, hash_column),
-                )
-                col_info = cursor.fetchone()
-                data_type = (col_info[0] or "").lower() if col_info else ""
-                max_len = col_info[1] if col_info else None
+                table_schema = get_table_schema(conn, table_name, schema=schema)
+                col_info = table_schema.column(hash_column) if table_schema else None
+                data_type = col_info.data_type if col_info else ""
+                max_len = col_info.max_length if col_info else None
 
                 indexable = True
                 if data_type in {"text", "ntext", "image"}:
@@ -708,18 +1249,7 @@ class SQLServerOnlyManager:
                     indexable = False
 
                 if indexable:
-                    cursor.execute(
-                        """
-                        SELECT 1
-                        FROM sys.indexes i
-                        JOIN sys.index_columns ic ON i.object_id = ic.object_id AND i.index_id = ic.index_id
-                        JOIN sys.columns c ON c.object_id = ic.object_id AND c.column_id = ic.column_id
-                        WHERE i.object_id = OBJECT_ID(?)
-                          AND c.name = ?
-                        """,
-                        (f"{schema}.{table_name}", hash_column),
-                    )
-                    has_any_index = cursor.fetchone() is not None
+                    has_any_index = hash_column.lower() in table_schema.indexed_columns()
                     if not has_any_index:
                         idx_name = f"idx_{table_name}_{hash_column}"
                         cursor.execute(
@@ -728,6 +1258,7 @@ class SQLServerOnlyManager:
                             (idx_name, f"{schema}.{table_name}"),
                         )
                         conn.commit()
+                        invalidate_table_schema(table_name, schema=schema)
             except Exception as e:
                 logging.warning(f"Skip creating index on {schema}.{table_name}.{hash_column}: {e}")
 
@@ -744,22 +1275,18 @@ class SQLServerOnlyManager:
 
             cursor.execute(f"TRUNCATE TABLE {schema}.[{staging_table_name}]")
             conn.commit()
+            # Staging is a SELECT INTO copy of the target, so reuse its cached columns
+            get_schema_catalog().register_copy(
+                table_name, staging_table_name, schema=schema, scope=connection_scope(conn)
+            )
 
+        # Readable keys become 16-byte digests here when the hash column is BINARY(16)
         self.bulk_insert(df, staging_table_name, if_exists="append")
 
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute(
-                f"""
-                SELECT COLUMN_NAME
-                FROM INFORMATION_SCHEMA.COLUMNS
-                WHERE TABLE_NAME = ? AND TABLE_SCHEMA = ?
-                AND COLUMN_NAME != 'id'
-                ORDER BY ORDINAL_POSITION
-                """,
-                (table_name, schema),
-            )
-            table_cols = [r[0] for r in cursor.fetchall()]
+            table_schema = get_table_schema(conn, table_name, schema=schema)
+            table_cols = table_schema.column_names(exclude=("id",)) if table_schema else []
             insert_cols = [c for c in table_cols if c in df.columns]
             if hash_column not in insert_cols:
                 insert_cols.append(hash_column)
@@ -805,6 +1332,8 @@ class SQLServerOnlyManager:
 
     def ensure_run_state_table(self):
         """Ensure the etl_run_state table exists."""
+        if ddl_ensured(self.connection_string, "etl_run_state"):
+            return
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
@@ -818,6 +1347,7 @@ class SQLServerOnlyManager:
                 END
             """)
             conn.commit()
+        mark_ddl_ensured(self.connection_string, "etl_run_state")
 
     def get_last_run_time(self, component_name: str) -> Optional[float]:
         """Get last run timestamp (epoch) for a component."""
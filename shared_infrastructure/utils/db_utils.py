@@ -17,6 +17,28 @@ import pandas as pd
 # logging.basicConfig removed to allow consumer scripts to configure logging
 
 
+def to_sqlite_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    转换为 SQLite 可写入的副本：datetime 列转为 ISO 格式字符串（NaT 为 None）
+
+    bulk_insert / upsert_dataframe 及按键增量写入共用，保证同一列在表中的文本格式一致。
+    """
+    df_converted = df.copy()
+    for col in df_converted.columns:
+        if pd.api.types.is_datetime64_any_dtype(df_converted[col]):
+            df_converted[col] = df_converted[col].apply(
+                lambda x: x.isoformat() if pd.notna(x) else None
+            )
+    return df_converted
+
+
+def to_sqlite_params(df: pd.DataFrame) -> List[tuple]:
+    """转换为 executemany 参数（datetime 为 ISO 字符串，空值为 None，numpy 标量转为 Python 类型）"""
+    converted = to_sqlite_frame(df).astype(object)
+    converted = converted.where(converted.notna(), None)
+    return list(converted.itertuples(index=False, name=None))
+
+
 class DatabaseManager:
     """数据库管理器 - 支持 SQLite，可扩展到 PostgreSQL"""
     
@@ -147,13 +169,7 @@ class DatabaseManager:
         stats = {"inserted": 0, "updated": 0, "skipped": 0}
         
         # 转换 pandas Timestamp 为 Python 原生类型（SQLite 兼容）
-        df_converted = df.copy()
-        for col in df_converted.columns:
-            if pd.api.types.is_datetime64_any_dtype(df_converted[col]):
-                # 转换为 ISO 格式字符串
-                df_converted[col] = df_converted[col].apply(
-                    lambda x: x.isoformat() if pd.notna(x) else None
-                )
+        df_converted = to_sqlite_frame(df)
         
         # 获取 DataFrame 列名
         columns = list(df_converted.columns)
@@ -216,12 +232,7 @@ class DatabaseManager:
             return 0
         
         # 转换 pandas Timestamp 为 Python 原生类型（SQLite 兼容）
-        df_converted = df.copy()
-        for col in df_converted.columns:
-            if pd.api.types.is_datetime64_any_dtype(df_converted[col]):
-                df_converted[col] = df_converted[col].apply(
-                    lambda x: x.isoformat() if pd.notna(x) else None
-                )
+        df_converted = to_sqlite_frame(df)
         
         with self.get_connection() as conn:
             df_converted.to_sql(table_name, conn, if_exists=if_exists, index=False)
@@ -9,7 +9,7 @@ import time
 import logging
 import yaml
 import pandas as pd
-from typing import Dict, List, Any, Optional
+from typing import Dict, Iterator, List, Any, Optional
 from zipfile import BadZipFile
 from pathlib import Path
 
@@ -44,6 +44,7 @@ def setup_logging(cfg: Dict[str, Any], base_dir: str = None) -> None:
 
 
 from shared_infrastructure.env_utils import load_yaml_with_env, normalize_path, denormalize_path
+from shared_infrastructure.utils.excel_cache import get_excel_cache
 
 def load_config(config_path: str) -> Dict[str, Any]:
     """加载配置文件 (支持环境变量替换)"""
@@ -62,6 +63,26 @@ def read_sharepoint_excel(file_path: str, max_rows: Optional[int] = None, max_re
     if file_size < 1024:  # 小于1KB可能是损坏文件
         logging.warning(f"Excel文件大小异常 ({file_size} bytes): {file_path}")
     
+    # 落地缓存：同一内容的工作簿直接读取 Parquet
+    cache = get_excel_cache()
+    cache_key = cache_source = None
+    if cache is not None:
+        try:
+            cache_key = cache.key(file_path, sheet_name=0)
+            df = cache.get(cache_key, file_path)
+            # 未命中：在解析之前记录来源身份（只缓存完整读取的结果）
+            if df is None and not max_rows:
+                cache_source = cache.source(file_path)
+        except OSError as e:
+            logging.warning(f"Excel 缓存不可用，直接解析: {e}")
+            cache_key, cache_source, df = None, None, None
+        if df is not None:
+            logging.info(f"Excel 缓存命中: {os.path.basename(file_path)} ({len(df)} 行)")
+            if max_rows:
+                df = df.head(max_rows)
+                logging.info(f"测试模式：仅读取前 {len(df)} 行数据")
+            return df
+    
     # 重试机制
     for attempt in range(max_retries):
         try:
@@ -73,6 +94,10 @@ def read_sharepoint_excel(file_path: str, max_rows: Optional[int] = None, max_re
             # 使用read_only模式避免锁定问题
             df = pd.read_excel(file_path, engine='openpyxl', sheet_name=0, nrows=max_rows)
             
+            # 只缓存完整读取的结果（测试模式的前 N 行不缓存）
+            if cache_key and cache_source is not None:
+                cache.put(cache_key, cache_source, df)
+            
             if max_rows and len(df) > 0:
                 logging.info(f"测试模式：仅读取前 {len(df)} 行数据")
             return df
@@ -110,6 +135,132 @@ def read_sharepoint_excel(file_path: str, max_rows: Optional[int] = None, max_re
                 raise
 
 
+# 流式读取每块的默认行数
+EXCEL_STREAM_CHUNK_ROWS = 50_000
+
+
+def _convert_excel_cell(cell) -> Any:
+    """单元格取值，与 pandas read_excel(engine='openpyxl') 的转换一致"""
+    from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+
+    if cell.value is None:
+        return ""
+    if cell.data_type == TYPE_ERROR:
+        return np.nan
+    if cell.data_type == TYPE_NUMERIC:
+        val = int(cell.value)
+        if val == cell.value:
+            return val
+        return float(cell.value)
+    return cell.value
+
+
+def _rows_to_frame(header: List[Any], rows: List[List[Any]], start: int) -> pd.DataFrame:
+    """表头 + 数据行 → DataFrame（与 read_excel 相同的表头处理和类型推断）"""
+    from pandas.io.parsers import TextParser
+
+    data = [header] + rows
+    width = max(len(r) for r in data)
+    data = [r + [""] * (width - len(r)) for r in data]
+    df = TextParser(data, header=0, skip_blank_lines=False).read()
+    df.index = pd.RangeIndex(start, start + len(df))
+    return df
+
+
+def iter_sharepoint_excel_chunks(
+    file_path: str,
+    chunk_rows: int = EXCEL_STREAM_CHUNK_ROWS,
+    max_rows: Optional[int] = None,
+    max_retries: int = 3,
+) -> Iterator[pd.DataFrame]:
+    """
+    流式读取 Excel 第一个 sheet，按 chunk_rows 行产出 DataFrame
+
+    使用 openpyxl 只读模式逐行迭代，内存只与 chunk_rows 有关，与文件大小无关。
+    单元格转换、表头处理与 read_sharepoint_excel 一致，但列类型按块推断：
+    同一列在不同块中可能是 int64 / float64 / object，调用方的清洗需要按值处理类型。
+    落地缓存命中时直接分批读取 Parquet；流式读取本身不写缓存。
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"Excel文件不存在: {file_path}")
+    file_size = os.path.getsize(file_path)
+    if file_size == 0:
+        raise ValueError(f"Excel文件为空: {file_path}")
+
+    cache = get_excel_cache()
+    if cache is not None:
+        try:
+            chunks = cache.iter_chunks(cache.key(file_path, sheet_name=0), file_path, chunk_rows)
+        except OSError as e:
+            logging.warning(f"Excel 缓存不可用，直接解析: {e}")
+            chunks = None
+        if chunks is not None:
+            logging.info(f"Excel 缓存命中（分块读取）: {os.path.basename(file_path)}")
+            remaining = max_rows
+            for df in chunks:
+                if remaining is not None:
+                    df = df.head(remaining)
+                    remaining -= len(df)
+                if len(df):
+                    yield df
+                if remaining is not None and remaining <= 0:
+                    return
+            return
+
+    from openpyxl import load_workbook
+
+    # 只在打开阶段重试：开始产出数据后不能再重读
+    for attempt in range(max_retries):
+        try:
+            if attempt > 0:
+                logging.info(f"重试读取Excel文件 (第{attempt + 1}次): {file_path}")
+                time.sleep(2 * attempt)
+            workbook = load_workbook(file_path, read_only=True, data_only=True, keep_links=False)
+            break
+        except (BadZipFile, PermissionError) as e:
+            if attempt < max_retries - 1:
+                logging.warning(f"Excel文件可能正在同步或被占用，等待后重试: {file_path} ({e})")
+                continue
+            logging.error(f"Excel文件无法打开: {file_path}")
+            raise
+
+    try:
+        sheet = workbook.worksheets[0]
+        sheet.reset_dimensions()
+        header: Optional[List[Any]] = None
+        rows: List[List[Any]] = []
+        blank_rows = 0
+        emitted = 0
+        for row in sheet.rows:
+            values = [_convert_excel_cell(cell) for cell in row]
+            while values and values[-1] == "":
+                values.pop()
+            if header is None:
+                header = values
+                continue
+            if not values:
+                # 空行先暂存：后面还有数据才保留（与 read_excel 一样去掉末尾空行）
+                blank_rows += 1
+                continue
+            if blank_rows:
+                rows.extend([] for _ in range(blank_rows))
+                blank_rows = 0
+            rows.append(values)
+            if max_rows is not None and emitted + len(rows) >= max_rows:
+                rows = rows[: max_rows - emitted]
+                break
+            if len(rows) >= chunk_rows:
+                yield _rows_to_frame(header, rows[:chunk_rows], emitted)
+                emitted += chunk_rows
+                rows = rows[chunk_rows:]
+        while rows:
+            yield _rows_to_frame(header, rows[:chunk_rows], emitted)
+            emitted += min(len(rows), chunk_rows)
+            rows = rows[chunk_rows:]
+    finally:
+        workbook.close()
+
+
 def save_to_parquet(df: pd.DataFrame, output_path: str, cfg: Dict[str, Any] = None) -> None:
     """保存DataFrame为Parquet格式"""
     if cfg is None:
@@ -400,6 +551,29 @@ def ensure_directory_exists(directory: str) -> None:
 
 # ==================== 多工厂数据处理工具 ====================
 
+# 并行读取Excel的进程数（0/1 = 串行；默认 CPU 核数）
+EXCEL_READ_WORKERS = int(os.getenv("MDDAP_EXCEL_READ_WORKERS", str(os.cpu_count() or 1)) or 0)
+
+
+def _excel_reader_init(log_level: int) -> None:
+    """读取子进程初始化：子进程（Windows spawn）没有继承日志配置"""
+    logging.basicConfig(level=log_level, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def _read_factory_excel(file_path: str, factory_id: str, factory_name: str) -> pd.DataFrame:
+    """读取单个工厂文件并添加工厂标识列（可在子进程中执行）"""
+    df = read_sharepoint_excel(file_path)
+    if df.empty:
+        return df
+    # 添加工厂标识列
+    df["factory_source"] = factory_id
+    df["factory_name"] = factory_name
+    # 添加源文件名（便于追溯）
+    df["source_file"] = os.path.basename(file_path)
+    # 数据类型标准化处理
+    return standardize_data_types(df)
+
+
 def read_multi_factory_mes_data(cfg: Dict[str, Any]) -> pd.DataFrame:
     """
     读取多工厂数据并合并
@@ -408,6 +582,9 @@ def read_multi_factory_mes_data(cfg: Dict[str, Any]) -> pd.DataFrame:
     1. path: 单个文件路径
     2. pattern: 通配符模式，匹配多个文件（如 CMES_Product_Output_CZM_*.xlsx）
     
+    多个文件时使用进程池并行读取（source.read_workers 或 MDDAP_EXCEL_READ_WORKERS，
+    默认 CPU 核数），结果按文件顺序合并，与串行读取一致
+    
     Args:
         cfg: 配置字典
         
@@ -415,8 +592,7 @@ def read_multi_factory_mes_data(cfg: Dict[str, Any]) -> pd.DataFrame:
         合并后的DataFrame，包含factory_source和factory_name列
     """
     import glob
-    
-    all_dataframes = []
+    import concurrent.futures
     
     # 获取多工厂数据源配置
     mes_sources = cfg.get("source", {}).get("mes_sources", [])
@@ -427,6 +603,8 @@ def read_multi_factory_mes_data(cfg: Dict[str, Any]) -> pd.DataFrame:
     
     logging.info(f"开始读取 {len(mes_sources)} 个工厂数据...")
     
+    # (文件路径, 工厂ID, 工厂名称)
+    read_tasks = []
     for source in mes_sources:
         if not source.get("enabled", True):
             logging.info(f"跳过已禁用的工厂: {source.get('factory_name', 'Unknown')}")
@@ -459,39 +637,63 @@ def read_multi_factory_mes_data(cfg: Dict[str, Any]) -> pd.DataFrame:
             logging.error(f"[ERROR] {factory_name}: 未配置 path 或 pattern")
             continue
         
-        # 读取所有匹配的文件
-        factory_dataframes = []
-        for file_path in files_to_read:
-            logging.info(f"正在读取 {factory_name} - {os.path.basename(file_path)}...")
-            
+        read_tasks.extend((f, factory_id, factory_name) for f in files_to_read)
+    
+    workers = int(cfg.get("source", {}).get("read_workers") or EXCEL_READ_WORKERS)
+    workers = max(1, min(workers, len(read_tasks)))
+    
+    def read_serial(tasks):
+        for task in tasks:
+            logging.info(f"正在读取 {task[2]} - {os.path.basename(task[0])}...")
             try:
-                # 读取Excel数据
-                df = read_sharepoint_excel(file_path)
-                
-                if not df.empty:
-                    # 添加工厂标识列
-                    df["factory_source"] = factory_id
-                    df["factory_name"] = factory_name
-                    # 添加源文件名（便于追溯）
-                    df["source_file"] = os.path.basename(file_path)
-                    
-                    # 数据类型标准化处理
-                    df = standardize_data_types(df)
-                    
-                    factory_dataframes.append(df)
-                    logging.info(f"  [OK] 成功读取 {len(df)} 行数据")
-                else:
-                    logging.warning(f"  [WARNING] 数据为空: {os.path.basename(file_path)}")
-                    
+                yield task, _read_factory_excel(*task), None
             except Exception as e:
-                logging.error(f"  [ERROR] 读取失败 - {e}")
-                continue
-        
-        # 合并该工厂的所有文件数据
-        if factory_dataframes:
-            factory_combined = pd.concat(factory_dataframes, ignore_index=True)
-            all_dataframes.append(factory_combined)
-            logging.info(f"[OK] {factory_name}: 总计 {len(factory_combined)} 行数据（来自 {len(factory_dataframes)} 个文件）")
+                yield task, None, e
+    
+    def read_parallel(tasks):
+        logging.info(f"并行读取 {len(tasks)} 个文件（{workers} 个进程）...")
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_excel_reader_init,
+            initargs=(logging.getLogger().getEffectiveLevel(),),
+        )
+        try:
+            futures = [executor.submit(_read_factory_excel, *task) for task in tasks]
+            # 按提交顺序取结果，保证合并顺序与串行一致
+            for i, (task, future) in enumerate(zip(tasks, futures)):
+                try:
+                    yield task, future.result(), None
+                except concurrent.futures.process.BrokenProcessPool as e:
+                    # 进程池不可用（如被杀死/内存不足）：剩余文件退回串行读取
+                    logging.warning(f"并行读取进程池异常，剩余文件改为串行读取: {e}")
+                    yield from read_serial(tasks[i:])
+                    return
+                except Exception as e:
+                    yield task, None, e
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+    
+    results = read_parallel(read_tasks) if workers > 1 else read_serial(read_tasks)
+    
+    all_dataframes = []
+    # 工厂名称 -> [文件数, 行数]
+    factory_counts: Dict[str, List[int]] = {}
+    for (file_path, factory_id, factory_name), df, error in results:
+        file_name = os.path.basename(file_path)
+        if error is not None:
+            logging.error(f"  [ERROR] {factory_name} - {file_name} 读取失败 - {error}")
+            continue
+        if df.empty:
+            logging.warning(f"  [WARNING] 数据为空: {file_name}")
+            continue
+        all_dataframes.append(df)
+        counts = factory_counts.setdefault(factory_name, [0, 0])
+        counts[0] += 1
+        counts[1] += len(df)
+        logging.info(f"  [OK] {factory_name} - {file_name}: 成功读取 {len(df)} 行数据")
+    
+    for factory_name, (file_count, row_count) in factory_counts.items():
+        logging.info(f"[OK] {factory_name}: 总计 {row_count} 行数据（来自 {file_count} 个文件）")
     
     if all_dataframes:
         # 合并所有工厂数据
@@ -645,26 +847,188 @@ def get_factory_summary(df: pd.DataFrame) -> Dict[str, Any]:
 
 import json
 import hashlib
+import numpy as np
 from datetime import datetime
 
+from shared_infrastructure.utils.file_fingerprint import FILE_FINGERPRINT_ENABLED, compute_fingerprint, content_unchanged
+
+# 记录哈希算法标识（pandas hash_pandas_object，固定 key 的 SipHash，64 位）
+RECORD_HASH_FORMAT = "siphash64-v1"
+# 增量文件条目数超过基础文件的该比例（且不少于 RECORD_DELTA_MIN_COMPACT 条）时合并
+RECORD_DELTA_COMPACT_RATIO = 0.2
+RECORD_DELTA_MIN_COMPACT = 100_000
+
+
+def build_record_ids(df: pd.DataFrame, fields: List[str]) -> pd.Series:
+    """
+    向量化生成记录唯一标识：各字段 str() 后以 '|' 连接，空值记为 ''
+
+    与逐行的 IncrementalProcessor._generate_record_id 格式一致
+    """
+    parts = []
+    for field in fields:
+        col = df[field]
+        if col.dtype.kind == "M":
+            # 按元素 str(Timestamp)，避免整列格式推断（全为 0 点时只输出日期）
+            text = col.astype(object).astype(str)
+        else:
+            text = col.astype(str)
+        parts.append(text.where(col.notna(), ""))
+    if not parts:
+        return pd.Series("", index=df.index, dtype=object)
+    if len(parts) == 1:
+        return parts[0].astype(object)
+    return parts[0].str.cat(parts[1:], sep="|")
+
+
+def hash_record_ids(ids: Any) -> np.ndarray:
+    """将记录标识字符串转换为 64 位哈希（uint64）"""
+    values = np.asarray(ids, dtype=object)
+    if len(values) == 0:
+        return np.empty(0, dtype=np.uint64)
+    # 记录标识基本唯一，跳过 factorize 直接哈希
+    return pd.util.hash_array(values, categorize=False).astype(np.uint64, copy=False)
+
+
+def _sorted_unique(hashes: np.ndarray) -> np.ndarray:
+    """排序去重后的 uint64 数组"""
+    hashes = np.sort(np.asarray(hashes, dtype=np.uint64))
+    if len(hashes) > 1:
+        keep = np.empty(len(hashes), dtype=bool)
+        keep[0] = True
+        np.not_equal(hashes[1:], hashes[:-1], out=keep[1:])
+        hashes = hashes[keep]
+    return hashes
+
+
+class RecordHashStore:
+    """
+    已处理记录的 64 位哈希集合
+
+    - 基础文件 <prefix>.npy：排序去重后的 uint64 数组，按需内存映射读取
+    - 增量文件 <prefix>.delta：追加写入的原始 uint64，save 时写入，超过阈值后合并进基础文件
+    """
+
+    def __init__(self, prefix: str):
+        self.base_file = prefix + ".npy"
+        self.delta_file = prefix + ".delta"
+        self._base: Optional[np.ndarray] = None
+        self._delta: Optional[np.ndarray] = None
+        self._pending: List[np.ndarray] = []
+
+    def _load_base(self) -> np.ndarray:
+        if self._base is None:
+            if os.path.exists(self.base_file):
+                self._base = np.load(self.base_file, mmap_mode="r")
+            else:
+                self._base = np.empty(0, dtype=np.uint64)
+        return self._base
+
+    def _load_delta(self) -> np.ndarray:
+        if self._delta is None:
+            if os.path.exists(self.delta_file):
+                self._delta = _sorted_unique(np.fromfile(self.delta_file, dtype="<u8"))
+            else:
+                self._delta = np.empty(0, dtype=np.uint64)
+        return self._delta
+
+    @staticmethod
+    def _in_sorted(sorted_arr: np.ndarray, hashes: np.ndarray) -> np.ndarray:
+        if len(sorted_arr) == 0 or len(hashes) == 0:
+            return np.zeros(len(hashes), dtype=bool)
+        idx = np.searchsorted(sorted_arr, hashes)
+        found = idx < len(sorted_arr)
+        found[found] = sorted_arr[idx[found]] == hashes[found]
+        return found
+
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        """批量判断哈希是否已存在，返回布尔数组"""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        # 先排序查询值，使内存映射文件按顺序访问
+        order = np.argsort(hashes)
+        result = np.empty(len(hashes), dtype=bool)
+        result[order] = self._contains_sorted(hashes[order])
+        return result
+
+    def _contains_sorted(self, sorted_hashes: np.ndarray) -> np.ndarray:
+        hit = self._in_sorted(self._load_base(), sorted_hashes)
+        hit |= self._in_sorted(self._load_delta(), sorted_hashes)
+        for pending in self._pending:
+            hit |= self._in_sorted(pending, sorted_hashes)
+        return hit
+
+    def add(self, hashes: np.ndarray) -> int:
+        """加入新哈希（save 前仅保存在内存中），返回新增数量"""
+        hashes = _sorted_unique(hashes)
+        new = hashes[~self._contains_sorted(hashes)]
+        if len(new):
+            self._pending.append(new)
+        return int(len(new))
+
+    def __len__(self) -> int:
+        return int(len(self._load_base()) + len(self._load_delta()) + sum(len(p) for p in self._pending))
+
+    def save(self) -> None:
+        """把待写入的哈希追加到增量文件，必要时合并"""
+        if self._pending:
+            os.makedirs(os.path.dirname(self.delta_file) or ".", exist_ok=True)
+            pending = _sorted_unique(np.concatenate(self._pending))
+            with open(self.delta_file, "ab") as f:
+                pending.astype("<u8").tofile(f)
+            self._delta = _sorted_unique(np.concatenate([self._load_delta(), pending]))
+            self._pending = []
+
+        delta_size = len(self._load_delta())
+        if delta_size >= max(RECORD_DELTA_MIN_COMPACT, RECORD_DELTA_COMPACT_RATIO * len(self._load_base())):
+            self.compact()
+
+    def compact(self) -> None:
+        """合并基础文件与增量文件（原子替换）"""
+        merged = _sorted_unique(np.concatenate([np.asarray(self._load_base()), self._load_delta()]))
+        tmp_file = self.base_file + ".tmp.npy"
+        np.save(tmp_file, merged)
+        # Windows 下被内存映射的文件无法替换，先释放
+        self._base = None
+        os.replace(tmp_file, self.base_file)
+        if os.path.exists(self.delta_file):
+            os.remove(self.delta_file)
+        self._delta = np.empty(0, dtype=np.uint64)
+        logging.info(f"记录哈希已合并: {len(merged)} 条 -> {self.base_file}")
+
+    def clear(self) -> None:
+        self._base = None
+        self._delta = None
+        self._pending = []
+        for path in (self.base_file, self.delta_file):
+            if os.path.exists(path):
+                os.remove(path)
+
+
 class IncrementalProcessor:
     """
     统一的两层增量处理器
     
     第1层：文件级去重 - 基于文件修改时间快速跳过未变化的文件
+           （可选内容指纹：mtime 变化但内容未变的文件同样跳过）
     第2层：记录级去重 - 基于业务唯一键过滤已处理的记录
+           （记录标识以 64 位哈希保存在状态文件旁的 RecordHashStore 中）
     """
     
-    def __init__(self, state_file: str, unique_key_fields: List[str]):
+    def __init__(self, state_file: str, unique_key_fields: List[str], fingerprint: Optional[bool] = None):
         """
         初始化增量处理器
         
         Args:
             state_file: 状态文件路径
             unique_key_fields: 用于生成记录唯一标识的字段列表
+            fingerprint: 是否启用内容指纹，默认取 MDDAP_FILE_FINGERPRINT
         """
         self.state_file = state_file
         self.unique_key_fields = unique_key_fields
+        self.fingerprint = FILE_FINGERPRINT_ENABLED if fingerprint is None else fingerprint
+        # 内容未变、仅更新了 mtime 的文件数
+        self.refreshed_mtimes = 0
+        self.record_store = RecordHashStore(os.path.splitext(state_file)[0] + ".records")
         self.state = self._load_state()
     
     def _load_state(self) -> Dict[str, Any]:
@@ -676,16 +1040,22 @@ class IncrementalProcessor:
                     # 确保必要的字段存在
                     if "processed_files" not in state:
                         state["processed_files"] = {}
-                    if "processed_records" not in state:
-                        state["processed_records"] = []
+                    # 旧版本把记录标识以 JSON 列表保存：迁移到哈希存储
+                    legacy_records = state.pop("processed_records", None)
+                    if legacy_records:
+                        self.record_store.add(hash_record_ids(legacy_records))
+                        self.record_store.save()
+                        self.record_store.compact()
+                        logging.info(f"已迁移 {len(legacy_records)} 条旧版记录标识到 {self.record_store.base_file}")
+                    state["record_hash_format"] = RECORD_HASH_FORMAT
                     return state
             except Exception as e:
                 logging.warning(f"加载状态文件失败: {e}，将使用默认状态")
         
         return {
             "last_update": None,
-            "processed_files": {},  # {文件路径: {mtime: 修改时间, size: 文件大小}}
-            "processed_records": [],  # 已处理记录的唯一标识列表
+            "processed_files": {},  # {文件路径: {mtime: 修改时间, size: 文件大小[, sample_hash, content_hash]}}
+            "record_hash_format": RECORD_HASH_FORMAT,  # 已处理记录保存在 <状态文件>.records.npy/.delta
             "total_records": 0
         }
     
@@ -693,9 +1063,12 @@ class IncrementalProcessor:
         """保存状态文件"""
         try:
             os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+            self.record_store.save()
             self.state["last_update"] = datetime.now().isoformat()
-            with open(self.state_file, 'w', encoding='utf-8') as f:
+            tmp_file = self.state_file + ".tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
                 json.dump(self.state, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, self.state_file)
             logging.info(f"状态文件已保存: {self.state_file}")
         except Exception as e:
             logging.error(f"保存状态文件失败: {e}")
@@ -729,10 +1102,21 @@ class IncrementalProcessor:
         stored_size = file_info.get("size")
         
         # 如果修改时间或大小变化，认为文件有变化
-        if stored_mtime != current_mtime or stored_size != current_size:
+        if stored_size != current_size:
             return True
+        if stored_mtime == current_mtime:
+            return False
         
-        return False
+        # 仅 mtime 变化：按内容指纹确认，内容未变则记下新 mtime，下次直接跳过
+        if self.fingerprint and content_unchanged(
+            file_path, file_info.get("sample_hash"), file_info.get("content_hash")
+        ):
+            file_info["mtime"] = current_mtime
+            self.refreshed_mtimes += 1
+            logging.info(f"文件内容未变化（仅修改时间变化），跳过: {os.path.basename(file_path)}")
+            return False
+        
+        return True
     
     def filter_changed_files(self, file_paths: List[str]) -> List[str]:
         """
@@ -746,6 +1130,7 @@ class IncrementalProcessor:
         """
         changed_files = []
         skipped_count = 0
+        refreshed_before = self.refreshed_mtimes
         
         for file_path in file_paths:
             if self.is_file_changed(file_path):
@@ -756,18 +1141,25 @@ class IncrementalProcessor:
         if skipped_count > 0:
             logging.info(f"文件级去重：跳过 {skipped_count} 个未变化的文件，剩余 {len(changed_files)} 个待处理")
         
+        # 内容指纹确认未变的文件已记下新 mtime：立即保存（调用方无变化时不会再保存状态）
+        if self.refreshed_mtimes != refreshed_before:
+            self._save_state()
+        
         return changed_files
     
     def mark_file_processed(self, file_path: str) -> None:
         """标记文件为已处理"""
         if os.path.exists(file_path):
             norm_path = normalize_path(file_path)
-            self.state["processed_files"][norm_path] = {
+            file_info = {
                 "mtime": os.path.getmtime(file_path),
                 "size": os.path.getsize(file_path),
                 "processed_time": datetime.now().isoformat(),
                 "original_path": file_path # 保留原始路径供参考，但主键是归一化的
             }
+            if self.fingerprint:
+                file_info["sample_hash"], file_info["content_hash"] = compute_fingerprint(file_path)
+            self.state["processed_files"][norm_path] = file_info
     
     def _generate_record_id(self, row: pd.Series) -> str:
         """生成记录的唯一标识"""
@@ -781,6 +1173,10 @@ class IncrementalProcessor:
             values.append(val)
         return '|'.join(values)
     
+    def _record_hashes(self, df: pd.DataFrame) -> np.ndarray:
+        """向量化生成记录标识的 64 位哈希"""
+        return hash_record_ids(build_record_ids(df, self.unique_key_fields))
+    
     def filter_new_records(self, df: pd.DataFrame) -> pd.DataFrame:
         """
         第2层：过滤出新记录
@@ -800,15 +1196,9 @@ class IncrementalProcessor:
             logging.warning(f"记录级去重所需字段不存在: {missing_fields}，返回全部数据")
             return df
         
-        # 获取已处理的记录标识
-        processed_records = set(self.state.get("processed_records", []))
-        
-        # 生成每条记录的唯一标识
-        df['_record_id'] = df.apply(lambda row: self._generate_record_id(row), axis=1)
-        
-        # 筛选新记录
-        new_df = df[~df['_record_id'].isin(processed_records)].copy()
-        new_df = new_df.drop(columns=['_record_id'])
+        # 生成记录标识哈希并与已处理集合比对
+        seen = self.record_store.contains(self._record_hashes(df))
+        new_df = df[~seen].copy()
         
         total_count = len(df)
         new_count = len(new_df)
@@ -829,17 +1219,12 @@ class IncrementalProcessor:
             logging.warning(f"更新状态所需字段不存在: {missing_fields}")
             return
         
-        # 生成新记录的标识
-        new_ids = df.apply(lambda row: self._generate_record_id(row), axis=1).tolist()
-        
-        # 合并到已处理集合
-        existing_ids = set(self.state.get("processed_records", []))
-        all_ids = existing_ids.union(set(new_ids))
-        
-        self.state["processed_records"] = list(all_ids)
-        self.state["total_records"] = len(all_ids)
+        # 生成新记录的标识并合并到已处理集合
+        added = self.record_store.add(self._record_hashes(df))
+        total = len(self.record_store)
+        self.state["total_records"] = total
         
-        logging.info(f"状态已更新：总记录 {len(all_ids)}，新增 {len(new_ids)} 条")
+        logging.info(f"状态已更新：总记录 {total}，新增 {added} 条")
     
     def save(self) -> None:
         """保存状态"""
@@ -850,9 +1235,10 @@ class IncrementalProcessor:
         self.state = {
             "last_update": None,
             "processed_files": {},
-            "processed_records": [],
+            "record_hash_format": RECORD_HASH_FORMAT,
             "total_records": 0
         }
+        self.record_store.clear()
         if os.path.exists(self.state_file):
             os.remove(self.state_file)
             logging.info(f"状态文件已清除: {self.state_file}")
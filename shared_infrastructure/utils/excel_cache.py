@@ -0,0 +1,244 @@
+"""
+Excel → Parquet 落地缓存（按文件内容寻址）
+
+read_sharepoint_excel 第一次解析某个工作簿时，把结果按 (抽样哈希, sheet) 写成 Parquet 旁路文件；
+之后同一内容的工作簿（重跑、回补、多个 ETL 读同一份导出）直接内存映射读取 Parquet，
+不再经过 openpyxl 的 XML 解析。
+
+- 缓存键为文件的抽样哈希（file_fingerprint.sample_hash，含文件大小，只读几百 KB）
+- Parquet 元数据中记录来源文件的 (路径, 大小, mtime) 和全量哈希：路径/大小/mtime 一致时直接命中；
+  否则（其他路径的同一内容、同步工具只改了 mtime）读取全量哈希确认，不一致按未命中处理
+- 来源身份（source）在解析之前记录；解析后文件的大小/mtime 有变化（同步工具正在改写）则不写缓存
+- 只缓存能无损往返的 DataFrame：object 列必须全部是字符串（混合类型的列不缓存）
+- 总大小超过 MDDAP_EXCEL_CACHE_MAX_MB 时按最近使用时间（LRU，命中时刷新 mtime）淘汰
+"""
+
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from shared_infrastructure.utils.file_fingerprint import full_hash, sample_hash
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+
+# 是否启用落地缓存
+EXCEL_CACHE_ENABLED = os.getenv("MDDAP_EXCEL_CACHE", "1").strip().lower() in ("1", "true", "yes", "on")
+EXCEL_CACHE_DIR = os.getenv("MDDAP_EXCEL_CACHE_DIR") or str(PROJECT_ROOT / "data_pipelines" / "cache" / "excel_landing")
+EXCEL_CACHE_MAX_MB = float(os.getenv("MDDAP_EXCEL_CACHE_MAX_MB", "2048") or 2048)
+# 解析逻辑或存储格式变化时递增，旧缓存自然失效并被 LRU 淘汰
+EXCEL_CACHE_FORMAT = "v2"
+
+_STRING_TYPES = (pa.string(), pa.large_string(), pa.null())
+# Parquet schema 元数据中记录来源文件的键
+_META_FULL_HASH = b"mddap_full_hash"
+_META_SOURCE = b"mddap_source"
+
+
+@dataclass(frozen=True)
+class ExcelSource:
+    """解析前记录的来源文件身份"""
+    file_path: str
+    source_id: bytes  # (路径, 大小, mtime)
+    full_hash: str
+
+
+class ExcelLandingCache:
+    """按内容（抽样哈希 + 全量哈希确认）保存 Excel 解析结果的 Parquet 缓存目录"""
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def key(self, file_path: str, sheet_name: object = 0) -> str:
+        """缓存键：抽样哈希（含文件大小）+ sheet，只读文件头/中/尾三个块"""
+        sheet = str(sheet_name).replace(os.sep, "_").replace("/", "_")
+        return f"{sample_hash(file_path)}_{sheet}_{EXCEL_CACHE_FORMAT}"
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ".parquet")
+
+    @staticmethod
+    def _source_id(file_path: str) -> bytes:
+        """来源文件的 (路径, 大小, mtime)"""
+        st = os.stat(file_path)
+        return f"{os.path.abspath(file_path)}|{st.st_size}|{st.st_mtime_ns}".encode("utf-8")
+
+    def source(self, file_path: str) -> ExcelSource:
+        """在解析之前记录来源身份（先取 stat 再算全量哈希：之后的任何改写都会改变 stat）"""
+        source_id = self._source_id(file_path)
+        return ExcelSource(file_path, source_id, full_hash(file_path))
+
+    def _matches(self, metadata: Optional[dict], file_path: str) -> bool:
+        """缓存是否属于该文件：来源一致直接认定，否则用全量哈希确认"""
+        metadata = metadata or {}
+        stored_full = metadata.get(_META_FULL_HASH)
+        if not stored_full:
+            return False
+        if metadata.get(_META_SOURCE) == self._source_id(file_path):
+            return True
+        return full_hash(file_path).encode("ascii") == stored_full
+
+    def get(self, key: str, file_path: str) -> Optional[pd.DataFrame]:
+        """命中时返回 DataFrame（并刷新 LRU 时间），未命中或缓存损坏返回 None"""
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            table = pq.read_table(path, memory_map=True)
+        except Exception as e:
+            logging.warning(f"Excel 缓存文件损坏，忽略并删除: {path} ({e})")
+            self._remove(path)
+            return None
+        if not self._matches(table.schema.metadata, file_path):
+            return None
+        self._touch(path)
+        return _restore_nan(table.to_pandas())
+
+    def iter_chunks(self, key: str, file_path: str, chunk_rows: int) -> Optional[Iterator[pd.DataFrame]]:
+        """命中时返回按 chunk_rows 行分批读取的迭代器（不一次性加载整个文件），未命中返回 None"""
+        path = self._path(key)
+        try:
+            parquet_file = pq.ParquetFile(path, memory_map=True)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning(f"Excel 缓存文件损坏，忽略并删除: {path} ({e})")
+            self._remove(path)
+            return None
+        if not self._matches(parquet_file.schema_arrow.metadata, file_path):
+            return None
+        self._touch(path)
+
+        def chunks() -> Iterator[pd.DataFrame]:
+            start = 0
+            for batch in parquet_file.iter_batches(batch_size=chunk_rows):
+                df = _restore_nan(batch.to_pandas())
+                # 与整表读取一致的连续 RangeIndex
+                df.index = pd.RangeIndex(start, start + len(df))
+                start += len(df)
+                yield df
+
+        return chunks()
+
+    @staticmethod
+    def _touch(path: str) -> None:
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+    def put(self, key: str, source: ExcelSource, df: pd.DataFrame) -> bool:
+        """
+        写入缓存（原子替换），无法无损往返的 DataFrame 不缓存
+
+        source 为解析之前 source() 的结果；解析期间文件被改写时不缓存，
+        避免旧内容的解析结果记在新内容的身份下。
+        """
+        try:
+            if self._source_id(source.file_path) != source.source_id:
+                logging.info(f"Excel 缓存跳过：解析期间文件发生变化 {os.path.basename(source.file_path)}")
+                return False
+        except OSError:
+            return False
+        if not all(isinstance(c, str) for c in df.columns):
+            logging.debug("Excel 缓存跳过：列名不全是字符串")
+            return False
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowException, ValueError, TypeError) as e:
+            logging.debug(f"Excel 缓存跳过：无法转换为 Arrow ({e})")
+            return False
+        for col, field in zip(df.columns, table.schema):
+            if df[col].dtype == object and field.type not in _STRING_TYPES:
+                logging.debug(f"Excel 缓存跳过：列 {col} 为 {field.type}，往返后类型会变化")
+                return False
+
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            table = table.replace_schema_metadata({
+                **(table.schema.metadata or {}),
+                _META_FULL_HASH: source.full_hash.encode("ascii"),
+                _META_SOURCE: source.source_id,
+            })
+            os.makedirs(self.cache_dir, exist_ok=True)
+            pq.write_table(table, tmp_path, compression="snappy")
+            os.replace(tmp_path, path)
+        except (OSError, pa.ArrowException) as e:
+            logging.warning(f"写入 Excel 缓存失败: {e}")
+            self._remove(tmp_path)
+            return False
+        self.evict()
+        return True
+
+    def evict(self) -> None:
+        """总大小超过上限时，按最近使用时间从旧到新删除"""
+        with self._lock:
+            entries = []
+            try:
+                with os.scandir(self.cache_dir) as it:
+                    for entry in it:
+                        if entry.name.endswith(".parquet"):
+                            try:
+                                st = entry.stat()
+                            except OSError:
+                                continue
+                            entries.append((st.st_mtime, st.st_size, entry.path))
+            except FileNotFoundError:
+                return
+            total = sum(size for _, size, _ in entries)
+            if total <= self.max_bytes:
+                return
+            entries.sort()
+            removed = 0
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                # 其他进程可能正在读取或已删除：删不掉就跳过
+                if self._remove(path):
+                    total -= size
+                    removed += 1
+            logging.info(f"Excel 缓存 LRU 淘汰 {removed} 个文件，当前 {total / 1024 / 1024:.1f} MB")
+
+    @staticmethod
+    def _remove(path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+
+def _restore_nan(df: pd.DataFrame) -> pd.DataFrame:
+    """Parquet 中字符串列的空值读回为 None，与 read_excel 的 NaN 保持一致"""
+    for col in df.columns:
+        if df[col].dtype == object:
+            values = df[col].to_numpy()
+            missing = pd.isna(values)
+            if missing.any():
+                values = values.copy()
+                values[missing] = np.nan
+                df[col] = values
+    return df
+
+
+_CACHE: Optional[ExcelLandingCache] = None
+
+
+def get_excel_cache() -> Optional[ExcelLandingCache]:
+    """进程内共享的落地缓存；MDDAP_EXCEL_CACHE=0 时返回 None"""
+    global _CACHE
+    if not EXCEL_CACHE_ENABLED:
+        return None
+    if _CACHE is None:
+        _CACHE = ExcelLandingCache(EXCEL_CACHE_DIR, int(EXCEL_CACHE_MAX_MB * 1024 * 1024))
+    return _CACHE
@@ -0,0 +1,71 @@
+"""
+源文件内容指纹（文件级增量的可选第二道判断）
+
+SharePoint/OneDrive 同步经常只改 mtime 而不改内容。开启后，mtime/size 判断为
+“有变化”的文件再按内容确认：
+1. 抽样哈希：文件头、中、尾各一个块 + 文件大小，只读几百 KB，内容有变化时通常在这里就能判定
+2. 全量哈希：抽样一致时才流式读取整个文件确认
+
+两个哈希都与 mtime/size 一起保存在文件状态中（etl_file_state 或增量状态文件）。
+"""
+
+import hashlib
+import os
+from typing import Optional, Tuple
+
+# 是否启用内容指纹（默认关闭，只比较 mtime/size）
+FILE_FINGERPRINT_ENABLED = os.getenv("MDDAP_FILE_FINGERPRINT", "0").strip().lower() in ("1", "true", "yes", "on")
+
+SAMPLE_BLOCK_SIZE = 64 * 1024
+FULL_HASH_CHUNK_SIZE = 1024 * 1024
+# blake2b 128 位，十六进制 32 个字符
+HASH_DIGEST_SIZE = 16
+
+
+def sample_hash(file_path: str, block_size: int = SAMPLE_BLOCK_SIZE) -> str:
+    """抽样哈希：文件大小 + 头/中/尾三个块（小文件即全文件）"""
+    size = os.path.getsize(file_path)
+    digest = hashlib.blake2b(digest_size=HASH_DIGEST_SIZE)
+    digest.update(str(size).encode("ascii"))
+    with open(file_path, "rb") as f:
+        if size <= 3 * block_size:
+            digest.update(f.read())
+        else:
+            # xlsx 为 zip 格式，中央目录在文件尾，内容变化时尾块几乎一定变化
+            for offset in (0, (size - block_size) // 2, size - block_size):
+                f.seek(offset)
+                digest.update(f.read(block_size))
+    return digest.hexdigest()
+
+
+def full_hash(file_path: str, chunk_size: int = FULL_HASH_CHUNK_SIZE) -> str:
+    """全量哈希：流式读取整个文件"""
+    digest = hashlib.blake2b(digest_size=HASH_DIGEST_SIZE)
+    with open(file_path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def compute_fingerprint(file_path: str) -> Tuple[str, str]:
+    """计算 (抽样哈希, 全量哈希)，用于标记文件已处理"""
+    return sample_hash(file_path), full_hash(file_path)
+
+
+def content_unchanged(file_path: str, stored_sample: Optional[str], stored_full: Optional[str]) -> bool:
+    """
+    文件内容是否与保存的指纹一致
+
+    没有保存指纹（旧状态）或读取失败时返回 False，按有变化处理。
+    """
+    if not stored_sample or not stored_full:
+        return False
+    try:
+        if sample_hash(file_path) != stored_sample:
+            return False
+        return full_hash(file_path) == stored_full
+    except OSError:
+        return False
@@ -0,0 +1,299 @@
+"""
+本次运行内的跨文件记录去重（MES / SFC 原始层 ETL 共用）
+
+各 ETL 逐文件（或逐块）写库时，用一个过滤器记住已写过的 record_hash，
+后续文件中重复的记录在清洗后直接丢弃，不再送进 merge_insert_by_hash。
+按整列批量判断，不逐条循环：
+
+- hashset（默认）：每个键两路 64 位哈希（共 128 位），按 (h1, h2) 排序的 NumPy 数组二分查找，
+  每键 16 字节；超过 MDDAP_DEDUP_MAX_KEYS 后不再记录新键
+- bloom：固定内存的 Bloom 过滤器；命中的键可交给 exact_check（例如查询数据库）确认后才算重复
+- set：Python 字符串集合（原实现，用于对照）
+
+漏判（把重复记录当成新记录）无害：漏掉的重复由数据库的 NOT EXISTS 去重兜底。
+误判（把新记录当成重复而丢弃）会丢数据：
+- set 不会误判；hashset 仅在两个键的 128 位哈希完全相同时误判（概率可忽略）
+- bloom 按 error_rate 误判，因此应提供 exact_check；未提供时会记录警告
+
+ETL 应先用 new_mask 判断、写库成功后再 add 记录，写库失败的块不会留在过滤器中。
+"""
+
+import logging
+import math
+from abc import ABC, abstractmethod
+import os
+import sys
+from typing import Any, Callable, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+# 过滤器类型：hashset / bloom / set
+DEDUP_FILTER_KIND = os.getenv("MDDAP_DEDUP_FILTER", "hashset").strip().lower()
+# hashset 最多记录的键数（每键 16 字节）；bloom 的设计容量
+DEDUP_MAX_KEYS = int(os.getenv("MDDAP_DEDUP_MAX_KEYS", "10000000") or 10_000_000)
+# bloom 在设计容量下的误判率
+DEDUP_BLOOM_ERROR_RATE = float(os.getenv("MDDAP_DEDUP_BLOOM_ERROR", "0.001") or 0.001)
+
+# 两路哈希使用不同的 16 字节 key（第一路为 pandas 默认值）
+_HASH_KEY_1 = "0123456789123456"
+_HASH_KEY_2 = "mddap-dedup-h2-k"
+# 待合并的小数组超过主数组的该比例（且不少于 _MIN_MERGE 个键）时合并
+_MERGE_RATIO = 0.125
+_MIN_MERGE = 65_536
+
+
+def _present_keys(keys: Any) -> Tuple[np.ndarray, np.ndarray]:
+    """(非空掩码, 非空键的字符串数组)"""
+    values = pd.Series(keys, copy=False) if not isinstance(keys, pd.Series) else keys
+    present = values.notna().to_numpy(dtype=bool)
+    text = values[present].astype(str).to_numpy(dtype=object)
+    return present, text
+
+
+def _key_hashes(text: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    if len(text) == 0:
+        empty = np.empty(0, dtype=np.uint64)
+        return empty, empty
+    h1 = pd.util.hash_array(text, hash_key=_HASH_KEY_1, categorize=False).astype(np.uint64, copy=False)
+    h2 = pd.util.hash_array(text, hash_key=_HASH_KEY_2, categorize=False).astype(np.uint64, copy=False)
+    return h1, h2
+
+
+class RecordKeyFilter(ABC):
+    """记录键过滤器基类：contains / add 都按整列处理，空键既不算重复也不记录"""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    @property
+    @abstractmethod
+    def nbytes(self) -> int:
+        """过滤器占用的内存（字节，近似值）"""
+
+    @abstractmethod
+    def _contains(self, text: np.ndarray) -> np.ndarray:
+        ...
+
+    @abstractmethod
+    def _add(self, text: np.ndarray) -> None:
+        ...
+
+    def contains(self, keys: Any) -> np.ndarray:
+        """每个键是否已记录（布尔数组，与 keys 对齐）"""
+        present, text = _present_keys(keys)
+        seen = np.zeros(len(present), dtype=bool)
+        if len(text):
+            seen[present] = self._contains(text)
+        return seen
+
+    def add(self, keys: Any) -> None:
+        """记录这些键（应在对应的行写库成功之后调用）"""
+        _, text = _present_keys(keys)
+        if len(text):
+            self._add(text)
+
+    def new_mask(self, keys: Any) -> np.ndarray:
+        """未记录过的行的掩码（空键视为新记录），不记录任何键"""
+        return ~self.contains(keys)
+
+    def filter_new(self, keys: Any) -> np.ndarray:
+        """
+        返回未记录过的行的掩码，并立即记录这些行的键
+
+        同一批内的重复键都会保留（由写库前的 drop_duplicates 处理）。
+        写库可能失败时改用 new_mask + 写库成功后 add。
+        """
+        present, text = _present_keys(keys)
+        keep = np.ones(len(present), dtype=bool)
+        if len(text):
+            new = ~self._contains(text)
+            keep[present] = new
+            self._add(text[new])
+        return keep
+
+
+class ExactKeyFilter(RecordKeyFilter):
+    """Python 字符串集合（原实现）"""
+
+    def __init__(self):
+        self._keys: Set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    @property
+    def nbytes(self) -> int:
+        return sys.getsizeof(self._keys) + sum(sys.getsizeof(k) for k in self._keys)
+
+    def _contains(self, text: np.ndarray) -> np.ndarray:
+        return pd.Series(text, dtype=object).isin(self._keys).to_numpy(dtype=bool)
+
+    def _add(self, text: np.ndarray) -> None:
+        self._keys.update(text.tolist())
+
+
+class HashSetKeyFilter(RecordKeyFilter):
+    """
+    128 位哈希集合
+
+    主数组按 (h1, h2) 排序，新加入的键先放在较小的待合并数组中，达到阈值后归并，
+    避免每次加入都对全部键重新排序。
+    """
+
+    def __init__(self, max_keys: int = DEDUP_MAX_KEYS):
+        self.max_keys = max_keys
+        self._runs: List[Tuple[np.ndarray, np.ndarray]] = []
+        self._count = 0
+        self._full_logged = False
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def nbytes(self) -> int:
+        return sum(h1.nbytes + h2.nbytes for h1, h2 in self._runs)
+
+    @staticmethod
+    def _sorted_run(h1: np.ndarray, h2: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        order = np.lexsort((h2, h1))
+        h1, h2 = h1[order], h2[order]
+        if len(h1) > 1:
+            keep = np.ones(len(h1), dtype=bool)
+            keep[1:] = (h1[1:] != h1[:-1]) | (h2[1:] != h2[:-1])
+            h1, h2 = h1[keep], h2[keep]
+        return h1, h2
+
+    @staticmethod
+    def _run_contains(run: Tuple[np.ndarray, np.ndarray], q1: np.ndarray, q2: np.ndarray) -> np.ndarray:
+        h1, h2 = run
+        lo = np.searchsorted(h1, q1, side="left")
+        hi = np.searchsorted(h1, q1, side="right")
+        found = hi > lo
+        match = found & (h2[np.minimum(lo, len(h1) - 1)] == q2)
+        # h1 相同的键（极少）在 [lo, hi) 内按 h2 排序，逐个确认
+        for i in np.flatnonzero(hi - lo > 1):
+            match[i] = bool(np.any(h2[lo[i]:hi[i]] == q2[i]))
+        return match
+
+    def _contains(self, text: np.ndarray) -> np.ndarray:
+        q1, q2 = _key_hashes(text)
+        seen = np.zeros(len(text), dtype=bool)
+        for run in self._runs:
+            if len(run[0]):
+                seen |= self._run_contains(run, q1, q2)
+        return seen
+
+    def _add(self, text: np.ndarray) -> None:
+        room = self.max_keys - self._count
+        if room <= 0:
+            if not self._full_logged:
+                logging.warning(f"跨文件去重已记录 {self._count} 个键（上限 {self.max_keys}），之后的重复交给数据库去重")
+                self._full_logged = True
+            return
+        h1, h2 = self._sorted_run(*_key_hashes(text))
+        h1, h2 = h1[:room], h2[:room]
+        self._runs.append((h1, h2))
+        self._count += len(h1)
+
+        # 小数组归并到主数组（同一个键可能在多个数组中，归并时去重）
+        main_size = len(self._runs[0][0])
+        pending = self._count - main_size
+        if len(self._runs) > 1 and pending >= max(_MIN_MERGE, main_size * _MERGE_RATIO):
+            self._merge()
+
+    def _merge(self) -> None:
+        h1 = np.concatenate([r[0] for r in self._runs])
+        h2 = np.concatenate([r[1] for r in self._runs])
+        self._runs = [self._sorted_run(h1, h2)]
+        self._count = len(self._runs[0][0])
+
+
+class BloomKeyFilter(RecordKeyFilter):
+    """
+    固定内存的 Bloom 过滤器
+
+    位数组大小按设计容量和误判率计算，k 个位置由两路哈希组合生成（h1 + i*h2）。
+    exact_check(keys) 返回确实已存在的键；提供时，Bloom 命中的键只有经它确认才算重复，
+    否则按误判率 error_rate 可能把新记录当成重复。
+    """
+
+    def __init__(
+        self,
+        capacity: int = DEDUP_MAX_KEYS,
+        error_rate: float = DEDUP_BLOOM_ERROR_RATE,
+        exact_check: Optional[Callable[[List[str]], Set[str]]] = None,
+    ):
+        capacity = max(int(capacity), 1)
+        self.capacity = capacity
+        self.num_bits = max(64, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.exact_check = exact_check
+        if exact_check is None:
+            logging.warning(
+                f"跨文件去重 Bloom 过滤器未提供 exact_check，约 {error_rate:.2%} 的新记录可能被误判为重复而丢弃"
+            )
+        self._bits = np.zeros((self.num_bits + 7) // 8, dtype=np.uint8)
+        self._count = 0
+        self._full_logged = False
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def nbytes(self) -> int:
+        return self._bits.nbytes
+
+    def _positions(self, h1: np.ndarray, h2: np.ndarray, i: int) -> np.ndarray:
+        # uint64 溢出按模 2^64 回绕即可
+        with np.errstate(over="ignore"):
+            return (h1 + np.uint64(i) * h2) % np.uint64(self.num_bits)
+
+    def _contains(self, text: np.ndarray) -> np.ndarray:
+        h1, h2 = _key_hashes(text)
+        maybe = np.ones(len(text), dtype=bool)
+        for i in range(self.num_hashes):
+            rows = np.flatnonzero(maybe)
+            if len(rows) == 0:
+                break
+            pos = self._positions(h1[rows], h2[rows], i)
+            hit = (self._bits[pos >> np.uint64(3)] >> (pos & np.uint64(7)).astype(np.uint8)) & 1
+            maybe[rows[hit == 0]] = False
+
+        if self.exact_check is not None and maybe.any():
+            candidates = text[maybe]
+            confirmed = self.exact_check(candidates.tolist())
+            maybe[maybe] = pd.Series(candidates, dtype=object).isin(confirmed).to_numpy(dtype=bool)
+        return maybe
+
+    def _add(self, text: np.ndarray) -> None:
+        h1, h2 = _key_hashes(text)
+        for i in range(self.num_hashes):
+            pos = self._positions(h1, h2, i)
+            np.bitwise_or.at(self._bits, pos >> np.uint64(3), (1 << (pos & np.uint64(7))).astype(np.uint8))
+        self._count += len(text)
+        if self._count > self.capacity and not self._full_logged:
+            logging.warning(f"跨文件去重 Bloom 过滤器已超过设计容量 {self.capacity}，误判率将上升")
+            self._full_logged = True
+
+
+def make_record_filter(
+    kind: Optional[str] = None,
+    max_keys: int = DEDUP_MAX_KEYS,
+    exact_check: Optional[Callable[[List[str]], Set[str]]] = None,
+) -> RecordKeyFilter:
+    """
+    按类型创建过滤器（默认取 MDDAP_DEDUP_FILTER）
+
+    Args:
+        exact_check: 仅 bloom 使用，确认 Bloom 命中的键是否真的已存在
+    """
+    kind = (kind or DEDUP_FILTER_KIND).strip().lower()
+    if kind == "set":
+        return ExactKeyFilter()
+    if kind == "bloom":
+        return BloomKeyFilter(capacity=max_keys, exact_check=exact_check)
+    if kind != "hashset":
+        logging.warning(f"未知的去重过滤器类型 {kind}，使用 hashset")
+    return HashSetKeyFilter(max_keys=max_keys)
@@ -0,0 +1,42 @@
+"""
+记录键的定长二进制哈希（BINARY(16) 的 record_hash 列）
+
+ETL 仍按 'BatchNumber|Operation|...' 的格式生成可读的记录键，写入数据库时
+（bulk_insert / merge_insert_by_hash / get_existing_hashes）若目标 record_hash 列
+已迁移为 BINARY(16)，则转换为 16 字节摘要后再比较和存储。
+
+摘要为键的 UTF-16LE 编码的 MD5，与 SQL Server 的 HASHBYTES('MD5', <NVARCHAR 键>) 完全一致，
+因此历史数据可以在服务器端直接回填（见 scripts/maintenance/migrate_record_hash_binary.py），
+无需把整表读回 Python。这里只用作去重键，不涉及安全用途。
+"""
+
+import hashlib
+from typing import Any, Iterable, Optional
+
+import numpy as np
+
+# 视为二进制记录哈希的 SQL 类型
+BINARY_HASH_SQL_TYPES = {"binary", "varbinary"}
+RECORD_HASH_DIGEST_SIZE = 16
+# SQL Server 端与 record_key_digest 等价的表达式
+RECORD_HASH_SQL_EXPR = "HASHBYTES('MD5', {key})"
+
+
+def record_key_digest(key: Optional[str]) -> Optional[bytes]:
+    """单个记录键的 16 字节摘要；空值返回 None"""
+    if key is None:
+        return None
+    return hashlib.md5(key.encode("utf-16-le")).digest()
+
+
+def record_key_digests(keys: Iterable[Any]) -> np.ndarray:
+    """
+    批量计算摘要（object 数组，元素为 bytes 或 None）
+
+    keys 应为已清洗的键（与写入 NVARCHAR 列时相同的 strip / 空值处理），None 保持为 None。
+    """
+    md5 = hashlib.md5
+    return np.array(
+        [None if k is None else md5(k.encode("utf-16-le")).digest() for k in keys],
+        dtype=object,
+    )
@@ -0,0 +1,238 @@
+"""
+SQL Server Schema Catalog
+Process-wide cache of table columns, data types and indexes.
+
+Writers look tables up here instead of querying INFORMATION_SCHEMA / sys.indexes
+on every call. Code that runs DDL (CREATE/ALTER/DROP, new indexes) must call
+invalidate_table_schema() afterwards so the next lookup reloads the table.
+"""
+
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# Seconds before a cached table is reloaded; 0 keeps entries until invalidated
+SCHEMA_CACHE_TTL = float(os.getenv("MDDAP_SCHEMA_CACHE_TTL", "0") or 0)
+
+# pyodbc.SQL_SERVER_NAME / pyodbc.SQL_DATABASE_NAME
+_SQL_SERVER_NAME = 13
+_SQL_DATABASE_NAME = 16
+
+
+@dataclass(frozen=True)
+class ColumnInfo:
+    name: str
+    data_type: str
+    max_length: Optional[int]
+    ordinal: int
+
+
+@dataclass(frozen=True)
+class TableSchema:
+    schema: str
+    table: str
+    columns: Tuple[ColumnInfo, ...]
+    # index name -> key columns in key order, then included columns
+    indexes: Dict[str, Tuple[str, ...]] = field(default_factory=dict)
+
+    def column_names(self, exclude: Tuple[str, ...] = ()) -> List[str]:
+        """Column names in ordinal order, skipping `exclude` (case-insensitive, like the default collation)."""
+        skip = {c.lower() for c in exclude}
+        return [c.name for c in self.columns if c.name.lower() not in skip]
+
+    def column_types(self, exclude: Tuple[str, ...] = ()) -> List[Tuple[str, str]]:
+        """(column name, DATA_TYPE) pairs in ordinal order."""
+        skip = {c.lower() for c in exclude}
+        return [(c.name, c.data_type) for c in self.columns if c.name.lower() not in skip]
+
+    def column(self, name: str) -> Optional[ColumnInfo]:
+        lowered = name.lower()
+        for c in self.columns:
+            if c.name.lower() == lowered:
+                return c
+        return None
+
+    def has_column(self, name: str) -> bool:
+        return self.column(name) is not None
+
+    def indexed_columns(self) -> Set[str]:
+        """Lower-cased names of columns that appear in any index."""
+        return {col.lower() for cols in self.indexes.values() for col in cols}
+
+    def leads_index(self, name: str) -> bool:
+        """True when some index has `name` as its first key column (usable for seeks)."""
+        lowered = name.lower()
+        return any(cols and cols[0].lower() == lowered for cols in self.indexes.values())
+
+
+def connection_scope(conn) -> str:
+    """Identify the server/database a connection points at, for cache keys."""
+    try:
+        return f"{conn.getinfo(_SQL_SERVER_NAME)}/{conn.getinfo(_SQL_DATABASE_NAME)}".lower()
+    except Exception:
+        return ""
+
+
+class SchemaCatalog:
+    """Thread-safe cache of TableSchema keyed by (scope, schema, table)."""
+
+    def __init__(self, ttl_seconds: float = SCHEMA_CACHE_TTL):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.RLock()
+        self._tables: Dict[Tuple[str, str, str], Tuple[float, TableSchema]] = {}
+
+    @staticmethod
+    def _key(scope: str, schema: str, table_name: str) -> Tuple[str, str, str]:
+        return ((scope or "").lower(), (schema or "dbo").lower(), table_name.lower())
+
+    def get_table(
+        self,
+        conn: Any,
+        table_name: str,
+        schema: str = "dbo",
+        scope: Optional[str] = None,
+    ) -> Optional[TableSchema]:
+        """
+        Return the cached TableSchema, loading it on a miss.
+
+        `conn` is either an open connection or a zero-argument factory returning one
+        (used as a context manager), so callers only connect on a cache miss. A factory
+        requires an explicit `scope`. Missing tables return None and are not cached.
+        """
+        if scope is None:
+            if callable(conn) and not hasattr(conn, "cursor"):
+                raise ValueError("scope is required when passing a connection factory")
+            scope = connection_scope(conn)
+        key = self._key(scope, schema, table_name)
+
+        with self._lock:
+            hit = self._tables.get(key)
+            if hit is not None and (self.ttl_seconds <= 0 or time.monotonic() - hit[0] < self.ttl_seconds):
+                return hit[1]
+
+        if callable(conn) and not hasattr(conn, "cursor"):
+            with conn() as opened:
+                table = self._load(opened, table_name, schema)
+        else:
+            table = self._load(conn, table_name, schema)
+
+        if table is not None:
+            with self._lock:
+                self._tables[key] = (time.monotonic(), table)
+        return table
+
+    def register_copy(
+        self,
+        source_table: str,
+        target_table: str,
+        schema: str = "dbo",
+        scope: str = "",
+    ) -> None:
+        """Record that target was created with SELECT ... INTO from source (same columns, no indexes)."""
+        with self._lock:
+            hit = self._tables.get(self._key(scope, schema, source_table))
+            if hit is None:
+                self._tables.pop(self._key(scope, schema, target_table), None)
+                return
+            source = hit[1]
+            copy = TableSchema(schema=source.schema, table=target_table, columns=source.columns, indexes={})
+            self._tables[self._key(scope, schema, target_table)] = (time.monotonic(), copy)
+
+    def invalidate(self, table_name: Optional[str] = None, schema: str = "dbo", scope: Optional[str] = None) -> None:
+        """
+        Drop cached entries after DDL.
+
+        With no table_name every table is dropped; with no scope the table is
+        dropped for every server/database.
+        """
+        with self._lock:
+            if table_name is None and scope is None:
+                self._tables.clear()
+                return
+            for key in list(self._tables):
+                k_scope, k_schema, k_table = key
+                if scope is not None and k_scope != scope.lower():
+                    continue
+                if table_name is not None and (k_schema, k_table) != ((schema or "dbo").lower(), table_name.lower()):
+                    continue
+                del self._tables[key]
+
+    @staticmethod
+    def _load(conn, table_name: str, schema: str) -> Optional[TableSchema]:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT COLUMN_NAME, DATA_TYPE, CHARACTER_MAXIMUM_LENGTH, ORDINAL_POSITION
+            FROM INFORMATION_SCHEMA.COLUMNS
+            WHERE TABLE_SCHEMA = ? AND TABLE_NAME = ?
+            ORDER BY ORDINAL_POSITION
+            """,
+            (schema, table_name),
+        )
+        columns = tuple(
+            ColumnInfo(
+                name=str(r[0]),
+                data_type=(r[1] or "").lower(),
+                max_length=None if r[2] is None else int(r[2]),
+                ordinal=int(r[3]),
+            )
+            for r in cur.fetchall()
+        )
+        if not columns:
+            return None
+
+        indexes: Dict[str, List[str]] = {}
+        try:
+            cur.execute(
+                """
+                SELECT i.name, c.name
+                FROM sys.indexes i
+                JOIN sys.index_columns ic ON i.object_id = ic.object_id AND i.index_id = ic.index_id
+                JOIN sys.columns c ON c.object_id = ic.object_id AND c.column_id = ic.column_id
+                WHERE i.object_id = OBJECT_ID(?) AND i.name IS NOT NULL
+                ORDER BY i.index_id, ic.is_included_column, ic.key_ordinal
+                """,
+                (f"{schema}.{table_name}",),
+            )
+            for idx_name, col_name in cur.fetchall():
+                indexes.setdefault(str(idx_name), []).append(str(col_name))
+        except Exception as e:
+            logging.debug(f"Index metadata unavailable for {schema}.{table_name}: {e}")
+
+        logging.debug(f"Schema catalog loaded {schema}.{table_name} ({len(columns)} columns, {len(indexes)} indexes)")
+        return TableSchema(
+            schema=schema,
+            table=table_name,
+            columns=columns,
+            indexes={name: tuple(cols) for name, cols in indexes.items()},
+        )
+
+
+_CATALOG = SchemaCatalog()
+
+
+def get_schema_catalog() -> SchemaCatalog:
+    """Return the process-wide schema catalog."""
+    return _CATALOG
+
+
+def get_table_schema(
+    conn: Any,
+    table_name: str,
+    schema: str = "dbo",
+    scope: Optional[str] = None,
+) -> Optional[TableSchema]:
+    """Cached columns/types/indexes for a table (see SchemaCatalog.get_table)."""
+    return _CATALOG.get_table(conn, table_name, schema=schema, scope=scope)
+
+
+def invalidate_table_schema(
+    table_name: Optional[str] = None,
+    schema: str = "dbo",
+    scope: Optional[str] = None,
+) -> None:
+    """Forget cached metadata after DDL; no arguments clears the whole catalog."""
+    _CATALOG.invalidate(table_name, schema=schema, scope=scope)
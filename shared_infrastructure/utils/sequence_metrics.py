@@ -0,0 +1,162 @@
+"""
+机台批次序列指标（MES / SFC 清洗共用）
+
+按 machine 分组、组内按 TrackOutTime 升序排列后，用一次稳定排序和数组位移计算：
+- Setup：与同机台上一批的 CFN 相同为 "No"，否则为 "Yes"
+- PreviousBatchEndTime：同机台上一批的 TrackOutTime；第一批回退为 EnterStepTime
+
+排序规则与 sort_values(["machine", "TrackOutTime"], na_position="last") 一致：
+machine 或 TrackOutTime 为空的记录排在组末，不参与 PreviousBatchEndTime 计算。
+增量模式下只重算有新数据的机台，其余机台沿用已有的 PreviousBatchEndTime。
+"""
+
+import logging
+from typing import Any, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+_NAT = np.iinfo(np.int64).min
+_NAT_LAST = np.iinfo(np.int64).max
+
+
+def to_datetime_column(values: pd.Series, numeric_unit: Optional[str] = "ms") -> pd.Series:
+    """
+    转换为 datetime64[ns]
+
+    数值列按 numeric_unit 解析（MES 导出的毫秒时间戳），文本列按混合格式解析
+    （SQLite 历史表回读的 ISO 字符串），无法解析的值为 NaT。
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        if getattr(values.dt, "tz", None) is not None:
+            values = values.dt.tz_localize(None)
+        return values.astype("datetime64[ns]")
+    if numeric_unit and pd.api.types.is_numeric_dtype(values):
+        return pd.to_datetime(values, unit=numeric_unit, errors="coerce").astype("datetime64[ns]")
+    return pd.to_datetime(values, errors="coerce", format="mixed").astype("datetime64[ns]")
+
+
+def machine_sequence_order(machine: pd.Series, trackout: pd.Series) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    计算 (machine, TrackOutTime) 的稳定排序
+
+    Returns:
+        (order, machine_codes, trackout_ns)：order 为排序后的行位置；
+        machine_codes / trackout_ns 已按 order 重排，machine 为空时编码为 -1，TrackOutTime 为空时为 NaT
+    """
+    codes, _ = pd.factorize(machine, sort=True)
+    codes = codes.astype(np.int64, copy=False)
+    trackout_ns = to_datetime_column(trackout).to_numpy().view(np.int64)
+
+    # 空值排在最后（与 na_position="last" 一致）
+    machine_key = np.where(codes < 0, np.iinfo(np.int64).max, codes)
+    time_key = np.where(trackout_ns == _NAT, _NAT_LAST, trackout_ns)
+    order = np.lexsort((time_key, machine_key))
+    return order, codes[order], trackout_ns[order]
+
+
+def _same_machine_as_previous(codes: np.ndarray) -> np.ndarray:
+    same = np.zeros(len(codes), dtype=bool)
+    if len(codes) > 1:
+        same[1:] = (codes[1:] == codes[:-1]) & (codes[1:] >= 0)
+    return same
+
+
+def setup_flags(codes: np.ndarray, cfn: pd.Series) -> np.ndarray:
+    """
+    已排序序列的 Setup 标志
+
+    Args:
+        codes: 排序后的 machine 编码
+        cfn: 排序后的 CFN
+    """
+    cfn_codes, _ = pd.factorize(cfn)
+    same_cfn = np.zeros(len(codes), dtype=bool)
+    if len(codes) > 1:
+        same_cfn[1:] = (cfn_codes[:-1] >= 0) & (cfn_codes[1:] == cfn_codes[:-1])
+    same_cfn &= _same_machine_as_previous(codes)
+    return np.where(same_cfn, "No", "Yes").astype(object)
+
+
+def previous_end_ns(codes: np.ndarray, trackout_ns: np.ndarray, fallback_ns: Optional[np.ndarray]) -> np.ndarray:
+    """
+    已排序序列的上批结束时间（纳秒，NaT 为 int64 最小值）
+
+    machine 和 TrackOutTime 都不为空的记录取同机台上一条有效记录的 TrackOutTime，
+    没有上一条时取 fallback_ns（EnterStepTime）。
+    """
+    valid = (codes >= 0) & (trackout_ns != _NAT)
+    # 组内有效记录连续排在前面，上一行有效且同机台即为上一批
+    has_previous = np.zeros(len(codes), dtype=bool)
+    has_previous[1:] = valid[1:] & valid[:-1] & (codes[1:] == codes[:-1])
+
+    result = np.full(len(codes), _NAT, dtype=np.int64)
+    previous_rows = np.flatnonzero(has_previous)
+    result[previous_rows] = trackout_ns[previous_rows - 1]
+    if fallback_ns is not None:
+        first = valid & ~has_previous
+        result[first] = fallback_ns[first]
+    return result
+
+
+def calculate_sequence_metrics(
+    df: pd.DataFrame,
+    setup: bool = True,
+    previous_end: bool = True,
+    changed_machines: Optional[Iterable[Any]] = None,
+    machine_col: str = "machine",
+    time_col: str = "TrackOutTime",
+    cfn_col: str = "CFN",
+    fallback_col: str = "EnterStepTime",
+) -> pd.DataFrame:
+    """
+    一次排序同时计算 Setup 和 PreviousBatchEndTime
+
+    Args:
+        df: 包含 machine / TrackOutTime（以及 CFN、EnterStepTime）的数据
+        setup: 是否计算 Setup（需要 CFN 列）
+        previous_end: 是否计算 PreviousBatchEndTime
+        changed_machines: 增量模式下有新数据的机台；df 已有 PreviousBatchEndTime 时只重算这些机台
+
+    Returns:
+        全量模式返回按 (machine, TrackOutTime) 排序的副本（保留原索引）；
+        增量模式保持原行顺序，只更新变化机台的行
+    """
+    result = df.copy()
+    if previous_end:
+        result[time_col] = to_datetime_column(result[time_col])
+        if fallback_col in result.columns:
+            result[fallback_col] = to_datetime_column(result[fallback_col], numeric_unit=None)
+
+    incremental = (
+        changed_machines is not None
+        and previous_end
+        and not setup
+        and "PreviousBatchEndTime" in result.columns
+    )
+    if incremental:
+        changed = pd.Index(pd.unique(pd.Series(list(changed_machines), dtype=object).dropna()))
+        rows = np.flatnonzero(result[machine_col].isin(changed).to_numpy())
+        kept = to_datetime_column(result["PreviousBatchEndTime"], numeric_unit=None)
+        logging.info(f"增量计算 PreviousBatchEndTime：{len(changed)} 个机台，{len(rows)}/{len(result)} 行需要重算")
+        if len(rows) == 0:
+            result["PreviousBatchEndTime"] = kept
+            return result
+        subset = result.iloc[rows]
+        order, codes, trackout_ns = machine_sequence_order(subset[machine_col], subset[time_col])
+        fallback = subset[fallback_col].to_numpy().view(np.int64)[order] if fallback_col in subset.columns else None
+        values = kept.to_numpy().view(np.int64).copy()
+        values[rows[order]] = previous_end_ns(codes, trackout_ns, fallback)
+        result["PreviousBatchEndTime"] = pd.Series(values.view("datetime64[ns]"), index=result.index)
+        return result
+
+    order, codes, trackout_ns = machine_sequence_order(result[machine_col], result[time_col])
+    result = result.iloc[order]
+    if setup:
+        result["Setup"] = setup_flags(codes, result[cfn_col])
+    if previous_end:
+        fallback = result[fallback_col].to_numpy().view(np.int64) if fallback_col in result.columns else None
+        result["PreviousBatchEndTime"] = pd.Series(
+            previous_end_ns(codes, trackout_ns, fallback).view("datetime64[ns]"), index=result.index
+        )
+    return result
@@ -0,0 +1,301 @@
+"""
+SQL Server Connection Pool
+Process-wide, thread-safe pool of pyodbc connections keyed by connection string.
+
+Connections handed out behave like pyodbc connections: `with conn:` commits on
+success and rolls back on error, and close() (or dropping the last reference)
+returns the connection to the pool instead of logging out. Idle connections
+are pinged before reuse and closed after MDDAP_SQL_POOL_IDLE_SECONDS.
+
+Also holds a small "DDL already ensured" memo so bookkeeping helpers run their
+CREATE TABLE IF NOT EXISTS batches once per process.
+"""
+
+import logging
+import os
+import threading
+import time
+import weakref
+from typing import Any, Callable, Dict, List, Set, Tuple
+
+# 0 disables pooling (every get_connection opens a fresh connection)
+SQL_POOL_SIZE = int(os.getenv("MDDAP_SQL_POOL_SIZE", "8") or 0)
+# Idle connections older than this are closed
+SQL_POOL_IDLE_SECONDS = float(os.getenv("MDDAP_SQL_POOL_IDLE_SECONDS", "300") or 300)
+# Idle connections older than this are pinged with SELECT 1 before reuse
+SQL_POOL_PING_SECONDS = float(os.getenv("MDDAP_SQL_POOL_PING_SECONDS", "30") or 30)
+
+
+class PooledCursor:
+    """
+    pyodbc cursor proxy.
+
+    pyodbc cursors cannot be weakly referenced, so the connection tracks these proxies
+    instead: a dropped proxy frees its cursor right away, a live one is closed on release.
+    """
+
+    def __init__(self, raw: Any):
+        object.__setattr__(self, "_raw", raw)
+
+    def execute(self, *args, **kwargs):
+        result = self._raw.execute(*args, **kwargs)
+        # pyodbc returns the cursor itself so calls can be chained
+        return self if result is self._raw else result
+
+    def __getattr__(self, name: str):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self._raw, name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self._raw, name, value)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._raw)
+
+    def __enter__(self):
+        self._raw.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._raw.__exit__(exc_type, exc, tb)
+
+
+class PooledConnection:
+    """pyodbc connection proxy that returns itself to its pool on close()."""
+
+    def __init__(self, pool: "ConnectionPool", raw: Any, pooled: bool = True):
+        object.__setattr__(self, "_pool", pool)
+        object.__setattr__(self, "_raw", raw)
+        object.__setattr__(self, "_pooled", pooled)
+        object.__setattr__(self, "_cursors", weakref.WeakSet())
+
+    def _conn(self):
+        raw = self._raw
+        if raw is None:
+            raise RuntimeError("Attempt to use a connection that was returned to the pool")
+        return raw
+
+    def cursor(self):
+        cur = PooledCursor(self._conn().cursor())
+        self._cursors.add(cur)
+        return cur
+
+    def execute(self, *args, **kwargs):
+        cur = PooledCursor(self._conn().execute(*args, **kwargs))
+        self._cursors.add(cur)
+        return cur
+
+    def close(self) -> None:
+        raw = self._raw
+        if raw is None:
+            return
+        object.__setattr__(self, "_raw", None)
+        # Only cursors still referenced somewhere are left; dropped ones were freed already
+        cursors = [cur._raw for cur in list(self._cursors)]
+        self._cursors.clear()
+        self._pool._release(raw, cursors, self._pooled)
+
+    @property
+    def closed(self) -> bool:
+        return self._raw is None
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._conn(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self._conn(), name, value)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Same semantics as pyodbc.Connection.__exit__: the connection stays open
+        raw = self._raw
+        if raw is None or raw.autocommit:
+            return False
+        if exc_type is None:
+            raw.commit()
+        else:
+            raw.rollback()
+        return False
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """Bounded pool of idle connections for one connection string."""
+
+    def __init__(
+        self,
+        connect: Callable[[], Any],
+        max_size: int = SQL_POOL_SIZE,
+        idle_seconds: float = SQL_POOL_IDLE_SECONDS,
+        ping_seconds: float = SQL_POOL_PING_SECONDS,
+        name: str = "",
+    ):
+        self._connect = connect
+        self.max_size = max_size
+        self.idle_seconds = idle_seconds
+        self.ping_seconds = ping_seconds
+        self.name = name
+        self._lock = threading.Lock()
+        # (raw connection, returned_at)
+        self._idle: List[Tuple[Any, float]] = []
+        self._in_use = 0
+        self._defaults: Dict[int, Tuple[bool, int]] = {}
+
+    def acquire(self) -> PooledConnection:
+        """Check out a healthy connection, opening a new one when none is idle."""
+        while True:
+            with self._lock:
+                self._evict_idle_locked()
+                if not self._idle:
+                    pooled = self._in_use < self.max_size
+                    self._in_use += 1 if pooled else 0
+                    break
+                raw, returned_at = self._idle.pop()
+                self._in_use += 1
+            if time.monotonic() - returned_at < self.ping_seconds or self._ping(raw):
+                return PooledConnection(self, raw)
+            self._discard(raw, in_use=True)
+
+        if not pooled:
+            # Pool exhausted: hand out a one-off connection rather than block (nested callers)
+            logging.debug(f"SQL pool {self.name} exhausted ({self.max_size}); opening overflow connection")
+        try:
+            raw = self._connect()
+        except Exception:
+            if pooled:
+                with self._lock:
+                    self._in_use -= 1
+            raise
+        self._defaults[id(raw)] = (bool(getattr(raw, "autocommit", False)), int(getattr(raw, "timeout", 0) or 0))
+        return PooledConnection(self, raw, pooled=pooled)
+
+    def _release(self, raw: Any, cursors: List[Any], pooled: bool) -> None:
+        for cur in cursors:
+            try:
+                cur.close()
+            except Exception:
+                pass
+        if not pooled:
+            self._close_quietly(raw)
+            return
+        try:
+            if not raw.autocommit:
+                raw.rollback()
+            autocommit, timeout = self._defaults.get(id(raw), (False, 0))
+            if raw.autocommit != autocommit:
+                raw.autocommit = autocommit
+            if (getattr(raw, "timeout", 0) or 0) != timeout:
+                raw.timeout = timeout
+        except Exception:
+            # Broken connection (network drop, killed session): never reuse it
+            self._discard(raw, in_use=True)
+            return
+        with self._lock:
+            self._in_use -= 1
+            self._idle.append((raw, time.monotonic()))
+            self._evict_idle_locked()
+
+    def _ping(self, raw: Any) -> bool:
+        try:
+            cur = raw.cursor()
+            cur.execute("SELECT 1")
+            cur.fetchall()
+            cur.close()
+            return True
+        except Exception as e:
+            logging.info(f"SQL pool {self.name}: dropping stale connection ({e})")
+            return False
+
+    def _discard(self, raw: Any, in_use: bool) -> None:
+        self._defaults.pop(id(raw), None)
+        self._close_quietly(raw)
+        if in_use:
+            with self._lock:
+                self._in_use -= 1
+
+    def _evict_idle_locked(self) -> None:
+        now = time.monotonic()
+        keep = []
+        for raw, returned_at in self._idle:
+            if now - returned_at > self.idle_seconds:
+                self._defaults.pop(id(raw), None)
+                self._close_quietly(raw)
+            else:
+                keep.append((raw, returned_at))
+        self._idle = keep
+
+    @staticmethod
+    def _close_quietly(raw: Any) -> None:
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def close_all(self) -> None:
+        """Close every idle connection (checked-out connections close when released)."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for raw, _ in idle:
+            self._defaults.pop(id(raw), None)
+            self._close_quietly(raw)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"idle": len(self._idle), "in_use": self._in_use, "max_size": self.max_size}
+
+
+_POOLS: Dict[Tuple[int, str], ConnectionPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_pool(connection_string: str, connect: Callable[[], Any]) -> ConnectionPool:
+    """Return the pool for a connection string, creating it with `connect` on first use."""
+    # Keyed by pid so a forked child never reuses the parent's sockets
+    key = (os.getpid(), connection_string)
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is None:
+            pool = ConnectionPool(connect, name=connection_string.split("DATABASE=")[-1].split(";")[0])
+            _POOLS[key] = pool
+        return pool
+
+
+def close_all_pools() -> None:
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+        _POOLS.clear()
+    for pool in pools:
+        pool.close_all()
+
+
+_ENSURED_DDL: Set[Tuple[str, ...]] = set()
+_ENSURED_DDL_LOCK = threading.Lock()
+
+
+def ddl_ensured(*key: str) -> bool:
+    """True when the DDL identified by key was already applied in this process."""
+    with _ENSURED_DDL_LOCK:
+        return tuple(key) in _ENSURED_DDL
+
+
+def mark_ddl_ensured(*key: str) -> None:
+    with _ENSURED_DDL_LOCK:
+        _ENSURED_DDL.add(tuple(key))
+
+
+def reset_ddl_memo() -> None:
+    with _ENSURED_DDL_LOCK:
+        _ENSURED_DDL.clear()
@@ -0,0 +1,494 @@
+"""
+工作日历服务
+把 dim_calendar（或 MES 使用的 日历工作日表.csv）加载为按天展开的紧凑数组，
+进程内只加载一次，并按失效标记（CSV 修改时间 / dim_calendar 校验和）缓存到磁盘。
+
+提供整列（向量化）接口，替代逐行逐天扫描日历：
+- is_workday(dates)                          按日期判断是否工作日
+- add_working_hours(start, hours)            从 start 起累加工作时间得到完成时间
+- nonworking_hours_between(start, end)       区间内的非工作时段小时数
+- working_hours_between(start, end)          区间内的工作时段小时数
+- next_workday_start(ts)                     下一个工作时段的开始（8:00）
+- calendar_days_for_workdays(start, count)   覆盖 count 个工作日需要的自然日数
+
+"某天"的工作时段为当天 8:00 至次日 8:00（与 MES/SFC 报工口径一致）。
+日历范围外的日期按周一到周五判断（fallback="weekday"），或视为非工作日（fallback="none"）。
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# 磁盘缓存目录
+CALENDAR_CACHE_DIR = os.getenv("MDDAP_CALENDAR_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "mddap_calendar_cache")
+
+_NS_PER_US = 1_000
+_NS_PER_HOUR = 3_600_000_000_000
+_NS_PER_DAY = 86_400_000_000_000
+_NS_8AM = 8 * _NS_PER_HOUR
+_NAT = np.iinfo(np.int64).min
+# add_working_hours 最多向后查找的天数（与 MES calculate_due_time_by_workdays 一致）
+MAX_DUE_DAYS = 365
+
+
+def _as_ns(values: Any) -> np.ndarray:
+    """日期时间（Series/数组/标量）转换为 datetime64[ns] 的 int64 表示，NaT 为 int64 最小值"""
+    converted = pd.to_datetime(values)
+    if isinstance(converted, pd.Series):
+        arr = converted.to_numpy(dtype="datetime64[ns]")
+    else:
+        arr = np.asarray(converted, dtype="datetime64[ns]")
+    return np.atleast_1d(arr).view(np.int64)
+
+
+def _timedelta_hours_ns(hours: np.ndarray) -> np.ndarray:
+    """timedelta(hours=x) 的纳秒数（沿用 datetime.timedelta 的舍入规则）"""
+    return np.fromiter(
+        (timedelta(hours=h) // timedelta(microseconds=1) for h in hours.tolist()),
+        dtype=np.int64,
+        count=len(hours),
+    ) * _NS_PER_US
+
+
+def _overlap_hours(duration_ns: np.ndarray) -> np.ndarray:
+    """Timedelta.total_seconds() / 3600（total_seconds 精确到微秒）"""
+    return ((duration_ns // _NS_PER_US) / 1e6) / 3600
+
+
+class WorkCalendar:
+    """
+    按天的工作日标记
+
+    日期以 1970-01-01 起的天数（int64）表示；日历中的日期取日历值，
+    其余日期按 fallback 规则判断。查询时按需展开连续区间并计算累计工作日数。
+    """
+
+    def __init__(self, days: np.ndarray, flags: np.ndarray, fallback: str = "weekday", token: str = ""):
+        if fallback not in ("weekday", "none"):
+            raise ValueError(f"未知的 fallback: {fallback}")
+        self.days = np.asarray(days, dtype=np.int64)
+        self.flags = np.asarray(flags, dtype=bool)
+        self.fallback = fallback
+        self.token = token
+        self._lock = threading.Lock()
+        self._first_day = 0
+        self._workday = np.empty(0, dtype=bool)
+        # _cum_workdays[i] = [first_day, first_day + i) 内的工作日数
+        self._cum_workdays = np.zeros(1, dtype=np.int64)
+
+    # ---------- 构造 ----------
+
+    @classmethod
+    def weekdays_only(cls) -> "WorkCalendar":
+        """不含节假日的日历（周一到周五为工作日）"""
+        return cls(np.empty(0, dtype=np.int64), np.empty(0, dtype=bool), fallback="weekday", token="weekdays")
+
+    @classmethod
+    def from_frame(
+        cls,
+        calendar_df: pd.DataFrame,
+        flag_col: str,
+        date_col: Optional[str] = None,
+        fallback: str = "weekday",
+        is_work: Callable[[Any], bool] = bool,
+        token: str = "",
+    ) -> "WorkCalendar":
+        """
+        从日历 DataFrame 构造
+
+        Args:
+            calendar_df: 日历表（date_col 为空时使用索引作为日期）
+            flag_col: 是否工作日列
+            is_work: 把单元格值转换为是否工作日（默认 bool()，与 MES is_workday 一致）
+        """
+        if calendar_df.empty or flag_col not in calendar_df.columns:
+            return cls(np.empty(0, dtype=np.int64), np.empty(0, dtype=bool), fallback=fallback, token=token)
+        dates = calendar_df.index if date_col is None else calendar_df[date_col]
+        index = pd.DatetimeIndex(pd.to_datetime(dates, errors="coerce"))
+        # 只有 0 点的日期能按日期命中
+        valid = ~index.isna() & (index == index.normalize())
+        values = [is_work(v) for v in calendar_df[flag_col].to_numpy()[valid]]
+        # 重复日期取第一条
+        days, first = np.unique(index.asi8[valid] // _NS_PER_DAY, return_index=True)
+        flags = np.asarray(values, dtype=bool)[first] if len(values) else np.empty(0, dtype=bool)
+        return cls(days, flags, fallback=fallback, token=token)
+
+    def save(self, path: str) -> None:
+        """保存到磁盘缓存（原子替换）"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, days=self.days, flags=self.flags, fallback=np.array(self.fallback), token=np.array(self.token))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "WorkCalendar":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["days"], data["flags"], fallback=str(data["fallback"]), token=str(data["token"]))
+
+    # ---------- 按天标记 ----------
+
+    def workday_flags(self, first_day: int, last_day: int) -> np.ndarray:
+        """[first_day, last_day] 每天是否为工作日"""
+        days = np.arange(first_day, last_day + 1, dtype=np.int64)
+        if self.fallback == "weekday":
+            # 1970-01-01 为周四（weekday=3）
+            flags = (days + 3) % 7 < 5
+        else:
+            flags = np.zeros(len(days), dtype=bool)
+        if len(self.days):
+            pos = np.minimum(np.searchsorted(self.days, days), len(self.days) - 1)
+            hit = self.days[pos] == days
+            flags[hit] = self.flags[pos[hit]]
+        return flags
+
+    def _ensure_horizon(self, first_day: int, last_day: int) -> None:
+        with self._lock:
+            current_last = self._first_day + len(self._workday) - 1
+            if len(self._workday) and first_day >= self._first_day and last_day <= current_last:
+                return
+            if len(self._workday):
+                first_day = min(first_day, self._first_day)
+                last_day = max(last_day, current_last)
+            workday = self.workday_flags(first_day, last_day)
+            self._cum_workdays = np.concatenate([[0], np.cumsum(workday, dtype=np.int64)])
+            self._workday = workday
+            self._first_day = int(first_day)
+
+    def _is_workday_days(self, days: np.ndarray) -> np.ndarray:
+        days = np.asarray(days, dtype=np.int64)
+        if len(days) == 0:
+            return np.zeros(0, dtype=bool)
+        self._ensure_horizon(int(days.min()), int(days.max()))
+        return self._workday[days - self._first_day]
+
+    # ---------- 批量接口 ----------
+
+    def is_workday(self, dates: Any) -> np.ndarray:
+        """按日期（忽略时间部分）判断是否工作日；NaT 返回 False"""
+        ns = _as_ns(dates)
+        valid = ns != _NAT
+        result = np.zeros(len(ns), dtype=bool)
+        result[valid] = self._is_workday_days(ns[valid] // _NS_PER_DAY)
+        return result
+
+    def add_working_hours(self, start: Any, hours: Any, daily_working_hours: float = 24.0) -> np.ndarray:
+        """
+        从 start 起累加 hours 小时工作时间，跳过非工作日（返回 datetime64[ns] 数组）
+
+        开始当天若是工作日，先消耗到次日 8:00 的剩余时间；之后每个工作日提供
+        daily_working_hours 小时（从 8:00 起算）。超过 MAX_DUE_DAYS 天仍未完成时
+        返回最后推进到的日期 8:00。
+        """
+        start_ns = _as_ns(start)
+        hours = np.broadcast_to(np.asarray(hours, dtype=np.float64), start_ns.shape)
+        result = np.full(len(start_ns), _NAT, dtype=np.int64)
+        valid = start_ns != _NAT
+        result[valid] = self._add_working_hours_ns(start_ns[valid], hours[valid], daily_working_hours)
+        return result.view("datetime64[ns]")
+
+    def nonworking_hours_between(self, start: Any, end: Any, count_before_8am: bool = True) -> np.ndarray:
+        """
+        [start, end] 内非工作时段的小时数（未取整；end <= start 为 0，NaT 为 NaN）
+
+        count_before_8am=False 时从 start 所在日期的 8:00 时段开始统计，
+        start 当天 8:00 之前的部分（属于前一天的时段）不计入（MES NonWorkday(d) 口径）。
+        """
+        start_ns, end_ns = _as_ns(start), _as_ns(end)
+        result = np.full(len(start_ns), np.nan)
+        valid = (start_ns != _NAT) & (end_ns != _NAT)
+        result[valid] = 0.0
+        positive = valid & (end_ns > start_ns)
+        result[positive] = self._nonworking_hours_ns(start_ns[positive], end_ns[positive], count_before_8am)
+        return result
+
+    def working_hours_between(self, start: Any, end: Any) -> np.ndarray:
+        """[start, end] 内工作时段的小时数（end <= start 为 0，NaT 为 NaN）"""
+        start_ns, end_ns = _as_ns(start), _as_ns(end)
+        total = np.where(end_ns > start_ns, _overlap_hours(end_ns - start_ns), 0.0)
+        return total - self.nonworking_hours_between(start_ns.view("datetime64[ns]"), end_ns.view("datetime64[ns]"))
+
+    def next_workday_start(self, ts: Any) -> np.ndarray:
+        """ts 之后（不含 ts 所在时段）第一个工作时段的开始时间（8:00）"""
+        ns = _as_ns(ts)
+        result = np.full(len(ns), _NAT, dtype=np.int64)
+        valid = np.flatnonzero(ns != _NAT)
+        if len(valid) == 0:
+            return result.view("datetime64[ns]")
+        window_day = (ns[valid] - _NS_8AM) // _NS_PER_DAY
+        self._ensure_horizon(int(window_day.min()), int(window_day.max()) + MAX_DUE_DAYS + 1)
+        target = self._cum_workdays[window_day + 1 - self._first_day] + 1
+        found = np.searchsorted(self._cum_workdays, target, side="left") - 1
+        ok = found < len(self._workday)
+        result[valid[ok]] = (found[ok] + self._first_day) * _NS_PER_DAY + _NS_8AM
+        return result.view("datetime64[ns]")
+
+    def calendar_days_for_workdays(self, start: Any, count: Any) -> np.ndarray:
+        """
+        从 start 所在日期（含）起，数满 count 个工作日需要的自然日数
+
+        count <= 0 返回 0；日历范围内找不到足够工作日时返回 -1。
+        """
+        ns = _as_ns(start)
+        count = np.broadcast_to(np.asarray(count, dtype=np.int64), ns.shape)
+        result = np.full(len(ns), -1, dtype=np.int64)
+        result[count <= 0] = 0
+        rows = np.flatnonzero((ns != _NAT) & (count > 0))
+        if len(rows) == 0:
+            return result
+        day = ns[rows] // _NS_PER_DAY
+        self._ensure_horizon(int(day.min()), int(day.max()) + int(count[rows].max()) * 7 // 5 + 14)
+        offset = day - self._first_day
+        target = self._cum_workdays[offset] + count[rows]
+        found = np.searchsorted(self._cum_workdays, target, side="left") - 1
+        ok = found < len(self._workday)
+        result[rows[ok]] = found[ok] - offset[ok] + 1
+        return result
+
+    # ---------- 内部实现（纳秒 int64） ----------
+
+    def _add_working_hours_ns(self, start_ns: np.ndarray, required_hours: np.ndarray, daily_working_hours: float) -> np.ndarray:
+        result = start_ns.copy()
+        if len(start_ns) == 0:
+            return result
+
+        day = start_ns // _NS_PER_DAY
+        # Timestamp.replace(hour=8, minute=0, second=0, microsecond=0) 保留纳秒部分
+        nanos = start_ns % _NS_PER_US
+        start_8am = day * _NS_PER_DAY + _NS_8AM + nanos
+        self._ensure_horizon(int(day.min()), int(day.max()) + MAX_DUE_DAYS + 2)
+
+        todo = ~(required_hours <= 0)
+        after_8am = start_ns >= start_8am
+        start_is_workday = self._workday[day - self._first_day]
+
+        remaining = required_hours.copy()
+        loop_day = np.where(after_8am, day + 1, day)
+
+        # 开始当天是工作日：先扣除到次日 8:00 的剩余时间
+        same_day = todo & after_8am & start_is_workday
+        hours_left = _overlap_hours(start_8am + _NS_PER_DAY - start_ns)
+        finish_today = same_day & (required_hours <= hours_left)
+        if finish_today.any():
+            result[finish_today] = start_ns[finish_today] + _timedelta_hours_ns(required_hours[finish_today])
+        carry = same_day & ~finish_today
+        remaining[carry] = required_hours[carry] - hours_left[carry]
+
+        in_loop = todo & ~finish_today
+        # 剩余工时为 NaN 时不进入逐日累加，直接停在下一段的 8:00
+        nan_rows = in_loop & np.isnan(remaining)
+        result[nan_rows] = loop_day[nan_rows] * _NS_PER_DAY + _NS_8AM + nanos[nan_rows]
+        in_loop &= ~nan_rows
+
+        idx = np.flatnonzero(in_loop)
+        if len(idx) == 0:
+            return result
+
+        # 完成前需整天扣除的工作日数（逐次减去 daily_working_hours，保证与逐日累加的浮点结果一致）
+        rem = remaining[idx]
+        skipped = np.zeros(len(idx), dtype=np.int64)
+        active = np.flatnonzero(~(rem <= daily_working_hours))
+        for _ in range(MAX_DUE_DAYS):
+            if len(active) == 0:
+                break
+            rem[active] -= daily_working_hours
+            skipped[active] += 1
+            active = active[~(rem[active] <= daily_working_hours)]
+
+        # 第 skipped+1 个工作日完成
+        offset = loop_day[idx] - self._first_day
+        target = self._cum_workdays[offset] + skipped + 1
+        finish_pos = np.searchsorted(self._cum_workdays, target, side="left") - 1
+        done = np.ones(len(idx), dtype=bool)
+        done[active] = False
+        done &= (finish_pos - offset) < MAX_DUE_DAYS
+
+        finish_day_8am = (finish_pos + self._first_day) * _NS_PER_DAY + _NS_8AM + nanos[idx]
+        done_idx = np.flatnonzero(done)
+        result[idx[done_idx]] = finish_day_8am[done_idx] + _timedelta_hours_ns(rem[done_idx])
+
+        late = idx[~done]
+        if len(late):
+            logging.warning(f"计算完成时间超过{MAX_DUE_DAYS}天，返回估算值（{len(late)} 行）")
+            result[late] = (loop_day[late] + MAX_DUE_DAYS) * _NS_PER_DAY + _NS_8AM + nanos[late]
+        return result
+
+    def _nonworking_hours_ns(self, start_ns: np.ndarray, end_ns: np.ndarray, count_before_8am: bool) -> np.ndarray:
+        """要求 end > start；按时段顺序累加（与逐日累加的浮点结果一致）"""
+        total = np.zeros(len(start_ns), dtype=np.float64)
+        if len(start_ns) == 0:
+            return total
+
+        # 第一个时段：包含 start 的时段，或 start 所在日期的时段
+        first = (start_ns - _NS_8AM) // _NS_PER_DAY if count_before_8am else start_ns // _NS_PER_DAY
+        # 包含 end 的工作时段所属日期（该时段为 last 8:00 到 last+1 8:00）
+        last = (end_ns - _NS_8AM) // _NS_PER_DAY
+        self._ensure_horizon(int(min(first.min(), last.min())), int(max(first.max(), last.max())) + 1)
+
+        first_8am = first * _NS_PER_DAY + _NS_8AM
+        last_8am = last * _NS_PER_DAY + _NS_8AM
+
+        # 第一天时段与 [start, end] 的重叠
+        overlap = np.minimum(end_ns, first_8am + _NS_PER_DAY) - np.maximum(start_ns, first_8am)
+        use_first = ~self._workday[first - self._first_day] & (overlap > 0)
+        total[use_first] = _overlap_hours(overlap[use_first])
+
+        # 中间整天非工作日（每天 24 小时）
+        spans = last > first
+        inner = np.zeros(len(start_ns), dtype=np.int64)
+        lo = np.minimum(first + 1, last) - self._first_day
+        hi = last - self._first_day
+        inner[spans] = (hi[spans] - lo[spans]) - (self._cum_workdays[hi[spans]] - self._cum_workdays[lo[spans]])
+
+        # 从 0 开始累加整数小时是精确的，直接相乘；否则逐天累加
+        plain = spans & ~use_first
+        total[plain] = 24.0 * inner[plain]
+        seq = np.flatnonzero(spans & use_first & (inner > 0))
+        if len(seq):
+            seq = seq[np.argsort(-inner[seq], kind="stable")]
+            counts = inner[seq]
+            for step in range(int(counts[0])):
+                active = seq[:np.searchsorted(-counts, -step, side="left")]
+                total[active] += 24.0
+
+        # 最后一天（包含 end 的时段）
+        tail = end_ns - last_8am
+        use_last = spans & ~self._workday[last - self._first_day] & (tail > 0)
+        total[use_last] += _overlap_hours(tail[use_last])
+        return total
+
+
+# ==================== 加载与缓存 ====================
+
+# 进程内缓存：source key -> WorkCalendar
+_CALENDARS: Dict[Tuple[str, ...], WorkCalendar] = {}
+_CALENDARS_LOCK = threading.Lock()
+
+
+def _cache_path(key: Tuple[str, ...]) -> str:
+    digest = hashlib.sha1("|".join(key).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(CALENDAR_CACHE_DIR, f"work_calendar_{digest}.npz")
+
+
+def _load_cached(key: Tuple[str, ...], token: str, build: Callable[[], WorkCalendar]) -> WorkCalendar:
+    """按失效标记复用进程内/磁盘缓存，否则调用 build 重新加载"""
+    with _CALENDARS_LOCK:
+        cached = _CALENDARS.get(key)
+    if cached is not None and cached.token == token:
+        return cached
+
+    path = _cache_path(key)
+    calendar = None
+    if os.path.exists(path):
+        try:
+            disk = WorkCalendar.load(path)
+            if disk.token == token:
+                calendar = disk
+                logging.debug(f"工作日历使用磁盘缓存: {path}")
+        except Exception as e:
+            logging.warning(f"读取工作日历缓存失败，将重新加载: {path}, 错误: {e}")
+
+    if calendar is None:
+        calendar = build()
+        calendar.token = token
+        try:
+            calendar.save(path)
+        except Exception as e:
+            logging.warning(f"保存工作日历缓存失败: {path}, 错误: {e}")
+
+    with _CALENDARS_LOCK:
+        _CALENDARS[key] = calendar
+    return calendar
+
+
+def _read_calendar_csv(calendar_file: str) -> WorkCalendar:
+    """读取 日历工作日表.csv（日期 / 是否工作日），解析规则与 MES load_calendar_table 一致"""
+    df = pd.read_csv(calendar_file, encoding="utf-8-sig")
+    if "日期" not in df.columns or "是否工作日" not in df.columns:
+        logging.error(f"日历表缺少'日期'或'是否工作日'列: {calendar_file}，将使用默认周末逻辑")
+        return WorkCalendar.weekdays_only()
+    df["日期"] = pd.to_datetime(df["日期"])
+    if df["是否工作日"].dtype == "object":
+        df["是否工作日"] = df["是否工作日"].map({"True": True, "False": False, True: True, False: False})
+    calendar = WorkCalendar.from_frame(df, flag_col="是否工作日", date_col="日期")
+    logging.info(f"成功加载日历表: {calendar_file}, 共{len(calendar.days)}天")
+    return calendar
+
+
+def _read_dim_calendar(conn) -> WorkCalendar:
+    df = pd.read_sql("SELECT [date], [is_workday] FROM dbo.dim_calendar", conn)
+    # is_workday 为 NULL 的日期不覆盖默认规则
+    df = df[df["is_workday"].notna()]
+    calendar = WorkCalendar.from_frame(df, flag_col="is_workday", date_col="date", is_work=lambda v: int(v) == 1)
+    logging.info(f"成功加载 dim_calendar: 共{len(calendar.days)}天")
+    return calendar
+
+
+def _dim_calendar_token(conn) -> str:
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT COUNT(*), MIN([date]), MAX([date]), CHECKSUM_AGG(CHECKSUM([date], [is_workday]))
+        FROM dbo.dim_calendar
+        """
+    )
+    row = cur.fetchone()
+    return "|".join(str(v) for v in row)
+
+
+def get_work_calendar(
+    calendar_file: Optional[str] = None,
+    conn_factory: Optional[Callable[[], Any]] = None,
+    scope: str = "",
+) -> WorkCalendar:
+    """
+    获取工作日历（进程内只加载一次，按失效标记缓存到磁盘）
+
+    Args:
+        calendar_file: 日历工作日表.csv；文件修改时间/大小变化后重新解析
+        conn_factory: 返回 SQL Server 连接（可作为 with 上下文）的函数，用于读取 dbo.dim_calendar；
+            同一进程内只校验一次 dim_calendar 校验和
+        scope: dim_calendar 所在 server/database 标识（区分不同库的缓存）
+
+    两者都未提供或加载失败时，返回周一到周五的默认日历。
+    """
+    if calendar_file:
+        if not os.path.exists(calendar_file):
+            logging.warning(f"日历表文件不存在: {calendar_file}，将使用默认周末逻辑")
+            return WorkCalendar.weekdays_only()
+        stat = os.stat(calendar_file)
+        key = ("csv", os.path.abspath(calendar_file))
+        token = f"{stat.st_mtime_ns}|{stat.st_size}"
+        try:
+            return _load_cached(key, token, lambda: _read_calendar_csv(calendar_file))
+        except Exception as e:
+            logging.error(f"加载日历表失败: {calendar_file}, 错误: {e}")
+            return WorkCalendar.weekdays_only()
+
+    if conn_factory is not None:
+        key = ("dim_calendar", scope)
+        with _CALENDARS_LOCK:
+            cached = _CALENDARS.get(key)
+        if cached is not None:
+            return cached
+        try:
+            with conn_factory() as conn:
+                token = _dim_calendar_token(conn)
+                return _load_cached(key, token, lambda: _read_dim_calendar(conn))
+        except Exception as e:
+            logging.error(f"加载 dim_calendar 失败，将使用默认周末逻辑: {e}")
+            return WorkCalendar.weekdays_only()
+
+    return WorkCalendar.weekdays_only()
+
+
+def clear_work_calendar_cache() -> None:
+    """清空进程内缓存（磁盘缓存按失效标记自动更新）"""
+    with _CALENDARS_LOCK:
+        _CALENDARS.clear()